@@ -44,3 +44,19 @@ class TipoRegistro(str, Enum):
     """Tipo di registro contabile."""
     CASSA = "cassa"
     BANCA = "banca"
+
+
+class StatoJob(str, Enum):
+    """Stati di un lavoro della coda in background (tabella jobs)."""
+    IN_CODA = "in_coda"
+    IN_CORSO = "in_corso"
+    COMPLETATO = "completato"
+    ERRORE = "errore"          # tentativi esauriti o errore non recuperabile
+
+
+class TipoJob(str, Enum):
+    """Lavori eseguiti dal worker (scripts/worker_jobs.py)."""
+    PDF_RENDICONTO = "pdf_rendiconto"
+    PDF_REGISTRO_INVENTARIO = "pdf_registro_inventario"
+    IMPORT_ESTRATTO = "import_estratto"
+    FIRMA_RENDICONTO = "firma_rendiconto"
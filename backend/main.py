@@ -1,20 +1,47 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from contextlib import asynccontextmanager
 import uvicorn
 
+import database
 from database import get_db
 from auth import get_current_user
+from services import metriche, render_pdf
+from utils.template_pdf import precompila_template
+from services.asset_documenti import carica_asset
 
 import middleware
-from routes import persone, sacramenti, certificati, amministrazione, auth, contabilita, rendiconti_crud, rendiconti_documenti, stampe, template_categorie, impostazioni_diocesi, audit, enti, inventario
+from routes import persone, sacramenti, certificati, amministrazione, auth, contabilita, rendiconti_crud, rendiconti_documenti, stampe, template_categorie, impostazioni_diocesi, audit, enti, inventario, import_movimenti, jobs
+
+# ============================================
+# CICLO DI VITA (avvio/arresto)
+# ============================================
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Apre i pool (psycopg2, asyncpg e render PDF) all'avvio e li chiude allo shutdown"""
+    render_pdf.avvia_pool()
+    precompila_template()
+    carica_asset()
+    try:
+        database.pool.fill()
+        await database.init_async_pool()
+    except Exception:
+        pass  # Il database potrebbe non essere ancora pronto: i pool si aprono on-demand
+    yield
+    render_pdf.chiudi_pool()
+    await database.close_async_pool()
+    database.pool.closeall()
 
 # Inizializza FastAPI
 app = FastAPI(
     title="Ecclesia - Parrocchia App API",
     description="API per gestione parrocchiale multi-ente",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # ============================================
@@ -54,6 +81,8 @@ app.include_router(impostazioni_diocesi.router)
 app.include_router(audit.router)
 app.include_router(enti.router)
 app.include_router(inventario.router)
+app.include_router(import_movimenti.router)
+app.include_router(jobs.router)
 
 # ============================================
 # UTILITY FUNCTIONS
@@ -106,7 +135,7 @@ def check_modulo_permission(modulo: str, ente_id: str, current_user: dict, db: S
 # ============================================
 
 @app.get("/api/anagrafica/persone")
-async def get_persone(
+def get_persone(
     ente_id: str,
     skip: int = 0,
     limit: int = 100,
@@ -164,7 +193,7 @@ async def get_persone(
     return {"persone": persone_list}
 
 @app.post("/api/anagrafica/persone")
-async def create_persona(
+def create_persona(
     persona_data: dict,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -221,14 +250,15 @@ async def root():
     }
 
 @app.get("/api/health")
-async def health_check(db: Session = Depends(get_db)):
+def health_check(db: Session = Depends(get_db)):
     """Health check con test database"""
     try:
         db.execute(text("SELECT 1"))
         return {
             "status": "healthy",
             "database": "connected",
-            "version": "2.0.0"
+            "version": "2.0.0",
+            "pool": database.get_pool_stats()
         }
     except Exception as e:
         raise HTTPException(
@@ -236,6 +266,14 @@ async def health_check(db: Session = Depends(get_db)):
             detail=f"Database error: {str(e)}"
         )
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Metriche delle richieste in formato testo Prometheus"""
+    return PlainTextResponse(
+        metriche.esporta_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
 # ============================================
 # AVVIO SERVER
 # ============================================
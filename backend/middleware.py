@@ -9,6 +9,7 @@ from fastapi.responses import JSONResponse
 from typing import Callable
 import permissions
 import re
+from services import metriche
 
 
 class PermissionMiddleware:
@@ -171,20 +172,40 @@ def require_permission(operazione: str, tabella: str):
 async def log_request_middleware(request: Request, call_next):
     """
     Middleware per loggare tutte le richieste.
-    Utile per debugging e audit.
+    Registra le metriche per route (latenza, tempo DB, dimensione),
+    segnala N+1 e richieste lente (SQL_PROFILING) e aggiunge
+    l'header Server-Timing alla risposta.
     """
     import time
     
-    start_time = time.time()
+    stato = metriche.inizia_richiesta()
+    metriche.richiesta_iniziata()
+    start_time = time.perf_counter()
+    status_code = 500
+    response = None
     
-    # Log richiesta
-    
-    # Processa richiesta
-    response = await call_next(request)
-    
-    # Log risposta
-    process_time = time.time() - start_time
+    try:
+        # Processa richiesta
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        metriche.richiesta_terminata()
+        process_time = time.perf_counter() - start_time
+        
+        # Path template della route (es. /api/contabilita/movimenti/{movimento_id})
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or metriche.ROUTE_NON_TROVATA
+        
+        dimensione = None
+        if response is not None and "content-length" in response.headers:
+            dimensione = int(response.headers["content-length"])
+        
+        metriche.registra_richiesta(
+            request.method, route_path, status_code, process_time, stato, dimensione
+        )
+        metriche.analizza_richiesta(request.method, route_path, process_time, stato)
     
+    response.headers["Server-Timing"] = metriche.server_timing(process_time, stato)
     return response
 
 
@@ -260,7 +281,7 @@ def handle_validation_error(error: Exception) -> JSONResponse:
 # UTILITY LOGGING
 # ============================================
 
-async def log_operation(
+def log_operation(
     request: Request,
     tabella: str,
     record_id: str,
@@ -0,0 +1,109 @@
+-- ============================================
+-- MIGRATION: Saldo registri mantenuto in modo incrementale
+-- ============================================
+-- registri_contabili.saldo_attuale = somma dei movimenti NON bloccati
+-- (entrate - uscite), come calcolato finora da get_registri.
+-- I periodi chiusi sono bloccati e riportati con un saldo_iniziale
+-- non bloccato, quindi il valore coincide con il saldo corrente del conto.
+--
+-- Il saldo è aggiornato da trigger a livello di statement (transition
+-- tables): un INSERT/UPDATE/DELETE su molte righe, come il blocco
+-- movimenti alla creazione di un rendiconto, esegue un solo UPDATE
+-- per registro coinvolto, nella stessa transazione.
+
+-- Stessa precisione di saldo_iniziale
+ALTER TABLE registri_contabili
+ALTER COLUMN saldo_attuale TYPE NUMERIC(12,2);
+
+-- Effetto di un movimento sul saldo del registro
+CREATE OR REPLACE FUNCTION effetto_saldo_movimento(
+    p_tipo_movimento VARCHAR,
+    p_importo NUMERIC,
+    p_bloccato BOOLEAN
+) RETURNS NUMERIC AS $$
+    SELECT CASE
+        WHEN COALESCE(p_bloccato, FALSE) THEN 0
+        WHEN p_tipo_movimento = 'entrata' THEN p_importo
+        WHEN p_tipo_movimento = 'uscita' THEN -p_importo
+        ELSE 0
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION aggiorna_saldi_registri() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale + d.delta
+        FROM (
+            SELECT registro_id,
+                   SUM(effetto_saldo_movimento(tipo_movimento, importo, bloccato)) AS delta
+            FROM movimenti_nuovi
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale - d.delta
+        FROM (
+            SELECT registro_id,
+                   SUM(effetto_saldo_movimento(tipo_movimento, importo, bloccato)) AS delta
+            FROM movimenti_vecchi
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+
+    ELSE
+        -- UPDATE: importo, tipo, blocco o registro possono cambiare
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale + d.delta
+        FROM (
+            SELECT registro_id, SUM(effetto) AS delta
+            FROM (
+                SELECT registro_id,
+                       effetto_saldo_movimento(tipo_movimento, importo, bloccato) AS effetto
+                FROM movimenti_nuovi
+                UNION ALL
+                SELECT registro_id,
+                       -effetto_saldo_movimento(tipo_movimento, importo, bloccato)
+                FROM movimenti_vecchi
+            ) x
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_saldi_registri_insert ON movimenti_contabili;
+CREATE TRIGGER trg_saldi_registri_insert
+AFTER INSERT ON movimenti_contabili
+REFERENCING NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_saldi_registri();
+
+DROP TRIGGER IF EXISTS trg_saldi_registri_update ON movimenti_contabili;
+CREATE TRIGGER trg_saldi_registri_update
+AFTER UPDATE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_saldi_registri();
+
+DROP TRIGGER IF EXISTS trg_saldi_registri_delete ON movimenti_contabili;
+CREATE TRIGGER trg_saldi_registri_delete
+AFTER DELETE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_saldi_registri();
+
+-- Allineamento iniziale dei saldi esistenti
+UPDATE registri_contabili r
+SET saldo_attuale = COALESCE((
+    SELECT SUM(effetto_saldo_movimento(m.tipo_movimento, m.importo, m.bloccato))
+    FROM movimenti_contabili m
+    WHERE m.registro_id = r.id
+), 0);
+
+-- Lookup del saldo iniziale per registro (get_registri, update_registro)
+CREATE INDEX IF NOT EXISTS idx_movimenti_saldo_iniziale
+ON movimenti_contabili(registro_id, data_movimento)
+WHERE tipo_speciale = 'saldo_iniziale';
@@ -0,0 +1,93 @@
+-- ============================================
+-- MIGRATION: Gerarchia piano dei conti (closure table)
+-- ============================================
+-- piano_conti_gerarchia contiene una riga per ogni coppia
+-- (antenato, discendente) lungo categoria_padre_id, compresa la coppia
+-- della categoria con sé stessa (profondita = 0).
+--
+-- Percorso completo e discendenti a qualsiasi profondità si ottengono
+-- con una sola query indicizzata, senza risalire/scendere un livello
+-- alla volta (vedi services/piano_conti.py).
+--
+-- La tabella è mantenuta da trigger a livello di statement, quindi
+-- resta allineata su creazione/modifica/eliminazione categorie e
+-- sull'applicazione del template diocesano (INSERT ... SELECT).
+-- Le eliminazioni sono gestite dalle FK ON DELETE CASCADE.
+
+CREATE TABLE IF NOT EXISTS piano_conti_gerarchia (
+    antenato_id UUID NOT NULL REFERENCES piano_conti(id) ON DELETE CASCADE,
+    discendente_id UUID NOT NULL REFERENCES piano_conti(id) ON DELETE CASCADE,
+    profondita INTEGER NOT NULL,
+    PRIMARY KEY (antenato_id, discendente_id)
+);
+
+-- Percorso di una categoria: tutti gli antenati di un discendente
+CREATE INDEX IF NOT EXISTS idx_piano_conti_gerarchia_discendente
+ON piano_conti_gerarchia(discendente_id, profondita);
+
+-- Ricalcola le righe delle categorie indicate risalendo categoria_padre_id.
+-- Il limite di profondità protegge da eventuali cicli nei dati.
+CREATE OR REPLACE FUNCTION ricalcola_gerarchia_piano_conti(p_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM piano_conti_gerarchia
+    WHERE discendente_id = ANY(p_ids);
+
+    WITH RECURSIVE risalita AS (
+        SELECT pc.id AS discendente_id,
+               pc.id AS antenato_id,
+               pc.categoria_padre_id AS padre_id,
+               0 AS profondita
+        FROM piano_conti pc
+        WHERE pc.id = ANY(p_ids)
+        UNION ALL
+        SELECT r.discendente_id, p.id, p.categoria_padre_id, r.profondita + 1
+        FROM risalita r
+        JOIN piano_conti p ON p.id = r.padre_id
+        WHERE r.profondita < 32
+    )
+    INSERT INTO piano_conti_gerarchia (antenato_id, discendente_id, profondita)
+    SELECT antenato_id, discendente_id, profondita
+    FROM risalita
+    ON CONFLICT (antenato_id, discendente_id) DO UPDATE
+    SET profondita = EXCLUDED.profondita;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION aggiorna_gerarchia_piano_conti() RETURNS TRIGGER AS $$
+DECLARE
+    v_ids UUID[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id) INTO v_ids FROM categorie_nuove;
+    ELSE
+        -- UPDATE: solo le categorie spostate e tutto il loro sottoalbero
+        SELECT array_agg(DISTINCT g.discendente_id) INTO v_ids
+        FROM categorie_nuove n
+        JOIN categorie_vecchie o ON o.id = n.id
+        JOIN piano_conti_gerarchia g ON g.antenato_id = n.id
+        WHERE n.categoria_padre_id IS DISTINCT FROM o.categoria_padre_id;
+    END IF;
+
+    IF v_ids IS NOT NULL THEN
+        PERFORM ricalcola_gerarchia_piano_conti(v_ids);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_gerarchia_piano_conti_insert ON piano_conti;
+CREATE TRIGGER trg_gerarchia_piano_conti_insert
+AFTER INSERT ON piano_conti
+REFERENCING NEW TABLE AS categorie_nuove
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_gerarchia_piano_conti();
+
+DROP TRIGGER IF EXISTS trg_gerarchia_piano_conti_update ON piano_conti;
+CREATE TRIGGER trg_gerarchia_piano_conti_update
+AFTER UPDATE ON piano_conti
+REFERENCING OLD TABLE AS categorie_vecchie NEW TABLE AS categorie_nuove
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_gerarchia_piano_conti();
+
+-- Popolamento iniziale
+SELECT ricalcola_gerarchia_piano_conti(ARRAY(SELECT id FROM piano_conti));
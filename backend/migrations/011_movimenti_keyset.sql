@@ -0,0 +1,22 @@
+-- ============================================
+-- MIGRATION: Paginazione keyset dei movimenti
+-- ============================================
+-- Le liste movimenti sono paginate sulla chiave
+-- (data_movimento, created_at, id) in ordine decrescente:
+-- created_at non deve essere NULL perché il confronto tra righe
+-- (a, b, c) < (x, y, z) funzioni e usi l'indice.
+
+UPDATE movimenti_contabili
+SET created_at = COALESCE(updated_at, data_movimento::timestamp)
+WHERE created_at IS NULL;
+
+ALTER TABLE movimenti_contabili
+ALTER COLUMN created_at SET NOT NULL;
+
+-- Lista generale dell'ente (get_movimenti_generali)
+CREATE INDEX IF NOT EXISTS idx_movimenti_ente_chiave
+ON movimenti_contabili(ente_id, data_movimento, created_at, id);
+
+-- Lista del singolo conto (get_movimenti_conto, filtro registro)
+CREATE INDEX IF NOT EXISTS idx_movimenti_registro_chiave
+ON movimenti_contabili(registro_id, data_movimento, created_at, id);
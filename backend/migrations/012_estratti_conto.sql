@@ -0,0 +1,62 @@
+-- ============================================
+-- MIGRATION: Import estratti conto bancari
+-- ============================================
+-- estratti_conto / estratti_conto_righe: file importati e loro righe
+-- (importo con segno: positivo = entrata). movimento_id collega la riga
+-- al movimento creato dall'import o abbinato in seguito.
+-- regole_import_categorie: assegnazione automatica della categoria
+-- quando la descrizione della riga contiene il testo della regola.
+
+CREATE TABLE IF NOT EXISTS estratti_conto (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    ente_id UUID NOT NULL REFERENCES enti(id),
+    registro_id UUID NOT NULL REFERENCES registri_contabili(id) ON DELETE CASCADE,
+    nome_file VARCHAR(255),
+    formato VARCHAR(20) NOT NULL,
+    numero_righe INTEGER DEFAULT 0,
+    movimenti_creati INTEGER DEFAULT 0,
+    created_by UUID,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_estratti_conto_registro
+ON estratti_conto(registro_id, created_at);
+
+CREATE TABLE IF NOT EXISTS estratti_conto_righe (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    estratto_id UUID NOT NULL REFERENCES estratti_conto(id) ON DELETE CASCADE,
+    riga INTEGER NOT NULL,
+    data_operazione DATE NOT NULL,
+    importo NUMERIC(12,2) NOT NULL,
+    descrizione TEXT,
+    riferimento VARCHAR(255),
+    movimento_id UUID REFERENCES movimenti_contabili(id) ON DELETE SET NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_estratti_righe_estratto
+ON estratti_conto_righe(estratto_id, riga);
+
+-- Riconoscimento delle righe già importate
+CREATE INDEX IF NOT EXISTS idx_estratti_righe_riferimento
+ON estratti_conto_righe(riferimento)
+WHERE riferimento IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_estratti_righe_movimento
+ON estratti_conto_righe(movimento_id)
+WHERE movimento_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS regole_import_categorie (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    ente_id UUID NOT NULL REFERENCES enti(id),
+    registro_id UUID REFERENCES registri_contabili(id) ON DELETE CASCADE,
+    testo VARCHAR(255) NOT NULL,
+    tipo_movimento VARCHAR(10) CHECK (tipo_movimento IN ('entrata', 'uscita')),
+    categoria_id UUID NOT NULL REFERENCES piano_conti(id) ON DELETE CASCADE,
+    priorita INTEGER DEFAULT 100,
+    attivo BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_regole_import_ente
+ON regole_import_categorie(ente_id)
+WHERE attivo = TRUE;
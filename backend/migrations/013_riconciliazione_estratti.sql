@@ -0,0 +1,26 @@
+-- ============================================
+-- MIGRATION: Riconciliazione estratti conto
+-- ============================================
+-- Abbinamenti confermati tra righe dell'estratto e movimenti del conto.
+-- Una riga può essere abbinata a più movimenti (es. un versamento che
+-- raccoglie più offerte), un movimento a una sola riga.
+-- estratti_conto_righe.movimento_id resta valorizzato per gli
+-- abbinamenti 1:1 e per i movimenti creati dall'import.
+
+CREATE TABLE IF NOT EXISTS estratti_conto_abbinamenti (
+    riga_id UUID NOT NULL REFERENCES estratti_conto_righe(id) ON DELETE CASCADE,
+    movimento_id UUID NOT NULL REFERENCES movimenti_contabili(id) ON DELETE CASCADE,
+    created_by UUID,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (riga_id, movimento_id)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_abbinamenti_movimento
+ON estratti_conto_abbinamenti(movimento_id);
+
+-- Movimenti creati dagli import precedenti: già riconciliati
+INSERT INTO estratti_conto_abbinamenti (riga_id, movimento_id)
+SELECT id, movimento_id
+FROM estratti_conto_righe
+WHERE movimento_id IS NOT NULL
+ON CONFLICT DO NOTHING;
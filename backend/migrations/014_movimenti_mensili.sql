@@ -0,0 +1,168 @@
+-- ============================================
+-- MIGRATION: Riepiloghi mensili dei movimenti
+-- ============================================
+-- movimenti_mensili: somma e numero dei movimenti per ente, registro,
+-- categoria, mese e tipo (più tipo_speciale e riporto_saldo, usati dai
+-- filtri di rendiconti e report). Mantenuta dai trigger a livello di
+-- statement nella stessa transazione del movimento, come i saldi dei
+-- registri (migration 009).
+--
+-- totali_movimenti_periodo() risponde ai totali di un periodo leggendo
+-- i mesi interi dai riepiloghi e solo i mesi parziali agli estremi dai
+-- movimenti: un report pluriennale costa mesi × categorie righe invece
+-- di una scansione di tutti i movimenti.
+
+CREATE TABLE IF NOT EXISTS movimenti_mensili (
+    ente_id UUID NOT NULL,
+    registro_id UUID NOT NULL,
+    categoria_id UUID,
+    mese DATE NOT NULL,
+    tipo_movimento VARCHAR(10),
+    tipo_speciale VARCHAR(50),
+    riporto_saldo BOOLEAN NOT NULL DEFAULT FALSE,
+    totale NUMERIC(14,2) NOT NULL DEFAULT 0,
+    numero INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_movimenti_mensili UNIQUE NULLS NOT DISTINCT
+        (ente_id, mese, registro_id, categoria_id, tipo_movimento, tipo_speciale, riporto_saldo)
+);
+
+CREATE INDEX IF NOT EXISTS idx_movimenti_mensili_registro
+ON movimenti_mensili(registro_id, mese);
+
+-- Variazioni raggruppate per chiave (righe nuove in positivo, vecchie in
+-- negativo) e applicate con un solo upsert. Le transition table sono
+-- lette solo nel ramo dell'evento che le dichiara.
+CREATE OR REPLACE FUNCTION aggiorna_movimenti_mensili() RETURNS TRIGGER AS $$
+DECLARE
+    nuove movimenti_mensili[] := '{}';
+    vecchie movimenti_mensili[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT COALESCE(array_agg(ROW(
+                   v.ente_id, v.registro_id, v.categoria_id, v.mese, v.tipo_movimento,
+                   v.tipo_speciale, v.riporto_saldo, v.totale, v.numero
+               )::movimenti_mensili), '{}')
+        INTO nuove
+        FROM (
+            SELECT ente_id, registro_id, categoria_id,
+                   date_trunc('month', data_movimento)::date AS mese,
+                   tipo_movimento, tipo_speciale, COALESCE(riporto_saldo, FALSE) AS riporto_saldo,
+                   SUM(importo) AS totale, COUNT(*)::integer AS numero
+            FROM movimenti_nuovi
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        ) v;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT COALESCE(array_agg(ROW(
+                   v.ente_id, v.registro_id, v.categoria_id, v.mese, v.tipo_movimento,
+                   v.tipo_speciale, v.riporto_saldo, v.totale, v.numero
+               )::movimenti_mensili), '{}')
+        INTO vecchie
+        FROM (
+            SELECT ente_id, registro_id, categoria_id,
+                   date_trunc('month', data_movimento)::date AS mese,
+                   tipo_movimento, tipo_speciale, COALESCE(riporto_saldo, FALSE) AS riporto_saldo,
+                   -SUM(importo) AS totale, -COUNT(*)::integer AS numero
+            FROM movimenti_vecchi
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        ) v;
+    END IF;
+
+    -- ORDER BY: upsert concorrenti bloccano le righe nello stesso ordine
+    INSERT INTO movimenti_mensili AS mm (
+        ente_id, registro_id, categoria_id, mese, tipo_movimento, tipo_speciale, riporto_saldo, totale, numero
+    )
+    SELECT ente_id, registro_id, categoria_id, mese, tipo_movimento, tipo_speciale, riporto_saldo,
+           SUM(totale), SUM(numero)
+    FROM (
+        SELECT * FROM unnest(nuove)
+        UNION ALL
+        SELECT * FROM unnest(vecchie)
+    ) x
+    GROUP BY ente_id, mese, registro_id, categoria_id, tipo_movimento, tipo_speciale, riporto_saldo
+    HAVING SUM(numero) <> 0 OR SUM(totale) <> 0
+    ORDER BY ente_id, mese, registro_id, categoria_id, tipo_movimento, tipo_speciale, riporto_saldo
+    ON CONFLICT ON CONSTRAINT uq_movimenti_mensili DO UPDATE
+    SET totale = mm.totale + EXCLUDED.totale,
+        numero = mm.numero + EXCLUDED.numero;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_movimenti_mensili_insert ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_mensili_insert
+AFTER INSERT ON movimenti_contabili
+REFERENCING NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_movimenti_mensili();
+
+DROP TRIGGER IF EXISTS trg_movimenti_mensili_update ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_mensili_update
+AFTER UPDATE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_movimenti_mensili();
+
+DROP TRIGGER IF EXISTS trg_movimenti_mensili_delete ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_mensili_delete
+AFTER DELETE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_movimenti_mensili();
+
+-- Totali di un periodo (estremi inclusi, NULL = illimitato):
+-- mesi interi dai riepiloghi, mesi parziali dai movimenti
+CREATE OR REPLACE FUNCTION totali_movimenti_periodo(
+    p_ente_id UUID,
+    p_data_da DATE,
+    p_data_a DATE
+) RETURNS TABLE (
+    registro_id UUID,
+    categoria_id UUID,
+    tipo_movimento VARCHAR,
+    tipo_speciale VARCHAR,
+    riporto_saldo BOOLEAN,
+    totale NUMERIC,
+    numero BIGINT
+) AS $$
+    WITH limiti AS (
+        SELECT
+            COALESCE(p_data_da, '-infinity'::date) AS data_da,
+            COALESCE(p_data_a, 'infinity'::date) AS data_a,
+            -- primo mese interamente nel periodo
+            CASE WHEN p_data_da IS NULL THEN '-infinity'::date
+                 ELSE (date_trunc('month', p_data_da - 1) + INTERVAL '1 month')::date END AS mese_da,
+            -- primo mese dopo l'ultimo interamente nel periodo
+            CASE WHEN p_data_a IS NULL THEN 'infinity'::date
+                 ELSE date_trunc('month', p_data_a + 1)::date END AS mese_a
+    )
+    SELECT x.registro_id, x.categoria_id, x.tipo_movimento, x.tipo_speciale, x.riporto_saldo,
+           SUM(x.totale), SUM(x.numero)::bigint
+    FROM (
+        SELECT mm.registro_id, mm.categoria_id, mm.tipo_movimento, mm.tipo_speciale, mm.riporto_saldo,
+               mm.totale, mm.numero
+        FROM movimenti_mensili mm, limiti l
+        WHERE mm.ente_id = p_ente_id
+          AND mm.mese >= l.mese_da
+          AND mm.mese < l.mese_a
+          AND mm.numero <> 0
+        UNION ALL
+        SELECT m.registro_id, m.categoria_id, m.tipo_movimento, m.tipo_speciale,
+               COALESCE(m.riporto_saldo, FALSE), m.importo, 1
+        FROM movimenti_contabili m, limiti l
+        WHERE m.ente_id = p_ente_id
+          AND m.data_movimento BETWEEN l.data_da AND l.data_a
+          AND (m.data_movimento < l.mese_da OR m.data_movimento >= l.mese_a)
+    ) x
+    GROUP BY x.registro_id, x.categoria_id, x.tipo_movimento, x.tipo_speciale, x.riporto_saldo;
+$$ LANGUAGE sql STABLE;
+
+-- Popolamento iniziale
+TRUNCATE movimenti_mensili;
+INSERT INTO movimenti_mensili (
+    ente_id, registro_id, categoria_id, mese, tipo_movimento, tipo_speciale, riporto_saldo, totale, numero
+)
+SELECT ente_id, registro_id, categoria_id, date_trunc('month', data_movimento)::date,
+       tipo_movimento, tipo_speciale, COALESCE(riporto_saldo, FALSE),
+       SUM(importo), COUNT(*)
+FROM movimenti_contabili
+GROUP BY 1, 2, 3, 4, 5, 6, 7;
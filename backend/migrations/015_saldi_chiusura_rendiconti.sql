@@ -0,0 +1,71 @@
+-- ============================================
+-- MIGRATION: Saldi di chiusura dei rendiconti
+-- ============================================
+-- Fotografia dei saldi alla creazione del rendiconto, scritta nella
+-- stessa transazione della chiusura (services/chiusura_rendiconto.py):
+--
+-- rendiconti_saldi_registri: saldo finale di ogni conto attivo (= importo
+-- del riporto creato al giorno successivo);
+-- rendiconti_saldi_categorie: totale e numero dei movimenti del periodo
+-- per categoria e tipo.
+--
+-- Il saldo di apertura di un periodo si legge dalla fotografia del
+-- rendiconto precedente invece di risommare lo storico. Le righe non si
+-- modificano: sono eliminate solo con il rendiconto.
+
+CREATE TABLE IF NOT EXISTS rendiconti_saldi_registri (
+    rendiconto_id UUID NOT NULL REFERENCES rendiconti(id) ON DELETE CASCADE,
+    registro_id UUID NOT NULL,
+    nome VARCHAR(255),
+    saldo_finale NUMERIC(14,2) NOT NULL,
+    PRIMARY KEY (rendiconto_id, registro_id)
+);
+
+CREATE TABLE IF NOT EXISTS rendiconti_saldi_categorie (
+    rendiconto_id UUID NOT NULL REFERENCES rendiconti(id) ON DELETE CASCADE,
+    categoria_id UUID,
+    tipo_movimento VARCHAR(10),
+    totale NUMERIC(14,2) NOT NULL,
+    numero INTEGER NOT NULL,
+    CONSTRAINT uq_rendiconti_saldi_categorie UNIQUE NULLS NOT DISTINCT
+        (rendiconto_id, categoria_id, tipo_movimento)
+);
+
+CREATE OR REPLACE FUNCTION impedisci_modifica_saldi_chiusura() RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'I saldi di chiusura del rendiconto non sono modificabili';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_saldi_registri_immutabili ON rendiconti_saldi_registri;
+CREATE TRIGGER trg_saldi_registri_immutabili
+BEFORE UPDATE ON rendiconti_saldi_registri
+FOR EACH STATEMENT EXECUTE FUNCTION impedisci_modifica_saldi_chiusura();
+
+DROP TRIGGER IF EXISTS trg_saldi_categorie_immutabili ON rendiconti_saldi_categorie;
+CREATE TRIGGER trg_saldi_categorie_immutabili
+BEFORE UPDATE ON rendiconti_saldi_categorie
+FOR EACH STATEMENT EXECUTE FUNCTION impedisci_modifica_saldi_chiusura();
+
+-- Popolamento per i rendiconti esistenti: saldi dei conti dai riporti
+-- creati alla chiusura, totali per categoria dai movimenti (bloccati)
+-- del periodo
+INSERT INTO rendiconti_saldi_registri (rendiconto_id, registro_id, nome, saldo_finale)
+SELECT r.id, m.registro_id, reg.nome,
+       SUM(CASE WHEN m.tipo_movimento = 'entrata' THEN m.importo ELSE -m.importo END)
+FROM rendiconti r
+JOIN movimenti_contabili m
+  ON m.ente_id = r.ente_id
+ AND m.riporto_saldo = TRUE
+ AND m.note = 'Riporto automatico da rendiconto ' || r.id::text
+JOIN registri_contabili reg ON reg.id = m.registro_id
+GROUP BY r.id, m.registro_id, reg.nome
+ON CONFLICT DO NOTHING;
+
+INSERT INTO rendiconti_saldi_categorie (rendiconto_id, categoria_id, tipo_movimento, totale, numero)
+SELECT r.id, t.categoria_id, t.tipo_movimento, SUM(t.totale), SUM(t.numero)
+FROM rendiconti r
+CROSS JOIN LATERAL totali_movimenti_periodo(r.ente_id, r.periodo_inizio, r.periodo_fine) t
+WHERE t.tipo_speciale IS NULL
+GROUP BY r.id, t.categoria_id, t.tipo_movimento
+ON CONFLICT DO NOTHING;
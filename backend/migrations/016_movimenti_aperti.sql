@@ -0,0 +1,10 @@
+-- ============================================
+-- MIGRATION: Indice dei movimenti aperti
+-- ============================================
+-- Gli aggregati dei movimenti bloccati sono in cache per rendiconto
+-- (services/cache_periodi_chiusi.py): nei periodi dei rendiconti si
+-- leggono dal database solo i movimenti non bloccati.
+
+CREATE INDEX IF NOT EXISTS idx_movimenti_aperti
+ON movimenti_contabili(ente_id, data_movimento)
+WHERE bloccato IS NOT TRUE;
@@ -0,0 +1,42 @@
+-- ============================================
+-- MIGRATION: Ricerca testuale nei movimenti
+-- ============================================
+-- ricerca: tsvector italiano di descrizione (peso A), causale (B) e
+-- note (C), colonna generata e indicizzata con GIN.
+-- testo_ricerca_movimento(): gli stessi campi più l'importo come testo,
+-- indicizzato con pg_trgm per parole parziali e importi ("150.5").
+-- Gli indici includono ente_id (btree_gin): la ricerca di un ente non
+-- legge le voci degli altri enti della diocesi.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE movimenti_contabili
+ADD COLUMN IF NOT EXISTS ricerca tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('italian', COALESCE(descrizione, '')), 'A') ||
+    setweight(to_tsvector('italian', COALESCE(causale, '')), 'B') ||
+    setweight(to_tsvector('italian', COALESCE(note, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_movimenti_ricerca
+ON movimenti_contabili USING gin (ente_id, ricerca);
+
+CREATE OR REPLACE FUNCTION testo_ricerca_movimento(
+    p_descrizione TEXT,
+    p_causale TEXT,
+    p_note TEXT,
+    p_importo NUMERIC
+) RETURNS TEXT AS $$
+    SELECT lower(
+        COALESCE(p_descrizione, '') || ' ' ||
+        COALESCE(p_causale, '') || ' ' ||
+        COALESCE(p_note, '') || ' ' ||
+        COALESCE(p_importo::text, '')
+    );
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_movimenti_ricerca_trigrammi
+ON movimenti_contabili USING gin (
+    ente_id,
+    testo_ricerca_movimento(descrizione, causale, note, importo) gin_trgm_ops
+);
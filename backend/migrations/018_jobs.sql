@@ -0,0 +1,48 @@
+-- ============================================
+-- MIGRATION: Coda dei lavori in background
+-- ============================================
+-- jobs: operazioni lunghe (PDF, import, firma) accodate dalle route ed
+-- eseguite da scripts/worker_jobs.py. I worker prelevano i lavori con
+-- FOR UPDATE SKIP LOCKED: più processi non prendono mai lo stesso lavoro.
+-- chiave: lavori equivalenti (es. PDF dello stesso rendiconto) non sono
+-- accodati due volte finché uno è in coda o in corso.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    tipo VARCHAR(50) NOT NULL,
+    ente_id UUID REFERENCES enti(id) ON DELETE CASCADE,
+    utente_id UUID,
+    parametri JSONB NOT NULL DEFAULT '{}',
+    chiave VARCHAR(255),
+    stato VARCHAR(20) NOT NULL DEFAULT 'in_coda'
+        CHECK (stato IN ('in_coda', 'in_corso', 'completato', 'errore')),
+    progresso INTEGER NOT NULL DEFAULT 0,
+    messaggio TEXT,
+    risultato JSONB,
+    errore TEXT,
+    tentativi INTEGER NOT NULL DEFAULT 0,
+    max_tentativi INTEGER NOT NULL DEFAULT 3,
+    esegui_dopo TIMESTAMP NOT NULL DEFAULT NOW(),
+    worker VARCHAR(255),
+    iniziato_at TIMESTAMP,
+    completato_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Prelievo: solo i lavori in coda, nell'ordine di esecuzione
+CREATE INDEX IF NOT EXISTS idx_jobs_in_coda
+ON jobs(esegui_dopo)
+WHERE stato = 'in_coda';
+
+-- Recupero dei lavori di worker terminati
+CREATE INDEX IF NOT EXISTS idx_jobs_in_corso
+ON jobs(iniziato_at)
+WHERE stato = 'in_corso';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_chiave_attivi
+ON jobs(chiave)
+WHERE chiave IS NOT NULL AND stato IN ('in_coda', 'in_corso');
+
+CREATE INDEX IF NOT EXISTS idx_jobs_ente
+ON jobs(ente_id, created_at DESC);
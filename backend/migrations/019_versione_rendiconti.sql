@@ -0,0 +1,85 @@
+-- ============================================
+-- MIGRATION: Versione dei rendiconti per la cache dei periodi chiusi
+-- ============================================
+-- Gli aggregati dei movimenti bloccati sono in cache con versione
+-- rendiconti.updated_at (services/cache_periodi_chiusi.py): la versione
+-- deve cambiare a ogni modifica che li riguarda, anche se la route non
+-- aggiorna updated_at o l'invalidazione non raggiunge gli altri worker.
+--
+-- - cambio di stato o di periodo del rendiconto;
+-- - inserimento, modifica o eliminazione di movimenti bloccati del
+--   rendiconto.
+--
+-- clock_timestamp() invece di NOW(): due modifiche nella stessa
+-- transazione producono comunque versioni diverse da quella letta prima.
+
+CREATE OR REPLACE FUNCTION aggiorna_versione_rendiconto() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rendiconti_versione ON rendiconti;
+CREATE TRIGGER trg_rendiconti_versione
+BEFORE UPDATE OF stato, periodo_inizio, periodo_fine ON rendiconti
+FOR EACH ROW
+WHEN (OLD.stato IS DISTINCT FROM NEW.stato
+      OR OLD.periodo_inizio IS DISTINCT FROM NEW.periodo_inizio
+      OR OLD.periodo_fine IS DISTINCT FROM NEW.periodo_fine)
+EXECUTE FUNCTION aggiorna_versione_rendiconto();
+
+-- Le transition table sono lette solo nel ramo dell'evento che le dichiara
+CREATE OR REPLACE FUNCTION aggiorna_versione_rendiconti_movimenti() RETURNS TRIGGER AS $$
+DECLARE
+    rendiconti_toccati UUID[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT rendiconti_toccati || COALESCE(array_agg(DISTINCT rendiconto_id), '{}')
+        INTO rendiconti_toccati
+        FROM movimenti_nuovi
+        WHERE bloccato AND rendiconto_id IS NOT NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT rendiconti_toccati || COALESCE(array_agg(DISTINCT rendiconto_id), '{}')
+        INTO rendiconti_toccati
+        FROM movimenti_vecchi
+        WHERE bloccato AND rendiconto_id IS NOT NULL;
+    END IF;
+
+    IF cardinality(rendiconti_toccati) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    -- Righe bloccate in ordine di id: nessun deadlock tra statement concorrenti
+    PERFORM 1 FROM rendiconti
+    WHERE id = ANY(rendiconti_toccati)
+    ORDER BY id
+    FOR UPDATE;
+
+    UPDATE rendiconti
+    SET updated_at = clock_timestamp()
+    WHERE id = ANY(rendiconti_toccati);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_movimenti_versione_rendiconti_insert ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_versione_rendiconti_insert
+AFTER INSERT ON movimenti_contabili
+REFERENCING NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_versione_rendiconti_movimenti();
+
+DROP TRIGGER IF EXISTS trg_movimenti_versione_rendiconti_update ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_versione_rendiconti_update
+AFTER UPDATE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi NEW TABLE AS movimenti_nuovi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_versione_rendiconti_movimenti();
+
+DROP TRIGGER IF EXISTS trg_movimenti_versione_rendiconti_delete ON movimenti_contabili;
+CREATE TRIGGER trg_movimenti_versione_rendiconti_delete
+AFTER DELETE ON movimenti_contabili
+REFERENCING OLD TABLE AS movimenti_vecchi
+FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_versione_rendiconti_movimenti();
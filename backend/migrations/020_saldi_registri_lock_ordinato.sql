@@ -0,0 +1,84 @@
+-- ============================================
+-- MIGRATION: Lock dei registri in ordine di id nei trigger dei saldi
+-- ============================================
+-- aggiorna_saldi_registri (migration 009) aggiornava registri_contabili
+-- con UPDATE ... FROM sulle righe aggregate delle transition table, che
+-- prende i lock dei registri in un ordine qualsiasi: due statement
+-- concorrenti su più registri comuni potevano andare in deadlock.
+--
+-- Ora i registri coinvolti sono bloccati prima in ordine di id, come in
+-- ricostruisci_saldi (services/saldi.py); l'UPDATE trova i lock già presi.
+-- I trigger della migration 009 restano invariati.
+
+-- Le transition table sono lette solo nel ramo dell'evento che le dichiara
+CREATE OR REPLACE FUNCTION aggiorna_saldi_registri() RETURNS TRIGGER AS $$
+DECLARE
+    registri_toccati UUID[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT registri_toccati || COALESCE(array_agg(DISTINCT registro_id), '{}')
+        INTO registri_toccati
+        FROM movimenti_nuovi;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT registri_toccati || COALESCE(array_agg(DISTINCT registro_id), '{}')
+        INTO registri_toccati
+        FROM movimenti_vecchi;
+    END IF;
+
+    IF cardinality(registri_toccati) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    -- Righe bloccate in ordine di id: nessun deadlock tra statement concorrenti
+    PERFORM 1 FROM registri_contabili
+    WHERE id = ANY(registri_toccati)
+    ORDER BY id
+    FOR UPDATE;
+
+    IF TG_OP = 'INSERT' THEN
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale + d.delta
+        FROM (
+            SELECT registro_id,
+                   SUM(effetto_saldo_movimento(tipo_movimento, importo, bloccato)) AS delta
+            FROM movimenti_nuovi
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale - d.delta
+        FROM (
+            SELECT registro_id,
+                   SUM(effetto_saldo_movimento(tipo_movimento, importo, bloccato)) AS delta
+            FROM movimenti_vecchi
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+
+    ELSE
+        -- UPDATE: importo, tipo, blocco o registro possono cambiare
+        UPDATE registri_contabili r
+        SET saldo_attuale = r.saldo_attuale + d.delta
+        FROM (
+            SELECT registro_id, SUM(effetto) AS delta
+            FROM (
+                SELECT registro_id,
+                       effetto_saldo_movimento(tipo_movimento, importo, bloccato) AS effetto
+                FROM movimenti_nuovi
+                UNION ALL
+                SELECT registro_id,
+                       -effetto_saldo_movimento(tipo_movimento, importo, bloccato)
+                FROM movimenti_vecchi
+            ) x
+            GROUP BY registro_id
+        ) d
+        WHERE r.id = d.registro_id AND d.delta <> 0;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -17,7 +17,7 @@ router = APIRouter(prefix="/api/audit", tags=["audit"])
 
 
 @router.get("")
-async def get_audit_log(
+def get_audit_log(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id"),
@@ -87,7 +87,7 @@ async def get_audit_log(
 
 
 @router.get("/record/{tabella}/{record_id}")
-async def get_storia_record(
+def get_storia_record(
     tabella: str,
     record_id: str,
     db: Session = Depends(get_db),
@@ -135,7 +135,7 @@ async def get_storia_record(
 
 
 @router.get("/statistiche")
-async def get_statistiche_audit(
+def get_statistiche_audit(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
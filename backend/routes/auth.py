@@ -37,7 +37,7 @@ class UpdateProfileRequest(BaseModel):
 # ============================================
 
 @router.post("/login")
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -127,7 +127,7 @@ async def login(
 # ============================================
 
 @router.post("/change-password")
-async def change_password(
+def change_password(
     request: ChangePasswordRequest,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -186,7 +186,7 @@ async def change_password(
 # ============================================
 
 @router.put("/update-profile")
-async def update_profile(
+def update_profile(
     request: UpdateProfileRequest,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -254,6 +254,6 @@ async def update_profile(
 # ============================================
 
 @router.get("/me")
-async def get_me(current_user: dict = Depends(get_current_user)):
+def get_me(current_user: dict = Depends(get_current_user)):
     """Ottiene dati utente corrente"""
     return current_user
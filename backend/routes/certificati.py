@@ -113,7 +113,7 @@ def registra_certificato_emesso(
 # ============================================
 
 @router.post("/battesimo/{battesimo_id}")
-async def genera_certificato_battesimo(battesimo_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+def genera_certificato_battesimo(battesimo_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     """
     Genera certificato di battesimo in PDF.
     Richiede che l'utente appartenga alla parrocchia amministrante.
@@ -202,7 +202,7 @@ async def genera_certificato_battesimo(battesimo_id: str, request: Request, curr
         )
         
         # Log operazione
-        await middleware.log_operation(
+        middleware.log_operation(
             request,
             tabella="certificati",
             record_id=battesimo_id,
@@ -229,7 +229,7 @@ async def genera_certificato_battesimo(battesimo_id: str, request: Request, curr
 
 
 @router.post("/cresima/{cresima_id}")
-async def genera_certificato_cresima(cresima_id: str, current_user: dict = Depends(get_current_user)):
+def genera_certificato_cresima(cresima_id: str, current_user: dict = Depends(get_current_user)):
     """Genera certificato di cresima in PDF"""
     try:
         user_id = current_user["user_id"]
@@ -331,7 +331,7 @@ async def genera_certificato_cresima(cresima_id: str, current_user: dict = Depen
 # ============================================
 
 @router.get("/download/{numero_protocollo}")
-async def download_certificato(numero_protocollo: str, current_user: dict = Depends(get_current_user)):
+def download_certificato(numero_protocollo: str, current_user: dict = Depends(get_current_user)):
     """
     Download del certificato PDF.
     Solo la parrocchia che lo ha emesso può scaricarlo.
@@ -399,7 +399,7 @@ async def download_certificato(numero_protocollo: str, current_user: dict = Depe
 # ============================================
 
 @router.get("/storico")
-async def get_storico_certificati(current_user: dict = Depends(get_current_user)):
+def get_storico_certificati(current_user: dict = Depends(get_current_user)):
     """
     Ottiene lo storico dei certificati emessi dalla parrocchia.
     """
@@ -17,7 +17,7 @@ Date: 2025-11-29
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, File, UploadFile, Form
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pathlib import Path
@@ -32,7 +32,19 @@ import shutil
 from database import get_db
 from auth import get_current_user
 from services.audit import registra_audit, get_record_data
-from constants import TipoMovimento
+from services.piano_conti import discendenti_categorie, elimina_categorie
+from services.cache_categorie import albero_categorie, invalida_categorie
+from services.movimenti import pagina_movimenti, MOVIMENTI_PAGINA, MOVIMENTI_PAGINA_MAX
+from services.ricerca_movimenti import cerca_movimenti, RICERCA_PAGINA, RICERCA_PAGINA_MAX
+from services.dashboard import dati_dashboard, json_dashboard
+from utils.etag import etag_contenuto, etag_corrisponde
+from services.report import filtri_report, riepilogo_report, movimenti_report, json_in_streaming
+from services.export_movimenti import (
+    FORMATI_EXPORT, colonne_export, righe_movimenti, csv_in_streaming, xlsx_in_streaming
+)
+from services.jobs import accoda_job
+from services import cache_pdf
+from constants import TipoMovimento, TipoJob
 
 router = APIRouter(prefix="/api/contabilita", tags=["contabilita"])
 
@@ -401,6 +413,8 @@ def delete_registro(
     )
     
     db.commit()
+    # Il conto non è più tra i registri abilitati delle categorie
+    invalida_categorie(ente_id)
     
     row = result.fetchone()
     if not row:
@@ -413,16 +427,16 @@ def delete_registro(
     }
 
 @router.get("/registri")
-async def get_registri(
+def get_registri(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
     """
-    Restituisce tutti i registri contabili dell'ente con saldo calcolato.
+    Restituisce tutti i registri contabili dell'ente con il saldo attuale.
     
-    Il saldo viene calcolato dalla somma di tutti i movimenti (entrate - uscite),
-    includendo anche i movimenti speciali di tipo 'saldo_iniziale'.
+    Il saldo è la somma dei movimenti non bloccati (entrate - uscite),
+    inclusi i movimenti speciali di tipo 'saldo_iniziale'.
     """
     try:
         
@@ -431,8 +445,8 @@ async def get_registri(
         if not ente_id:
             raise HTTPException(status_code=400, detail="Ente ID mancante")
         
-        # Calcola saldo SOLO dai movimenti NON bloccati
-        # Include anche il saldo_iniziale dal movimento speciale
+        # Saldo dei movimenti NON bloccati (saldo_iniziale compreso),
+        # mantenuto dai trigger su movimenti_contabili (migration 009)
         query = text("""
             SELECT
                 r.id,
@@ -441,20 +455,7 @@ async def get_registri(
                 r.descrizione,
                 r.attivo,
                 r.iban,
-                COALESCE(
-                    (SELECT SUM(
-                        CASE 
-                            WHEN m.tipo_movimento = 'entrata' THEN m.importo
-                            WHEN m.tipo_movimento = 'uscita' THEN -m.importo
-                            ELSE 0
-                        END
-                    )
-                    FROM movimenti_contabili m
-                    WHERE m.registro_id = r.id
-                      AND m.ente_id = :ente_id
-                      AND (m.bloccato = FALSE OR m.bloccato IS NULL)),
-                    0
-                ) as saldo_attuale,
+                COALESCE(r.saldo_attuale, 0) as saldo_attuale,
                 COALESCE(
                     (SELECT CASE
                         WHEN m.tipo_movimento = 'entrata' THEN m.importo
@@ -546,6 +547,39 @@ def get_ultimo_rendiconto(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/dashboard")
+def get_dashboard(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """
+    Riepilogo per la home page della contabilità: saldi dei conti, entrate
+    e uscite dell'anno per categoria di primo livello, flusso di cassa degli
+    ultimi 12 mesi, ultimo periodo chiuso e rendiconto in lavorazione.
+
+    Con ETag: se i dati non sono cambiati risponde 304 senza corpo.
+    """
+    try:
+        ente_id = current_user.get('ente_id') or x_ente_id
+
+        if not ente_id:
+            raise HTTPException(status_code=400, detail="Ente ID mancante")
+
+        corpo = json_dashboard(dati_dashboard(db, ente_id))
+        etag = etag_contenuto(corpo)
+        intestazioni = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "X-Ente-Id"}
+
+        if etag_corrisponde(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=intestazioni)
+        return Response(content=corpo, media_type="application/json", headers=intestazioni)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============================================
 # ENDPOINTS: CATEGORIE (PIANO DEI CONTI)
 # ============================================
@@ -564,45 +598,19 @@ def get_categorie(
     """
     ente_id = current_user.get('ente_id') or x_ente_id
     
-    # Query categorie
-    query_cat = """
-        SELECT id, descrizione, 
-               COALESCE(categoria_padre_id, conto_padre_id) as parent_id, 
-               tipo
-        FROM piano_conti
-        WHERE ente_id = :ente_id 
-          AND (is_sistema = FALSE OR is_sistema IS NULL)
-        ORDER BY CAST(NULLIF(REGEXP_REPLACE(codice, '[^0-9]', '', 'g'), '') AS INTEGER) NULLS LAST, codice
-    """
-    categorie = db.execute(text(query_cat), {"ente_id": ente_id}).fetchall()
-    
-    # Query associazioni registri
-    query_registri = """
-        SELECT categoria_id, registro_id
-        FROM categorie_registri
-    """
-    registri_assoc = db.execute(text(query_registri)).fetchall()
-    
-    # Raggruppa per categoria
-    registri_per_categoria = {}
-    for row in registri_assoc:
-        cat_id = str(row[0])
-        reg_id = str(row[1])
-        if cat_id not in registri_per_categoria:
-            registri_per_categoria[cat_id] = []
-        registri_per_categoria[cat_id].append(reg_id)
-    
-    # Costruisci risposta categorie
-    result = []
-    for cat in categorie:
-        cat_id = str(cat[0])
-        result.append({
-            "id": cat_id,
-            "nome": cat[1],
-            "parent_id": str(cat[2]) if cat[2] else None,
-            "tipo": cat[3],
-            "registri_abilitati": registri_per_categoria.get(cat_id, [])
-        })
+    # Categorie dalla cache dell'albero (nessuna query a regime)
+    albero = albero_categorie(db, ente_id)
+    result = [
+        {
+            "id": cat["id"],
+            "nome": cat["descrizione"],
+            "parent_id": cat["parent_id"],
+            "tipo": cat["tipo"],
+            "registri_abilitati": cat["registri_abilitati"]
+        }
+        for cat in albero.categorie
+        if not cat["is_sistema"]
+    ]
     
     # Query conti
     query_conti = """
@@ -618,16 +626,22 @@ def get_categorie(
         "categorie": result
     }
 
+# Versione del layout del PDF del piano dei conti (chiave della cache PDF):
+# da incrementare quando cambia la sua impaginazione
+_VERSIONE_PDF_PIANO_CONTI = "1"
+
 @router.get("/categorie/stampa-pdf")
 def stampa_piano_conti_pdf(
     livelli: str = "1,2,3",
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-    x_ente_id: str = Header(None, alias="X-Ente-Id")
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
 ):
     """
     Genera PDF del piano dei conti filtrato per livelli.
     livelli: stringa con livelli da includere es. "1" o "1,2" o "1,2,3"
+    Il PDF è riusato dalla cache finché categorie, ente e data non cambiano.
     """
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -636,7 +650,6 @@ def stampa_piano_conti_pdf(
     from reportlab.lib.enums import TA_LEFT, TA_CENTER
     from reportlab.lib import colors
     from io import BytesIO
-    from fastapi.responses import StreamingResponse
     import datetime
 
     ente_id = current_user.get('ente_id') or x_ente_id
@@ -654,48 +667,16 @@ def stampa_piano_conti_pdf(
     ).fetchone()
     nome_ente = ente_row[0] if ente_row else "Parrocchia"
 
-    # Recupera TUTTE le categorie (l'albero viene costruito in Python)
-    query = text("""
-        SELECT id, codice, descrizione, livello,
-               COALESCE(categoria_padre_id, conto_padre_id) as parent_id
-        FROM piano_conti
-        WHERE ente_id = :ente_id
-          AND (is_sistema = FALSE OR is_sistema IS NULL)
-          AND attivo = TRUE
-        ORDER BY codice
-    """)
-    righe = db.execute(query, {"ente_id": ente_id}).fetchall()
-
-    # Costruisci albero gerarchico in Python
-    from collections import defaultdict
-
-    nodi = {}
-    figli = defaultdict(list)
-    for row in righe:
-        cat_id = str(row[0])
-        nodi[cat_id] = {
-            "id": cat_id,
-            "codice": row[1] or "",
-            "descrizione": row[2] or "",
-            "livello": row[3] or 1,
-            "parent_id": str(row[4]) if row[4] else None
-        }
-
-    for cat_id, cat in nodi.items():
-        figli[cat.get("parent_id")].append(cat)
-
-    # Ordinamento naturale: splitta per "." e confronta ogni segmento come intero
-    def sort_key(cat):
-        codice = cat["codice"]
-        try:
-            return [int(p) for p in codice.split(".")]
-        except (ValueError, AttributeError):
-            return [999999]
+    # Albero delle categorie dalla cache (figli già in ordine naturale)
+    albero = albero_categorie(db, ente_id)
 
     # Visita ricorsiva dell'albero: padre → figli ordinati
+    # (categorie di sistema o disattivate escluse con tutto il sottoalbero)
     def walk(parent_id=None):
         risultato = []
-        for cat in sorted(figli.get(parent_id, []), key=sort_key):
+        for cat in albero.figli.get(parent_id, []):
+            if cat["is_sistema"] or not cat["attivo"]:
+                continue
             if cat["livello"] in livelli_lista:
                 risultato.append(cat)
             risultato.extend(walk(cat["id"]))
@@ -703,6 +684,21 @@ def stampa_piano_conti_pdf(
 
     categorie_ordinate = walk(None)
 
+    # Stesso contenuto → PDF dalla cache (la data di stampa è nel documento)
+    oggi = datetime.date.today()
+    chiave = cache_pdf.impronta(
+        "piano_conti",
+        {
+            "ente": nome_ente,
+            "data": oggi.isoformat(),
+            "categorie": [(c["codice"], c["descrizione"], c["livello"]) for c in categorie_ordinate],
+        },
+        versione=_VERSIONE_PDF_PIANO_CONTI
+    )
+    percorso = cache_pdf.leggi(chiave)
+    if percorso is not None:
+        return cache_pdf.risposta_pdf(percorso, chiave, "piano_conti.pdf", if_none_match)
+
     # Genera PDF
     buffer = BytesIO()
     doc = SimpleDocTemplate(
@@ -763,7 +759,7 @@ def stampa_piano_conti_pdf(
     elements.append(Paragraph(nome_ente, style_titolo))
     elements.append(Paragraph("Piano dei Conti", style_titolo))
     elements.append(Paragraph(
-        f"Stampato il {datetime.date.today().strftime('%d/%m/%Y')}",
+        f"Stampato il {oggi.strftime('%d/%m/%Y')}",
         style_sottotitolo
     ))
     elements.append(Spacer(1, 0.5*cm))
@@ -777,15 +773,9 @@ def stampa_piano_conti_pdf(
         elements.append(Paragraph(testo, style))
 
     doc.build(elements)
-    buffer.seek(0)
 
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": "attachment; filename=piano_conti.pdf"
-        }
-    )
+    percorso = cache_pdf.salva(chiave, buffer.getvalue())
+    return cache_pdf.risposta_pdf(percorso, chiave, "piano_conti.pdf", if_none_match)
 
 @router.post("/categorie")
 def create_categoria(
@@ -900,6 +890,7 @@ def create_categoria(
     )
     
     db.commit()
+    invalida_categorie(ente_id)
     return {"id": categoria_id, "message": "Categoria creata"}
 
 @router.put("/categorie/{categoria_id}")
@@ -971,6 +962,7 @@ def update_categoria(
     )
     
     db.commit()
+    invalida_categorie(ente_id)
     return {"message": "Categoria aggiornata"}
 
 @router.delete("/categorie/{categoria_id}")
@@ -989,40 +981,14 @@ def delete_categoria(
     if check_sistema and check_sistema[0]:
         raise HTTPException(403, detail="Impossibile eliminare categoria di sistema")
 
-    # Raccogli tutti gli id da controllare (categoria + figli + nipoti)
-    ids_da_controllare = [categoria_id]
-
-    cat_info = db.execute(text("""
-        SELECT livello FROM piano_conti WHERE id = :id
-    """), {"id": categoria_id}).fetchone()
-
-    if cat_info:
-        if cat_info[0] == 1:
-            figli_l2 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_l2 = [str(r[0]) for r in figli_l2]
-            ids_da_controllare.extend(ids_l2)
-            if ids_l2:
-                ids_l2_str = ", ".join([f"'{i}'" for i in ids_l2])
-                figli_l3 = db.execute(text(f"""
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN ({ids_l2_str})
-                """)).fetchall()
-            else:
-                figli_l3 = []
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
-        elif cat_info[0] == 2:
-            figli_l3 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
+    # Categoria + tutte le sottocategorie, a qualsiasi livello
+    ids_da_controllare = discendenti_categorie(db, [categoria_id]) or [categoria_id]
 
     # Conta movimenti abbinati a tutti i livelli
-    placeholders = ", ".join([f"'{i}'" for i in ids_da_controllare])
-    check = db.execute(text(f"""
+    check = db.execute(text("""
         SELECT COUNT(*) FROM movimenti_contabili
-        WHERE categoria_id IN ({placeholders})
-    """)).fetchone()
+        WHERE categoria_id = ANY(CAST(:ids AS uuid[]))
+    """), {"ids": ids_da_controllare}).fetchone()
 
     if check[0] > 0:
         raise HTTPException(
@@ -1035,15 +1001,8 @@ def delete_categoria(
         )
 
     dati_precedenti = get_record_data(db, "piano_conti", categoria_id)
-    # Elimina in ordine: associazioni registri, figli, categoria
-    if len(ids_da_controllare) > 1:
-        for id_figlio in reversed(ids_da_controllare[1:]):
-            db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": id_figlio})
-            db.execute(text("DELETE FROM piano_conti WHERE id = :id"), {"id": id_figlio})
-    db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": categoria_id})
-    db.execute(text("DELETE FROM piano_conti WHERE id = :id AND ente_id = :ente_id"), {
-        "id": categoria_id, "ente_id": ente_id
-    })
+    # Elimina associazioni registri, poi categoria e sottocategorie
+    elimina_categorie(db, ids_da_controllare, ente_id)
     registra_audit(
         db=db,
         azione="DELETE",
@@ -1056,6 +1015,7 @@ def delete_categoria(
         descrizione="Eliminazione categoria"
     )
     db.commit()
+    invalida_categorie(ente_id)
     return {"message": "Categoria eliminata"}
 
 @router.get("/categorie/{categoria_id}/movimenti-abbinati")
@@ -1067,43 +1027,17 @@ def get_movimenti_abbinati(
 ):
     ente_id = current_user.get('ente_id') or x_ente_id
 
-    # Raccogli tutti gli id (categoria + figli + nipoti)
-    ids_da_controllare = [categoria_id]
-
-    cat_info = db.execute(text("""
-        SELECT livello FROM piano_conti WHERE id = :id
-    """), {"id": categoria_id}).fetchone()
+    # Categoria + tutte le sottocategorie, a qualsiasi livello
+    ids_da_controllare = discendenti_categorie(db, [categoria_id]) or [categoria_id]
 
-    if cat_info:
-        if cat_info[0] == 1:
-            figli_l2 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_l2 = [str(r[0]) for r in figli_l2]
-            ids_da_controllare.extend(ids_l2)
-            if ids_l2:
-                ids_l2_str = ", ".join([f"'{i}'" for i in ids_l2])
-                figli_l3 = db.execute(text(f"""
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN ({ids_l2_str})
-                """)).fetchall()
-            else:
-                figli_l3 = []
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
-        elif cat_info[0] == 2:
-            figli_l3 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
-
-    placeholders = ", ".join([f"'{i}'" for i in ids_da_controllare])
-    movimenti = db.execute(text(f"""
+    movimenti = db.execute(text("""
         SELECT m.id, m.data_movimento, m.importo, m.tipo_movimento,
                m.descrizione, m.causale, r.nome as registro_nome, m.categoria_id
         FROM movimenti_contabili m
         LEFT JOIN registri_contabili r ON m.registro_id = r.id
-        WHERE m.categoria_id IN ({placeholders})
+        WHERE m.categoria_id = ANY(CAST(:ids AS uuid[]))
         ORDER BY m.data_movimento DESC
-    """)).fetchall()
+    """), {"ids": ids_da_controllare}).fetchall()
 
     return {
         "count": len(movimenti),
@@ -1139,38 +1073,13 @@ def elimina_categoria_con_riassegnazione(
     if check_sistema and check_sistema[0]:
         raise HTTPException(403, detail="Impossibile eliminare categoria di sistema")
 
-    # Raccogli tutti gli id figli
-    ids_da_controllare = [categoria_id]
-    cat_info = db.execute(text("""
-        SELECT livello FROM piano_conti WHERE id = :id
-    """), {"id": categoria_id}).fetchone()
-
-    if cat_info:
-        if cat_info[0] == 1:
-            figli_l2 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_l2 = [str(r[0]) for r in figli_l2]
-            ids_da_controllare.extend(ids_l2)
-            if ids_l2:
-                ids_l2_str = ", ".join([f"'{i}'" for i in ids_l2])
-                figli_l3 = db.execute(text(f"""
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN ({ids_l2_str})
-                """)).fetchall()
-            else:
-                figli_l3 = []
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
-        elif cat_info[0] == 2:
-            figli_l3 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
+    # Categoria + tutte le sottocategorie, a qualsiasi livello
+    ids_da_controllare = discendenti_categorie(db, [categoria_id]) or [categoria_id]
 
     # Verifica che tutte le riassegnazioni siano valide
-    placeholders = ", ".join([f"'{i}'" for i in ids_da_controllare])
-    movimenti_da_riassegnare = db.execute(text(f"""
-        SELECT id FROM movimenti_contabili WHERE categoria_id IN ({placeholders})
-    """)).fetchall()
+    movimenti_da_riassegnare = db.execute(text("""
+        SELECT id FROM movimenti_contabili WHERE categoria_id = ANY(CAST(:ids AS uuid[]))
+    """), {"ids": ids_da_controllare}).fetchall()
 
     ids_movimenti = {str(m[0]) for m in movimenti_da_riassegnare}
     ids_riassegnati = {r["movimento_id"] for r in riassegnazioni}
@@ -1189,14 +1098,7 @@ def elimina_categoria_con_riassegnazione(
 
         # Elimina figli poi categoria
         dati_precedenti = get_record_data(db, "piano_conti", categoria_id)
-        if len(ids_da_controllare) > 1:
-            for id_figlio in reversed(ids_da_controllare[1:]):
-                db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": id_figlio})
-                db.execute(text("DELETE FROM piano_conti WHERE id = :id"), {"id": id_figlio})
-        db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": categoria_id})
-        db.execute(text("DELETE FROM piano_conti WHERE id = :id AND ente_id = :ente_id"), {
-            "id": categoria_id, "ente_id": ente_id
-        })
+        elimina_categorie(db, ids_da_controllare, ente_id)
         registra_audit(
             db=db,
             azione="DELETE",
@@ -1209,6 +1111,7 @@ def elimina_categoria_con_riassegnazione(
             descrizione=f"Eliminazione categoria con riassegnazione di {len(riassegnazioni)} movimenti"
         )
         db.commit()
+        invalida_categorie(ente_id)
         return {"message": "Categoria eliminata e movimenti riassegnati"}
     except HTTPException:
         raise
@@ -1232,49 +1135,18 @@ def elimina_categoria_con_movimenti(
     if check_sistema and check_sistema[0]:
         raise HTTPException(403, detail="Impossibile eliminare categoria di sistema")
 
-    # Raccogli tutti gli id (categoria + figli + nipoti)
-    ids_da_controllare = [categoria_id]
-    cat_info = db.execute(text("""
-        SELECT livello FROM piano_conti WHERE id = :id
-    """), {"id": categoria_id}).fetchone()
-
-    if cat_info:
-        if cat_info[0] == 1:
-            figli_l2 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_l2 = [str(r[0]) for r in figli_l2]
-            ids_da_controllare.extend(ids_l2)
-            if ids_l2:
-                ids_l2_str = ", ".join([f"'{i}'" for i in ids_l2])
-                figli_l3 = db.execute(text(f"""
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN ({ids_l2_str})
-                """)).fetchall()
-                ids_da_controllare.extend([str(r[0]) for r in figli_l3])
-        elif cat_info[0] == 2:
-            figli_l3 = db.execute(text("""
-                SELECT id FROM piano_conti WHERE categoria_padre_id = :id
-            """), {"id": categoria_id}).fetchall()
-            ids_da_controllare.extend([str(r[0]) for r in figli_l3])
+    # Categoria + tutte le sottocategorie, a qualsiasi livello
+    ids_da_controllare = discendenti_categorie(db, [categoria_id]) or [categoria_id]
 
     try:
-        placeholders = ", ".join([f"'{i}'" for i in ids_da_controllare])
-
         # Elimina tutti i movimenti abbinati
-        db.execute(text(f"""
-            DELETE FROM movimenti_contabili WHERE categoria_id IN ({placeholders})
-        """))
+        db.execute(text("""
+            DELETE FROM movimenti_contabili WHERE categoria_id = ANY(CAST(:ids AS uuid[]))
+        """), {"ids": ids_da_controllare})
 
         # Elimina figli poi categoria
         dati_precedenti = get_record_data(db, "piano_conti", categoria_id)
-        if len(ids_da_controllare) > 1:
-            for id_figlio in reversed(ids_da_controllare[1:]):
-                db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": id_figlio})
-                db.execute(text("DELETE FROM piano_conti WHERE id = :id"), {"id": id_figlio})
-        db.execute(text("DELETE FROM categorie_registri WHERE categoria_id = :id"), {"id": categoria_id})
-        db.execute(text("DELETE FROM piano_conti WHERE id = :id AND ente_id = :ente_id"), {
-            "id": categoria_id, "ente_id": ente_id
-        })
+        elimina_categorie(db, ids_da_controllare, ente_id)
         registra_audit(
             db=db,
             azione="DELETE",
@@ -1287,6 +1159,7 @@ def elimina_categoria_con_movimenti(
             descrizione="Eliminazione categoria con tutti i movimenti abbinati"
         )
         db.commit()
+        invalida_categorie(ente_id)
         return {"message": "Categoria e movimenti eliminati"}
     except HTTPException:
         raise
@@ -1303,6 +1176,7 @@ def toggle_registro(
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
     """Abilita/disabilita associazione registro-categoria"""
+    ente_id = current_user.get('ente_id') or x_ente_id
     registro_id = data["registro_id"]
     enabled = data["enabled"]
     
@@ -1321,6 +1195,7 @@ def toggle_registro(
         """), {"cat_id": categoria_id, "reg_id": registro_id})
     
     db.commit()
+    invalida_categorie(ente_id)
     return {"message": "Aggiornato"}
 
 # ============================================
@@ -1335,7 +1210,9 @@ def get_movimenti_generali(
     registro_id: str = Query(None),
     data_da: date = Query(None),
     data_a: date = Query(None),
-    tipo: str = Query(None)
+    tipo: str = Query(None),
+    cursore: str = Query(None),
+    limite: int = Query(None, ge=1, le=MOVIMENTI_PAGINA_MAX)
 ):
     """
     Lista movimenti generali con filtri opzionali.
@@ -1345,96 +1222,170 @@ def get_movimenti_generali(
     - data_da/data_a: intervallo date
     - tipo: 'entrata' o 'uscita'
     
-    Restituisce i movimenti con categoria completa e saldo progressivo.
-    """
-    ente_id = current_user.get('ente_id') or x_ente_id
+    Paginazione (opzionale):
+    - limite: movimenti per pagina (senza limite né cursore: tutti, in
+      ordine cronologico; con la paginazione dal più recente)
+    - cursore: valore di 'cursore_successivo' della pagina precedente
     
-    query = """
-    SELECT 
-        m.id,
-        m.data_movimento,
-        m.tipo_movimento,
-        m.importo,
-        m.descrizione,
-        m.note,
-        m.allegati,
-        m.bloccato,
-        m.tipo_speciale,
-        r.nome as conto_nome,
-        r.id as registro_id,
-        c.id as categoria_id,
-        c.descrizione as categoria_nome,
-        c.categoria_padre_id,
-        m.created_at,
-        m.riporto_saldo
-    FROM movimenti_contabili m
-        LEFT JOIN registri_contabili r ON m.registro_id = r.id
-        LEFT JOIN piano_conti c ON m.categoria_id = c.id
-        WHERE m.ente_id = :ente_id
+    Restituisce i movimenti con categoria completa e saldo progressivo
+    (calcolato in SQL per conto); i totali riguardano tutti i movimenti
+    filtrati, non solo la pagina, e sono calcolati solo per la prima
+    pagina (null con il cursore).
     """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    if cursore and not limite:
+        limite = MOVIMENTI_PAGINA
     
-    params = {"ente_id": ente_id}
-    
-    # Applica filtri
-    if registro_id:
-        query += " AND m.registro_id = :registro_id"
-        params["registro_id"] = registro_id
-    
-    if data_da:
-        query += " AND m.data_movimento >= :data_da"
-        params["data_da"] = data_da
-    
-    if data_a:
-        query += " AND m.data_movimento <= :data_a"
-        params["data_a"] = data_a
-    
-    if tipo:
-        query += " AND m.tipo_movimento = :tipo"
-        params["tipo"] = tipo
-    
-    query += " ORDER BY m.data_movimento DESC, m.created_at DESC"
+    try:
+        pagina = pagina_movimenti(
+            db, ente_id, registro_id=registro_id, data_da=data_da, data_a=data_a,
+            tipo=tipo, cursore=cursore, limite=limite, crescente=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    movimenti = db.execute(text(query), params).fetchall()
+    # Percorsi completi delle categorie (cache dell'albero)
+    percorsi = albero_categorie(db, ente_id).percorsi
     
     # Costruisci risposta con categoria completa
     movimenti_list = []
-    for mov in movimenti:
-        # Costruisci gerarchia categoria
-        categoria_completa = build_categoria_completa(db, mov[11], mov[12], mov[13])
-        
+    for mov, saldo_progressivo in pagina["righe"]:
         movimenti_list.append({
-             "id": str(mov[0]),
-             "data_movimento": mov[1].isoformat() if mov[1] else None,
-             "tipo_movimento": mov[2],
-             "importo": float(mov[3]) if mov[3] else 0,
-             "descrizione": mov[4],
-             "note": mov[5],
-             "allegati": mov[6] or [],
-             "bloccato": mov[7],
-             "tipo_speciale": mov[8],
-             "conto_nome": mov[9],
-             "registro_id": str(mov[10]) if mov[10] else None,
-             "categoria_id": str(mov[11]) if mov[11] else None,
-             "categoria_completa": categoria_completa,
-             "created_at": mov[14].isoformat() if mov[14] else None,
-             "riporto_saldo": mov[15] if mov[15] else False
+             "id": str(mov.id),
+             "data_movimento": mov.data_movimento.isoformat() if mov.data_movimento else None,
+             "tipo_movimento": mov.tipo_movimento,
+             "importo": float(mov.importo) if mov.importo else 0,
+             "descrizione": mov.descrizione,
+             "note": mov.note,
+             "allegati": mov.allegati or [],
+             "bloccato": mov.bloccato,
+             "tipo_speciale": mov.tipo_speciale,
+             "conto_nome": mov.conto_nome,
+             "registro_id": str(mov.registro_id) if mov.registro_id else None,
+             "categoria_id": str(mov.categoria_id) if mov.categoria_id else None,
+             "categoria_completa": build_categoria_completa(percorsi, mov.categoria_id, mov.categoria_nome),
+             "saldo_progressivo": round(float(saldo_progressivo), 2),
+             "created_at": mov.created_at.isoformat() if mov.created_at else None,
+             "riporto_saldo": mov.riporto_saldo if mov.riporto_saldo else False
         })
     
-    # Calcola saldo progressivo per ogni conto
-    movimenti_con_saldo = calcola_saldo_progressivo(movimenti_list)
-    
-    # Calcola totali (solo movimenti non bloccati)
-    totale_entrate = sum(m['importo'] for m in movimenti_con_saldo
-                         if m['tipo_movimento'] == TipoMovimento.ENTRATA and not m.get('bloccato'))
-    totale_uscite = sum(m['importo'] for m in movimenti_con_saldo
-                        if m['tipo_movimento'] == TipoMovimento.USCITA and not m.get('bloccato'))
-    saldo = totale_entrate - totale_uscite
+    # Totali (solo movimenti non bloccati) dalla query aggregata della prima pagina
+    totale_entrate = totale_uscite = saldo = None
+    if pagina["totali"] is not None:
+        totale_entrate = float(sum(t["entrate"] for t in pagina["totali"].values()))
+        totale_uscite = float(sum(t["uscite"] for t in pagina["totali"].values()))
+        saldo = totale_entrate - totale_uscite
 
     return {
-        "movimenti": movimenti_con_saldo,
+        "movimenti": movimenti_list,
         "totale_entrate": totale_entrate,
         "totale_uscite": totale_uscite,
-        "saldo": saldo
+        "saldo": saldo,
+        "cursore_successivo": pagina["cursore_successivo"]
+    }
+
+@router.get("/movimenti/export")
+def export_movimenti(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    formato: str = Query("csv"),
+    registro_id: str = Query(None),
+    data_da: date = Query(None),
+    data_a: date = Query(None),
+    tipo: str = Query(None)
+):
+    """
+    Esporta i movimenti in CSV o XLSX, con gli stessi filtri di GET /movimenti.
+
+    Le righe sono lette con un cursore lato server e inviate in streaming:
+    la memoria usata non dipende dal numero di movimenti. Con registro_id
+    l'export contiene anche il saldo progressivo del conto.
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    formato = formato.lower()
+    if formato not in FORMATI_EXPORT:
+        raise HTTPException(status_code=400, detail="Formato non supportato (csv o xlsx)")
+
+    nome_file = "movimenti"
+    if registro_id:
+        conto = db.execute(
+            text("SELECT nome FROM registri_contabili WHERE id = :id AND ente_id = :ente_id"),
+            {"id": registro_id, "ente_id": ente_id}
+        ).fetchone()
+        if not conto:
+            raise HTTPException(status_code=404, detail="Conto non trovato")
+        nome_file += "_" + "".join(c if c.isascii() and c.isalnum() else "_" for c in conto[0]).strip("_").lower()
+
+    percorsi = albero_categorie(db, ente_id).percorsi
+    colonne = colonne_export(con_saldo=bool(registro_id))
+    righe = righe_movimenti(ente_id, percorsi, registro_id, data_da, data_a, tipo)
+    contenuto = csv_in_streaming(colonne, righe) if formato == "csv" else xlsx_in_streaming(colonne, righe)
+
+    return StreamingResponse(
+        contenuto,
+        media_type=FORMATI_EXPORT[formato],
+        headers={"Content-Disposition": f"attachment; filename={nome_file}_{date.today().isoformat()}.{formato}"}
+    )
+
+@router.get("/movimenti/cerca")
+def cerca_movimenti_testo(
+    q: str = Query(..., description="Testo da cercare in descrizione, causale, note e importo"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    registro_id: str = Query(None),
+    categoria_id: str = Query(None),
+    data_da: date = Query(None),
+    data_a: date = Query(None),
+    tipo: str = Query(None),
+    pagina: int = Query(1, ge=1),
+    per_pagina: int = Query(RICERCA_PAGINA, ge=1, le=RICERCA_PAGINA_MAX)
+):
+    """
+    Ricerca testuale nei movimenti, dal più rilevante.
+    
+    - parole intere con radici italiane, "frasi" e -esclusioni
+    - parti di parola e importi (es. "matrim", "150,50")
+    - filtri: registro_id, categoria_id (con sottocategorie), data_da/data_a, tipo
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    if not ente_id:
+        raise HTTPException(status_code=400, detail="Ente ID mancante")
+
+    try:
+        risultato = cerca_movimenti(
+            db, ente_id, q, registro_id=registro_id, categoria_id=categoria_id,
+            data_da=data_da, data_a=data_a, tipo=tipo, pagina=pagina, per_pagina=per_pagina
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    percorsi = albero_categorie(db, ente_id).percorsi
+
+    return {
+        "movimenti": [
+            {
+                "id": str(mov.id),
+                "data_movimento": mov.data_movimento.isoformat() if mov.data_movimento else None,
+                "tipo_movimento": mov.tipo_movimento,
+                "importo": float(mov.importo) if mov.importo else 0,
+                "descrizione": mov.descrizione,
+                "causale": mov.causale,
+                "note": mov.note,
+                "bloccato": mov.bloccato,
+                "tipo_speciale": mov.tipo_speciale,
+                "conto_nome": mov.conto_nome,
+                "registro_id": str(mov.registro_id) if mov.registro_id else None,
+                "categoria_id": str(mov.categoria_id) if mov.categoria_id else None,
+                "categoria_completa": build_categoria_completa(percorsi, mov.categoria_id, mov.categoria_nome),
+                "rilevanza": round(float(mov.rilevanza), 4)
+            }
+            for mov in risultato["risultati"]
+        ],
+        "pagina": risultato["pagina"],
+        "per_pagina": risultato["per_pagina"],
+        "ha_successivi": risultato["ha_successivi"]
     }
 
 @router.get("/movimenti/conto/{registro_id}")
@@ -1442,13 +1393,17 @@ def get_movimenti_conto(
     registro_id: str,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-    x_ente_id: str = Header(None, alias="X-Ente-Id")
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    cursore: str = Query(None),
+    limite: int = Query(None, ge=1, le=MOVIMENTI_PAGINA_MAX)
 ):
     """
     Lista movimenti di un singolo conto con saldo progressivo.
     
-    I movimenti sono ordinati cronologicamente e il saldo progressivo
-    viene calcolato in tempo reale (entrate - uscite).
+    Il saldo progressivo è calcolato in SQL (entrate - uscite, esclusi i
+    movimenti bloccati). Senza paginazione i movimenti sono in ordine
+    cronologico; con limite/cursore dal più recente, come in
+    get_movimenti_generali (totali e saldo solo nella prima pagina).
     """
     ente_id = current_user.get('ente_id') or x_ente_id
     
@@ -1459,73 +1414,54 @@ def get_movimenti_conto(
     if not conto:
         raise HTTPException(status_code=404, detail="Conto non trovato")
     
-    # Query movimenti
-    query = """
-        SELECT
-            m.id,
-            m.data_movimento,
-            m.tipo_movimento,
-            m.importo,
-            m.descrizione,
-            m.note,
-            m.allegati,
-            m.bloccato,
-            m.tipo_speciale,
-            c.id as categoria_id,
-            c.descrizione as categoria_nome,
-            c.categoria_padre_id,
-            m.created_at,
-            m.riporto_saldo
-        FROM movimenti_contabili m
-        LEFT JOIN piano_conti c ON m.categoria_id = c.id
-        WHERE m.ente_id = :ente_id AND m.registro_id = :registro_id
-        ORDER BY m.data_movimento ASC, m.created_at ASC
-    """
+    if cursore and not limite:
+        limite = MOVIMENTI_PAGINA
+    
+    try:
+        pagina = pagina_movimenti(
+            db, ente_id, registro_id=registro_id, cursore=cursore, limite=limite, crescente=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    movimenti = db.execute(text(query), {"ente_id": ente_id, "registro_id": registro_id}).fetchall()
+    percorsi = albero_categorie(db, ente_id).percorsi
     
-    # Costruisci lista con saldo progressivo
     movimenti_list = []
-    saldo_progressivo = 0
-    
-    for mov in movimenti:
-        categoria_completa = build_categoria_completa(db, mov[9], mov[10], mov[11])
-        
-        # Calcola saldo progressivo SOLO per movimenti NON bloccati
-        if not mov[7]:  # mov[7] = bloccato
-            if mov[2] == TipoMovimento.ENTRATA:
-                saldo_progressivo += float(mov[3])
-            else:
-                saldo_progressivo -= float(mov[3])
-        
+    for mov, saldo_progressivo in pagina["righe"]:
         movimenti_list.append({
-            "id": str(mov[0]),
-            "data_movimento": mov[1].isoformat() if mov[1] else None,
-            "tipo_movimento": mov[2],
-            "importo": float(mov[3]) if mov[3] else 0,
-            "descrizione": mov[4],
-            "note": mov[5],
-            "allegati": mov[6] or [],
-            "bloccato": mov[7],
-            "tipo_speciale": mov[8],
-            "categoria_id": str(mov[9]) if mov[9] else None,
-            "categoria_completa": categoria_completa,
-            "saldo_progressivo": round(saldo_progressivo, 2),
-            "created_at": mov[12].isoformat() if mov[12] else None,
-            "riporto_saldo": mov[13] if mov[13] else False
+            "id": str(mov.id),
+            "data_movimento": mov.data_movimento.isoformat() if mov.data_movimento else None,
+            "tipo_movimento": mov.tipo_movimento,
+            "importo": float(mov.importo) if mov.importo else 0,
+            "descrizione": mov.descrizione,
+            "note": mov.note,
+            "allegati": mov.allegati or [],
+            "bloccato": mov.bloccato,
+            "tipo_speciale": mov.tipo_speciale,
+            "categoria_id": str(mov.categoria_id) if mov.categoria_id else None,
+            "categoria_completa": build_categoria_completa(percorsi, mov.categoria_id, mov.categoria_nome),
+            "saldo_progressivo": round(float(saldo_progressivo), 2),
+            "created_at": mov.created_at.isoformat() if mov.created_at else None,
+            "riporto_saldo": mov.riporto_saldo if mov.riporto_saldo else False
         })
     
-    # Calcola totali (solo movimenti non bloccati)
-    totale_entrate = sum(m['importo'] for m in movimenti_list if m['tipo_movimento'] == TipoMovimento.ENTRATA and not m['bloccato'])
-    totale_uscite = sum(m['importo'] for m in movimenti_list if m['tipo_movimento'] == TipoMovimento.USCITA and not m['bloccato'])
+    # Totali (solo movimenti non bloccati) dalla query aggregata della prima pagina
+    saldo_attuale = totale_entrate = totale_uscite = saldo = None
+    if pagina["totali"] is not None:
+        totali = pagina["totali"].get(str(registro_id), {})
+        saldo_attuale = round(float(totali.get("saldo", 0)), 2)
+        totale_entrate = float(totali.get("entrate", 0))
+        totale_uscite = float(totali.get("uscite", 0))
+        saldo = totale_entrate - totale_uscite
     
     return {
         "conto_nome": conto[0],
-        "saldo_attuale": round(saldo_progressivo, 2),
+        "saldo_attuale": saldo_attuale,
         "movimenti": movimenti_list,
         "totale_entrate": totale_entrate,
         "totale_uscite": totale_uscite,
-        "saldo": totale_entrate - totale_uscite
+        "saldo": saldo,
+        "cursore_successivo": pagina["cursore_successivo"]
     }
 
 @router.post("/movimenti")
@@ -1704,9 +1640,11 @@ def create_giroconto(
         
         if categoria_result:
             categoria_giroconto_id = str(categoria_result[0])
+            categoria_creata = False
         else:
             # Crea categoria di sistema
             categoria_giroconto_id = str(uuid.uuid4())
+            categoria_creata = True
             db.execute(text("""
                 INSERT INTO piano_conti (id, ente_id, codice, descrizione, tipo, is_sistema, livello)
                 VALUES (:id, :ente_id, 'GIR', 'Giroconto', 'economico', TRUE, 1)
@@ -1825,7 +1763,8 @@ def create_giroconto(
         )
         
         db.commit()
-        
+        if categoria_creata:
+            invalida_categorie(ente_id)
         
         return {
             "message": "Giroconto creato con successo",
@@ -2006,7 +1945,7 @@ def delete_movimento(
 # ============================================
 
 @router.post("/movimenti/{movimento_id}/allegati")
-async def carica_allegato(
+def carica_allegato(
     movimento_id: str,
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user),
@@ -2036,7 +1975,7 @@ async def carica_allegato(
             )
         
         # Leggi e verifica dimensione
-        contents = await file.read()
+        contents = file.file.read()
         file_size = len(contents)
         
         if file_size > MAX_FILE_SIZE:
@@ -2108,7 +2047,7 @@ async def carica_allegato(
         raise HTTPException(status_code=500, detail=f"Errore caricamento: {str(e)}")
 
 @router.get("/movimenti/{movimento_id}/allegati")
-async def lista_allegati(
+def lista_allegati(
     movimento_id: str,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2143,7 +2082,7 @@ async def lista_allegati(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/allegati/{allegato_id}/download")
-async def scarica_allegato(
+def scarica_allegato(
     allegato_id: str,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2184,7 +2123,7 @@ async def scarica_allegato(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/allegati/{allegato_id}")
-async def elimina_allegato(
+def elimina_allegato(
     allegato_id: str,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2228,7 +2167,7 @@ async def elimina_allegato(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/movimenti/{movimento_id}/allegati/count")
-async def conta_allegati(
+def conta_allegati(
     movimento_id: str,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2253,7 +2192,7 @@ async def conta_allegati(
 # ============================================
 
 @router.post("/report")
-async def genera_report(
+def genera_report(
     data: dict,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
@@ -2267,6 +2206,10 @@ async def genera_report(
     - contiSelezionati: array ID conti
     - categorieSelezionate: array ID categorie
     - tipiMovimento: {entrate: bool, uscite: bool}
+
+    - dettaglio (default true): include l'elenco dei movimenti, inviato
+      in streaming; con false solo il riepilogo (totali per categoria ai
+      tre livelli, per conto e complessivi), calcolato in una query
     """
     try:
         ente_id = current_user.get('ente_id') or x_ente_id or data.get('ente_id')
@@ -2282,157 +2225,12 @@ async def genera_report(
         """)
         ente = db.execute(ente_query, {"ente_id": ente_id}).fetchone()
         
-        # Estrai filtri
-        data_inizio = data.get('dataInizio')
-        data_fine = data.get('dataFine')
-        conti_sel = data.get('contiSelezionati', [])
-        cat_sel = data.get('categorieSelezionate', [])
-        tipi_mov = data.get('tipiMovimento', {'entrate': True, 'uscite': True})
+        filtri = filtri_report(data)
+        albero = albero_categorie(db, ente_id)
+        riepilogo = riepilogo_report(db, ente_id, filtri, albero)
+        conti_sel = filtri["conti"]
         
-        # Query movimenti con gerarchia completa categorie
-        query = """
-            SELECT
-                m.id, m.data_movimento, m.causale, m.importo, m.tipo_movimento,
-                r.nome as conto_nome,
-                c.descrizione as categoria_nome,
-                c.id as categoria_id,
-                cp.descrizione as categoria_padre_nome,
-                cp.id as categoria_padre_id,
-                cpp.descrizione as categoria_nonno_nome,
-                cpp.id as categoria_nonno_id
-            FROM movimenti_contabili m
-            LEFT JOIN registri_contabili r ON m.registro_id = r.id
-            LEFT JOIN piano_conti c ON m.categoria_id = c.id
-            LEFT JOIN piano_conti cp ON c.categoria_padre_id = cp.id
-            LEFT JOIN piano_conti cpp ON cp.categoria_padre_id = cpp.id
-            WHERE m.ente_id = :ente_id
-              AND (m.riporto_saldo IS NULL OR m.riporto_saldo = FALSE)
-        """
-        
-        params = {"ente_id": ente_id}
-        
-        if data_inizio:
-            query += " AND m.data_movimento >= :data_inizio"
-            params["data_inizio"] = data_inizio
-        
-        if data_fine:
-            query += " AND m.data_movimento <= :data_fine"
-            params["data_fine"] = data_fine
-        
-        if conti_sel:
-            placeholders = ','.join([f':conto_{i}' for i in range(len(conti_sel))])
-            query += f" AND m.registro_id IN ({placeholders})"
-            for i, conto_id in enumerate(conti_sel):
-                params[f'conto_{i}'] = conto_id
-        
-        if cat_sel:
-            placeholders = ','.join([f':cat_{i}' for i in range(len(cat_sel))])
-            # Include categorie selezionate + tutte le sottocategorie (figli e nipoti)
-            query += f""" AND (
-                m.categoria_id IN ({placeholders})
-                OR m.categoria_id IN (
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN ({placeholders})
-                )
-                OR m.categoria_id IN (
-                    SELECT id FROM piano_conti WHERE categoria_padre_id IN (
-                        SELECT id FROM piano_conti WHERE categoria_padre_id IN ({placeholders})
-                    )
-                )
-            )"""
-            for i, cat_id in enumerate(cat_sel):
-                params[f'cat_{i}'] = cat_id
-        
-        # Filtro tipo movimento
-        tipi = []
-        if tipi_mov.get('entrate'):
-            tipi.append(TipoMovimento.ENTRATA)
-        if tipi_mov.get('uscite'):
-            tipi.append(TipoMovimento.USCITA)
-        
-        if tipi:
-            placeholders = ','.join([f':tipo_{i}' for i in range(len(tipi))])
-            query += f" AND m.tipo_movimento IN ({placeholders})"
-            for i, tipo in enumerate(tipi):
-                params[f'tipo_{i}'] = tipo
-        
-        query += " ORDER BY m.data_movimento DESC, m.created_at DESC"
-        
-        movimenti = db.execute(text(query), params).fetchall()
-        
-        # Calcola totali
-        totale_entrate = sum(float(m[3]) for m in movimenti if m[4] == TipoMovimento.ENTRATA)
-        totale_uscite = sum(float(m[3]) for m in movimenti if m[4] == TipoMovimento.USCITA)
-        
-        # Costruisci risposta
-        movimenti_list = []
-        for m in movimenti:
-           # Determina il livello della categoria del movimento
-            categoria_nome = m[6]
-            categoria_id = str(m[7]) if m[7] else None
-            categoria_padre_nome = m[8]
-            categoria_padre_id = str(m[9]) if m[9] else None
-            categoria_nonno_nome = m[10]
-            categoria_nonno_id = str(m[11]) if m[11] else None
-            
-            # Determina cosa mostrare in base a cosa è stato selezionato
-            gerarchia = "Non categorizzato"
-            
-            if cat_sel:
-                # Verifica quale livello è stato selezionato dall'utente
-                cat_sel_str = [str(c) for c in cat_sel]
-                
-                if categoria_nonno_id and categoria_nonno_id in cat_sel_str:
-                    # Selezionata la categoria nonno (livello 1) → mostra solo nonno
-                    gerarchia = categoria_nonno_nome
-                elif categoria_padre_id and categoria_padre_id in cat_sel_str:
-                    # Selezionata la categoria padre (livello 1 o 2) → mostra fino al padre
-                    if categoria_nonno_nome:
-                        gerarchia = f"{categoria_nonno_nome} > {categoria_padre_nome}"
-                    else:
-                        gerarchia = categoria_padre_nome
-                elif categoria_id and categoria_id in cat_sel_str:
-                    # Selezionata questa categoria specifica → mostra gerarchia completa
-                    if categoria_nonno_nome:
-                        gerarchia = f"{categoria_nonno_nome} > {categoria_padre_nome} > {categoria_nome}"
-                    elif categoria_padre_nome:
-                        gerarchia = f"{categoria_padre_nome} > {categoria_nome}"
-                    else:
-                        gerarchia = categoria_nome
-                else:
-                    # Categoria figlia di una selezionata → mostra la categoria selezionata
-                    # Risali la gerarchia per trovare quella selezionata
-                    if categoria_nonno_id:
-                        gerarchia = categoria_nonno_nome
-                    elif categoria_padre_id:
-                        gerarchia = categoria_padre_nome
-                    else:
-                        gerarchia = categoria_nome
-            else:
-                # Nessun filtro categoria → mostra gerarchia completa
-                if categoria_nonno_nome:
-                    gerarchia = f"{categoria_nonno_nome} > {categoria_padre_nome} > {categoria_nome}"
-                elif categoria_padre_nome:
-                    gerarchia = f"{categoria_padre_nome} > {categoria_nome}"
-                else:
-                    gerarchia = categoria_nome or "Non categorizzato"
-            
-            movimenti_list.append({
-                "id": str(m[0]),
-                "data_movimento": m[1].isoformat() if m[1] else None,
-                "causale": m[2],
-                "importo": float(m[3]),
-                "tipo_movimento": m[4],
-                "conto": m[5],
-                "categoria": categoria_nome or "Non categorizzato",
-                "categoria_id": categoria_id,
-                "categoria_padre": categoria_padre_nome,
-                "categoria_padre_id": categoria_padre_id,
-                "categoria_nonno": categoria_nonno_nome,
-                "categoria_nonno_id": categoria_nonno_id,
-                "gerarchia": gerarchia
-            })
-        
-        return {
+        risposta = {
             "ente": {
                 "denominazione": ente[0] if ente else "",
                 "indirizzo": ente[1] if ente else "",
@@ -2443,12 +2241,21 @@ async def genera_report(
                 "telefono": ente[6] if ente else "",
                 "parroco": ente[7] if ente else ""
             },
-            "movimenti": movimenti_list,
-            "totale_entrate": totale_entrate,
-            "totale_uscite": totale_uscite,
-            "numero_movimenti": len(movimenti_list),
+            "riepilogo": riepilogo,
+            "totale_entrate": riepilogo[TipoMovimento.ENTRATA]["totale"],
+            "totale_uscite": riepilogo[TipoMovimento.USCITA]["totale"],
+            "numero_movimenti": sum(sezione["numero"] for sezione in riepilogo.values()),
             "conto": "TUTTI I CONTI" if not conti_sel else f"{len(conti_sel)} conti selezionati"
         }
+
+        if data.get('dettaglio') is False:
+            return risposta
+
+        # Movimenti per ultimi, letti e serializzati a blocchi
+        return StreamingResponse(
+            json_in_streaming(risposta, "movimenti", movimenti_report(ente_id, filtri, albero)),
+            media_type="application/json"
+        )
         
     except HTTPException:
         raise
@@ -2462,7 +2269,7 @@ async def genera_report(
 # ============================================
 
 @router.get("/economo/rendiconti")
-async def lista_rendiconti_economo(
+def lista_rendiconti_economo(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     stato: str = Query(None),
@@ -2538,8 +2345,9 @@ async def lista_rendiconti_economo(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/economo/rendiconti/{rendiconto_id}/approva")
-async def approva_rendiconto(
+def approva_rendiconto(
     rendiconto_id: str,
+    asincrono: bool = Query(False),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
@@ -2548,6 +2356,8 @@ async def approva_rendiconto(
     
     Stato finale: 'approvato'
     Genera PDF firmato con timbro e firma del Vescovo.
+    Con asincrono=true la firma è applicata dal worker: la risposta
+    contiene job_id e pdf_firmato è impostato al termine del lavoro.
     """
     try:
         
@@ -2577,8 +2387,8 @@ async def approva_rendiconto(
         if not pdf_path:
             raise HTTPException(status_code=400, detail="PDF del rendiconto non trovato")
         
-        # Applica firma digitale
-        pdf_firmato_path = await applica_firma_vescovo(pdf_path)
+        # Applica firma digitale (subito o dal worker)
+        pdf_firmato_path = None if asincrono else applica_firma_vescovo(pdf_path)
         
         # Aggiorna stato
         update_query = text("""
@@ -2596,6 +2406,17 @@ async def approva_rendiconto(
             "pdf_firmato": pdf_firmato_path
         }).fetchone()
         
+        job_id = None
+        if asincrono:
+            job_id = accoda_job(
+                db,
+                TipoJob.FIRMA_RENDICONTO,
+                {"rendiconto_id": rendiconto_id},
+                ente_id=ente_id,
+                utente_id=current_user.get('user_id'),
+                chiave=f"{TipoJob.FIRMA_RENDICONTO.value}:{rendiconto_id}"
+            )
+        
         db.commit()
         
         
@@ -2603,6 +2424,7 @@ async def approva_rendiconto(
             "message": "Rendiconto approvato con successo",
             "rendiconto_id": rendiconto_id,
             "pdf_firmato": pdf_firmato_path,
+            "job_id": job_id,
             "data_approvazione": update_result[0].isoformat() if update_result else None
         }
         
@@ -2615,7 +2437,7 @@ async def approva_rendiconto(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/economo/rendiconti/{rendiconto_id}/respingi")
-async def respingi_rendiconto(
+def respingi_rendiconto(
     rendiconto_id: str,
     motivo: str = Form(...),
     allegato: UploadFile = File(None),
@@ -2663,7 +2485,7 @@ async def respingi_rendiconto(
             filepath = UPLOAD_DIR / unique_filename
             
             with open(filepath, "wb") as f:
-                content = await allegato.read()
+                content = allegato.file.read()
                 f.write(content)
             
             insert_allegato = text("""
@@ -2707,7 +2529,7 @@ async def respingi_rendiconto(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/rendiconti/allegati/{allegato_id}/download")
-async def download_allegato_rendiconto(
+def download_allegato_rendiconto(
     allegato_id: str,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
@@ -2739,17 +2561,16 @@ async def download_allegato_rendiconto(
 # FUNZIONI HELPER
 # ============================================
 
-def build_categoria_completa(db, categoria_id, categoria_nome, parent_id):
+def build_categoria_completa(percorsi, categoria_id, categoria_nome):
     """
-    Costruisce la stringa gerarchica completa della categoria.
+    Restituisce la stringa gerarchica completa della categoria.
     
     Esempio: "Entrate: Offerte: Matrimoni"
     
     Args:
-        db: Sessione database
+        percorsi: Percorsi già letti con percorsi_categorie()
         categoria_id: ID categoria corrente
-        categoria_nome: Nome categoria corrente
-        parent_id: ID categoria padre
+        categoria_nome: Nome categoria corrente (se manca il percorso)
         
     Returns:
         str: Categoria gerarchica completa separata da ":"
@@ -2757,55 +2578,9 @@ def build_categoria_completa(db, categoria_id, categoria_nome, parent_id):
     if not categoria_id:
         return "Non categorizzato"
     
-    gerarchia = [categoria_nome]
-    current_parent = parent_id
-    
-    while current_parent:
-        parent_query = "SELECT descrizione, categoria_padre_id FROM piano_conti WHERE id = :id"
-        parent = db.execute(text(parent_query), {"id": current_parent}).fetchone()
-        if parent:
-            gerarchia.insert(0, parent[0])
-            current_parent = parent[1]
-        else:
-            break
-    
-    return ": ".join(gerarchia)
-
-def calcola_saldo_progressivo(movimenti):
-    """
-    Calcola il saldo progressivo per ogni movimento, raggruppato per conto.
-    
-    IMPORTANTE: Esclude i movimenti bloccati dal calcolo (già chiusi in rendiconti).
-    
-    Args:
-        movimenti: Lista di movimenti con campo 'registro_id' e 'bloccato'
-        
-    Returns:
-        list: Movimenti con campo 'saldo_progressivo' aggiunto
-    """
-    saldi_per_conto = {}
-    
-    # Ordina per data E per timestamp inserimento (fondamentale per saldo corretto!)
-    movimenti_ordinati = sorted(movimenti, key=lambda x: (x["data_movimento"], x.get("created_at", "")))
-    
-    for mov in movimenti_ordinati:
-        conto_id = mov["registro_id"]
-        
-        if conto_id not in saldi_per_conto:
-            saldi_per_conto[conto_id] = 0
-        
-        # ✅ Somma SOLO se movimento NON bloccato
-        if not mov.get("bloccato", False):
-            if mov["tipo_movimento"] == TipoMovimento.ENTRATA:
-                saldi_per_conto[conto_id] += mov["importo"]
-            else:
-                saldi_per_conto[conto_id] -= mov["importo"]
-        
-        mov["saldo_progressivo"] = round(saldi_per_conto[conto_id], 2)
-    
-    return movimenti_ordinati
+    return percorsi.get(str(categoria_id)) or categoria_nome
 
-async def applica_firma_vescovo(pdf_path: str):
+def applica_firma_vescovo(pdf_path: str):
     """
     Applica timbro e firma digitale del Vescovo sul PDF del rendiconto.
     
@@ -8,7 +8,7 @@ router = APIRouter(prefix="/api/enti", tags=["enti"])
 
 
 @router.get("/my-enti")
-async def get_my_enti(
+def get_my_enti(
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -38,7 +38,7 @@ async def get_my_enti(
 
 
 @router.get("/{ente_id}")
-async def get_ente(
+def get_ente(
     ente_id: str,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -89,14 +89,13 @@ async def get_ente(
 
 
 @router.put("/{ente_id}")
-async def update_ente(
+def update_ente(
     ente_id: str,
-    request: Request,
+    data: dict,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Aggiorna dati ente"""
-    data = await request.json()
     check = db.execute(text("SELECT id FROM enti WHERE id = :ente_id"), {"ente_id": ente_id}).fetchone()
     if not check:
         raise HTTPException(status_code=404, detail="Ente non trovato")
@@ -0,0 +1,505 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form
+from uuid import UUID, uuid4
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import get_db_connection
+from auth import get_current_user
+from services.estratti_conto import FORMATI, leggi_estratto, riconosci_formato
+from services.import_movimenti import carica_staging, valida_staging, riepilogo_staging, registra_estratto
+from services.riconciliazione import (
+    RICONCILIAZIONE_GIORNI, carica_riconciliazione, proponi_abbinamenti,
+    serializza_riga, serializza_movimento
+)
+from services.audit import registra_audit_psycopg2
+from services.jobs import accoda_job_psycopg2
+from services.jobs_gestori import salva_file_import
+from constants import TipoJob
+
+router = APIRouter(prefix="/api/contabilita", tags=["Import Estratti Conto"])
+
+
+def _verifica_registro(cur, registro_id, ente_id):
+    cur.execute("""
+        SELECT nome FROM registri_contabili WHERE id = %s AND ente_id = %s
+    """, (str(registro_id), ente_id))
+    registro = cur.fetchone()
+    if not registro:
+        raise HTTPException(status_code=404, detail="Conto non trovato")
+    return registro[0]
+
+
+# ============================================
+# IMPORT ESTRATTO CONTO
+# ============================================
+
+@router.post("/registri/{registro_id}/import")
+def importa_estratto_conto(
+    registro_id: UUID,
+    file: UploadFile = File(...),
+    formato: str = Form(None),
+    dry_run: bool = Form(True),
+    crea_movimenti: bool = Form(True),
+    ignora_errori: bool = Form(False),
+    asincrono: bool = Form(False),
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Importa un estratto conto bancario (CSV, CAMT.053, OFX) nel conto.
+
+    - dry_run (default): restituisce solo l'anteprima, senza salvare
+    - crea_movimenti: crea un movimento per ogni riga valida; se falso
+      l'estratto viene solo salvato (es. per la riconciliazione)
+    - ignora_errori: importa le righe valide anche se altre hanno errori
+    - asincrono: (solo senza dry_run) il file viene importato dal worker;
+      la risposta contiene job_id (avanzamento su /api/jobs/{id})
+
+    Le righe con un riferimento bancario già importato nel conto vengono
+    saltate, così lo stesso file può essere caricato di nuovo.
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    formato = (formato or riconosci_formato(file.filename, file.file)).lower()
+    if formato not in FORMATI:
+        raise HTTPException(status_code=400, detail=f"Formato non supportato (ammessi: {', '.join(FORMATI)})")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        nome_conto = _verifica_registro(cur, registro_id, ente_id)
+
+        if asincrono and not dry_run:
+            percorso = salva_file_import(file.file, f"{uuid4()}.{formato}")
+            job_id = accoda_job_psycopg2(
+                cur,
+                TipoJob.IMPORT_ESTRATTO,
+                {
+                    "registro_id": str(registro_id),
+                    "ente_id": str(ente_id),
+                    "percorso": percorso,
+                    "nome_file": file.filename,
+                    "formato": formato,
+                    "crea_movimenti": crea_movimenti,
+                    "ignora_errori": ignora_errori,
+                    "utente": {"user_id": current_user.get('user_id'), "email": current_user.get('email')},
+                },
+                ente_id=ente_id,
+                utente_id=current_user.get('user_id')
+            )
+            conn.commit()
+            return {"conto": nome_conto, "formato": formato, "nome_file": file.filename,
+                    "dry_run": False, "importato": False, "job_id": job_id}
+
+        try:
+            carica_staging(cur, leggi_estratto(file.file, formato))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        valida_staging(cur, ente_id, str(registro_id), crea_movimenti)
+        riepilogo = riepilogo_staging(cur)
+        riepilogo.update({"conto": nome_conto, "formato": formato, "nome_file": file.filename})
+
+        if dry_run:
+            conn.rollback()
+            return {**riepilogo, "dry_run": True, "importato": False}
+
+        if riepilogo["righe_con_errori"] and not ignora_errori:
+            conn.rollback()
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "tipo": "import_con_errori",
+                    "messaggio": f"{riepilogo['righe_con_errori']} righe con errori: correggi il file o importa ignorando gli errori",
+                    "riepilogo": riepilogo
+                }
+            )
+
+        risultato = registra_estratto(
+            cur, ente_id, str(registro_id), file.filename, formato, crea_movimenti, current_user
+        )
+        conn.commit()
+        return {**riepilogo, **risultato, "dry_run": False, "importato": True}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
+
+
+@router.get("/registri/{registro_id}/estratti")
+def get_estratti_conto(
+    registro_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """Estratti conto importati nel conto, dal più recente."""
+    ente_id = current_user.get('ente_id') or x_ente_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        _verifica_registro(cur, registro_id, ente_id)
+        cur.execute("""
+            SELECT e.id, e.nome_file, e.formato, e.numero_righe, e.movimenti_creati, e.created_at,
+                   MIN(r.data_operazione), MAX(r.data_operazione),
+                   COUNT(r.id) FILTER (WHERE NOT EXISTS (
+                       SELECT 1 FROM estratti_conto_abbinamenti a WHERE a.riga_id = r.id))
+            FROM estratti_conto e
+            LEFT JOIN estratti_conto_righe r ON r.estratto_id = e.id
+            WHERE e.registro_id = %s
+            GROUP BY e.id
+            ORDER BY e.created_at DESC
+        """, (str(registro_id),))
+
+        return [
+            {
+                "id": str(row[0]),
+                "nome_file": row[1],
+                "formato": row[2],
+                "numero_righe": row[3],
+                "movimenti_creati": row[4],
+                "created_at": row[5].isoformat() if row[5] else None,
+                "data_da": row[6].isoformat() if row[6] else None,
+                "data_a": row[7].isoformat() if row[7] else None,
+                "righe_da_riconciliare": row[8]
+            }
+            for row in cur.fetchall()
+        ]
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ============================================
+# RICONCILIAZIONE
+# ============================================
+
+def _verifica_estratto(cur, estratto_id, ente_id):
+    cur.execute("""
+        SELECT registro_id FROM estratti_conto WHERE id = %s AND ente_id = %s
+    """, (str(estratto_id), ente_id))
+    estratto = cur.fetchone()
+    if not estratto:
+        raise HTTPException(status_code=404, detail="Estratto conto non trovato")
+    return str(estratto[0])
+
+
+@router.get("/estratti/{estratto_id}/riconciliazione")
+def proponi_riconciliazione(
+    estratto_id: UUID,
+    giorni: int = RICONCILIAZIONE_GIORNI,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Proposte di abbinamento tra le righe dell'estratto non ancora
+    riconciliate e i movimenti del conto (1:1 e una riga con più movimenti),
+    più righe e movimenti rimasti senza abbinamento.
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    if not 0 <= giorni <= 60:
+        raise HTTPException(status_code=400, detail="La finestra deve essere tra 0 e 60 giorni")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        registro_id = _verifica_estratto(cur, estratto_id, ente_id)
+        righe, movimenti = carica_riconciliazione(cur, str(estratto_id), registro_id, giorni)
+        risultato = proponi_abbinamenti(righe, movimenti, giorni)
+
+        return {
+            "estratto_id": str(estratto_id),
+            "giorni": giorni,
+            "proposte": [
+                {
+                    "tipo": p["tipo"],
+                    "punteggio": p["punteggio"],
+                    "riga": serializza_riga(p["riga"]),
+                    "movimenti": [serializza_movimento(m) for m in p["movimenti"]]
+                }
+                for p in risultato["proposte"]
+            ],
+            "righe_non_abbinate": [serializza_riga(r) for r in risultato["righe_non_abbinate"]],
+            "movimenti_non_abbinati": [serializza_movimento(m) for m in risultato["movimenti_non_abbinati"]]
+        }
+    finally:
+        cur.close()
+        conn.close()
+
+
+@router.post("/estratti/{estratto_id}/riconciliazione")
+def conferma_riconciliazione(
+    estratto_id: UUID,
+    data: dict,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Conferma gli abbinamenti:
+    {"abbinamenti": [{"riga_id": "...", "movimento_ids": ["...", ...]}, ...]}
+
+    Tipo e somma dei movimenti devono corrispondere all'importo della riga.
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    abbinamenti = data.get("abbinamenti") or []
+    if not abbinamenti or any(not a.get("riga_id") or not a.get("movimento_ids") for a in abbinamenti):
+        raise HTTPException(status_code=400, detail="Indicare per ogni abbinamento riga_id e movimento_ids")
+
+    riga_ids = [str(a["riga_id"]) for a in abbinamenti]
+    movimento_ids = [str(m) for a in abbinamenti for m in a["movimento_ids"]]
+    if len(set(riga_ids)) != len(riga_ids) or len(set(movimento_ids)) != len(movimento_ids):
+        raise HTTPException(status_code=400, detail="Ogni riga e ogni movimento può comparire in un solo abbinamento")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        registro_id = _verifica_estratto(cur, estratto_id, ente_id)
+
+        cur.execute("""
+            SELECT r.id, r.importo,
+                   EXISTS (SELECT 1 FROM estratti_conto_abbinamenti a WHERE a.riga_id = r.id)
+            FROM estratti_conto_righe r
+            WHERE r.estratto_id = %s AND r.id = ANY(%s::uuid[])
+        """, (str(estratto_id), riga_ids))
+        righe = {str(r[0]): r for r in cur.fetchall()}
+
+        cur.execute("""
+            SELECT m.id, m.tipo_movimento, m.importo,
+                   EXISTS (SELECT 1 FROM estratti_conto_abbinamenti a WHERE a.movimento_id = m.id)
+            FROM movimenti_contabili m
+            WHERE m.registro_id = %s AND m.id = ANY(%s::uuid[])
+        """, (registro_id, movimento_ids))
+        movimenti = {str(m[0]): m for m in cur.fetchall()}
+
+        for abbinamento in abbinamenti:
+            riga = righe.get(str(abbinamento["riga_id"]))
+            if not riga:
+                raise HTTPException(status_code=404, detail=f"Riga {abbinamento['riga_id']} non trovata nell'estratto")
+            if riga[2]:
+                raise HTTPException(status_code=409, detail=f"Riga {abbinamento['riga_id']} già riconciliata")
+
+            tipo = 'entrata' if riga[1] > 0 else 'uscita'
+            totale = 0
+            for movimento_id in abbinamento["movimento_ids"]:
+                movimento = movimenti.get(str(movimento_id))
+                if not movimento:
+                    raise HTTPException(status_code=404, detail=f"Movimento {movimento_id} non trovato nel conto")
+                if movimento[3]:
+                    raise HTTPException(status_code=409, detail=f"Movimento {movimento_id} già riconciliato")
+                if movimento[1] != tipo:
+                    raise HTTPException(status_code=400, detail=f"Il movimento {movimento_id} non è di tipo {tipo}")
+                totale += movimento[2]
+            if totale != abs(riga[1]):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"La somma dei movimenti ({totale}) non corrisponde all'importo della riga ({abs(riga[1])})"
+                )
+
+        cur.execute("""
+            INSERT INTO estratti_conto_abbinamenti (riga_id, movimento_id, created_by)
+            SELECT a.riga_id, a.movimento_id, %s
+            FROM unnest(%s::uuid[], %s::uuid[]) AS a(riga_id, movimento_id)
+        """, (
+            current_user.get('user_id'),
+            [str(a["riga_id"]) for a in abbinamenti for _ in a["movimento_ids"]],
+            movimento_ids
+        ))
+
+        # Abbinamenti 1:1: collegamento diretto sulla riga
+        cur.execute("""
+            UPDATE estratti_conto_righe r
+            SET movimento_id = a.movimento_id
+            FROM estratti_conto_abbinamenti a
+            WHERE a.riga_id = r.id
+              AND r.id = ANY(%s::uuid[])
+              AND (SELECT COUNT(*) FROM estratti_conto_abbinamenti x WHERE x.riga_id = r.id) = 1
+        """, (riga_ids,))
+
+        registra_audit_psycopg2(
+            cur,
+            azione="UPDATE",
+            tabella="movimenti_contabili",
+            record_id=str(estratto_id),
+            utente_id=current_user.get('user_id'),
+            utente_email=current_user.get('email'),
+            ente_id=ente_id,
+            dati_nuovi={"estratto_id": str(estratto_id), "abbinamenti": abbinamenti},
+            descrizione=f"Riconciliazione estratto conto: {len(abbinamenti)} righe abbinate"
+        )
+
+        conn.commit()
+        return {"message": "Abbinamenti confermati", "righe_abbinate": len(abbinamenti), "movimenti_abbinati": len(movimento_ids)}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
+
+
+@router.delete("/estratti/{estratto_id}/righe/{riga_id}/abbinamento")
+def annulla_riconciliazione(
+    estratto_id: UUID,
+    riga_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """Scollega la riga dai movimenti abbinati (i movimenti restano)."""
+    ente_id = current_user.get('ente_id') or x_ente_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        _verifica_estratto(cur, estratto_id, ente_id)
+        cur.execute("""
+            DELETE FROM estratti_conto_abbinamenti a
+            USING estratti_conto_righe r
+            WHERE a.riga_id = r.id AND r.id = %s AND r.estratto_id = %s
+        """, (str(riga_id), str(estratto_id)))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Abbinamento non trovato")
+        cur.execute("""
+            UPDATE estratti_conto_righe SET movimento_id = NULL WHERE id = %s
+        """, (str(riga_id),))
+        conn.commit()
+        return {"message": "Abbinamento annullato"}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ============================================
+# REGOLE CATEGORIE IMPORT
+# ============================================
+
+@router.get("/regole-import")
+def get_regole_import(
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """Regole di assegnazione automatica delle categorie all'import."""
+    ente_id = current_user.get('ente_id') or x_ente_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            SELECT r.id, r.testo, r.tipo_movimento, r.registro_id, r.categoria_id,
+                   pc.descrizione, r.priorita, r.attivo
+            FROM regole_import_categorie r
+            JOIN piano_conti pc ON pc.id = r.categoria_id
+            WHERE r.ente_id = %s
+            ORDER BY r.priorita, LENGTH(r.testo) DESC
+        """, (ente_id,))
+
+        return [
+            {
+                "id": str(row[0]),
+                "testo": row[1],
+                "tipo_movimento": row[2],
+                "registro_id": str(row[3]) if row[3] else None,
+                "categoria_id": str(row[4]),
+                "categoria_nome": row[5],
+                "priorita": row[6],
+                "attivo": row[7]
+            }
+            for row in cur.fetchall()
+        ]
+    finally:
+        cur.close()
+        conn.close()
+
+
+@router.post("/regole-import")
+def create_regola_import(
+    data: dict,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Crea una regola: se la descrizione della riga contiene 'testo'
+    (senza distinzione maiuscole/minuscole) si assegna 'categoria_id'.
+    """
+    ente_id = current_user.get('ente_id') or x_ente_id
+    testo = (data.get("testo") or "").strip()
+    if not testo or not data.get("categoria_id"):
+        raise HTTPException(status_code=400, detail="Testo e categoria sono obbligatori")
+    if data.get("tipo_movimento") not in (None, "entrata", "uscita"):
+        raise HTTPException(status_code=400, detail="tipo_movimento deve essere 'entrata' o 'uscita'")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            SELECT 1 FROM piano_conti WHERE id = %s AND ente_id = %s
+        """, (data["categoria_id"], ente_id))
+        if not cur.fetchone():
+            raise HTTPException(status_code=404, detail="Categoria non trovata")
+
+        cur.execute("""
+            INSERT INTO regole_import_categorie (ente_id, registro_id, testo, tipo_movimento, categoria_id, priorita)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (
+            ente_id, data.get("registro_id"), testo, data.get("tipo_movimento"),
+            data["categoria_id"], data.get("priorita", 100)
+        ))
+        regola_id = str(cur.fetchone()[0])
+        conn.commit()
+        return {"id": regola_id, "message": "Regola creata"}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
+
+
+@router.delete("/regole-import/{regola_id}")
+def delete_regola_import(
+    regola_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    ente_id = current_user.get('ente_id') or x_ente_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            DELETE FROM regole_import_categorie WHERE id = %s AND ente_id = %s
+        """, (str(regola_id), ente_id))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Regola non trovata")
+        conn.commit()
+        return {"message": "Regola eliminata"}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
@@ -11,6 +11,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_db_connection
 from auth import get_current_user
+from services.asset_documenti import invalida_asset
 
 router = APIRouter(prefix="/api/admin", tags=["Impostazioni Diocesi"])
 
@@ -25,7 +26,7 @@ class ImpostazioniDiocesiUpdate(BaseModel):
 
 
 @router.get("/impostazioni-diocesi")
-async def get_impostazioni_diocesi(current_user: dict = Depends(get_current_user)):
+def get_impostazioni_diocesi(current_user: dict = Depends(get_current_user)):
     """Recupera le impostazioni della diocesi"""
     conn = get_db_connection()
     cur = conn.cursor()
@@ -79,7 +80,7 @@ async def get_impostazioni_diocesi(current_user: dict = Depends(get_current_user
 
 
 @router.put("/impostazioni-diocesi")
-async def update_impostazioni_diocesi(
+def update_impostazioni_diocesi(
     dati: ImpostazioniDiocesiUpdate,
     current_user: dict = Depends(get_current_user)
 ):
@@ -118,6 +119,7 @@ async def update_impostazioni_diocesi(
             cur.execute(query, params)
         
         conn.commit()
+        invalida_asset()
         
         return {"message": "Impostazioni aggiornate con successo"}
         
@@ -130,7 +132,7 @@ async def update_impostazioni_diocesi(
 
 
 @router.post("/impostazioni-diocesi/upload/{tipo}")
-async def upload_file_diocesi(
+def upload_file_diocesi(
     tipo: str,
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
@@ -173,6 +175,7 @@ async def upload_file_diocesi(
         """, (str(filepath), file.filename, file_size))
         
         conn.commit()
+        invalida_asset()
         
         return {
             "message": f"{tipo.capitalize()} caricato con successo",
@@ -190,7 +193,7 @@ async def upload_file_diocesi(
 
 
 @router.delete("/impostazioni-diocesi/file/{tipo}")
-async def delete_file_diocesi(
+def delete_file_diocesi(
     tipo: str,
     current_user: dict = Depends(get_current_user)
 ):
@@ -224,6 +227,7 @@ async def delete_file_diocesi(
         """)
         
         conn.commit()
+        invalida_asset()
         
         return {"message": f"{tipo.capitalize()} eliminato con successo"}
         
@@ -29,7 +29,7 @@ FOTO_MAX_SIZE = 10 * 1024 * 1024  # 10MB
 # ============================================
 
 @router.get("/beni")
-async def get_beni(
+def get_beni(
     categoria: str = None,
     ubicazione: str = None,
     stato_conservazione: str = None,
@@ -117,7 +117,7 @@ async def get_beni(
 # ============================================
 
 @router.get("/beni/{bene_id}")
-async def get_bene(
+def get_bene(
     bene_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -222,7 +222,7 @@ async def get_bene(
 # ============================================
 
 @router.post("/beni", status_code=status.HTTP_201_CREATED)
-async def create_bene(
+def create_bene(
     data: dict,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -315,7 +315,7 @@ async def create_bene(
 # ============================================
 
 @router.put("/beni/{bene_id}")
-async def update_bene(
+def update_bene(
     bene_id: UUID,
     data: dict,
     current_user: dict = Depends(get_current_user),
@@ -413,7 +413,7 @@ async def update_bene(
 # ============================================
 
 @router.delete("/beni/{bene_id}")
-async def delete_bene(
+def delete_bene(
     bene_id: UUID,
     data: dict = None,
     current_user: dict = Depends(get_current_user),
@@ -556,7 +556,7 @@ async def delete_bene(
 # ============================================
 
 @router.get("/beni/{bene_id}/foto")
-async def get_foto_bene(
+def get_foto_bene(
     bene_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -607,7 +607,7 @@ async def get_foto_bene(
 # ============================================
 
 @router.post("/beni/{bene_id}/foto", status_code=status.HTTP_201_CREATED)
-async def upload_foto(
+def upload_foto(
     bene_id: UUID,
     file: UploadFile = File(...),
     didascalia: str = Form(None),
@@ -633,7 +633,7 @@ async def upload_foto(
             )
 
         # Leggi e verifica dimensione
-        contents = await file.read()
+        contents = file.file.read()
         file_size = len(contents)
         if file_size > FOTO_MAX_SIZE:
             raise HTTPException(
@@ -710,7 +710,7 @@ async def upload_foto(
 # ============================================
 
 @router.get("/foto/{foto_id}/visualizza")
-async def visualizza_foto(
+def visualizza_foto(
     foto_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -751,7 +751,7 @@ async def visualizza_foto(
 # ============================================
 
 @router.delete("/foto/{foto_id}")
-async def delete_foto(
+def delete_foto(
     foto_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -803,7 +803,7 @@ async def delete_foto(
 # ============================================
 
 @router.put("/foto/{foto_id}/ordine")
-async def update_ordine_foto(
+def update_ordine_foto(
     foto_id: UUID,
     data: dict,
     current_user: dict = Depends(get_current_user),
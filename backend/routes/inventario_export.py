@@ -25,7 +25,7 @@ COLONNE_CSV = [
 # ============================================
 
 @router.get("/export/csv")
-async def export_csv(
+def export_csv(
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
@@ -86,7 +86,7 @@ async def export_csv(
 # ============================================
 
 @router.get("/export/excel")
-async def export_excel(
+def export_excel(
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
@@ -169,7 +169,7 @@ async def export_excel(
 # ============================================
 
 @router.get("/import/template")
-async def download_template(
+def download_template(
     current_user: dict = Depends(get_current_user)
 ):
     try:
@@ -226,14 +226,14 @@ async def download_template(
 # ============================================
 
 @router.post("/import")
-async def import_beni(
+def import_beni(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
     ente_id = get_ente_id(current_user, x_ente_id)
 
-    contents = await file.read()
+    contents = file.file.read()
     filename = file.filename.lower()
 
     rows_data = []
@@ -17,7 +17,7 @@ router = APIRouter(prefix="/api/inventario", tags=["Inventario - Categorie e Ubi
 # ============================================
 
 @router.get("/categorie")
-async def get_categorie(
+def get_categorie(
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
@@ -52,7 +52,7 @@ async def get_categorie(
 
 
 @router.post("/categorie", status_code=status.HTTP_201_CREATED)
-async def create_categoria(
+def create_categoria(
     data: dict,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -101,7 +101,7 @@ async def create_categoria(
 
 
 @router.put("/categorie/{categoria_id}")
-async def update_categoria(
+def update_categoria(
     categoria_id: UUID,
     data: dict,
     current_user: dict = Depends(get_current_user),
@@ -151,7 +151,7 @@ async def update_categoria(
 
 
 @router.delete("/categorie/{categoria_id}")
-async def delete_categoria(
+def delete_categoria(
     categoria_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -200,7 +200,7 @@ async def delete_categoria(
 # ============================================
 
 @router.get("/ubicazioni")
-async def get_ubicazioni(
+def get_ubicazioni(
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
@@ -234,7 +234,7 @@ async def get_ubicazioni(
 
 
 @router.post("/ubicazioni", status_code=status.HTTP_201_CREATED)
-async def create_ubicazione(
+def create_ubicazione(
     data: dict,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -282,7 +282,7 @@ async def create_ubicazione(
 
 
 @router.put("/ubicazioni/{ubicazione_id}")
-async def update_ubicazione(
+def update_ubicazione(
     ubicazione_id: UUID,
     data: dict,
     current_user: dict = Depends(get_current_user),
@@ -331,7 +331,7 @@ async def update_ubicazione(
 
 
 @router.delete("/ubicazioni/{ubicazione_id}")
-async def delete_ubicazione(
+def delete_ubicazione(
     ubicazione_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
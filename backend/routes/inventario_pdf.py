@@ -1,8 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
-from fastapi.responses import StreamingResponse
 from uuid import UUID
 from pathlib import Path
-from io import BytesIO
 from datetime import datetime
 import base64
 import sys
@@ -12,6 +10,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_db_connection
 from auth import get_current_user
 from routes.inventario import get_ente_id
+from services.render_pdf import renderizza_pdf, CodaPdfPiena, TimeoutRenderPdf, ErroreRenderPdf
+from services.jobs import accoda_job_psycopg2
+from services import cache_pdf
+from services.asset_documenti import asset_pdf
+from constants import TipoJob
 
 # WeasyPrint opzionale (richiede GTK su Windows)
 try:
@@ -20,7 +23,7 @@ try:
 except (ImportError, OSError):
     WEASYPRINT_AVAILABLE = False
 
-from jinja2 import Environment, FileSystemLoader
+from utils.template_pdf import get_template
 
 router = APIRouter(prefix="/api/inventario", tags=["Inventario - PDF"])
 
@@ -29,33 +32,6 @@ TEMPLATES_DIR = BASE_DIR / "templates"
 FOTO_UPLOAD_DIR = Path("uploads/inventario")
 
 
-def get_jinja_env():
-    env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)))
-
-    def formato_italiano(valore):
-        try:
-            numero = float(valore)
-            formatted = "{:,.2f}".format(numero)
-            return formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-        except:
-            return valore
-
-    def formato_data(valore):
-        if not valore:
-            return ""
-        try:
-            if isinstance(valore, str):
-                from datetime import date as dt_date
-                valore = dt_date.fromisoformat(valore)
-            return valore.strftime('%d/%m/%Y')
-        except:
-            return str(valore)
-
-    env.filters['ita'] = formato_italiano
-    env.filters['data'] = formato_data
-    return env
-
-
 def check_weasyprint():
     if not WEASYPRINT_AVAILABLE:
         raise HTTPException(
@@ -86,22 +62,25 @@ def get_ente_info(cur, ente_id):
 
 
 def get_logo_base64():
-    logo_path = TEMPLATES_DIR / "assets" / "Logo Diocesi - Economato.png"
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            return "data:image/png;base64," + base64.b64encode(f.read()).decode()
-    return None
-
-
-def render_pdf(html_content, filename):
-    buffer = BytesIO()
-    HTML(string=html_content, base_url=str(BASE_DIR)).write_pdf(buffer)
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    # Codificato una volta sola (services/asset_documenti.py)
+    return asset_pdf()["logo_economato"]
+
+
+def render_pdf(html_content, filename, if_none_match=None):
+    # Tutto il documento (logo e foto in base64) è nell'HTML: ne è l'impronta
+    chiave = cache_pdf.impronta("inventario", html_content)
+    percorso = cache_pdf.leggi(chiave)
+    if percorso is None:
+        try:
+            pdf = renderizza_pdf(html_content, base_url=str(BASE_DIR))
+        except CodaPdfPiena as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+        except TimeoutRenderPdf as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except ErroreRenderPdf as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        percorso = cache_pdf.salva(chiave, pdf)
+    return cache_pdf.risposta_pdf(percorso, chiave, filename, if_none_match)
 
 
 # ============================================
@@ -109,7 +88,7 @@ def render_pdf(html_content, filename):
 # ============================================
 
 @router.get("/stampa/bozza")
-async def stampa_bozza(
+def stampa_bozza(
     categoria_id: str = None,
     ubicazione_id: str = None,
     stato_conservazione: str = None,
@@ -189,8 +168,7 @@ async def stampa_bozza(
                 "ubicazione_nome": r[7] or ""
             })
 
-        env = get_jinja_env()
-        template = env.get_template('inventario_registro.html')
+        template = get_template('inventario_registro.html')
         html_content = template.render(
             ente=ente,
             logo_base64=get_logo_base64(),
@@ -219,7 +197,7 @@ async def stampa_bozza(
 # ============================================
 
 @router.get("/stampa/bene/{bene_id}")
-async def stampa_scheda_bene(
+def stampa_scheda_bene(
     bene_id: UUID,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -294,8 +272,7 @@ async def stampa_scheda_bene(
                     "didascalia": f[3] or ""
                 })
 
-        env = get_jinja_env()
-        template = env.get_template('inventario_scheda_bene.html')
+        template = get_template('inventario_scheda_bene.html')
         html_content = template.render(
             ente=ente,
             logo_base64=get_logo_base64(),
@@ -319,75 +296,125 @@ async def stampa_scheda_bene(
 # PDF REGISTRO UFFICIALE (da snapshot)
 # ============================================
 
+def html_registro(cur, registro_id, ente_id):
+    """
+    HTML del registro ufficiale (dallo snapshot) e nome del file PDF.
+    Usato dalla route e dal lavoro in background (services/jobs_gestori.py).
+    """
+    ente = get_ente_info(cur, ente_id)
+
+    cur.execute("""
+        SELECT anno, numero_registro, data_generazione, totale_beni,
+               dati_snapshot, note
+        FROM inventario_registri
+        WHERE id = %s AND ente_id = %s
+    """, (str(registro_id), ente_id))
+    reg = cur.fetchone()
+    if not reg:
+        raise HTTPException(status_code=404, detail="Registro non trovato")
+
+    anno = reg[0]
+    numero_registro = reg[1]
+    data_generazione = reg[2]
+    totale_beni = reg[3]
+    snapshot = reg[4] if reg[4] else []
+    note = reg[5]
+
+    # Costruisci lista beni dallo snapshot
+    beni = []
+    valore_totale = 0
+    for s in snapshot:
+        valore = s.get("valore_stimato") or 0
+        valore_totale += valore
+        beni.append({
+            "numero_progressivo": s.get("numero_progressivo"),
+            "descrizione": s.get("descrizione", ""),
+            "quantita": s.get("quantita", 1),
+            "stato_conservazione": s.get("stato_conservazione", ""),
+            "valore_stimato": valore,
+            "bloccato": True,
+            "categoria_nome": s.get("categoria_nome", ""),
+            "ubicazione_nome": s.get("ubicazione_nome", "")
+        })
+
+    template = get_template('inventario_registro.html')
+    html_content = template.render(
+        ente=ente,
+        logo_base64=get_logo_base64(),
+        titolo=f"REGISTRO DEI BENI — Anno {anno}",
+        sottotitolo=f"Registro Ufficiale N. {numero_registro}",
+        is_bozza=False,
+        anno=anno,
+        numero_registro=numero_registro,
+        data_generazione=data_generazione.strftime('%d/%m/%Y') if data_generazione else "",
+        note=note or "",
+        beni=beni,
+        totale_beni=totale_beni,
+        valore_totale=valore_totale
+    )
+
+    return html_content, f"registro_beni_{anno}_N{numero_registro}.pdf"
+
+
 @router.get("/registri/{registro_id}/pdf")
-async def get_registro_pdf(
+def get_registro_pdf(
     registro_id: UUID,
     current_user: dict = Depends(get_current_user),
-    x_ente_id: str = Header(None, alias="X-Ente-Id")
+    x_ente_id: str = Header(None, alias="X-Ente-Id"),
+    if_none_match: str = Header(None, alias="If-None-Match")
 ):
     check_weasyprint()
     ente_id = get_ente_id(current_user, x_ente_id)
     conn = get_db_connection()
     cur = conn.cursor()
     try:
-        ente = get_ente_info(cur, ente_id)
+        html_content, filename = html_registro(cur, registro_id, ente_id)
+        return render_pdf(html_content, filename, if_none_match)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
 
+
+@router.post("/registri/{registro_id}/pdf/job", status_code=202)
+def accoda_registro_pdf(
+    registro_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Genera il PDF del registro in background: restituisce l'id del lavoro
+    (avanzamento su /api/jobs/{id}, file su /api/jobs/{id}/file).
+    """
+    check_weasyprint()
+    ente_id = get_ente_id(current_user, x_ente_id)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
         cur.execute("""
-            SELECT anno, numero_registro, data_generazione, totale_beni,
-                   dati_snapshot, note
-            FROM inventario_registri
-            WHERE id = %s AND ente_id = %s
+            SELECT 1 FROM inventario_registri WHERE id = %s AND ente_id = %s
         """, (str(registro_id), ente_id))
-        reg = cur.fetchone()
-        if not reg:
+        if not cur.fetchone():
             raise HTTPException(status_code=404, detail="Registro non trovato")
 
-        anno = reg[0]
-        numero_registro = reg[1]
-        data_generazione = reg[2]
-        totale_beni = reg[3]
-        snapshot = reg[4] if reg[4] else []
-        note = reg[5]
-
-        # Costruisci lista beni dallo snapshot
-        beni = []
-        valore_totale = 0
-        for s in snapshot:
-            valore = s.get("valore_stimato") or 0
-            valore_totale += valore
-            beni.append({
-                "numero_progressivo": s.get("numero_progressivo"),
-                "descrizione": s.get("descrizione", ""),
-                "quantita": s.get("quantita", 1),
-                "stato_conservazione": s.get("stato_conservazione", ""),
-                "valore_stimato": valore,
-                "bloccato": True,
-                "categoria_nome": s.get("categoria_nome", ""),
-                "ubicazione_nome": s.get("ubicazione_nome", "")
-            })
-
-        env = get_jinja_env()
-        template = env.get_template('inventario_registro.html')
-        html_content = template.render(
-            ente=ente,
-            logo_base64=get_logo_base64(),
-            titolo=f"REGISTRO DEI BENI — Anno {anno}",
-            sottotitolo=f"Registro Ufficiale N. {numero_registro}",
-            is_bozza=False,
-            anno=anno,
-            numero_registro=numero_registro,
-            data_generazione=data_generazione.strftime('%d/%m/%Y') if data_generazione else "",
-            note=note or "",
-            beni=beni,
-            totale_beni=totale_beni,
-            valore_totale=valore_totale
+        job_id = accoda_job_psycopg2(
+            cur,
+            TipoJob.PDF_REGISTRO_INVENTARIO,
+            {"registro_id": str(registro_id), "ente_id": str(ente_id)},
+            ente_id=ente_id,
+            utente_id=current_user.get('user_id'),
+            chiave=f"{TipoJob.PDF_REGISTRO_INVENTARIO.value}:{registro_id}"
         )
-
-        filename = f"registro_beni_{anno}_N{numero_registro}.pdf"
-        return render_pdf(html_content, filename)
+        conn.commit()
+        return {"job_id": job_id}
     except HTTPException:
+        conn.rollback()
         raise
     except Exception as e:
+        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cur.close()
@@ -399,7 +426,7 @@ async def get_registro_pdf(
 # ============================================
 
 @router.get("/storico/pdf")
-async def get_storico_pdf(
+def get_storico_pdf(
     anno: int = None,
     motivo: str = None,
     current_user: dict = Depends(get_current_user),
@@ -456,8 +483,7 @@ async def get_storico_pdf(
         if anno:
             titolo += f" — Anno {anno}"
 
-        env = get_jinja_env()
-        template = env.get_template('inventario_storico.html')
+        template = get_template('inventario_storico.html')
         html_content = template.render(
             ente=ente,
             logo_base64=get_logo_base64(),
@@ -20,7 +20,7 @@ router = APIRouter(prefix="/api/inventario", tags=["Inventario - Registri e Stor
 # ============================================
 
 @router.get("/registri")
-async def get_registri(
+def get_registri(
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
 ):
@@ -64,7 +64,7 @@ async def get_registri(
 # ============================================
 
 @router.post("/registri/genera", status_code=status.HTTP_201_CREATED)
-async def genera_registro(
+def genera_registro(
     data: dict,
     current_user: dict = Depends(get_current_user),
     x_ente_id: str = Header(None, alias="X-Ente-Id")
@@ -217,7 +217,7 @@ async def genera_registro(
 # ============================================
 
 @router.get("/storico")
-async def get_storico(
+def get_storico(
     anno: int = None,
     motivo: str = None,
     current_user: dict = Depends(get_current_user),
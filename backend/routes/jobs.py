@@ -0,0 +1,84 @@
+"""
+API LAVORI IN BACKGROUND
+========================
+Stato e risultato dei lavori accodati (services/jobs.py): il client
+riceve job_id dalla route che avvia l'operazione e interroga
+GET /api/jobs/{id} finché lo stato non è 'completato' o 'errore'.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import FileResponse
+from pathlib import Path
+from uuid import UUID
+
+from database import get_db_connection
+from auth import get_current_user
+from constants import StatoJob
+from services.jobs import leggi_job
+
+router = APIRouter(prefix="/api/jobs", tags=["Lavori in background"])
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def _job_autorizzato(job_id: UUID, current_user: dict, x_ente_id: str) -> dict:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        job = leggi_job(cur, job_id)
+    finally:
+        cur.close()
+        conn.close()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Lavoro non trovato")
+    ente_id = current_user.get('ente_id') or x_ente_id
+    if not (
+        job["utente_id"] == str(current_user.get('user_id'))
+        or current_user.get('is_economo')
+        or (job["ente_id"] and job["ente_id"] == str(ente_id))
+    ):
+        raise HTTPException(status_code=404, detail="Lavoro non trovato")
+    return job
+
+
+@router.get("/{job_id}")
+def get_job(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """
+    Stato del lavoro: in_coda, in_corso (progresso 0-100 e messaggio),
+    completato (risultato) o errore (errore; tentativi esauriti).
+    """
+    job = _job_autorizzato(job_id, current_user, x_ente_id)
+    if job["stato"] == StatoJob.COMPLETATO and (job["risultato"] or {}).get("file"):
+        job["download_url"] = f"/api/jobs/{job['id']}/file"
+    return job
+
+
+@router.get("/{job_id}/file")
+def scarica_file_job(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    x_ente_id: str = Header(None, alias="X-Ente-Id")
+):
+    """File prodotto dal lavoro (es. PDF), se completato."""
+    job = _job_autorizzato(job_id, current_user, x_ente_id)
+    if job["stato"] != StatoJob.COMPLETATO:
+        raise HTTPException(status_code=409, detail=f"Lavoro non completato (stato: {job['stato']})")
+
+    risultato = job["risultato"] or {}
+    if not risultato.get("file"):
+        raise HTTPException(status_code=404, detail="Il lavoro non ha prodotto file")
+
+    percorso = (BASE_DIR / risultato["file"]).resolve()
+    if BASE_DIR not in percorso.parents or not percorso.exists():
+        raise HTTPException(status_code=404, detail="File non trovato")
+
+    return FileResponse(
+        str(percorso),
+        media_type="application/pdf",
+        filename=risultato.get("nome_file") or percorso.name
+    )
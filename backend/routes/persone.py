@@ -109,7 +109,7 @@ class PersonaResponse(BaseModel):
 # ============================================
 
 @router.get("/", response_model=List[PersonaResponse])
-async def get_persone(
+def get_persone(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
     search: Optional[str] = None,
@@ -174,7 +174,7 @@ async def get_persone(
 
 
 @router.get("/{persona_id}")
-async def get_persona(persona_id: str, current_user: dict = Depends(get_current_user)):
+def get_persona(persona_id: str, current_user: dict = Depends(get_current_user)):
     """
     Ottiene i dati completi di una persona con tutti i sacramenti.
     Include flag per indicare quali dati sono modificabili.
@@ -208,7 +208,7 @@ async def get_persona(persona_id: str, current_user: dict = Depends(get_current_
 # ============================================
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_persona(persona: PersonaCreate, request: Request, current_user: dict = Depends(get_current_user)):
+def create_persona(persona: PersonaCreate, request: Request, current_user: dict = Depends(get_current_user)):
     """
     Crea una nuova persona.
     La parrocchia_proprietaria_id viene impostata automaticamente.
@@ -291,7 +291,7 @@ async def create_persona(persona: PersonaCreate, request: Request, current_user:
         conn.commit()
         
         # Log operazione
-        await middleware.log_operation(
+        middleware.log_operation(
             request,
             tabella="persone",
             record_id=persona_id,
@@ -324,7 +324,7 @@ async def create_persona(persona: PersonaCreate, request: Request, current_user:
 # ============================================
 
 @router.put("/{persona_id}")
-async def update_persona(persona_id: str, persona: PersonaUpdate, request: Request, current_user: dict = Depends(get_current_user)):
+def update_persona(persona_id: str, persona: PersonaUpdate, request: Request, current_user: dict = Depends(get_current_user)):
     """
     Aggiorna i dati di una persona.
     SOLO la parrocchia proprietaria può modificare l'anagrafica base.
@@ -380,7 +380,7 @@ async def update_persona(persona_id: str, persona: PersonaUpdate, request: Reque
         conn.commit()
         
         # Log operazione
-        await middleware.log_operation(
+        middleware.log_operation(
             request,
             tabella="persone",
             record_id=persona_id,
@@ -415,7 +415,7 @@ async def update_persona(persona_id: str, persona: PersonaUpdate, request: Reque
 # ============================================
 
 @router.delete("/{persona_id}")
-async def delete_persona(persona_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+def delete_persona(persona_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     """
     Cancella una persona.
     SOLO la parrocchia proprietaria può cancellare.
@@ -451,7 +451,7 @@ async def delete_persona(persona_id: str, request: Request, current_user: dict =
         conn.commit()
         
         # Log operazione
-        await middleware.log_operation(
+        middleware.log_operation(
             request,
             tabella="persone",
             record_id=persona_id,
@@ -484,7 +484,7 @@ async def delete_persona(persona_id: str, request: Request, current_user: dict =
 # ============================================
 
 @router.get("/ricerca/avanzata")
-async def ricerca_avanzata(
+def ricerca_avanzata(
     cognome: Optional[str] = None,
     nome: Optional[str] = None,
     data_nascita: Optional[date] = None,
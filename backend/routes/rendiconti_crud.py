@@ -1,18 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from uuid import UUID
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from typing import Optional
 import sys
 import os
-import uuid
 
 # Import dal progetto esistente
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_db_connection, SessionLocal
 from auth import get_current_user
 from services.audit import registra_audit_psycopg2
-from constants import StatoRendiconto, TipoMovimento
+from services.chiusura_rendiconto import chiudi_periodo
+from services.cache_periodi_chiusi import invalida_aggregati_rendiconto
+from services.jobs import accoda_job_psycopg2
+from constants import StatoRendiconto, TipoJob
 
 router = APIRouter(prefix="/api/contabilita", tags=["Rendiconti"])
 
@@ -47,13 +49,13 @@ class RendicontoResponse(BaseModel):
 # ============================================
 
 @router.post("/rendiconti", response_model=dict)
-async def crea_rendiconto(
+def crea_rendiconto(
     dati: RendicontoCreate,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Crea un nuovo rendiconto in stato 'bozza'
-    🆕 BLOCCA movimenti, CREA saldi iniziali, GENERA PDF
+    🆕 BLOCCA movimenti, CREA saldi iniziali, ACCODA il PDF (job_id: avanzamento su /api/jobs/{id})
     """
     conn = get_db_connection()
     cur = conn.cursor()
@@ -107,15 +109,13 @@ async def crea_rendiconto(
             )
         
         # Calcola totali del periodo (escludi saldi iniziali e giroconti)
+        # dai riepiloghi mensili + mesi parziali (migration 014)
         cur.execute("""
             SELECT
-                COALESCE(SUM(CASE WHEN tipo_movimento = 'entrata' THEN importo ELSE 0 END), 0) as totale_entrate,
-                COALESCE(SUM(CASE WHEN tipo_movimento = 'uscita' THEN importo ELSE 0 END), 0) as totale_uscite
-            FROM movimenti_contabili
-            WHERE ente_id = %s
-              AND data_movimento >= %s
-              AND data_movimento <= %s
-              AND tipo_speciale IS NULL
+                COALESCE(SUM(totale) FILTER (WHERE tipo_movimento = 'entrata'), 0) as totale_entrate,
+                COALESCE(SUM(totale) FILTER (WHERE tipo_movimento = 'uscita'), 0) as totale_uscite
+            FROM totali_movimenti_periodo(%s, %s, %s)
+            WHERE tipo_speciale IS NULL
         """, (ente_id, dati.periodo_inizio, dati.periodo_fine))
         
         totali = cur.fetchone()
@@ -165,134 +165,21 @@ async def crea_rendiconto(
             descrizione=f"Nuovo rendiconto: {dati.periodo_inizio} - {dati.periodo_fine}"
         )
         
-        # 🆕 BLOCCA MOVIMENTI DEL PERIODO
-        cur.execute("""
-            UPDATE movimenti_contabili
-            SET bloccato = TRUE, rendiconto_id = %s
-            WHERE ente_id = %s
-              AND data_movimento BETWEEN %s AND %s
-              AND (tipo_speciale IS NULL OR tipo_speciale = 'saldo_iniziale')
-        """, (
-            rendiconto_id,
-            ente_id,
-            dati.periodo_inizio,
-            dati.periodo_fine
-        ))
-        
-        movimenti_bloccati = cur.rowcount
-        
-        # COMMIT dopo blocco movimenti
-        conn.commit()
+        # Chiusura del periodo: blocco movimenti e riporti dei saldi, nella
+        # stessa transazione del rendiconto
+        chiusura = chiudi_periodo(cur, ente_id, rendiconto_id, dati.periodo_inizio, dati.periodo_fine)
 
-        # 🆕 CREA SALDI INIZIALI (con psycopg2!)
-        
-        try:
-            # Data saldo iniziale = STESSA data di fine periodo
-            # Es: periodo 01/01/2025 - 24/02/2026 → saldo iniziale 24/02/2026
-            data_inizio_nuovo = dati.periodo_fine + timedelta(days=1)
-            
-            # Trova categoria "Riporto da bilancio precedente"
-            cur.execute("""
-                SELECT id FROM piano_conti 
-                WHERE ente_id = %s 
-                AND (descrizione = 'SALDO DA ESERCIZIO PRECEDENTE' 
-                     OR descrizione = 'Riporto da bilancio precedente'
-                     OR codice = '000')
-                LIMIT 1
-            """, (ente_id,))
-            
-            categoria_result = cur.fetchone()
-            
-            if not categoria_result:
-                pass
-            else:
-                categoria_id = categoria_result[0]
-                
-                # 🆕 Trova TUTTI i conti attivi (anche senza movimenti)
-                cur.execute("""
-                    SELECT id, nome
-                    FROM registri_contabili
-                    WHERE ente_id = %s
-                      AND attivo = TRUE
-                """, (ente_id,))
-                
-                conti = cur.fetchall()
-                
-                # Per ogni conto, calcola saldo e crea movimento iniziale
-                for conto in conti:
-                    registro_id = conto[0]
-                    nome_conto = conto[1]
-                    
-                    # Calcola SALDO FINALE del conto nel periodo
-                    cur.execute("""
-                        SELECT 
-                            COALESCE(SUM(
-                                CASE 
-                                    WHEN tipo_movimento = 'entrata' THEN importo 
-                                    ELSE -importo 
-                                END
-                            ), 0) as saldo
-                        FROM movimenti_contabili
-                        WHERE ente_id = %s
-                          AND registro_id = %s
-                          AND data_movimento BETWEEN %s AND %s
-                          AND (tipo_speciale IS NULL OR tipo_speciale = 'saldo_iniziale')
-                    """, (ente_id, registro_id, dati.periodo_inizio, dati.periodo_fine))
-                    
-                    saldo_conto = cur.fetchone()[0]
-
-
-                    # 🆕 Crea movimento ANCHE se saldo = 0!
-                    movimento_id = str(uuid.uuid4())
-
-                    cur.execute("""
-                        INSERT INTO movimenti_contabili (
-                            id, ente_id, registro_id, categoria_id,
-                            data_movimento, tipo_movimento, importo,
-                            causale, note,
-                            tipo_speciale, riporto_saldo, bloccato
-                        )
-                        VALUES (
-                            %s, %s, %s, %s,
-                            %s, %s, %s,
-                            %s, %s,
-                            'saldo_iniziale', TRUE, FALSE
-                        )
-                    """, (
-                        movimento_id,
-                        ente_id,
-                        registro_id,
-                        categoria_id,
-                        data_inizio_nuovo,
-                        TipoMovimento.ENTRATA if saldo_conto >= 0 else TipoMovimento.USCITA,
-                        abs(saldo_conto) if saldo_conto != 0 else 0,
-                        "Saldo iniziale",
-                        f"Riporto automatico da rendiconto {rendiconto_id}"
-                    ))
-                
-                # Commit dopo creazione saldi
-                conn.commit()
-                
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-        
-        # 🆕 GENERA PDF
-        pdf_path = None
-        try:
-            from routes.rendiconti_documenti import genera_pdf_rendiconto
-            pdf_path = await genera_pdf_rendiconto(rendiconto_id, ente_id)
-            
-            # Salva path PDF nel rendiconto
-            cur.execute("""
-                UPDATE rendiconti 
-                SET pdf_path = %s 
-                WHERE id = %s
-            """, (pdf_path, rendiconto_id))
-            
-            conn.commit()
-        except Exception:
-            pass
+        # PDF generato dal worker: accodato nella stessa transazione
+        job_id = accoda_job_psycopg2(
+            cur,
+            TipoJob.PDF_RENDICONTO,
+            {"rendiconto_id": rendiconto_id, "ente_id": str(ente_id)},
+            ente_id=ente_id,
+            utente_id=current_user.get('user_id'),
+            chiave=f"{TipoJob.PDF_RENDICONTO.value}:{rendiconto_id}"
+        )
+
+        conn.commit()
 
         return {
             "id": rendiconto_id,
@@ -310,8 +197,10 @@ async def crea_rendiconto(
             "data_revisione": None,
             "created_at": new_rendiconto[1].isoformat(),
             "num_documenti": 0,
-            "movimenti_bloccati": movimenti_bloccati,
-            "pdf_path": pdf_path,
+            "movimenti_bloccati": chiusura["movimenti_bloccati"],
+            "chiusura": chiusura,
+            "pdf_path": None,
+            "job_id": job_id,
             "message": "Rendiconto creato in bozza. Movimenti del periodo bloccati."
         }
         
@@ -331,7 +220,7 @@ async def crea_rendiconto(
 # ============================================
 
 @router.get("/rendiconti")
-async def get_rendiconti(
+def get_rendiconti(
     stato: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
@@ -407,7 +296,7 @@ async def get_rendiconti(
 # ============================================
 
 @router.get("/rendiconti/{rendiconto_id}")
-async def get_rendiconto(
+def get_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -476,7 +365,7 @@ async def get_rendiconto(
 # ============================================
 
 @router.delete("/rendiconti/{rendiconto_id}")
-async def elimina_rendiconto(
+def elimina_rendiconto(
     rendiconto_id: UUID,
     elimina_documenti: bool = True,
     current_user: dict = Depends(get_current_user)
@@ -528,9 +417,13 @@ async def elimina_rendiconto(
             WHERE ente_id = %s
               AND tipo_speciale = 'saldo_iniziale'
               AND riporto_saldo = TRUE
+            RETURNING rendiconto_id
         """, (str(ente_id),))
         
         saldi_eliminati = cur.rowcount
+        # Riporti già bloccati da altri rendiconti: anche i loro aggregati cambiano
+        rendiconti_modificati = {str(row[0]) for row in cur.fetchall() if row[0]}
+        rendiconti_modificati.add(str(rendiconto_id))
         
         # Elimina documenti fisici (solo se richiesto)
         if elimina_documenti:
@@ -560,6 +453,9 @@ async def elimina_rendiconto(
         # Elimina il rendiconto (CASCADE elimina documenti dal DB)
         cur.execute("DELETE FROM rendiconti WHERE id = %s", (str(rendiconto_id),))
         conn.commit()
+
+        for modificato_id in rendiconti_modificati:
+            invalida_aggregati_rendiconto(modificato_id)
         
         return {
             "message": f"Rendiconto eliminato con successo",
@@ -583,7 +479,7 @@ async def elimina_rendiconto(
 # ============================================
 
 @router.post("/rendiconti/{rendiconto_id}/correggi")
-async def correggi_rendiconto(
+def correggi_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -628,11 +524,13 @@ async def correggi_rendiconto(
         cur.execute("""
             UPDATE rendiconti
             SET stato = 'parrocchia',
-                updated_at = NOW()
+                updated_at = clock_timestamp()
             WHERE id = %s
         """, (str(rendiconto_id),))
 
         conn.commit()
+        # Nuovo updated_at = nuova versione anche per i worker non raggiunti
+        invalida_aggregati_rendiconto(rendiconto_id)
 
         return {
             "message": "Rendiconto riportato in stato Parrocchia. Puoi ora modificarlo e reinviarlo.",
@@ -656,7 +554,7 @@ async def correggi_rendiconto(
 # ============================================
 
 @router.get("/economo/rendiconti")
-async def get_rendiconti_economo(
+def get_rendiconti_economo(
     stato: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
@@ -740,7 +638,7 @@ async def get_rendiconti_economo(
 
 
 @router.post("/economo/rendiconti/{rendiconto_id}/approva")
-async def approva_rendiconto(
+def approva_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -820,7 +718,7 @@ async def approva_rendiconto(
 
 
 @router.post("/economo/rendiconti/{rendiconto_id}/respingi")
-async def respingi_rendiconto(
+def respingi_rendiconto(
     rendiconto_id: UUID,
     motivazione: str = None,
     current_user: dict = Depends(get_current_user)
@@ -6,8 +6,6 @@ import shutil
 from datetime import datetime
 from pathlib import Path
 import sys
-# Aggiungi questi import
-from jinja2 import Environment, FileSystemLoader
 # WeasyPrint opzionale (richiede GTK su Windows)
 try:
     from weasyprint import HTML
@@ -22,6 +20,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_db_connection
 from auth import get_current_user
 from constants import StatoRendiconto, TipoMovimento
+from services.chiusura_rendiconto import saldi_apertura
+from services.render_pdf import renderizza_pdf
+from services.asset_documenti import asset_pdf
+from utils.template_pdf import get_template
 
 router = APIRouter(prefix="/api/contabilita", tags=["Rendiconti Documenti"])
 
@@ -43,7 +45,7 @@ TIPI_DOCUMENTO_AMMESSI = [
 # ============================================
 
 @router.post("/rendiconti/{rendiconto_id}/documenti")
-async def upload_documento_rendiconto(
+def upload_documento_rendiconto(
     rendiconto_id: UUID,
     tipo_documento: str = Form(...),
     file: UploadFile = File(...),
@@ -159,7 +161,7 @@ async def upload_documento_rendiconto(
 # ============================================
 
 @router.get("/rendiconti/{rendiconto_id}/documenti")
-async def get_documenti_rendiconto(
+def get_documenti_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -214,7 +216,7 @@ async def get_documenti_rendiconto(
 # ============================================
 
 @router.get("/rendiconti/{rendiconto_id}/pdf")
-async def download_pdf_rendiconto(
+def download_pdf_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -281,7 +283,7 @@ async def download_pdf_rendiconto(
 # ============================================
 
 @router.get("/rendiconti/documenti/{documento_id}/download")
-async def download_documento(
+def download_documento(
     documento_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -329,7 +331,7 @@ async def download_documento(
 # ============================================
 
 @router.delete("/rendiconti/documenti/{documento_id}")
-async def delete_documento(
+def delete_documento(
     documento_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -385,7 +387,7 @@ async def delete_documento(
 # ============================================
 
 @router.post("/rendiconti/{rendiconto_id}/invia")
-async def invia_rendiconto(
+def invia_rendiconto(
     rendiconto_id: UUID,
     current_user: dict = Depends(get_current_user)
 ):
@@ -483,7 +485,7 @@ async def invia_rendiconto(
 # GENERA PDF RENDICONTO
 # ============================================
 
-async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
+def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
     """
     Genera PDF del rendiconto con movimenti organizzati per categoria
     """
@@ -548,21 +550,23 @@ async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
         periodo_inizio = rend[0]
         periodo_fine = rend[1]
         
-        # 3. Recupera saldi conti
+        # 3. Recupera saldi conti a fine periodo (riepiloghi mensili, migration 014)
         cur.execute("""
-            SELECT r.nome, r.tipo,
-                   COALESCE(SUM(CASE
-                       WHEN m.tipo_movimento = 'entrata' THEN m.importo
-                       WHEN m.tipo_movimento = 'uscita' THEN -m.importo
-                       ELSE 0
-                   END), 0) as saldo
+            SELECT r.nome, r.tipo, COALESCE(t.saldo, 0) as saldo
             FROM registri_contabili r
-            LEFT JOIN movimenti_contabili m ON m.registro_id = r.id
-                AND m.data_movimento <= %s
+            LEFT JOIN (
+                SELECT registro_id,
+                       SUM(CASE
+                           WHEN tipo_movimento = 'entrata' THEN totale
+                           WHEN tipo_movimento = 'uscita' THEN -totale
+                           ELSE 0
+                       END) as saldo
+                FROM totali_movimenti_periodo(%s, NULL, %s)
+                GROUP BY registro_id
+            ) t ON t.registro_id = r.id
             WHERE r.ente_id = %s AND r.attivo = TRUE
-            GROUP BY r.id, r.nome, r.tipo
             ORDER BY r.nome
-        """, (periodo_fine, ente_id))
+        """, (ente_id, periodo_fine, ente_id))
 
         conti = [{'nome': row[0], 'tipo': (row[1] or '').capitalize(), 'saldo': float(row[2])} for row in cur.fetchall()]
         totale_attivo = sum(c['saldo'] for c in conti)
@@ -682,15 +686,21 @@ async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
         totale_uscite = sum(c['totale'] for c in categorie_uscite)
         saldo = totale_entrate - totale_uscite
         
-        # 6. Recupera riporto anno precedente
-        cur.execute("""
-            SELECT saldo FROM rendiconti 
-            WHERE ente_id = %s AND periodo_fine < %s
-            ORDER BY periodo_fine DESC LIMIT 1
-        """, (ente_id, periodo_inizio))
-        
-        riporto_row = cur.fetchone()
-        if riporto_row:
+        # 6. Recupera riporto anno precedente (saldi di chiusura del rendiconto precedente)
+        saldi_precedenti = saldi_apertura(cur, ente_id, periodo_inizio)
+        riporto_row = None
+        if saldi_precedenti is None:
+            # Rendiconto precedente senza saldi di chiusura: usa il suo saldo
+            cur.execute("""
+                SELECT saldo FROM rendiconti 
+                WHERE ente_id = %s AND periodo_fine < %s
+                ORDER BY periodo_fine DESC LIMIT 1
+            """, (ente_id, periodo_inizio))
+            riporto_row = cur.fetchone()
+
+        if saldi_precedenti is not None:
+            riporto_precedente = sum(saldi_precedenti.values())
+        elif riporto_row:
             riporto_precedente = float(riporto_row[0])
         else:
             # Se non c'è rendiconto precedente, somma i saldi iniziali di TUTTI i conti
@@ -712,36 +722,15 @@ async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
        # 7. Prepara dati per template
         # 8. Renderizza template
         BASE_DIR = Path(__file__).resolve().parent.parent
-        TEMPLATES_DIR = BASE_DIR / "templates"
-        
-        # Carica logo e vescovo da impostazioni diocesi
-        logo_diocesi = None
-        vescovo_nome = None
-        vescovo_titolo = "Vescovo"
-        try:
-            cur.execute("SELECT logo_path, vescovo_nome, vescovo_titolo FROM impostazioni_diocesi LIMIT 1")
-            imp_diocesi = cur.fetchone()
-            if imp_diocesi:
-                if imp_diocesi[0]:  # logo_path
-                    logo_from_db = BASE_DIR / imp_diocesi[0]
-                    if logo_from_db.exists():
-                        logo_diocesi = str(logo_from_db)
-                vescovo_nome = imp_diocesi[1]  # vescovo_nome
-                vescovo_titolo = imp_diocesi[2] or "Vescovo"  # vescovo_titolo
-        except:
-            pass
-        
-        # Fallback logo statico
-        if not logo_diocesi:
-            logo_path = TEMPLATES_DIR / "assets" / "Logo Diocesi - Economato.png"
-            if logo_path.exists():
-                logo_diocesi = str(logo_path)
+        
+        # Logo (data URI) e Vescovo dalle impostazioni diocesi, precaricati
+        asset = asset_pdf()
         
         dati_template = {
             'ente': ente,
-            'logo_diocesi': logo_diocesi,
-            'vescovo': vescovo_nome or ente.get('vescovo') or "S.E. Mons. Calogero Peri",
-            'vescovo_titolo': vescovo_titolo,
+            'logo_diocesi': asset['logo_diocesi'],
+            'vescovo': asset['vescovo_nome'] or ente.get('vescovo') or "S.E. Mons. Calogero Peri",
+            'vescovo_titolo': asset['vescovo_titolo'],
             'periodo_inizio_fmt': periodo_inizio.strftime('%d/%m/%Y'),
             'periodo_fine_fmt': periodo_fine.strftime('%d/%m/%Y'),
             'data_compilazione': datetime.now().strftime('%d/%m/%Y'),
@@ -760,30 +749,7 @@ async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
             'data_approvazione': rend[7].strftime('%d/%m/%Y') if rend[7] else '',
         }
         
-        env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)))
-
-        # Filtro per formato numeri italiani (1.234,56)
-        def formato_italiano(valore):
-            try:
-                numero = float(valore)
-                formatted = "{:,.2f}".format(numero)
-                formatted = formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-                return formatted
-            except:
-                return valore
-
-        env.filters['ita'] = formato_italiano
-
-        def formato_italiano_intero(valore):
-            try:
-                numero = int(float(valore))
-                return f"{numero:,}".replace(",", ".")
-            except:
-                return valore
-
-        env.filters['ita_int'] = formato_italiano_intero
-
-        template = env.get_template('rendiconto.html')
+        template = get_template('rendiconto.html')
         html_content = template.render(**dati_template)
         
         # 9. Genera PDF (solo se WeasyPrint disponibile)
@@ -797,7 +763,7 @@ async def genera_pdf_rendiconto(rendiconto_id: str, ente_id: str):
         filename = f"rendiconto_{rendiconto_id}.pdf"
         pdf_path = RENDICONTI_DIR / filename
         
-        HTML(string=html_content, base_url=str(BASE_DIR)).write_pdf(str(pdf_path))
+        renderizza_pdf(html_content, percorso=str(pdf_path), base_url=str(BASE_DIR))
         
         # 10. Aggiorna totali nel database
         cur.execute("""
@@ -5,7 +5,7 @@ from uuid import UUID
 import asyncpg
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from auth import get_current_user
 from models.sacramenti import (
     BattesimoCreate, BattesimoUpdate, BattesimoResponse,
@@ -24,7 +24,7 @@ router = APIRouter(prefix="/sacramenti", tags=["sacramenti"])
 @router.get("/persone/{persona_id}/battesimo", response_model=Optional[BattesimoResponse])
 async def get_battesimo_persona(
     persona_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Ottiene il battesimo di una persona"""
@@ -44,7 +44,7 @@ async def get_battesimo_persona(
 @router.post("/battesimi", response_model=BattesimoResponse, status_code=status.HTTP_201_CREATED)
 async def create_battesimo(
     battesimo: BattesimoCreate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea un nuovo battesimo"""
@@ -81,7 +81,7 @@ async def create_battesimo(
 async def update_battesimo(
     battesimo_id: UUID,
     battesimo: BattesimoUpdate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Aggiorna un battesimo esistente"""
@@ -121,7 +121,7 @@ async def update_battesimo(
 @router.delete("/battesimi/{battesimo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_battesimo(
     battesimo_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Elimina un battesimo"""
@@ -138,7 +138,7 @@ async def delete_battesimo(
 @router.get("/persone/{persona_id}/prima-comunione", response_model=Optional[PrimaComunioneResponse])
 async def get_prima_comunione_persona(
     persona_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Ottiene la prima comunione di una persona"""
@@ -158,7 +158,7 @@ async def get_prima_comunione_persona(
 @router.post("/prime-comunioni", response_model=PrimaComunioneResponse, status_code=status.HTTP_201_CREATED)
 async def create_prima_comunione(
     comunione: PrimaComunioneCreate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea una nuova prima comunione"""
@@ -189,7 +189,7 @@ async def create_prima_comunione(
 async def update_prima_comunione(
     comunione_id: UUID,
     comunione: PrimaComunioneUpdate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Aggiorna una prima comunione esistente"""
@@ -227,7 +227,7 @@ async def update_prima_comunione(
 @router.delete("/prime-comunioni/{comunione_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_prima_comunione(
     comunione_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Elimina una prima comunione"""
@@ -244,7 +244,7 @@ async def delete_prima_comunione(
 @router.get("/persone/{persona_id}/cresima", response_model=Optional[CresimaResponse])
 async def get_cresima_persona(
     persona_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Ottiene la cresima di una persona"""
@@ -264,7 +264,7 @@ async def get_cresima_persona(
 @router.post("/cresime", response_model=CresimaResponse, status_code=status.HTTP_201_CREATED)
 async def create_cresima(
     cresima: CresimaCreate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea una nuova cresima"""
@@ -301,7 +301,7 @@ async def create_cresima(
 async def update_cresima(
     cresima_id: UUID,
     cresima: CresimaUpdate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Aggiorna una cresima esistente"""
@@ -339,7 +339,7 @@ async def update_cresima(
 @router.delete("/cresime/{cresima_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_cresima(
     cresima_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Elimina una cresima"""
@@ -356,7 +356,7 @@ async def delete_cresima(
 @router.get("/persone/{persona_id}/matrimoni", response_model=List[MatrimonioResponse])
 async def get_matrimoni_persona(
     persona_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Ottiene tutti i matrimoni di una persona (come sposo o sposa)"""
@@ -372,7 +372,7 @@ async def get_matrimoni_persona(
 @router.post("/matrimoni", response_model=MatrimonioResponse, status_code=status.HTTP_201_CREATED)
 async def create_matrimonio(
     matrimonio: MatrimonioCreate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Crea un nuovo matrimonio"""
@@ -415,7 +415,7 @@ async def create_matrimonio(
 async def update_matrimonio(
     matrimonio_id: UUID,
     matrimonio: MatrimonioUpdate,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Aggiorna un matrimonio esistente"""
@@ -453,7 +453,7 @@ async def update_matrimonio(
 @router.delete("/matrimoni/{matrimonio_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_matrimonio(
     matrimonio_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Elimina un matrimonio"""
@@ -470,7 +470,7 @@ async def delete_matrimonio(
 @router.get("/persone/{persona_id}/riepilogo", response_model=SacramentiPersonaResponse)
 async def get_sacramenti_persona(
     persona_id: UUID,
-    db: asyncpg.Pool = Depends(get_db),
+    db: asyncpg.Pool = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Ottiene tutti i sacramenti ricevuti da una persona"""
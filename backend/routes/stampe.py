@@ -1,19 +1,23 @@
 """
 Routes per generazione stampe rendiconti
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
 from fastapi.responses import FileResponse
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
 import os
 
-from database import get_db_connection
+from database import get_db
 from auth import get_current_user
+from services.chiusura_rendiconto import saldi_apertura
+from services.render_pdf import CodaPdfPiena, TimeoutRenderPdf
+from services import cache_pdf
 from utils.pdf_generator import (
     genera_pdf_rendiconto,
+    pdf_rendiconto_in_cache,
     salva_firma_vescovo,
     salva_timbro_diocesi,
     valida_immagine
@@ -34,7 +38,7 @@ os.makedirs(TIMBRI_DIR, exist_ok=True)
 router = APIRouter(prefix="/api/rendiconti", tags=["stampe"])
 
 
-async def calcola_dati_rendiconto(rendiconto_id: str, db):
+def calcola_dati_rendiconto(rendiconto_id: str, db: Session):
     """
     Recupera e calcola tutti i dati necessari per il PDF
     """
@@ -48,51 +52,63 @@ async def calcola_dati_rendiconto(rendiconto_id: str, db):
         JOIN enti e ON r.ente_id = e.id
         WHERE r.id = :rendiconto_id
     """)
-    result = await db.execute(query_rendiconto, {"rendiconto_id": rendiconto_id})
+    result = db.execute(query_rendiconto, {"rendiconto_id": rendiconto_id})
     rendiconto = result.fetchone()
     
     if not rendiconto:
         raise HTTPException(404, "Rendiconto non trovato")
     
     # 2. Calcola saldo anno precedente (per saldo iniziale)
-    query_saldo_precedente = text("""
-        SELECT COALESCE(SUM(
-            CASE
-                WHEN tipo_movimento = 'entrata' THEN importo
-                WHEN tipo_movimento = 'uscita' THEN -importo
-            END
-        ), 0) as saldo_precedente
-        FROM movimenti_contabili
-        WHERE ente_id = :ente_id
-          AND data_movimento < :periodo_inizio
-          AND tipo_speciale IS NULL
-    """)
-    result = await db.execute(query_saldo_precedente, {
-        "ente_id": rendiconto.ente_id,
-        "periodo_inizio": rendiconto.periodo_inizio
-    })
-    saldo_precedente = result.scalar() or Decimal('0')
+    # Saldi di chiusura del rendiconto precedente (migration 015), come nel
+    # documento del rendiconto (routes/rendiconti_documenti.py)
+    giorno_prima = rendiconto.periodo_inizio - timedelta(days=1)
+    cur = db.connection().connection.cursor()
+    try:
+        saldi_precedenti = saldi_apertura(cur, str(rendiconto.ente_id), rendiconto.periodo_inizio) or {}
+    finally:
+        cur.close()
+
+    if saldi_precedenti:
+        saldo_precedente = sum((Decimal(str(v)) for v in saldi_precedenti.values()), Decimal('0'))
+    else:
+        # Nessun rendiconto precedente: riepiloghi mensili fino al giorno prima (migration 014)
+        query_saldo_precedente = text("""
+            SELECT COALESCE(SUM(
+                CASE
+                    WHEN tipo_movimento = 'entrata' THEN totale
+                    WHEN tipo_movimento = 'uscita' THEN -totale
+                END
+            ), 0) as saldo_precedente
+            FROM totali_movimenti_periodo(:ente_id, NULL, :data_fine)
+            WHERE tipo_speciale IS NULL
+        """)
+        result = db.execute(query_saldo_precedente, {
+            "ente_id": rendiconto.ente_id,
+            "data_fine": giorno_prima
+        })
+        saldo_precedente = result.scalar() or Decimal('0')
     
     # Saldo iniziale in entrate o uscite
     saldo_iniziale_entrate = saldo_precedente if saldo_precedente >= 0 else Decimal('0')
     saldo_iniziale_uscite = abs(saldo_precedente) if saldo_precedente < 0 else Decimal('0')
     
     # 3. Categorie ENTRATE con gerarchia
-    categorie_entrate = await calcola_categorie_gerarchiche(
+    categorie_entrate = calcola_categorie_gerarchiche(
         rendiconto_id, rendiconto.ente_id, 'entrata', db
     )
     
     # 4. Categorie USCITE con gerarchia
-    categorie_uscite = await calcola_categorie_gerarchiche(
+    categorie_uscite = calcola_categorie_gerarchiche(
         rendiconto_id, rendiconto.ente_id, 'uscita', db
     )
     
     # 5. Saldi registri iniziali e finali
-    conti_iniziali, conti_finali = await calcola_saldi_registri(
+    conti_iniziali, conti_finali = calcola_saldi_registri(
         rendiconto.ente_id, 
         rendiconto.periodo_inizio, 
         rendiconto.periodo_fine,
-        db
+        db,
+        saldi_precedenti
     )
     
     # 6. Totali
@@ -158,70 +174,59 @@ async def calcola_dati_rendiconto(rendiconto_id: str, db):
     return dati
 
 
-async def calcola_categorie_gerarchiche(rendiconto_id: str, ente_id: str, tipo: str, db):
+def calcola_categorie_gerarchiche(rendiconto_id: str, ente_id: str, tipo: str, db: Session):
     """
     Calcola categorie con gerarchia (categoria → sottocategorie)
+
+    I totali sono quelli dei movimenti del rendiconto (periodo, esclusi i
+    giroconti: gli stessi bloccati alla creazione), letti dai riepiloghi
+    mensili in una sola query per tutte le categorie.
     """
-    # Query categorie principali (livello 1)
-    query_principali = text("""
-        SELECT 
-            pc.id, pc.codice, pc.descrizione, pc.livello,
-            COALESCE(SUM(mc.importo), 0) as totale
-        FROM piano_conti pc
-        LEFT JOIN movimenti_contabili mc ON (
-            mc.categoria_id = pc.id 
-            AND mc.rendiconto_id = :rendiconto_id
-            AND mc.tipo_movimento = :tipo
+    query = text("""
+        WITH periodo AS (
+            SELECT periodo_inizio, periodo_fine FROM rendiconti WHERE id = :rendiconto_id
+        ),
+        totali AS (
+            SELECT t.categoria_id, SUM(t.totale) AS totale
+            FROM periodo p, totali_movimenti_periodo(:ente_id, p.periodo_inizio, p.periodo_fine) t
+            WHERE t.tipo_movimento = :tipo
+              AND (t.tipo_speciale IS NULL OR t.tipo_speciale = 'saldo_iniziale')
+            GROUP BY t.categoria_id
         )
-        WHERE pc.ente_id = :ente_id 
-          AND pc.categoria = :tipo
-          AND pc.livello = 1
-          AND pc.is_sistema = FALSE
-        GROUP BY pc.id, pc.codice, pc.descrizione, pc.livello
+        SELECT
+            pc.id, pc.codice, pc.descrizione, pc.livello, pc.categoria, pc.is_sistema,
+            pc.conto_padre_id,
+            COALESCE(t.totale, 0) as totale
+        FROM piano_conti pc
+        LEFT JOIN totali t ON t.categoria_id = pc.id
+        WHERE pc.ente_id = :ente_id
         ORDER BY pc.codice
     """)
-    
-    result = await db.execute(query_principali, {
+
+    result = db.execute(query, {
         "rendiconto_id": rendiconto_id,
         "ente_id": ente_id,
         "tipo": tipo
     })
-    categorie_principali = result.fetchall()
-    
-    # Per ogni categoria principale, recupera sottocategorie
+    conti = result.fetchall()
+
+    figli = {}
+    for conto in conti:
+        if conto.conto_padre_id:
+            figli.setdefault(conto.conto_padre_id, []).append(conto)
+
     categorie = []
-    for cat_princ in categorie_principali:
-        # Query sottocategorie
-        query_sotto = text("""
-            SELECT 
-                pc.id, pc.codice, pc.descrizione, pc.livello,
-                COALESCE(SUM(mc.importo), 0) as totale
-            FROM piano_conti pc
-            LEFT JOIN movimenti_contabili mc ON (
-                mc.categoria_id = pc.id 
-                AND mc.rendiconto_id = :rendiconto_id
-                AND mc.tipo_movimento = :tipo
-            )
-            WHERE pc.ente_id = :ente_id 
-              AND pc.conto_padre_id = :padre_id
-            GROUP BY pc.id, pc.codice, pc.descrizione, pc.livello
-            ORDER BY pc.codice
-        """)
-        
-        result_sotto = await db.execute(query_sotto, {
-            "rendiconto_id": rendiconto_id,
-            "ente_id": ente_id,
-            "tipo": tipo,
-            "padre_id": cat_princ.id
-        })
-        sottocategorie = result_sotto.fetchall()
-        
+    for cat_princ in conti:
+        # Categorie principali (livello 1)
+        if cat_princ.categoria != tipo or cat_princ.livello != 1 or cat_princ.is_sistema:
+            continue
+
         sottocategorie_list = [
             {
                 'descrizione': sotto.descrizione,
                 'totale': float(sotto.totale)
             }
-            for sotto in sottocategorie
+            for sotto in figli.get(cat_princ.id, [])
         ]
         
         # Calcola subtotale (somma sottocategorie)
@@ -236,18 +241,21 @@ async def calcola_categorie_gerarchiche(rendiconto_id: str, ente_id: str, tipo:
     return categorie
 
 
-async def calcola_saldi_registri(ente_id: str, data_inizio, data_fine, db):
+def calcola_saldi_registri(ente_id: str, data_inizio, data_fine, db: Session, saldi_precedenti: Optional[dict] = None):
     """
-    Calcola saldi iniziali e finali per ogni registro
+    Calcola saldi iniziali e finali per ogni registro.
+    saldi_precedenti: saldi di chiusura del rendiconto precedente per registro
+    (da services.chiusura_rendiconto.saldi_apertura)
     """
+    saldi_precedenti = saldi_precedenti or {}
     # Saldi finali (attuali)
     query_finali = text("""
-        SELECT nome, tipo, saldo_attuale
+        SELECT id, nome, tipo, saldo_attuale
         FROM registri_contabili
         WHERE ente_id = :ente_id AND attivo = TRUE
         ORDER BY tipo, nome
     """)
-    result = await db.execute(query_finali, {"ente_id": ente_id})
+    result = db.execute(query_finali, {"ente_id": ente_id})
     registri = result.fetchall()
     
     conti_finali = [
@@ -258,29 +266,34 @@ async def calcola_saldi_registri(ente_id: str, data_inizio, data_fine, db):
         for r in registri
     ]
     
-    # Saldi iniziali (finali - movimenti del periodo)
-    conti_iniziali = []
-    for registro in registri:
-        # Somma movimenti del periodo per questo registro
-        query_movimenti = text("""
-            SELECT COALESCE(SUM(
+    # Saldi iniziali: dal rendiconto precedente, altrimenti finali - movimenti
+    # del periodo (tutti i registri in una query)
+    variazioni = {}
+    if any(str(r.id) not in saldi_precedenti for r in registri):
+        query_variazioni = text("""
+            SELECT registro_id, COALESCE(SUM(
                 CASE 
-                    WHEN tipo_movimento = 'entrata' THEN importo
-                    WHEN tipo_movimento = 'uscita' THEN -importo
+                    WHEN tipo_movimento = 'entrata' THEN totale
+                    WHEN tipo_movimento = 'uscita' THEN -totale
                 END
             ), 0) as variazione
-            FROM movimenti_contabili
-            WHERE registro_id = :registro_id
-              AND data_movimento BETWEEN :data_inizio AND :data_fine
+            FROM totali_movimenti_periodo(:ente_id, :data_inizio, :data_fine)
+            GROUP BY registro_id
         """)
-        result_mov = await db.execute(query_movimenti, {
-            "registro_id": registro.id,
+        result_mov = db.execute(query_variazioni, {
+            "ente_id": ente_id,
             "data_inizio": data_inizio,
             "data_fine": data_fine
         })
-        variazione = result_mov.scalar() or Decimal('0')
-        
-        saldo_iniziale = float(registro.saldo_attuale or 0) - float(variazione)
+        variazioni = {row.registro_id: row.variazione for row in result_mov.fetchall()}
+
+    conti_iniziali = []
+    for registro in registri:
+        if str(registro.id) in saldi_precedenti:
+            saldo_iniziale = float(saldi_precedenti[str(registro.id)])
+        else:
+            variazione = variazioni.get(registro.id) or Decimal('0')
+            saldo_iniziale = float(registro.saldo_attuale or 0) - float(variazione)
         
         conti_iniziali.append({
             'nome': registro.nome,
@@ -291,53 +304,57 @@ async def calcola_saldi_registri(ente_id: str, data_inizio, data_fine, db):
 
 
 @router.get("/{rendiconto_id}/pdf")
-async def genera_pdf(
+def genera_pdf(
     rendiconto_id: str,
-    db=Depends(get_db_connection),
-    current_user: dict = Depends(get_current_user)
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
 ):
     """
-    Genera e scarica PDF rendiconto
+    Genera e scarica PDF rendiconto (dalla cache se i dati non sono cambiati)
     """
     try:
         # Calcola dati
-        dati = await calcola_dati_rendiconto(rendiconto_id, db)
+        dati = calcola_dati_rendiconto(rendiconto_id, db)
         
-        # Genera PDF
-        pdf_path = genera_pdf_rendiconto(dati)
+        # Genera PDF (solo se non già in cache)
+        percorso, chiave, pdf_path = pdf_rendiconto_in_cache(dati)
         
         # Salva path nel database (se non esiste)
-        query_update = text("""
-            UPDATE rendiconti 
-            SET pdf_path = :pdf_path
-            WHERE id = :rendiconto_id AND pdf_path IS NULL
-        """)
-        await db.execute(query_update, {
-            "pdf_path": pdf_path,
-            "rendiconto_id": rendiconto_id
-        })
-        await db.commit()
+        if pdf_path:
+            query_update = text("""
+                UPDATE rendiconti 
+                SET pdf_path = :pdf_path
+                WHERE id = :rendiconto_id AND pdf_path IS NULL
+            """)
+            db.execute(query_update, {
+                "pdf_path": pdf_path,
+                "rendiconto_id": rendiconto_id
+            })
+            db.commit()
         
         # Ritorna file per download
-        return FileResponse(
-            pdf_path,
-            media_type='application/pdf',
-            filename=f"rendiconto_{rendiconto_id}.pdf"
-        )
+        return cache_pdf.risposta_pdf(percorso, chiave, f"rendiconto_{rendiconto_id}.pdf", if_none_match)
         
+    except HTTPException:
+        raise
+    except CodaPdfPiena as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "10"})
+    except TimeoutRenderPdf as e:
+        raise HTTPException(504, str(e))
     except Exception as e:
         raise HTTPException(500, f"Errore generazione PDF: {str(e)}")
 
 
 @router.post("/{rendiconto_id}/approva")
-async def approva_rendiconto(
+def approva_rendiconto(
     rendiconto_id: str,
     osservazioni: Optional[str] = Form(None),
     firma_vescovo: Optional[UploadFile] = File(None),
     timbro_diocesi: Optional[UploadFile] = File(None),
     vescovo_nome: Optional[str] = Form(None),
     luogo: Optional[str] = Form('Caltagirone'),
-    db=Depends(get_db_connection),
+    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -374,7 +391,7 @@ async def approva_rendiconto(
             WHERE id = :rendiconto_id
         """)
         
-        await db.execute(query_update, {
+        db.execute(query_update, {
             "rendiconto_id": rendiconto_id,
             "osservazioni": osservazioni,
             "firma_path": firma_path,
@@ -382,10 +399,10 @@ async def approva_rendiconto(
             "vescovo_nome": vescovo_nome,
             "luogo": luogo
         })
-        await db.commit()
+        db.commit()
         
         # Rigenera PDF con firme
-        dati = await calcola_dati_rendiconto(rendiconto_id, db)
+        dati = calcola_dati_rendiconto(rendiconto_id, db)
         pdf_firmato_path = genera_pdf_rendiconto(
             dati,
             output_path=f"{RENDICONTI_DIR}/rendiconto_{rendiconto_id}_approvato.pdf"
@@ -397,11 +414,11 @@ async def approva_rendiconto(
             SET pdf_firmato_path = :pdf_path
             WHERE id = :rendiconto_id
         """)
-        await db.execute(query_pdf, {
+        db.execute(query_pdf, {
             "pdf_path": pdf_firmato_path,
             "rendiconto_id": rendiconto_id
         })
-        await db.commit()
+        db.commit()
         
         return {
             "success": True,
@@ -409,16 +426,21 @@ async def approva_rendiconto(
             "pdf_path": pdf_firmato_path
         }
         
+    except CodaPdfPiena as e:
+        # Stato già salvato: il PDF si può rigenerare da GET /pdf
+        raise HTTPException(503, str(e), headers={"Retry-After": "10"})
+    except TimeoutRenderPdf as e:
+        raise HTTPException(504, str(e))
     except Exception as e:
-        await db.rollback()
+        db.rollback()
         raise HTTPException(500, f"Errore approvazione: {str(e)}")
 
 
 @router.post("/{rendiconto_id}/respingi")
-async def respingi_rendiconto(
+def respingi_rendiconto(
     rendiconto_id: str,
     osservazioni: str = Form(...),
-    db=Depends(get_db_connection),
+    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -439,14 +461,14 @@ async def respingi_rendiconto(
             WHERE id = :rendiconto_id
         """)
         
-        await db.execute(query, {
+        db.execute(query, {
             "rendiconto_id": rendiconto_id,
             "osservazioni": osservazioni
         })
-        await db.commit()
+        db.commit()
         
         # Genera PDF con stato "NON APPROVATO"
-        dati = await calcola_dati_rendiconto(rendiconto_id, db)
+        dati = calcola_dati_rendiconto(rendiconto_id, db)
         pdf_path = genera_pdf_rendiconto(dati)
         
         return {
@@ -455,15 +477,20 @@ async def respingi_rendiconto(
             "pdf_path": pdf_path
         }
         
+    except CodaPdfPiena as e:
+        # Stato già salvato: il PDF si può rigenerare da GET /pdf
+        raise HTTPException(503, str(e), headers={"Retry-After": "10"})
+    except TimeoutRenderPdf as e:
+        raise HTTPException(504, str(e))
     except Exception as e:
-        await db.rollback()
+        db.rollback()
         raise HTTPException(500, f"Errore: {str(e)}")
 
 
 @router.get("/{rendiconto_id}/pdf-firmato")
-async def scarica_pdf_firmato(
+def scarica_pdf_firmato(
     rendiconto_id: str,
-    db=Depends(get_db_connection),
+    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -474,7 +501,7 @@ async def scarica_pdf_firmato(
         FROM rendiconti 
         WHERE id = :rendiconto_id AND stato = 'approvato'
     """)
-    result = await db.execute(query, {"rendiconto_id": rendiconto_id})
+    result = db.execute(query, {"rendiconto_id": rendiconto_id})
     row = result.fetchone()
     
     if not row or not row.pdf_firmato_path:
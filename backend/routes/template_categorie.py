@@ -4,6 +4,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 from database import get_db
 from auth import get_current_user
+from services.cache_categorie import invalida_categorie
 
 router = APIRouter(prefix="/api/template-categorie", tags=["Template Categorie"])
 
@@ -29,7 +30,7 @@ class TemplateCategoriaUpdate(BaseModel):
 # ============================================
 
 @router.get("")
-async def get_template_categorie(
+def get_template_categorie(
     current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
 ):
@@ -78,7 +79,7 @@ async def get_template_categorie(
 # ============================================
 
 @router.post("")
-async def create_template_categoria(
+def create_template_categoria(
     categoria: TemplateCategoriaCreate,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
@@ -126,7 +127,7 @@ async def create_template_categoria(
 # ============================================
 
 @router.put("/{categoria_id}")
-async def update_template_categoria(
+def update_template_categoria(
     categoria_id: str,
     categoria: TemplateCategoriaUpdate,
     current_user: dict = Depends(get_current_user),
@@ -199,7 +200,7 @@ async def update_template_categoria(
 # ============================================
 
 @router.delete("/{categoria_id}")
-async def delete_template_categoria(
+def delete_template_categoria(
     categoria_id: str,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
@@ -255,7 +256,7 @@ CREATE INDEX idx_template_cat_ordine ON template_categorie_diocesano(ordine);
 """
 
 @router.post("/applica-a-ente/{ente_id}")
-async def applica_template_a_ente(
+def applica_template_a_ente(
     ente_id: str,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
@@ -363,6 +364,7 @@ async def applica_template_a_ente(
         
         db.execute(text(query_livello2), {"ente_id": ente_id})
         db.commit()
+        invalida_categorie(ente_id)
         
         # Conta categorie totali dopo inserimento
         count_after = """
@@ -393,7 +395,7 @@ async def applica_template_a_ente(
 
 
 @router.delete("/rimuovi-da-ente/{ente_id}")
-async def rimuovi_template_da_ente(
+def rimuovi_template_da_ente(
     ente_id: str,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
@@ -457,6 +459,7 @@ async def rimuovi_template_da_ente(
         
         db.execute(text(query), {"ente_id": ente_id})
         db.commit()
+        invalida_categorie(ente_id)
         
         return {
             "success": True,
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+============================================
+ECCLESIA - Benchmark Endpoint
+============================================
+Misura latenza (p50/p95/p99) e throughput degli endpoint più usati,
+eseguendo l'app FastAPI in-process con httpx.AsyncClient (ASGITransport)
+contro il database configurato, oppure contro un server già avviato (--url).
+
+Pensato per il dataset di scripts/genera_dataset.py (utente sint_1).
+
+USO:
+    python scripts/benchmark.py esegui --output benchmark/base.json
+    python scripts/benchmark.py esegui --richieste 500 --concorrenza 20 --scenari registri,movimenti
+    python scripts/benchmark.py esegui --scrittura            # include creazione rendiconto + PDF
+    python scripts/benchmark.py confronta benchmark/base.json benchmark/nuovo.json --soglia 10
+    python scripts/benchmark.py template --ripetizioni 200   # render Jinja dei PDF, senza database
+
+`confronta` termina con codice 1 se trova regressioni oltre la soglia.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BACKEND_DIR))
+
+
+# ============================================
+# SCENARI
+# ============================================
+# Ogni scenario: (nome, metodo, path, body, solo_con_scrittura)
+# I path possono usare i segnaposto {registro_id} e {anno}, risolti dopo il login.
+
+SCENARI = [
+    ("login", "LOGIN", "/api/auth/login", None, False),
+    ("registri", "GET", "/api/contabilita/registri", None, False),
+    ("movimenti", "GET", "/api/contabilita/movimenti", None, False),
+    ("movimenti_pagina", "GET", "/api/contabilita/movimenti?limite=100", None, False),
+    ("movimenti_conto", "GET", "/api/contabilita/movimenti/conto/{registro_id}", None, False),
+    ("report", "POST", "/api/contabilita/report", {
+        "dataInizio": "{anno}-01-01",
+        "dataFine": "{anno}-12-31",
+        "tipiMovimento": {"entrate": True, "uscite": True}
+    }, False),
+    ("report_riepilogo", "POST", "/api/contabilita/report", {
+        "dataInizio": "{anno}-01-01",
+        "dataFine": "{anno}-12-31",
+        "tipiMovimento": {"entrate": True, "uscite": True},
+        "dettaglio": False
+    }, False),
+    ("inventario_beni", "GET", "/api/inventario/beni", None, False),
+    ("piano_conti_pdf", "GET", "/api/contabilita/categorie/stampa-pdf", None, False),
+    ("inventario_pdf", "GET", "/api/inventario/stampa/bozza", None, False),
+    # Crea il rendiconto dell'anno aperto (blocco movimenti, saldi, PDF) e lo elimina
+    ("rendiconto_crea", "RENDICONTO", "/api/contabilita/rendiconti", None, True),
+]
+
+
+# ============================================
+# DRIVER DI CARICO
+# ============================================
+
+class Sessione:
+    """Client autenticato con i parametri risolti per gli scenari"""
+
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.headers = {}
+        self.parametri = {"anno": str(args.anno)}
+
+    async def login(self) -> httpx.Response:
+        return await self.client.post("/api/auth/login", data={
+            "username": self.args.utente,
+            "password": self.args.password
+        })
+
+    async def prepara(self):
+        risposta = await self.login()
+        risposta.raise_for_status()
+        dati = risposta.json()
+        self.headers = {"Authorization": f"Bearer {dati['access_token']}"}
+        if dati.get("enti"):
+            self.headers["X-Ente-Id"] = dati["enti"][0]["id"]
+
+        registri = await self.client.get("/api/contabilita/registri", headers=self.headers)
+        registri.raise_for_status()
+        elenco = registri.json()
+        elenco = elenco.get("registri", elenco) if isinstance(elenco, dict) else elenco
+        if elenco:
+            self.parametri["registro_id"] = str(elenco[0]["id"])
+
+    def risolvi(self, valore):
+        if isinstance(valore, str):
+            return valore.format(**self.parametri)
+        if isinstance(valore, dict):
+            return {k: self.risolvi(v) for k, v in valore.items()}
+        if isinstance(valore, list):
+            return [self.risolvi(v) for v in valore]
+        return valore
+
+    async def esegui(self, metodo: str, path: str, body) -> httpx.Response:
+        if metodo == "LOGIN":
+            return await self.login()
+        if metodo == "RENDICONTO":
+            anno = self.parametri["anno"]
+            risposta = await self.client.post(path, headers=self.headers, json={
+                "periodo_inizio": f"{anno}-01-01",
+                "periodo_fine": f"{anno}-12-31"
+            })
+            if risposta.status_code == 200:
+                rendiconto_id = risposta.json()["id"]
+                await self.client.delete(f"{path}/{rendiconto_id}", headers=self.headers)
+            return risposta
+        return await self.client.request(
+            metodo, self.risolvi(path), headers=self.headers,
+            json=self.risolvi(body) if body is not None else None
+        )
+
+
+def percentile(valori: list, p: float) -> float:
+    """Percentile con interpolazione lineare (valori già ordinati)"""
+    if not valori:
+        return 0.0
+    k = (len(valori) - 1) * p / 100
+    inferiore = int(k)
+    superiore = min(inferiore + 1, len(valori) - 1)
+    return valori[inferiore] + (valori[superiore] - valori[inferiore]) * (k - inferiore)
+
+
+def tempo_db_ms(risposta: httpx.Response):
+    """Estrae il tempo DB dall'header Server-Timing (db;dur=...)"""
+    for voce in risposta.headers.get("server-timing", "").split(","):
+        parti = voce.strip().split(";")
+        if parti[0] == "db":
+            for parte in parti[1:]:
+                if parte.startswith("dur="):
+                    return float(parte[4:])
+    return None
+
+
+async def misura_scenario(sessione: Sessione, scenario, args) -> dict:
+    nome, metodo, path, body, _ = scenario
+
+    # Riscaldamento (cache, pool, compilazione template)
+    for _ in range(args.riscaldamento):
+        await sessione.esegui(metodo, path, body)
+
+    totale = args.richieste
+    # La creazione rendiconto non è concorrente: un solo rendiconto aperto per ente
+    concorrenza = 1 if metodo == "RENDICONTO" else args.concorrenza
+    durate = []
+    tempi_db = []
+    errori = {}
+    coda = iter(range(totale))
+
+    async def worker():
+        for _ in coda:
+            inizio = time.perf_counter()
+            try:
+                risposta = await sessione.esegui(metodo, path, body)
+            except Exception as e:
+                chiave = type(e).__name__
+                errori[chiave] = errori.get(chiave, 0) + 1
+                continue
+            durate.append((time.perf_counter() - inizio) * 1000)
+            if risposta.status_code >= 400:
+                chiave = str(risposta.status_code)
+                errori[chiave] = errori.get(chiave, 0) + 1
+            db = tempo_db_ms(risposta)
+            if db is not None:
+                tempi_db.append(db)
+
+    inizio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concorrenza)))
+    durata_totale = time.perf_counter() - inizio
+
+    durate.sort()
+    return {
+        "richieste": totale,
+        "concorrenza": concorrenza,
+        "errori": errori,
+        "min_ms": round(durate[0], 3) if durate else None,
+        "media_ms": round(statistics.fmean(durate), 3) if durate else None,
+        "p50_ms": round(percentile(durate, 50), 3),
+        "p95_ms": round(percentile(durate, 95), 3),
+        "p99_ms": round(percentile(durate, 99), 3),
+        "max_ms": round(durate[-1], 3) if durate else None,
+        "db_media_ms": round(statistics.fmean(tempi_db), 3) if tempi_db else None,
+        "throughput_rps": round(len(durate) / durata_totale, 2) if durata_totale else None,
+    }
+
+
+async def esegui_benchmark(args) -> dict:
+    scenari = [s for s in SCENARI if args.scrittura or not s[4]]
+    if args.scenari:
+        richiesti = set(args.scenari.split(","))
+        scenari = [s for s in scenari if s[0] in richiesti]
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        ciclo_vita = None
+    else:
+        import main
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://benchmark", timeout=args.timeout
+        )
+        ciclo_vita = main.lifespan(main.app)
+        await ciclo_vita.__aenter__()
+
+    risultati = {}
+    try:
+        async with client:
+            sessione = Sessione(client, args)
+            await sessione.prepara()
+            for scenario in scenari:
+                nome = scenario[0]
+                if "{registro_id}" in scenario[2] and "registro_id" not in sessione.parametri:
+                    print(f"   ⏭️  {nome}: nessun registro disponibile, saltato")
+                    continue
+                risultato = await misura_scenario(sessione, scenario, args)
+                risultati[nome] = risultato
+                errori = f" ⚠️ errori {risultato['errori']}" if risultato["errori"] else ""
+                print(
+                    f"   {nome:<20} p50 {risultato['p50_ms']:>9.2f} ms | "
+                    f"p95 {risultato['p95_ms']:>9.2f} ms | p99 {risultato['p99_ms']:>9.2f} ms | "
+                    f"{risultato['throughput_rps'] or 0:>8.1f} req/s{errori}"
+                )
+    finally:
+        if ciclo_vita is not None:
+            await ciclo_vita.__aexit__(None, None, None)
+
+    return risultati
+
+
+def commit_corrente():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ============================================
+# COMANDI
+# ============================================
+
+def comando_esegui(args):
+    print("\n" + "=" * 60)
+    print(f"⏱️  BENCHMARK ({'server ' + args.url if args.url else 'in-process'})")
+    print("=" * 60)
+    print(f"   Richieste/scenario: {args.richieste} | Concorrenza: {args.concorrenza}")
+
+    risultati = asyncio.run(esegui_benchmark(args))
+
+    report = {
+        "creato": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_corrente(),
+        "parametri": {
+            "richieste": args.richieste,
+            "concorrenza": args.concorrenza,
+            "riscaldamento": args.riscaldamento,
+            "utente": args.utente,
+            "anno": args.anno,
+            "url": args.url,
+        },
+        "scenari": risultati,
+    }
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\n✅ Risultati salvati in {output}")
+
+
+def variazione(prima, dopo):
+    if not prima or dopo is None:
+        return None
+    return (dopo - prima) / prima * 100
+
+
+def comando_confronta(args):
+    base = json.loads(Path(args.base).read_text())
+    nuovo = json.loads(Path(args.nuovo).read_text())
+
+    print("\n" + "=" * 60)
+    print(f"📊 CONFRONTO {base.get('commit') or args.base} → {nuovo.get('commit') or args.nuovo}")
+    print("=" * 60)
+
+    regressioni = []
+    for nome, dopo in nuovo["scenari"].items():
+        prima = base["scenari"].get(nome)
+        if prima is None:
+            print(f"   {nome:<20} (nuovo scenario)")
+            continue
+
+        righe = []
+        for metrica in ("p50_ms", "p95_ms", "p99_ms"):
+            delta = variazione(prima[metrica], dopo[metrica])
+            if delta is None:
+                continue
+            righe.append(f"{metrica[:-3]} {prima[metrica]:.1f}→{dopo[metrica]:.1f} ({delta:+.1f}%)")
+            # Le variazioni sotto 1 ms sono rumore anche se grandi in percentuale
+            if delta > args.soglia and dopo[metrica] - prima[metrica] > 1.0:
+                regressioni.append(f"{nome}: {metrica} +{delta:.1f}%")
+
+        delta = variazione(prima["throughput_rps"], dopo["throughput_rps"])
+        if delta is not None:
+            righe.append(f"rps {delta:+.1f}%")
+            if -delta > args.soglia:
+                regressioni.append(f"{nome}: throughput {delta:.1f}%")
+
+        print(f"   {nome:<20} " + " | ".join(righe))
+
+    if regressioni:
+        print(f"\n❌ Regressioni oltre il {args.soglia:.0f}%:")
+        for regressione in regressioni:
+            print(f"   - {regressione}")
+        sys.exit(1)
+    print(f"\n✅ Nessuna regressione oltre il {args.soglia:.0f}%")
+
+
+# ============================================
+# RENDER DEI TEMPLATE
+# ============================================
+
+def dati_template_sintetici(voci: int) -> dict:
+    """Contesto per rendiconto.html e inventario_registro.html con `voci` righe"""
+    categorie = [
+        {
+            "codice": f"{i}", "descrizione": f"Categoria {i}", "totale": 1000.0 + i,
+            "sottocategorie": [
+                {"codice": f"{i}.{j}", "descrizione": f"Voce {i}.{j}", "totale": 100.0 + j}
+                for j in range(5)
+            ],
+        }
+        for i in range(max(voci // 5, 1))
+    ]
+    return {
+        "ente": {"denominazione": "Parrocchia di prova", "comune": "Caltagirone", "provincia": "CT"},
+        "periodo_inizio_fmt": "01/01/2025", "periodo_fine_fmt": "31/12/2025",
+        "totale_entrate": 12345.67, "totale_uscite": 2345.67, "saldo": 10000.0,
+        "riporto_precedente": 500.0,
+        "categorie_entrate": categorie, "categorie_uscite": categorie,
+        "conti": [{"nome": f"Conto {i}", "saldo": 1000.0 * i} for i in range(5)],
+        "beni": [
+            {"numero_progressivo": i, "descrizione": f"Bene {i}", "quantita": 1,
+             "valore_stimato": 10.0 * i, "categoria_nome": "Arredi", "ubicazione_nome": "Chiesa"}
+            for i in range(voci)
+        ],
+        "anno": 2025, "numero_registro": 1, "totale_beni": voci, "valore_totale": 1000.0,
+    }
+
+
+def misura_render(funzione, ripetizioni: int) -> dict:
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - inizio) * 1000)
+    tempi.sort()
+    return {
+        "p50_ms": round(percentile(tempi, 50), 3),
+        "p95_ms": round(percentile(tempi, 95), 3),
+        "p99_ms": round(percentile(tempi, 99), 3),
+        "throughput_rps": round(ripetizioni / (sum(tempi) / 1000), 1) if tempi else 0,
+    }
+
+
+def comando_template(args):
+    """Render con un Environment nuovo per stampa (come prima) e con l'ambiente condiviso"""
+    from utils import template_pdf
+
+    contesto = dati_template_sintetici(args.voci)
+    risultati = {}
+
+    print("\n" + "=" * 60)
+    print(f"⏱️  RENDER TEMPLATE ({args.ripetizioni} ripetizioni, {args.voci} voci)")
+    print("=" * 60)
+    for nome in ("rendiconto.html", "inventario_registro.html"):
+        varianti = {
+            "nuovo_env": lambda: template_pdf.crea_ambiente(bytecode_cache=False).get_template(nome).render(**contesto),
+            "nuovo_env_bytecode": lambda: template_pdf.crea_ambiente().get_template(nome).render(**contesto),
+            "condiviso": lambda: template_pdf.get_template(nome).render(**contesto),
+        }
+        for variante, funzione in varianti.items():
+            funzione()  # riscaldamento (e bytecode cache su disco)
+            chiave = f"template_{nome.split('.')[0]}_{variante}"
+            risultati[chiave] = misura_render(funzione, args.ripetizioni)
+            print(f"   {chiave:<50} p50 {risultati[chiave]['p50_ms']:.2f} ms | p95 {risultati[chiave]['p95_ms']:.2f} ms")
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            "creato": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit_corrente(),
+            "parametri": {"ripetizioni": args.ripetizioni, "voci": args.voci},
+            "scenari": risultati,
+        }, indent=2, ensure_ascii=False))
+        print(f"\n✅ Risultati salvati in {output}")
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark degli endpoint Ecclesia")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+
+    esegui = comandi.add_parser("esegui", help="Esegue il benchmark e salva i risultati in JSON")
+    esegui.add_argument("--output", default=f"benchmark/risultati_{datetime.now():%Y%m%d_%H%M%S}.json")
+    esegui.add_argument("--richieste", type=int, default=200, help="Richieste per scenario (default: 200)")
+    esegui.add_argument("--concorrenza", type=int, default=10, help="Richieste in parallelo (default: 10)")
+    esegui.add_argument("--riscaldamento", type=int, default=5, help="Richieste di riscaldamento (default: 5)")
+    esegui.add_argument("--scenari", help="Elenco scenari separati da virgola (default: tutti)")
+    esegui.add_argument("--scrittura", action="store_true",
+                        help="Include gli scenari che modificano i dati (creazione rendiconto)")
+    esegui.add_argument("--utente", default="sint_1")
+    esegui.add_argument("--password", default="sintetico")
+    esegui.add_argument("--anno", type=int, default=2025, help="Anno usato da report e rendiconto")
+    esegui.add_argument("--url", help="URL di un server avviato (default: app in-process)")
+    esegui.add_argument("--timeout", type=float, default=120.0)
+
+    confronta = comandi.add_parser("confronta", help="Confronta due risultati e segnala regressioni")
+    confronta.add_argument("base")
+    confronta.add_argument("nuovo")
+    confronta.add_argument("--soglia", type=float, default=10.0,
+                           help="Peggioramento percentuale tollerato (default: 10)")
+
+    template = comandi.add_parser("template", help="Misura il render Jinja dei template PDF (senza database)")
+    template.add_argument("--ripetizioni", type=int, default=200)
+    template.add_argument("--voci", type=int, default=200, help="Righe di beni e categorie (default: 200)")
+    template.add_argument("--output", help="File JSON dei risultati (confrontabile con `confronta`)")
+
+    args = parser.parse_args()
+    if args.comando == "esegui":
+        os.chdir(BACKEND_DIR)
+        comando_esegui(args)
+    elif args.comando == "template":
+        comando_template(args)
+    else:
+        comando_confronta(args)
+
+
+if __name__ == "__main__":
+    main()
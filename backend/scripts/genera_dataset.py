@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+============================================
+ECCLESIA - Generatore Dataset Sintetico
+============================================
+Genera una diocesi sintetica a volume realistico per test di carico
+e benchmark: enti, piano dei conti (dal template diocesano), registri,
+movimenti su più anni con giroconti e saldi iniziali, rendiconti chiusi,
+persone con sacramenti, beni di inventario con foto e storico audit.
+
+Il caricamento usa COPY (niente INSERT riga per riga) e il generatore è
+deterministico: stesso --seed e stessi parametri => stessi dati, UUID compresi.
+
+USO:
+    python scripts/genera_dataset.py                          # dataset piccolo (default)
+    python scripts/genera_dataset.py --enti 60 --movimenti 3000000 --seed 7
+    python scripts/genera_dataset.py --elimina                # rimuove i dati generati
+
+Ogni utente generato ha password "sintetico" (username sint_<n>, economo: sint_economo).
+I dati generati sono riconoscibili da enti.diocesi = 'Diocesi Sintetica'.
+"""
+
+import os
+import io
+import csv
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from constants import TipoMovimento, TipoSpecialeMovimento
+from services.cache_categorie import invalida_categorie
+
+DIOCESI_SINTETICA = "Diocesi Sintetica"
+PASSWORD_SINTETICA = "sintetico"
+
+COMUNI = [
+    ("Caltagirone", "CT", "95041"), ("Grammichele", "CT", "95042"),
+    ("Mineo", "CT", "95044"), ("Palagonia", "CT", "95046"),
+    ("Vizzini", "CT", "95049"), ("Licodia Eubea", "CT", "95040"),
+    ("Mazzarrone", "CT", "95040"), ("Niscemi", "CL", "93015"),
+    ("Ramacca", "CT", "95040"), ("Scordia", "CT", "95048"),
+]
+SANTI = [
+    "San Giacomo", "Santa Maria del Monte", "San Giorgio", "San Pietro",
+    "Sant'Agata", "San Michele Arcangelo", "San Giuseppe", "Santa Lucia",
+    "Maria SS. Assunta", "San Francesco di Paola", "Sacro Cuore", "San Nicola",
+]
+NOMI_M = ["Giuseppe", "Salvatore", "Francesco", "Antonino", "Giovanni", "Mario",
+          "Vincenzo", "Carmelo", "Sebastiano", "Paolo", "Luca", "Marco"]
+NOMI_F = ["Maria", "Giuseppina", "Rosa", "Anna", "Francesca", "Carmela",
+          "Angela", "Lucia", "Giovanna", "Sara", "Giulia", "Chiara"]
+COGNOMI = ["Russo", "Lombardo", "Greco", "La Rosa", "Messina", "Caruso",
+           "Scuderi", "Failla", "Di Stefano", "Amato", "Pappalardo", "Costa",
+           "Barbagallo", "Cannizzaro", "Ferrara", "Leonardi", "Rizzo", "Gulino"]
+CAUSALI_ENTRATA = ["Offerte domenicali", "Offerta battesimo", "Offerta matrimonio",
+                   "Colletta festa patronale", "Contributo 8x1000", "Offerte candele",
+                   "Donazione privata", "Affitto locali parrocchiali"]
+CAUSALI_USCITA = ["Bolletta ENEL", "Bolletta acqua", "Manutenzione chiesa",
+                  "Acquisto paramenti", "Fiori per l'altare", "Assicurazione",
+                  "Spese ufficio", "Riscaldamento", "Contributo Curia"]
+TIPI_REGISTRO = ["cassa", "banca", "postale", "deposito"]
+STATI_CONSERVAZIONE = ["ottimo", "buono", "discreto", "restauro", "scadente"]
+CATEGORIE_INVENTARIO = ["Arredi sacri", "Paramenti", "Dipinti", "Statue",
+                        "Oreficeria", "Mobili", "Libri e archivio"]
+
+# Piano conti di riserva, usato solo se template_categorie_diocesano è vuoto
+# (codice, descrizione, codice padre)
+TEMPLATE_PREDEFINITO = [
+    ("1", "ENTRATE ORDINARIE", None),
+    ("1.1", "Offerte", "1"), ("1.1.1", "Offerte domenicali", "1.1"),
+    ("1.1.2", "Offerte sacramenti", "1.1"), ("1.2", "Contributi", "1"),
+    ("1.2.1", "Contributo 8x1000", "1.2"), ("1.2.2", "Donazioni", "1.2"),
+    ("2", "USCITE ORDINARIE", None),
+    ("2.1", "Utenze", "2"), ("2.1.1", "Energia elettrica", "2.1"),
+    ("2.1.2", "Acqua", "2.1"), ("2.1.3", "Riscaldamento", "2.1"),
+    ("2.2", "Culto", "2"), ("2.2.1", "Paramenti e arredi", "2.2"),
+    ("2.2.2", "Fiori e candele", "2.2"), ("2.3", "Manutenzioni", "2"),
+    ("2.3.1", "Manutenzione ordinaria", "2.3"), ("2.3.2", "Assicurazioni", "2.3"),
+]
+
+
+# ============================================
+# CONFIGURAZIONE
+# ============================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genera una diocesi sintetica per test di carico")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DATABASE_URL da .env)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed del generatore (default: 42)")
+    parser.add_argument("--enti", type=int, default=10, help="Numero di enti (default: 10)")
+    parser.add_argument("--registri", type=int, default=3, help="Registri contabili per ente (default: 3)")
+    parser.add_argument("--movimenti", type=int, default=100_000,
+                        help="Movimenti totali, ripartiti tra gli enti (default: 100000)")
+    parser.add_argument("--anni", type=int, default=5, help="Anni di storico contabile (default: 5)")
+    parser.add_argument("--anno-finale", type=int, default=2025,
+                        help="Ultimo anno (aperto, senza rendiconto) (default: 2025)")
+    parser.add_argument("--persone", type=int, default=1_000, help="Persone per ente (default: 1000)")
+    parser.add_argument("--beni", type=int, default=200, help="Beni di inventario per ente (default: 200)")
+    parser.add_argument("--audit", type=int, default=500, help="Righe audit_log per ente (default: 500)")
+    parser.add_argument("--blocco", type=int, default=50_000, help="Righe per COPY (default: 50000)")
+    parser.add_argument("--elimina", action="store_true", help="Elimina i dati sintetici ed esce")
+    return parser.parse_args()
+
+
+def get_dsn(args) -> str:
+    if args.dsn:
+        return args.dsn
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        print("❌ ERRORE: DATABASE_URL non impostato (usa --dsn)")
+        sys.exit(1)
+    return dsn
+
+
+# ============================================
+# CARICAMENTO CON COPY
+# ============================================
+
+class CaricatoreCopy:
+    """
+    Accumula righe in memoria e le invia con COPY ... FROM STDIN (CSV).
+    Quando il buffer supera `blocco` righe chiama `al_pieno`, che svuota
+    tutte le tabelle nell'ordine delle foreign key.
+    """
+
+    def __init__(self, cur, tabella: str, colonne: list, blocco: int, al_pieno=None):
+        self.cur = cur
+        self.tabella = tabella
+        self.colonne = colonne
+        self.blocco = blocco
+        self.al_pieno = al_pieno or self.svuota
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.righe_buffer = 0
+        self.totale = 0
+
+    def aggiungi(self, *righe):
+        """Aggiunge una o più righe (inviate sempre nello stesso COPY)"""
+        for riga in righe:
+            self.writer.writerow(riga)
+        self.righe_buffer += len(righe)
+        if self.righe_buffer >= self.blocco:
+            self.al_pieno()
+
+    def svuota(self):
+        if not self.righe_buffer:
+            return
+        self.buffer.seek(0)
+        self.cur.copy_expert(
+            f"COPY {self.tabella} ({', '.join(self.colonne)}) FROM STDIN WITH (FORMAT csv)",
+            self.buffer
+        )
+        self.totale += self.righe_buffer
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.righe_buffer = 0
+
+
+# ============================================
+# GENERATORE
+# ============================================
+
+class GeneratoreDiocesi:
+
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.anni = list(range(args.anno_finale - args.anni + 1, args.anno_finale + 1))
+
+        # Un solo hash bcrypt per tutti gli utenti, con sale derivato dal seed
+        import bcrypt
+        alfabeto = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+        rng_sale = random.Random(args.seed)
+        sale = "$2b$12$" + "".join(rng_sale.choice(alfabeto) for _ in range(21)) + "."
+        self.password_hash = bcrypt.hashpw(PASSWORD_SINTETICA.encode(), sale.encode()).decode()
+
+        blocco = args.blocco
+        cur = self.cur
+        self.copy = {
+            "enti": CaricatoreCopy(cur, "enti", [
+                "id", "tipo", "denominazione", "comune", "provincia", "cap", "diocesi",
+                "parroco", "santo_patrono", "attivo"], blocco),
+            "utenti": CaricatoreCopy(cur, "utenti", [
+                "id", "username", "email", "password_hash", "titolo", "nome", "cognome",
+                "attivo", "is_economo"], blocco),
+            "utenti_enti": CaricatoreCopy(cur, "utenti_enti", [
+                "id", "utente_id", "ente_id", "ruolo", "permessi"], blocco),
+            "piano_conti": CaricatoreCopy(cur, "piano_conti", [
+                "id", "ente_id", "codice", "descrizione", "tipo", "livello",
+                "categoria_padre_id", "ordine", "is_sistema", "attivo"], blocco),
+            "registri_contabili": CaricatoreCopy(cur, "registri_contabili", [
+                "id", "ente_id", "nome", "tipo", "saldo_iniziale", "saldo_attuale", "attivo"], blocco),
+            "rendiconti": CaricatoreCopy(cur, "rendiconti", [
+                "id", "ente_id", "periodo_inizio", "periodo_fine", "stato", "totale_entrate",
+                "totale_uscite", "saldo", "data_invio", "created_by", "updated_at"], blocco),
+            "movimenti_contabili": CaricatoreCopy(cur, "movimenti_contabili", [
+                "id", "ente_id", "registro_id", "categoria_id", "data_movimento",
+                "tipo_movimento", "importo", "causale", "descrizione", "note", "tipo_speciale",
+                "riporto_saldo", "bloccato", "rendiconto_id", "giroconto_collegato_id",
+                "created_by", "created_at", "updated_at"], blocco),
+            "persone": CaricatoreCopy(cur, "persone", [
+                "id", "ente_id", "cognome", "nome", "sesso", "data_nascita", "comune_nascita",
+                "indirizzo", "comune", "provincia", "cap", "vivente", "created_at"], blocco),
+            "battesimi": CaricatoreCopy(cur, "battesimi", [
+                "id", "persona_id", "ente_id", "data_battesimo", "luogo", "parrocchia",
+                "volume", "pagina", "numero_atto", "celebrante"], blocco),
+            "prime_comunioni": CaricatoreCopy(cur, "prime_comunioni", [
+                "id", "persona_id", "ente_id", "data_comunione", "luogo", "parrocchia",
+                "celebrante"], blocco),
+            "cresime": CaricatoreCopy(cur, "cresime", [
+                "id", "persona_id", "ente_id", "data_cresima", "luogo", "parrocchia",
+                "volume", "pagina", "numero_atto", "ministro"], blocco),
+            "inventario_categorie": CaricatoreCopy(cur, "inventario_categorie", [
+                "id", "ente_id", "nome", "ordine", "attivo"], blocco),
+            "beni_inventario": CaricatoreCopy(cur, "beni_inventario", [
+                "id", "ente_id", "numero_progressivo", "categoria_id", "descrizione", "quantita",
+                "stato_conservazione", "valore_stimato", "data_acquisto", "stato",
+                "created_by", "created_at", "updated_at"], blocco),
+            "inventario_foto": CaricatoreCopy(cur, "inventario_foto", [
+                "id", "bene_id", "ente_id", "nome_file", "path_file", "mime_type",
+                "dimensione", "ordine"], blocco),
+            "audit_log": CaricatoreCopy(cur, "audit_log", [
+                "id", "timestamp", "utente_id", "utente_email", "ente_id", "azione",
+                "tabella", "record_id", "dati_nuovi", "descrizione"], blocco),
+        }
+        # Ordine di scaricamento: rispetta le foreign key (i padri
+        # vengono sempre aggiunti prima dei figli)
+        self.ordine_tabelle = list(self.copy.keys())
+        for caricatore in self.copy.values():
+            caricatore.al_pieno = self.svuota_tutto
+
+    # --------------------------------------------
+    # Utility deterministiche
+    # --------------------------------------------
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def data_casuale(self, inizio: date, fine: date) -> date:
+        return inizio + timedelta(days=self.rng.randint(0, (fine - inizio).days))
+
+    def timestamp_di(self, giorno: date) -> datetime:
+        return datetime(giorno.year, giorno.month, giorno.day) + timedelta(
+            seconds=self.rng.randint(8 * 3600, 20 * 3600)
+        )
+
+    def importo(self, minimo: int, massimo: int) -> Decimal:
+        return Decimal(self.rng.randint(minimo * 100, massimo * 100)) / 100
+
+    def svuota_tutto(self):
+        for tabella in self.ordine_tabelle:
+            self.copy[tabella].svuota()
+
+    # --------------------------------------------
+    # Template piano conti
+    # --------------------------------------------
+
+    def carica_template(self) -> list:
+        """
+        Legge template_categorie_diocesano come lista (codice, descrizione,
+        codice_padre, ordine), con i padri sempre prima dei figli.
+        """
+        self.cur.execute("""
+            SELECT t.codice, t.descrizione, p.codice, t.ordine, t.livello
+            FROM template_categorie_diocesano t
+            LEFT JOIN template_categorie_diocesano p ON p.id = t.categoria_padre_id
+            WHERE t.attivo = TRUE
+            ORDER BY t.livello, t.ordine, t.codice
+        """)
+        righe = self.cur.fetchall()
+        if not righe:
+            print("   ⚠️  template_categorie_diocesano vuoto: uso il piano conti predefinito")
+            return [(c, d, p, i) for i, (c, d, p) in enumerate(TEMPLATE_PREDEFINITO)]
+        return [(r[0], r[1], r[2], r[3]) for r in righe]
+
+    # --------------------------------------------
+    # Generazione
+    # --------------------------------------------
+
+    def genera(self):
+        args = self.args
+        template = self.carica_template()
+
+        # Economo diocesano
+        economo_id = self.uuid()
+        self.copy["utenti"].aggiungi((
+            economo_id, "sint_economo", "sint_economo@diocesi.test", self.password_hash,
+            "Mons.", "Economo", "Sintetico", True, True
+        ))
+
+        movimenti_per_ente = max(args.movimenti // max(args.enti, 1), 0)
+
+        for n in range(1, args.enti + 1):
+            inizio = time.monotonic()
+            self.genera_ente(n, template, movimenti_per_ente, economo_id)
+            print(f"   ⛪ Ente {n}/{args.enti} generato ({time.monotonic() - inizio:.1f}s)")
+
+        self.svuota_tutto()
+
+    def genera_ente(self, n: int, template: list, num_movimenti: int, economo_id: str):
+        rng = self.rng
+        comune, provincia, cap = COMUNI[(n - 1) % len(COMUNI)]
+        santo = rng.choice(SANTI)
+        denominazione = f"Parrocchia {santo} ({n})"
+        ente_id = self.uuid()
+        parroco = f"Don {rng.choice(NOMI_M)} {rng.choice(COGNOMI)}"
+
+        self.copy["enti"].aggiungi((
+            ente_id, "Parrocchia", denominazione, comune, provincia, cap,
+            DIOCESI_SINTETICA, parroco, santo, True
+        ))
+
+        # Parroco/operatore dell'ente
+        utente_id = self.uuid()
+        self.copy["utenti"].aggiungi((
+            utente_id, f"sint_{n}", f"sint_{n}@diocesi.test", self.password_hash,
+            "Don", parroco.split()[1], parroco.split()[-1], True, False
+        ))
+        permessi = json.dumps({"anagrafica": True, "inventario": True, "contabilita": True})
+        self.copy["utenti_enti"].aggiungi((self.uuid(), utente_id, ente_id, "parroco", permessi))
+        self.copy["utenti_enti"].aggiungi((self.uuid(), economo_id, ente_id, "economo", permessi))
+
+        categorie_foglia, cat_saldo_id, cat_giroconto_id = self.genera_piano_conti(ente_id, template)
+        self.genera_contabilita(ente_id, utente_id, categorie_foglia, cat_saldo_id,
+                                cat_giroconto_id, num_movimenti)
+        persone_ids = self.genera_persone(ente_id, denominazione, comune, provincia, cap, parroco)
+        beni_ids = self.genera_inventario(ente_id, utente_id)
+        self.genera_audit(ente_id, utente_id, f"sint_{n}@diocesi.test", persone_ids, beni_ids)
+
+    def genera_piano_conti(self, ente_id: str, template: list):
+        """Copia il template nel piano conti dell'ente, come applica_template_a_ente"""
+        ids = {}
+        figli = set()
+        for codice, descrizione, codice_padre, ordine in template:
+            ids[codice] = self.uuid()
+            if codice_padre:
+                figli.add(codice_padre)
+
+        livelli = {}
+        for codice, descrizione, codice_padre, ordine in template:
+            livelli[codice] = livelli.get(codice_padre, 0) + 1
+            self.copy["piano_conti"].aggiungi((
+                ids[codice], ente_id, codice, descrizione, "economico", livelli[codice],
+                ids.get(codice_padre), ordine, False, True
+            ))
+
+        # Categorie di sistema usate da rendiconti e giroconti
+        cat_saldo_id = self.uuid()
+        cat_giroconto_id = self.uuid()
+        self.copy["piano_conti"].aggiungi((
+            cat_saldo_id, ente_id, "000", "SALDO DA ESERCIZIO PRECEDENTE", "economico",
+            1, None, 0, True, True
+        ))
+        self.copy["piano_conti"].aggiungi((
+            cat_giroconto_id, ente_id, "GIR", "Giroconto", "economico", 1, None, 0, True, True
+        ))
+
+        foglie = [ids[codice] for codice, _, _, _ in template if codice not in figli]
+        return foglie or list(ids.values()), cat_saldo_id, cat_giroconto_id
+
+    def genera_contabilita(self, ente_id, utente_id, categorie, cat_saldo_id,
+                           cat_giroconto_id, num_movimenti):
+        """
+        Registri, movimenti per anno, giroconti, saldi iniziali riportati e
+        un rendiconto approvato per ogni anno chiuso (movimenti bloccati).
+        """
+        rng = self.rng
+        args = self.args
+        movimenti = self.copy["movimenti_contabili"]
+
+        registri = []
+        for i in range(args.registri):
+            tipo = TIPI_REGISTRO[i % len(TIPI_REGISTRO)]
+            registri.append({
+                "id": self.uuid(),
+                "nome": f"{tipo.capitalize()} {i + 1}",
+                "tipo": tipo,
+                "saldo_iniziale": self.importo(500, 20_000),
+            })
+        saldi = {r["id"]: r["saldo_iniziale"] for r in registri}
+        # saldo_attuale parte da 0: lo aggiornano i trigger sui movimenti (migration 009)
+        for registro in registri:
+            self.copy["registri_contabili"].aggiungi((
+                registro["id"], ente_id, registro["nome"], registro["tipo"],
+                registro["saldo_iniziale"], 0, True
+            ))
+
+        per_anno = max(num_movimenti // len(self.anni), 0)
+        ultimo_anno = self.anni[-1]
+
+        for anno in self.anni:
+            inizio_anno, fine_anno = date(anno, 1, 1), date(anno, 12, 31)
+            chiuso = anno != ultimo_anno
+            rendiconto_id = self.uuid() if chiuso else None
+            totale_entrate = Decimal(0)
+            totale_uscite = Decimal(0)
+            # Righe dell'anno: caricate dopo il rendiconto che le blocca
+            righe = []
+
+            # Saldo iniziale di ogni registro (riporto dall'anno precedente)
+            for registro in registri:
+                saldo = saldi[registro["id"]]
+                creato = self.timestamp_di(inizio_anno)
+                righe.append((
+                    self.uuid(), ente_id, registro["id"], cat_saldo_id, inizio_anno,
+                    TipoMovimento.ENTRATA.value if saldo >= 0 else TipoMovimento.USCITA.value, abs(saldo),
+                    "Saldo iniziale", "Saldo iniziale", f"Riporto automatico esercizio {anno - 1}",
+                    TipoSpecialeMovimento.SALDO_INIZIALE.value, True, chiuso, rendiconto_id, None,
+                    utente_id, creato, creato
+                ))
+
+            giorni = sorted(self.data_casuale(inizio_anno, fine_anno) for _ in range(per_anno))
+            i = 0
+            while i < len(giorni):
+                giorno = giorni[i]
+                creato = self.timestamp_di(giorno)
+
+                # ~3% giroconti tra due registri (due righe collegate)
+                if len(registri) > 1 and rng.random() < 0.03 and i + 1 < len(giorni):
+                    origine, destinazione = rng.sample(registri, 2)
+                    importo = self.importo(50, 3_000)
+                    uscita_id, entrata_id = self.uuid(), self.uuid()
+                    nota_uscita = f"Giroconto per C/C {destinazione['nome']}"
+                    nota_entrata = f"Giroconto da C/C {origine['nome']}"
+                    # I giroconti non entrano nel rendiconto (tipo_speciale valorizzato)
+                    righe.append((
+                        (uscita_id, ente_id, origine["id"], cat_giroconto_id, giorno,
+                         TipoMovimento.USCITA.value, importo, nota_uscita, nota_uscita, nota_uscita,
+                         TipoSpecialeMovimento.GIROCONTO.value, False, False, None, entrata_id,
+                         utente_id, creato, creato),
+                        (entrata_id, ente_id, destinazione["id"], cat_giroconto_id, giorno,
+                         TipoMovimento.ENTRATA.value, importo, nota_entrata, nota_entrata, nota_entrata,
+                         TipoSpecialeMovimento.GIROCONTO.value, False, False, None, uscita_id,
+                         utente_id, creato, creato)
+                    ))
+                    saldi[origine["id"]] -= importo
+                    saldi[destinazione["id"]] += importo
+                    i += 2
+                    continue
+
+                registro = rng.choice(registri)
+                if rng.random() < 0.52:
+                    tipo = TipoMovimento.ENTRATA.value
+                    causale = rng.choice(CAUSALI_ENTRATA)
+                    importo = self.importo(5, 1_500)
+                    saldi[registro["id"]] += importo
+                    totale_entrate += importo
+                else:
+                    tipo = TipoMovimento.USCITA.value
+                    causale = rng.choice(CAUSALI_USCITA)
+                    importo = self.importo(5, 1_400)
+                    saldi[registro["id"]] -= importo
+                    totale_uscite += importo
+
+                righe.append((
+                    self.uuid(), ente_id, registro["id"], rng.choice(categorie), giorno,
+                    tipo, importo, causale, f"{causale} {giorno.strftime('%m/%Y')}", None,
+                    None, False, chiuso, rendiconto_id, None, utente_id, creato, creato
+                ))
+                i += 1
+
+            if chiuso:
+                data_invio = self.timestamp_di(date(anno + 1, 2, 15))
+                self.copy["rendiconti"].aggiungi((
+                    rendiconto_id, ente_id, inizio_anno, fine_anno, "approvato",
+                    totale_entrate, totale_uscite, totale_entrate - totale_uscite,
+                    data_invio, utente_id, data_invio
+                ))
+
+            for riga in righe:
+                # Coppia di giroconto: le due righe vanno nello stesso COPY
+                if isinstance(riga[0], tuple):
+                    movimenti.aggiungi(*riga)
+                else:
+                    movimenti.aggiungi(riga)
+
+    def genera_persone(self, ente_id, parrocchia, comune, provincia, cap, parroco) -> list:
+        rng = self.rng
+        oggi = date(self.args.anno_finale, 12, 31)
+        ids = []
+        for _ in range(self.args.persone):
+            persona_id = self.uuid()
+            ids.append(persona_id)
+            sesso = rng.choice("MF")
+            nome = rng.choice(NOMI_M if sesso == "M" else NOMI_F)
+            nascita = self.data_casuale(date(1930, 1, 1), oggi - timedelta(days=30))
+            vivente = nascita.year > 1950 or rng.random() < 0.4
+            self.copy["persone"].aggiungi((
+                persona_id, ente_id, rng.choice(COGNOMI), nome, sesso, nascita, comune,
+                f"Via {rng.choice(SANTI)} {rng.randint(1, 200)}", comune, provincia, cap,
+                vivente, self.timestamp_di(self.data_casuale(date(self.anni[0], 1, 1), oggi))
+            ))
+
+            volume = str(nascita.year)
+            if rng.random() < 0.85:
+                data = min(nascita + timedelta(days=rng.randint(20, 200)), oggi)
+                self.copy["battesimi"].aggiungi((
+                    self.uuid(), persona_id, ente_id, data, comune, parrocchia, volume,
+                    str(rng.randint(1, 300)), str(rng.randint(1, 999)), parroco
+                ))
+            if rng.random() < 0.65 and nascita + timedelta(days=9 * 365) < oggi:
+                data = nascita + timedelta(days=9 * 365 + rng.randint(0, 365))
+                self.copy["prime_comunioni"].aggiungi((
+                    self.uuid(), persona_id, ente_id, min(data, oggi), comune, parrocchia, parroco
+                ))
+            if rng.random() < 0.45 and nascita + timedelta(days=14 * 365) < oggi:
+                data = nascita + timedelta(days=14 * 365 + rng.randint(0, 3 * 365))
+                self.copy["cresime"].aggiungi((
+                    self.uuid(), persona_id, ente_id, min(data, oggi), comune, parrocchia,
+                    volume, str(rng.randint(1, 300)), str(rng.randint(1, 999)), "S.E. il Vescovo"
+                ))
+        return ids
+
+    def genera_inventario(self, ente_id, utente_id) -> list:
+        rng = self.rng
+        categorie = []
+        for ordine, nome in enumerate(CATEGORIE_INVENTARIO):
+            categoria_id = self.uuid()
+            categorie.append((categoria_id, nome))
+            self.copy["inventario_categorie"].aggiungi((categoria_id, ente_id, nome, ordine, True))
+
+        ids = []
+        for numero in range(1, self.args.beni + 1):
+            bene_id = self.uuid()
+            ids.append(bene_id)
+            categoria_id, nome_categoria = rng.choice(categorie)
+            acquisto = self.data_casuale(date(1900, 1, 1), date(self.args.anno_finale, 12, 31))
+            creato = self.timestamp_di(self.data_casuale(date(self.anni[0], 1, 1),
+                                                         date(self.args.anno_finale, 12, 31)))
+            self.copy["beni_inventario"].aggiungi((
+                bene_id, ente_id, numero, categoria_id, f"{nome_categoria} - oggetto n. {numero}",
+                rng.randint(1, 4), rng.choice(STATI_CONSERVAZIONE), self.importo(50, 50_000),
+                acquisto, "attivo", utente_id, creato, creato
+            ))
+            # Foto: solo metadati, puntano a un file segnaposto
+            for ordine in range(rng.choice((0, 1, 1, 2, 3))):
+                nome_file = f"{bene_id}_{ordine}.jpg"
+                self.copy["inventario_foto"].aggiungi((
+                    self.uuid(), bene_id, ente_id, nome_file,
+                    f"uploads/inventario/sintetico/{nome_file}", "image/jpeg",
+                    rng.randint(80_000, 2_500_000), ordine
+                ))
+        return ids
+
+    def genera_audit(self, ente_id, utente_id, email, persone_ids, beni_ids):
+        rng = self.rng
+        bersagli = [("persone", persone_ids), ("beni_inventario", beni_ids)]
+        bersagli = [(tabella, ids) for tabella, ids in bersagli if ids]
+        if not bersagli:
+            return
+        for _ in range(self.args.audit):
+            tabella, ids = rng.choice(bersagli)
+            azione = rng.choice(("INSERT", "UPDATE", "UPDATE", "DELETE"))
+            giorno = self.data_casuale(date(self.anni[0], 1, 1), date(self.args.anno_finale, 12, 31))
+            self.copy["audit_log"].aggiungi((
+                self.uuid(), self.timestamp_di(giorno), utente_id, email, ente_id, azione,
+                tabella, rng.choice(ids), json.dumps({"sintetico": True}),
+                f"{azione} su {tabella} (dato sintetico)"
+            ))
+
+
+# ============================================
+# ELIMINAZIONE
+# ============================================
+
+def elimina_dati_sintetici(conn):
+    """Rimuove tutti i dati della diocesi sintetica (ordine inverso alle FK)"""
+    cur = conn.cursor()
+    enti = "SELECT id FROM enti WHERE diocesi = %(diocesi)s"
+    tabelle_per_ente = [
+        "audit_log", "inventario_foto", "beni_inventario", "inventario_categorie",
+        "cresime", "prime_comunioni", "battesimi", "persone",
+        "movimenti_contabili", "rendiconti", "registri_contabili", "piano_conti",
+        "utenti_enti",
+    ]
+    cur.execute(enti, {"diocesi": DIOCESI_SINTETICA})
+    enti_eliminati = [str(r[0]) for r in cur.fetchall()]
+    for tabella in tabelle_per_ente:
+        cur.execute(f"DELETE FROM {tabella} WHERE ente_id IN ({enti})", {"diocesi": DIOCESI_SINTETICA})
+        print(f"   🗑️  {tabella}: {cur.rowcount}")
+    cur.execute("DELETE FROM enti WHERE diocesi = %(diocesi)s", {"diocesi": DIOCESI_SINTETICA})
+    print(f"   🗑️  enti: {cur.rowcount}")
+    cur.execute("DELETE FROM utenti WHERE username LIKE 'sint\\_%%' AND email LIKE '%%@diocesi.test'")
+    print(f"   🗑️  utenti: {cur.rowcount}")
+    conn.commit()
+    cur.close()
+
+    # Gli UUID sono deterministici: una nuova generazione riusa gli stessi enti
+    for ente_id in enti_eliminati:
+        invalida_categorie(ente_id)
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def main():
+    args = parse_args()
+    conn = psycopg2.connect(get_dsn(args))
+    conn.autocommit = False
+
+    try:
+        if args.elimina:
+            print("\n🧹 Eliminazione dati sintetici")
+            elimina_dati_sintetici(conn)
+            print("\n✅ Dati sintetici eliminati")
+            return
+
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM enti WHERE diocesi = %s", (DIOCESI_SINTETICA,))
+        if cur.fetchone()[0]:
+            print("❌ ERRORE: dati sintetici già presenti. Esegui prima con --elimina")
+            sys.exit(1)
+        cur.close()
+
+        print("\n" + "=" * 60)
+        print(f"🏗️  GENERAZIONE DIOCESI SINTETICA (seed {args.seed})")
+        print("=" * 60)
+        print(f"   Enti: {args.enti} | Registri/ente: {args.registri} | Movimenti: {args.movimenti}")
+        print(f"   Anni: {args.anni} (fino al {args.anno_finale}) | Persone/ente: {args.persone}")
+        print(f"   Beni/ente: {args.beni} | Audit/ente: {args.audit}")
+
+        inizio = time.monotonic()
+        generatore = GeneratoreDiocesi(conn, args)
+        generatore.genera()
+        conn.commit()
+
+        print(f"\n{'=' * 60}")
+        for tabella in generatore.ordine_tabelle:
+            print(f"   {tabella}: {generatore.copy[tabella].totale}")
+        print(f"\n✅ Completato in {time.monotonic() - inizio:.1f}s")
+        print(f"   Login: sint_1 / {PASSWORD_SINTETICA} (economo: sint_economo)")
+        print(f"{'=' * 60}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
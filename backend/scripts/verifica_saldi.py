@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+============================================
+ECCLESIA - Verifica/Ricostruzione Saldi Registri
+============================================
+Controlla che registri_contabili.saldo_attuale (mantenuto dai trigger
+della migration 009) coincida con la somma dei movimenti non bloccati,
+e che i riepiloghi mensili (movimenti_mensili, migration 014)
+coincidano con i movimenti.
+
+USO:
+    python scripts/verifica_saldi.py                     # verifica tutti gli enti
+    python scripts/verifica_saldi.py --ente <uuid>       # verifica un ente
+    python scripts/verifica_saldi.py --ricostruisci      # corregge le differenze
+
+Termina con codice 1 se trova differenze (e non è stato chiesto --ricostruisci).
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection
+from services.saldi import verifica_saldi, ricostruisci_saldi
+from services.movimenti_mensili import verifica_riepiloghi, ricostruisci_riepiloghi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica i saldi mantenuti dei registri contabili")
+    parser.add_argument("--ente", help="Limita la verifica a un ente (UUID)")
+    parser.add_argument("--ricostruisci", action="store_true", help="Corregge i saldi non allineati")
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        differenze = verifica_saldi(cur, args.ente)
+        differenze_mensili = verifica_riepiloghi(cur, args.ente)
+
+        if not differenze and not differenze_mensili:
+            print("✅ Tutti i saldi e i riepiloghi mensili sono allineati ai movimenti")
+            return
+
+        if differenze:
+            print(f"⚠️  {len(differenze)} registri con saldo non allineato:")
+            for d in differenze:
+                print(
+                    f"   {d['ente_id']} | {d['nome']}: memorizzato {d['saldo_memorizzato']} "
+                    f"≠ calcolato {d['saldo_calcolato']}"
+                )
+
+        if differenze_mensili:
+            print(f"⚠️  {len(differenze_mensili)} riepiloghi mensili non allineati:")
+            for d in differenze_mensili[:50]:
+                print(
+                    f"   {d['ente_id']} | {d['registro_id']} | {d['mese']} | {d['tipo_movimento']}: "
+                    f"memorizzato {d['totale_memorizzato']} ({d['numero_memorizzato']}) "
+                    f"≠ calcolato {d['totale_calcolato']} ({d['numero_calcolato']})"
+                )
+
+        if not args.ricostruisci:
+            sys.exit(1)
+
+        if differenze:
+            corretti = ricostruisci_saldi(cur, args.ente)
+            print(f"🔧 Saldi ricostruiti: {corretti}")
+        if differenze_mensili:
+            ricostruiti = ricostruisci_riepiloghi(cur, args.ente)
+            print(f"🔧 Riepiloghi mensili ricostruiti: {ricostruiti}")
+
+if __name__ == "__main__":
+    main()
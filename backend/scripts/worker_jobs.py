@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+============================================
+ECCLESIA - Worker dei lavori in background
+============================================
+Esegue i lavori accodati nella tabella jobs (migration 018): PDF dei
+rendiconti e dei registri inventario, import degli estratti conto,
+firma dei rendiconti. Più worker possono girare insieme (anche su host
+diversi): ogni lavoro è preso da uno solo (FOR UPDATE SKIP LOCKED).
+
+USO:
+    python scripts/worker_jobs.py                # ciclo continuo (SIGTERM per fermare)
+    python scripts/worker_jobs.py --una-volta    # esegue i lavori pronti ed esce
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import DATABASE_URL
+from services import render_pdf
+from services.jobs import esegui_worker
+from utils.template_pdf import precompila_template
+from services.asset_documenti import carica_asset
+import services.jobs_gestori  # noqa: F401 (registra i gestori)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker dei lavori in background")
+    parser.add_argument("--nome", help="Nome del worker (default: host:pid)")
+    parser.add_argument("--una-volta", action="store_true", help="Esce quando la coda è vuota")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    render_pdf.avvia_pool()
+    precompila_template()
+    carica_asset()
+    try:
+        esegui_worker(DATABASE_URL, nome=args.nome, una_volta=args.una_volta)
+    finally:
+        render_pdf.chiudi_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+ASSET DEI DOCUMENTI PDF
+=======================
+Loghi e dati della diocesi usati da ogni stampa (rendiconto, registri e
+schede dell'inventario) sono letti una volta e tenuti in memoria:
+
+- logo della diocesi (impostazioni_diocesi.logo_path, con ripiego sul
+  logo statico in templates/assets) già codificato come data URI;
+- logo statico dell'economato per l'inventario, codificato come data URI;
+- nome e titolo del Vescovo.
+
+Caricati all'avvio dell'app e del worker (carica_asset()). Dopo ogni
+modifica delle impostazioni della diocesi invalida_asset() ricarica il
+processo corrente e incrementa una versione in Redis: gli altri processi
+(worker uvicorn, worker dei lavori) ricaricano alla stampa successiva.
+Senza Redis gli asset sono ricaricati al più ogni ASSET_PDF_TTL secondi.
+
+Font e fogli di stile: la FontConfiguration di WeasyPrint è già condivisa
+dai processi di render (services/render_pdf.py) e i CSS sono inline nei
+template, compilati una volta con l'ambiente Jinja condiviso.
+"""
+
+import os
+import time
+import base64
+import logging
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import redis
+
+from database import get_db_connection
+from services.cache_categorie import client_redis, sospendi_redis
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURAZIONE
+# ============================================
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ASSETS_DIR = BASE_DIR / "templates" / "assets"
+LOGO_STATICO = ASSETS_DIR / "Logo Diocesi - Economato.png"
+
+ASSET_PDF_TTL = int(os.getenv("ASSET_PDF_TTL", 60))
+
+VESCOVO_TITOLO_DEFAULT = "Vescovo"
+
+_CHIAVE_VERSIONE = "ecclesia:asset_pdf:versione"
+
+_asset: Optional[Dict] = None
+_versione = None
+_caricato_alle = 0.0
+_lock = threading.Lock()
+
+
+# ============================================
+# CARICAMENTO
+# ============================================
+
+def _data_uri(percorso: Path) -> Optional[str]:
+    """Immagine → "data:image/png;base64,...", None se il file non esiste."""
+    try:
+        with open(percorso, "rb") as f:
+            contenuto = f.read()
+    except OSError:
+        return None
+    tipo = mimetypes.guess_type(str(percorso))[0] or "image/png"
+    return f"data:{tipo};base64," + base64.b64encode(contenuto).decode()
+
+
+def _leggi_impostazioni() -> Optional[tuple]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT logo_path, vescovo_nome, vescovo_titolo FROM impostazioni_diocesi LIMIT 1")
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _carica() -> Tuple[Dict, bool]:
+    """Asset e True se le impostazioni sono state lette dal database."""
+    logo_economato = _data_uri(LOGO_STATICO)
+    asset = {
+        "logo_diocesi": logo_economato,
+        "logo_economato": logo_economato,
+        "vescovo_nome": None,
+        "vescovo_titolo": VESCOVO_TITOLO_DEFAULT,
+    }
+    try:
+        impostazioni = _leggi_impostazioni()
+    except Exception as e:
+        logger.warning(f"Asset PDF: impostazioni diocesi non leggibili ({e})")
+        return asset, False
+
+    if impostazioni:
+        logo_path, vescovo_nome, vescovo_titolo = impostazioni
+        if logo_path:
+            asset["logo_diocesi"] = _data_uri(BASE_DIR / logo_path) or logo_economato
+        asset["vescovo_nome"] = vescovo_nome
+        asset["vescovo_titolo"] = vescovo_titolo or VESCOVO_TITOLO_DEFAULT
+    return asset, True
+
+
+def _versione_redis():
+    """Versione condivisa degli asset, None se Redis non è disponibile."""
+    client = client_redis()
+    if client is None:
+        return None
+    try:
+        versione = client.get(_CHIAVE_VERSIONE)
+        if versione is None:
+            client.set(_CHIAVE_VERSIONE, time.time_ns(), nx=True)
+            versione = client.get(_CHIAVE_VERSIONE)
+        return int(versione)
+    except redis.RedisError as e:
+        sospendi_redis(e)
+        return None
+
+
+def carica_asset() -> Dict:
+    """Legge (o rilegge) gli asset: chiamata all'avvio dell'app e del worker."""
+    global _asset, _versione, _caricato_alle
+    versione = _versione_redis()
+    asset, completo = _carica()
+    with _lock:
+        _asset = asset
+        # Database non raggiungibile (es. all'avvio): si riprova alla stampa successiva
+        _versione = versione if completo else None
+        _caricato_alle = time.monotonic() if completo else 0.0
+    return asset
+
+
+def asset_pdf() -> Dict:
+    """
+    Asset correnti (non modificare il dizionario restituito).
+
+    Chiavi: logo_diocesi, logo_economato (data URI o None),
+    vescovo_nome (o None), vescovo_titolo.
+    """
+    if _asset is None:
+        return carica_asset()
+    versione = _versione_redis()
+    if versione is not None:
+        if versione != _versione:
+            return carica_asset()
+    elif time.monotonic() - _caricato_alle > ASSET_PDF_TTL:
+        return carica_asset()
+    return _asset
+
+
+def invalida_asset():
+    """
+    Da chiamare dopo il commit di ogni modifica a impostazioni_diocesi
+    (logo, timbro, firma, dati del Vescovo).
+    """
+    client = client_redis()
+    if client is not None:
+        try:
+            if client.incr(_CHIAVE_VERSIONE) == 1:
+                # La chiave non esisteva: riparte dall'orologio come in _versione_redis
+                client.set(_CHIAVE_VERSIONE, time.time_ns())
+        except redis.RedisError as e:
+            sospendi_redis(e)
+    carica_asset()
@@ -0,0 +1,269 @@
+"""
+CACHE ALBERO CATEGORIE
+======================
+Il piano dei conti cambia di rado ma viene letto in quasi ogni richiesta
+contabile. Qui l'albero completo di ogni ente (id, codici, nomi, livelli,
+padri, percorsi e chiavi di ordinamento naturale) viene tenuto in cache:
+
+- versione per ente in Redis, incrementata da invalida_categorie() a ogni
+  modifica delle categorie (dopo il commit);
+- albero serializzato in Redis con chiave (ente, versione), condiviso tra
+  i worker;
+- LRU in processo davanti a Redis.
+
+A regime la risoluzione delle categorie non esegue query sul database.
+Se Redis non è raggiungibile l'albero viene letto dal database a ogni
+richiesta (nessuna cache, quindi nessun dato vecchio).
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURAZIONE
+# ============================================
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_CATEGORIE_TTL = int(os.getenv("CACHE_CATEGORIE_TTL", 3600))
+CACHE_CATEGORIE_LRU = int(os.getenv("CACHE_CATEGORIE_LRU", 256))
+# Dopo un errore Redis non viene ritentato per questo intervallo
+REDIS_PAUSA_ERRORE_SECONDI = float(os.getenv("REDIS_PAUSA_ERRORE_SECONDI", 30))
+
+_PREFISSO = "ecclesia:categorie"
+
+_QUERY_ALBERO = """
+    SELECT
+        pc.id, pc.codice, pc.descrizione, pc.livello,
+        COALESCE(pc.categoria_padre_id, pc.conto_padre_id) AS parent_id,
+        pc.categoria_padre_id, pc.tipo, pc.is_sistema, pc.attivo, pc.ordine,
+        COALESCE(
+            array_agg(cr.registro_id::text) FILTER (WHERE cr.registro_id IS NOT NULL),
+            '{}'
+        ) AS registri_abilitati
+    FROM piano_conti pc
+    LEFT JOIN categorie_registri cr ON cr.categoria_id = pc.id
+    WHERE pc.ente_id = :ente_id
+    GROUP BY pc.id
+"""
+
+
+def chiave_ordinamento(codice: Optional[str]) -> List[int]:
+    """Ordinamento naturale del codice: "1.10" dopo "1.9"."""
+    try:
+        return [int(p) for p in codice.split(".")]
+    except (ValueError, AttributeError):
+        return [999999]
+
+
+# ============================================
+# ALBERO
+# ============================================
+
+class AlberoCategorie:
+    """Piano dei conti di un ente, con percorsi precalcolati."""
+
+    def __init__(self, versione, categorie: List[Dict]):
+        self.versione = versione
+        self.categorie = categorie
+        self.per_id = {c["id"]: c for c in categorie}
+        # {categoria_id: "Entrate: Offerte: Matrimoni"}
+        self.percorsi = {c["id"]: c["percorso"] for c in categorie}
+        self.figli: Dict[Optional[str], List[Dict]] = {}
+        for cat in categorie:
+            self.figli.setdefault(cat["parent_id"], []).append(cat)
+
+    @classmethod
+    def da_righe(cls, versione, righe) -> "AlberoCategorie":
+        categorie = [
+            {
+                "id": str(r[0]),
+                "codice": r[1] or "",
+                "descrizione": r[2] or "",
+                "livello": r[3] or 1,
+                "parent_id": str(r[4]) if r[4] else None,
+                "categoria_padre_id": str(r[5]) if r[5] else None,
+                "tipo": r[6],
+                "is_sistema": bool(r[7]),
+                "attivo": r[8] is not False,
+                "ordine": r[9] or 0,
+                "registri_abilitati": sorted(r[10] or []),
+                "chiave": chiave_ordinamento(r[1]),
+            }
+            for r in righe
+        ]
+        categorie.sort(key=lambda c: (c["chiave"], c["codice"]))
+
+        # Percorsi lungo categoria_padre_id (come piano_conti_gerarchia)
+        per_id = {c["id"]: c for c in categorie}
+        for cat in categorie:
+            catena = []
+            corrente, visitati = cat, set()
+            while corrente and corrente["id"] not in visitati:
+                visitati.add(corrente["id"])
+                catena.append(corrente)
+                corrente = per_id.get(corrente["categoria_padre_id"])
+            catena.reverse()
+            cat["catena"] = [c["id"] for c in catena]
+            cat["percorso"] = ": ".join(c["descrizione"] for c in catena)
+
+        return cls(versione, categorie)
+
+    def serializza(self) -> str:
+        return json.dumps({"versione": self.versione, "categorie": self.categorie})
+
+    @classmethod
+    def deserializza(cls, dati) -> "AlberoCategorie":
+        contenuto = json.loads(dati)
+        return cls(contenuto["versione"], contenuto["categorie"])
+
+    def get(self, categoria_id) -> Optional[Dict]:
+        return self.per_id.get(str(categoria_id)) if categoria_id else None
+
+    def catena(self, categoria_id) -> List[Tuple[str, str]]:
+        """[(id, descrizione), ...] dalla radice alla categoria."""
+        cat = self.get(categoria_id)
+        if not cat:
+            return []
+        return [(i, self.per_id[i]["descrizione"]) for i in cat["catena"]]
+
+    def visita(self, parent_id: Optional[str] = None) -> List[Dict]:
+        """Visita in profondità: padre → figli in ordine naturale."""
+        risultato = []
+        for cat in self.figli.get(parent_id, []):
+            risultato.append(cat)
+            risultato.extend(self.visita(cat["id"]))
+        return risultato
+
+
+# ============================================
+# REDIS + LRU IN PROCESSO
+# ============================================
+
+_client: Optional[redis.Redis] = None
+_redis_sospeso_fino = 0.0
+_locale: "OrderedDict[str, AlberoCategorie]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def imposta_client(client):
+    """Sostituisce il client Redis (es. fakeredis nei test) e svuota la cache locale."""
+    global _client, _redis_sospeso_fino
+    _client = client
+    _redis_sospeso_fino = 0.0
+    with _lock:
+        _locale.clear()
+
+
+def client_redis() -> Optional[redis.Redis]:
+    """Client Redis condiviso dalle cache, None se sospeso dopo un errore."""
+    global _client
+    if time.monotonic() < _redis_sospeso_fino:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5
+        )
+    return _client
+
+
+def sospendi_redis(errore: Exception):
+    global _redis_sospeso_fino
+    _redis_sospeso_fino = time.monotonic() + REDIS_PAUSA_ERRORE_SECONDI
+    logger.warning(f"Cache: Redis non disponibile ({errore})")
+
+
+def _chiave_versione(ente_id: str) -> str:
+    return f"{_PREFISSO}:versione:{ente_id}"
+
+
+def _chiave_albero(ente_id: str, versione) -> str:
+    return f"{_PREFISSO}:albero:{ente_id}:{versione}"
+
+
+def _versione_corrente(client: redis.Redis, ente_id: str) -> int:
+    chiave = _chiave_versione(ente_id)
+    versione = client.get(chiave)
+    if versione is None:
+        # Valore iniziale basato sull'orologio: se la chiave viene persa
+        # (riavvio senza persistenza, eviction) non si riusa una versione vecchia
+        client.set(chiave, time.time_ns(), nx=True)
+        versione = client.get(chiave)
+    return int(versione)
+
+
+def _leggi_dal_database(db: Session, ente_id: str, versione) -> AlberoCategorie:
+    righe = db.execute(text(_QUERY_ALBERO), {"ente_id": ente_id}).fetchall()
+    return AlberoCategorie.da_righe(versione, righe)
+
+
+def albero_categorie(db: Session, ente_id: str) -> AlberoCategorie:
+    """
+    Albero del piano dei conti dell'ente, dalla cache se aggiornato.
+
+    Args:
+        db: Sessione database (usata solo in caso di cache mancante)
+        ente_id: ID ente
+    """
+    ente_id = str(ente_id)
+    client = client_redis()
+    if client is None:
+        return _leggi_dal_database(db, ente_id, None)
+
+    try:
+        versione = _versione_corrente(client, ente_id)
+
+        with _lock:
+            albero = _locale.get(ente_id)
+            if albero is not None and albero.versione == versione:
+                _locale.move_to_end(ente_id)
+                return albero
+
+        dati = client.get(_chiave_albero(ente_id, versione))
+        if dati is not None:
+            albero = AlberoCategorie.deserializza(dati)
+        else:
+            albero = _leggi_dal_database(db, ente_id, versione)
+            client.set(_chiave_albero(ente_id, versione), albero.serializza(), ex=CACHE_CATEGORIE_TTL)
+    except redis.RedisError as e:
+        sospendi_redis(e)
+        return _leggi_dal_database(db, ente_id, None)
+
+    with _lock:
+        _locale[ente_id] = albero
+        _locale.move_to_end(ente_id)
+        while len(_locale) > CACHE_CATEGORIE_LRU:
+            _locale.popitem(last=False)
+    return albero
+
+
+def invalida_categorie(ente_id: str):
+    """
+    Da chiamare DOPO il commit di ogni modifica a piano_conti o
+    categorie_registri dell'ente: gli altri worker vedono la nuova
+    versione alla richiesta successiva.
+    """
+    ente_id = str(ente_id)
+    with _lock:
+        _locale.pop(ente_id, None)
+
+    client = client_redis()
+    if client is None:
+        return
+    try:
+        chiave = _chiave_versione(ente_id)
+        if client.incr(chiave) == 1:
+            # La chiave non esisteva: riparte dall'orologio come in _versione_corrente
+            client.set(chiave, time.time_ns())
+    except redis.RedisError as e:
+        sospendi_redis(e)
@@ -0,0 +1,187 @@
+"""
+CACHE DEI PDF GENERATI
+======================
+Lo stesso documento (rendiconto, registro inventario, piano dei conti)
+viene scaricato più volte senza che i dati cambino. I PDF sono salvati
+su disco con chiave l'impronta di tutto ciò che entra nel render:
+
+- contenuto: HTML già renderizzato (template, dati e logo in base64
+  inclusi) oppure i dati del documento, serializzati in JSON;
+- versione: per i documenti costruiti da codice (reportlab);
+- file: immagini lette dal render per percorso (logo diocesi, firme,
+  timbri), con data di modifica e dimensione.
+
+Un documento con dati diversi ha un'altra chiave: non serve invalidare.
+Le voci meno usate di recente (data di modifica aggiornata a ogni
+lettura) sono eliminate oltre PDF_CACHE_MAX_MB. La cartella è scandita
+solo quando la dimensione stimata (scansione precedente più i PDF salvati
+da questo processo) supera il limite; le voci lette o scritte negli
+ultimi PDF_CACHE_MARGINE_SECONDI non sono eliminate, perché potrebbero
+essere ancora in invio al client.
+
+La chiave è anche l'ETag della risposta: If-None-Match → 304.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from fastapi import status
+from fastapi.responses import FileResponse, Response
+
+from utils.etag import etag_corrisponde
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", str(BASE_DIR / "uploads" / "cache_pdf")))
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", 512))
+PDF_CACHE_MARGINE_SECONDI = float(os.getenv("PDF_CACHE_MARGINE_SECONDI", 300))
+
+_lock = threading.Lock()
+# Byte in cache secondo l'ultima scansione più i salvataggi successivi
+_totale_stimato: Optional[int] = None
+# Oltre il limite solo per voci recenti: nuova scansione non prima di
+_prossima_scansione = 0.0
+
+
+def impronta(tipo: str, contenuto, versione: str = "", file: Iterable[Optional[str]] = ()) -> str:
+    """
+    Chiave del documento.
+
+    Args:
+        tipo: tipo di documento (separa documenti con contenuto uguale)
+        contenuto: HTML (str) o dati serializzabili in JSON
+        versione: versione del layout per i documenti costruiti da codice
+        file: percorsi letti durante il render (None ignorati)
+    """
+    h = hashlib.sha256()
+    h.update(f"{tipo}\0{versione}\0".encode("utf-8"))
+    if isinstance(contenuto, str):
+        h.update(contenuto.encode("utf-8"))
+    else:
+        h.update(json.dumps(contenuto, default=str, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    for percorso in sorted(str(p) for p in file if p):
+        try:
+            info = os.stat(percorso)
+            h.update(f"\0{percorso}:{info.st_mtime_ns}:{info.st_size}".encode("utf-8"))
+        except OSError:
+            h.update(f"\0{percorso}:assente".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _percorso(chiave: str) -> Path:
+    return PDF_CACHE_DIR / chiave[:2] / f"{chiave}.pdf"
+
+
+def leggi(chiave: str) -> Optional[Path]:
+    """Percorso del PDF in cache, None se assente."""
+    percorso = _percorso(chiave)
+    try:
+        os.utime(percorso)  # ordine LRU
+    except OSError:
+        return None
+    return percorso
+
+
+def salva(chiave: str, pdf: Optional[bytes] = None, da_file: Optional[str] = None) -> Path:
+    """
+    Salva il PDF (byte o copia di un file già generato) con scrittura
+    atomica, poi riduce la cache entro il limite.
+    """
+    percorso = _percorso(chiave)
+    percorso.parent.mkdir(parents=True, exist_ok=True)
+    if pdf is None:
+        with open(da_file, "rb") as f:
+            pdf = f.read()
+    descrittore, temporaneo = tempfile.mkstemp(dir=percorso.parent, suffix=".tmp")
+    try:
+        with os.fdopen(descrittore, "wb") as f:
+            f.write(pdf)
+        os.replace(temporaneo, percorso)
+    except BaseException:
+        try:
+            os.unlink(temporaneo)
+        except OSError:
+            pass
+        raise
+    _aggiungi(len(pdf))
+    return percorso
+
+
+def _aggiungi(dimensione: int):
+    """Aggiorna la dimensione stimata e riduce la cache se supera il limite."""
+    global _totale_stimato
+    with _lock:
+        if _totale_stimato is not None:
+            _totale_stimato += dimensione
+            if _totale_stimato <= PDF_CACHE_MAX_MB * 1024 * 1024:
+                return
+        if time.monotonic() < _prossima_scansione:
+            return
+    _riduci()
+
+
+def _riduci():
+    """
+    Elimina i PDF usati meno di recente finché la cache supera
+    PDF_CACHE_MAX_MB, esclusi quelli usati negli ultimi
+    PDF_CACHE_MARGINE_SECONDI.
+    """
+    global _totale_stimato, _prossima_scansione
+    limite = PDF_CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        voci = []
+        totale = 0
+        for cartella in PDF_CACHE_DIR.iterdir():
+            if not cartella.is_dir():
+                continue
+            for voce in os.scandir(cartella):
+                if not voce.name.endswith(".pdf"):
+                    continue
+                try:
+                    info = voce.stat()
+                except OSError:
+                    continue
+                voci.append((info.st_mtime, info.st_size, voce.path))
+                totale += info.st_size
+        _totale_stimato = totale
+        if totale <= limite:
+            return
+        voci.sort()
+        recenti = time.time() - PDF_CACHE_MARGINE_SECONDI
+        for mtime, dimensione, percorso in voci:
+            if totale <= limite or mtime > recenti:
+                break
+            try:
+                os.unlink(percorso)
+                totale -= dimensione
+            except OSError:
+                pass
+        _totale_stimato = totale
+        if totale > limite:
+            _prossima_scansione = time.monotonic() + PDF_CACHE_MARGINE_SECONDI / 10
+        logger.info("Cache PDF ridotta a %.1f MB", totale / 1024 / 1024)
+
+
+def etag(chiave: str) -> str:
+    return f'"{chiave[:32]}"'
+
+
+def risposta_pdf(percorso: Path, chiave: str, nome_file: str, if_none_match: Optional[str] = None) -> Response:
+    """FileResponse del PDF in cache con ETag, oppure 304 se il client lo ha già."""
+    intestazioni = {"ETag": etag(chiave), "Cache-Control": "private, no-cache"}
+    if etag_corrisponde(if_none_match, intestazioni["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=intestazioni)
+    return FileResponse(
+        str(percorso),
+        media_type="application/pdf",
+        filename=nome_file,
+        headers=intestazioni
+    )
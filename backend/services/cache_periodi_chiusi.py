@@ -0,0 +1,260 @@
+"""
+CACHE AGGREGATI DEI PERIODI CHIUSI
+==================================
+I movimenti bloccati appartengono a un rendiconto e non cambiano finché
+il rendiconto non viene corretto o eliminato. I loro aggregati (per
+registro, categoria, mese e tipo) sono quindi tenuti in cache senza
+scadenza, con chiave rendiconto_id:
+
+- Redis, condiviso tra i worker (stesso client della cache categorie);
+- LRU in processo davanti a Redis.
+
+Ogni voce porta l'updated_at del rendiconto: una voce scritta prima di
+una modifica non viene più usata anche dai worker che non hanno ricevuto
+l'invalidazione. updated_at cambia (trigger, migration 019) a ogni cambio
+di stato o periodo del rendiconto e a ogni modifica dei suoi movimenti
+bloccati. invalida_aggregati_rendiconto() va chiamata dopo il
+commit di correggi_rendiconto ed elimina_rendiconto.
+
+aggregati_periodo() unisce gli aggregati in cache dei rendiconti interni
+al periodo con i soli movimenti aperti letti dal database: i movimenti
+fuori dai rendiconti e quelli non bloccati (giroconti, movimenti
+successivi alla chiusura) nei periodi dei rendiconti.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from services.cache_categorie import client_redis, sospendi_redis
+
+CACHE_PERIODI_CHIUSI_LRU = int(os.getenv("CACHE_PERIODI_CHIUSI_LRU", 512))
+
+_PREFISSO = "ecclesia:periodi_chiusi"
+
+# Stessa chiave dei riepiloghi mensili (migration 014)
+_CHIAVE = ("registro_id", "categoria_id", "mese", "tipo_movimento", "tipo_speciale", "riporto_saldo")
+
+_SELECT_AGGREGATI = """
+    SELECT m.registro_id, m.categoria_id,
+           date_trunc('month', m.data_movimento)::date AS mese,
+           m.tipo_movimento, m.tipo_speciale, COALESCE(m.riporto_saldo, FALSE) AS riporto_saldo,
+           SUM(m.importo) AS totale, COUNT(*) AS numero
+    FROM movimenti_contabili m
+"""
+_GROUP_BY_AGGREGATI = " GROUP BY 1, 2, 3, 4, 5, 6"
+
+
+# ============================================
+# AGGREGATI DI UN RENDICONTO
+# ============================================
+
+def _serializza(righe: List[Dict]) -> List[Dict]:
+    return [
+        {
+            **r,
+            "registro_id": str(r["registro_id"]) if r["registro_id"] else None,
+            "categoria_id": str(r["categoria_id"]) if r["categoria_id"] else None,
+            "mese": r["mese"].isoformat(),
+            "totale": str(r["totale"]),
+        }
+        for r in righe
+    ]
+
+
+def _deserializza(righe: List[Dict]) -> List[Dict]:
+    return [
+        {**r, "mese": date.fromisoformat(r["mese"]), "totale": Decimal(r["totale"])}
+        for r in righe
+    ]
+
+
+def _da_righe(righe) -> List[Dict]:
+    return [
+        {
+            "registro_id": str(r[0]) if r[0] else None,
+            "categoria_id": str(r[1]) if r[1] else None,
+            "mese": r[2],
+            "tipo_movimento": r[3],
+            "tipo_speciale": r[4],
+            "riporto_saldo": r[5],
+            "totale": r[6],
+            "numero": int(r[7]),
+        }
+        for r in righe
+    ]
+
+
+def _leggi_rendiconto(db: Session, rendiconto_id: str) -> List[Dict]:
+    righe = db.execute(text(
+        _SELECT_AGGREGATI
+        + " WHERE m.rendiconto_id = :rendiconto_id AND m.bloccato = TRUE"
+        + _GROUP_BY_AGGREGATI
+    ), {"rendiconto_id": rendiconto_id}).fetchall()
+    return _da_righe(righe)
+
+
+_locale: "OrderedDict[str, Tuple[str, List[Dict]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _chiave(rendiconto_id: str) -> str:
+    return f"{_PREFISSO}:rendiconto:{rendiconto_id}"
+
+
+def aggregati_rendiconto(db: Session, rendiconto_id: str, versione: str) -> List[Dict]:
+    """
+    Aggregati dei movimenti bloccati del rendiconto.
+
+    Args:
+        versione: updated_at del rendiconto (le voci con versione diversa
+            sono ricalcolate)
+    """
+    rendiconto_id = str(rendiconto_id)
+    with _lock:
+        voce = _locale.get(rendiconto_id)
+        if voce is not None and voce[0] == versione:
+            _locale.move_to_end(rendiconto_id)
+            return voce[1]
+
+    righe = None
+    client = client_redis()
+    if client is not None:
+        try:
+            dati = client.get(_chiave(rendiconto_id))
+            if dati is not None:
+                contenuto = json.loads(dati)
+                if contenuto["versione"] == versione:
+                    righe = _deserializza(contenuto["righe"])
+            if righe is None:
+                righe = _leggi_rendiconto(db, rendiconto_id)
+                client.set(_chiave(rendiconto_id), json.dumps({
+                    "versione": versione,
+                    "righe": _serializza(righe),
+                }))
+        except redis.RedisError as e:
+            sospendi_redis(e)
+    if righe is None:
+        righe = _leggi_rendiconto(db, rendiconto_id)
+
+    with _lock:
+        _locale[rendiconto_id] = (versione, righe)
+        _locale.move_to_end(rendiconto_id)
+        while len(_locale) > CACHE_PERIODI_CHIUSI_LRU:
+            _locale.popitem(last=False)
+    return righe
+
+
+def invalida_aggregati_rendiconto(rendiconto_id: str):
+    """Da chiamare DOPO il commit di correzione o eliminazione del rendiconto."""
+    rendiconto_id = str(rendiconto_id)
+    with _lock:
+        _locale.pop(rendiconto_id, None)
+
+    client = client_redis()
+    if client is None:
+        return
+    try:
+        client.delete(_chiave(rendiconto_id))
+    except redis.RedisError as e:
+        sospendi_redis(e)
+
+
+# ============================================
+# AGGREGATI DI UN PERIODO
+# ============================================
+
+def _intervalli_aperti(data_da: date, data_a: date, chiusi: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """Parti di [data_da, data_a] fuori dai periodi chiusi (ordinati e disgiunti)."""
+    aperti = []
+    inizio = data_da
+    for periodo_inizio, periodo_fine in chiusi:
+        if periodo_inizio > inizio:
+            aperti.append((inizio, periodo_inizio - timedelta(days=1)))
+        if periodo_fine >= data_a:
+            return aperti
+        inizio = max(inizio, periodo_fine + timedelta(days=1))
+    if inizio <= data_a:
+        aperti.append((inizio, data_a))
+    return aperti
+
+
+def aggregati_periodo(
+    db: Session,
+    ente_id: str,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None
+) -> List[Dict]:
+    """
+    Totale e numero dei movimenti del periodo (estremi inclusi, None =
+    illimitato) per registro, categoria, mese, tipo, tipo_speciale e
+    riporto_saldo.
+
+    I rendiconti interamente nel periodo sono letti dalla cache; dal
+    database solo i movimenti fuori dai loro periodi e quelli non bloccati.
+    """
+    data_da = data_da or date.min
+    data_a = data_a or date.max
+
+    rendiconti = db.execute(text("""
+        SELECT id, periodo_inizio, periodo_fine, updated_at
+        FROM rendiconti
+        WHERE ente_id = :ente_id
+          AND periodo_inizio >= :data_da
+          AND periodo_fine <= :data_a
+        ORDER BY periodo_inizio
+    """), {"ente_id": ente_id, "data_da": data_da, "data_a": data_a}).fetchall()
+
+    totali: Dict[tuple, Dict] = {}
+
+    def somma(righe: List[Dict]):
+        for riga in righe:
+            chiave = tuple(riga[c] for c in _CHIAVE)
+            voce = totali.get(chiave)
+            if voce is None:
+                totali[chiave] = dict(riga)
+            else:
+                voce["totale"] += riga["totale"]
+                voce["numero"] += riga["numero"]
+
+    for r in rendiconti:
+        versione = r.updated_at.isoformat() if r.updated_at else ""
+        somma(aggregati_rendiconto(db, r.id, versione))
+
+    # Movimenti aperti: fuori dai rendiconti (qualsiasi stato) e non
+    # bloccati nei periodi dei rendiconti (indice parziale, migration 016)
+    chiusi = [(r.periodo_inizio, r.periodo_fine) for r in rendiconti]
+    condizioni = []
+    params = {"ente_id": ente_id}
+    for i, (da, a) in enumerate(_intervalli_aperti(data_da, data_a, chiusi)):
+        condizioni.append(f"m.data_movimento BETWEEN :aperto_da_{i} AND :aperto_a_{i}")
+        params[f"aperto_da_{i}"] = da
+        params[f"aperto_a_{i}"] = a
+    if chiusi:
+        periodi = []
+        for i, (da, a) in enumerate(chiusi):
+            periodi.append(f"m.data_movimento BETWEEN :chiuso_da_{i} AND :chiuso_a_{i}")
+            params[f"chiuso_da_{i}"] = da
+            params[f"chiuso_a_{i}"] = a
+        condizioni.append(f"(m.bloccato IS NOT TRUE AND ({' OR '.join(periodi)}))")
+
+    if condizioni:
+        righe = db.execute(text(
+            _SELECT_AGGREGATI
+            + f" WHERE m.ente_id = :ente_id AND ({' OR '.join(condizioni)})"
+            + _GROUP_BY_AGGREGATI
+        ), params).fetchall()
+        somma(_da_righe(righe))
+
+    return sorted(
+        (v for v in totali.values() if v["numero"]),
+        key=lambda v: (v["mese"], v["registro_id"] or "", v["categoria_id"] or "")
+    )
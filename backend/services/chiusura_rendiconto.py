@@ -0,0 +1,156 @@
+"""
+CHIUSURA PERIODO DEL RENDICONTO
+===============================
+Operazioni set-based eseguite alla creazione di un rendiconto, nella
+transazione del chiamante (che fa commit/rollback):
+
+1. blocco dei movimenti del periodo (un UPDATE);
+2. saldo finale di tutti i conti attivi (dai riepiloghi mensili della
+   migration 014) e inserimento dei saldi iniziali di riporto al giorno
+   successivo, in un'unica istruzione INSERT ... SELECT;
+3. fotografia dei saldi dei conti e dei totali per categoria
+   (migration 015), da cui si leggono i saldi di apertura del periodo
+   successivo.
+
+Il numero di query non dipende dal numero di conti dell'ente.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+# Categoria dei riporti (come nel piano dei conti standard)
+_SQL_CATEGORIA_RIPORTO = """
+    SELECT id FROM piano_conti
+    WHERE ente_id = %(ente_id)s
+      AND (descrizione = 'SALDO DA ESERCIZIO PRECEDENTE'
+           OR descrizione = 'Riporto da bilancio precedente'
+           OR codice = '000')
+    LIMIT 1
+"""
+
+
+def chiudi_periodo(cur, ente_id: str, rendiconto_id: str, periodo_inizio: date, periodo_fine: date) -> Dict:
+    """
+    Blocca i movimenti del periodo e crea i riporti dei saldi dei conti.
+
+    Il saldo di un conto è la somma dei movimenti del periodo, compreso il
+    suo saldo iniziale ed esclusi i giroconti. Il riporto è creato anche
+    per i conti a saldo zero; se l'ente non ha la categoria dei riporti
+    non viene creato nessun riporto.
+
+    Returns:
+        Riepilogo della chiusura (movimenti bloccati, saldi per conto)
+    """
+    cur.execute("""
+        UPDATE movimenti_contabili
+        SET bloccato = TRUE, rendiconto_id = %s
+        WHERE ente_id = %s
+          AND data_movimento BETWEEN %s AND %s
+          AND (tipo_speciale IS NULL OR tipo_speciale = 'saldo_iniziale')
+    """, (rendiconto_id, ente_id, periodo_inizio, periodo_fine))
+    movimenti_bloccati = cur.rowcount
+
+    data_riporto = periodo_fine + timedelta(days=1)
+    cur.execute(f"""
+        WITH categoria AS ({_SQL_CATEGORIA_RIPORTO}),
+        saldi AS (
+            SELECT r.id AS registro_id, r.nome,
+                   COALESCE(SUM(
+                       CASE WHEN t.tipo_movimento = 'entrata' THEN t.totale ELSE -t.totale END
+                   ), 0) AS saldo
+            FROM registri_contabili r
+            LEFT JOIN totali_movimenti_periodo(%(ente_id)s, %(periodo_inizio)s, %(periodo_fine)s) t
+                ON t.registro_id = r.id
+               AND (t.tipo_speciale IS NULL OR t.tipo_speciale = 'saldo_iniziale')
+            WHERE r.ente_id = %(ente_id)s
+              AND r.attivo = TRUE
+            GROUP BY r.id, r.nome
+        ),
+        riporti AS (
+            INSERT INTO movimenti_contabili (
+                id, ente_id, registro_id, categoria_id,
+                data_movimento, tipo_movimento, importo,
+                causale, note,
+                tipo_speciale, riporto_saldo, bloccato
+            )
+            SELECT
+                uuid_generate_v4(), %(ente_id)s, s.registro_id, c.id,
+                %(data_riporto)s,
+                CASE WHEN s.saldo >= 0 THEN 'entrata' ELSE 'uscita' END,
+                ABS(s.saldo),
+                'Saldo iniziale', %(note)s,
+                'saldo_iniziale', TRUE, FALSE
+            FROM saldi s
+            CROSS JOIN categoria c
+            RETURNING registro_id
+        ),
+        fotografia AS (
+            INSERT INTO rendiconti_saldi_registri (rendiconto_id, registro_id, nome, saldo_finale)
+            SELECT %(rendiconto_id)s, s.registro_id, s.nome, s.saldo
+            FROM saldi s
+        )
+        SELECT s.registro_id, s.nome, s.saldo,
+               EXISTS (SELECT 1 FROM riporti p WHERE p.registro_id = s.registro_id)
+        FROM saldi s
+        ORDER BY s.nome
+    """, {
+        "ente_id": ente_id,
+        "periodo_inizio": periodo_inizio,
+        "periodo_fine": periodo_fine,
+        "data_riporto": data_riporto,
+        "rendiconto_id": rendiconto_id,
+        "note": f"Riporto automatico da rendiconto {rendiconto_id}",
+    })
+
+    conti = [
+        {
+            "registro_id": str(row[0]),
+            "nome": row[1],
+            "saldo_finale": float(row[2]),
+            "riporto_creato": row[3],
+        }
+        for row in cur.fetchall()
+    ]
+    riporti_creati = sum(1 for c in conti if c["riporto_creato"])
+
+    cur.execute("""
+        INSERT INTO rendiconti_saldi_categorie (rendiconto_id, categoria_id, tipo_movimento, totale, numero)
+        SELECT %s, categoria_id, tipo_movimento, SUM(totale), SUM(numero)
+        FROM totali_movimenti_periodo(%s, %s, %s)
+        WHERE tipo_speciale IS NULL
+        GROUP BY categoria_id, tipo_movimento
+    """, (rendiconto_id, ente_id, periodo_inizio, periodo_fine))
+
+    return {
+        "movimenti_bloccati": movimenti_bloccati,
+        "data_riporto": data_riporto.isoformat(),
+        "riporti_creati": riporti_creati,
+        "categoria_riporto_mancante": bool(conti) and riporti_creati == 0,
+        "totale_saldi": round(sum(c["saldo_finale"] for c in conti), 2),
+        "conti": conti,
+    }
+
+
+def saldi_apertura(cur, ente_id: str, periodo_inizio: date) -> Optional[Dict[str, float]]:
+    """
+    Saldi di apertura per conto dalla fotografia del rendiconto precedente
+    (l'ultimo chiuso prima di periodo_inizio).
+
+    Returns:
+        {registro_id: saldo}, None se non c'è un rendiconto precedente
+        con fotografia
+    """
+    cur.execute("""
+        SELECT s.registro_id, s.saldo_finale
+        FROM rendiconti_saldi_registri s
+        WHERE s.rendiconto_id = (
+            SELECT id FROM rendiconti
+            WHERE ente_id = %s AND periodo_fine < %s
+            ORDER BY periodo_fine DESC
+            LIMIT 1
+        )
+    """, (ente_id, periodo_inizio))
+    righe = cur.fetchall()
+    if not righe:
+        return None
+    return {str(row[0]): float(row[1]) for row in righe}
@@ -0,0 +1,155 @@
+"""
+DASHBOARD CONTABILITÀ
+=====================
+Dati della home page della contabilità in poche query:
+
+- saldi dei conti da registri_contabili.saldo_attuale (trigger, migration 009);
+- entrate e uscite dell'anno per categoria di primo livello e flusso di
+  cassa degli ultimi 12 mesi da aggregati_periodo() (periodi chiusi in
+  cache, solo i movimenti aperti dal database);
+- ultimo periodo chiuso e rendiconto in lavorazione.
+
+Come nei rendiconti, entrate e uscite escludono i movimenti speciali
+(saldi iniziali, riporti, giroconti).
+"""
+
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from services.cache_categorie import albero_categorie, chiave_ordinamento
+from services.cache_periodi_chiusi import aggregati_periodo
+from constants import StatoRendiconto, TipoMovimento
+
+# Rendiconti non ancora chiusi dalla diocesi
+_STATI_IN_LAVORAZIONE = (
+    StatoRendiconto.BOZZA,
+    StatoRendiconto.PARROCCHIA,
+    StatoRendiconto.INVIATO,
+    StatoRendiconto.RESPINTO,
+)
+
+MESI_FLUSSO = 12
+
+
+def _sposta_mese(mese: date, mesi: int) -> date:
+    indice = mese.year * 12 + mese.month - 1 + mesi
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _rendiconto(row) -> Optional[Dict]:
+    if not row:
+        return None
+    return {
+        "id": str(row.id),
+        "periodo_inizio": row.periodo_inizio.isoformat(),
+        "periodo_fine": row.periodo_fine.isoformat(),
+        "stato": row.stato,
+        "data_invio": row.data_invio.isoformat() if row.data_invio else None,
+        "motivo_respingimento": row.motivo_respingimento,
+    }
+
+
+def dati_dashboard(db: Session, ente_id: str, oggi: Optional[date] = None) -> Dict:
+    oggi = oggi or date.today()
+    inizio_anno = date(oggi.year, 1, 1)
+    primo_mese = _sposta_mese(date(oggi.year, oggi.month, 1), -(MESI_FLUSSO - 1))
+
+    # Conti
+    registri = db.execute(text("""
+        SELECT id, nome, tipo, COALESCE(saldo_attuale, 0) AS saldo_attuale
+        FROM registri_contabili
+        WHERE ente_id = :ente_id AND attivo = TRUE
+        ORDER BY nome
+    """), {"ente_id": ente_id}).fetchall()
+    conti = [
+        {"id": str(r.id), "nome": r.nome, "tipo": r.tipo, "saldo": float(r.saldo_attuale)}
+        for r in registri
+    ]
+
+    # Entrate/uscite: anno corrente e ultimi 12 mesi in una lettura
+    albero = albero_categorie(db, ente_id)
+    mesi = {}
+    indice = primo_mese
+    while indice <= oggi:
+        mesi[indice] = {TipoMovimento.ENTRATA: Decimal(0), TipoMovimento.USCITA: Decimal(0)}
+        indice = _sposta_mese(indice, 1)
+    categorie = {TipoMovimento.ENTRATA: {}, TipoMovimento.USCITA: {}}
+
+    for riga in aggregati_periodo(db, ente_id, min(inizio_anno, primo_mese), date(oggi.year, 12, 31)):
+        tipo = riga["tipo_movimento"]
+        if riga["tipo_speciale"] or riga["riporto_saldo"] or tipo not in categorie:
+            continue
+        if riga["mese"] in mesi:
+            mesi[riga["mese"]][tipo] += riga["totale"]
+        if riga["mese"] >= inizio_anno:
+            catena = albero.catena(riga["categoria_id"])
+            radice = catena[0][0] if catena else None
+            voce = categorie[tipo].setdefault(radice, {"totale": Decimal(0), "numero": 0})
+            voce["totale"] += riga["totale"]
+            voce["numero"] += riga["numero"]
+
+    anno = {}
+    for tipo, per_radice in categorie.items():
+        elenco = []
+        for categoria_id, voce in per_radice.items():
+            cat = albero.get(categoria_id)
+            elenco.append({
+                "id": categoria_id,
+                "codice": cat["codice"] if cat else "",
+                "descrizione": cat["descrizione"] if cat else "Non categorizzato",
+                "totale": float(voce["totale"]),
+                "numero": voce["numero"],
+            })
+        # Non categorizzato in fondo
+        elenco.sort(key=lambda c: (c["id"] is None, chiave_ordinamento(c["codice"]), c["descrizione"]))
+        anno[tipo] = {
+            "totale": round(sum((c["totale"] for c in elenco), 0.0), 2),
+            "categorie": elenco,
+        }
+
+    flusso_cassa = [
+        {
+            "mese": mese.strftime("%Y-%m"),
+            "entrate": float(totali[TipoMovimento.ENTRATA]),
+            "uscite": float(totali[TipoMovimento.USCITA]),
+            "saldo": float(totali[TipoMovimento.ENTRATA] - totali[TipoMovimento.USCITA]),
+        }
+        for mese, totali in mesi.items()
+    ]
+
+    # Rendiconti: ultimo periodo chiuso (come /ultimo-rendiconto) e in lavorazione
+    ultimo_chiuso = db.execute(text("""
+        SELECT id, periodo_inizio, periodo_fine, stato, data_invio, motivo_respingimento
+        FROM rendiconti
+        WHERE ente_id = :ente_id AND stato != 'respinto'
+        ORDER BY periodo_fine DESC
+        LIMIT 1
+    """), {"ente_id": ente_id}).fetchone()
+    in_lavorazione = db.execute(text("""
+        SELECT id, periodo_inizio, periodo_fine, stato, data_invio, motivo_respingimento
+        FROM rendiconti
+        WHERE ente_id = :ente_id AND stato = ANY(CAST(:stati AS varchar[]))
+        ORDER BY periodo_fine DESC
+        LIMIT 1
+    """), {"ente_id": ente_id, "stati": [s.value for s in _STATI_IN_LAVORAZIONE]}).fetchone()
+
+    return {
+        "data": oggi.isoformat(),
+        "conti": conti,
+        "saldo_totale": round(sum((c["saldo"] for c in conti), 0.0), 2),
+        "anno": oggi.year,
+        "entrate": anno[TipoMovimento.ENTRATA],
+        "uscite": anno[TipoMovimento.USCITA],
+        "flusso_cassa": flusso_cassa,
+        "ultimo_periodo_chiuso": _rendiconto(ultimo_chiuso),
+        "rendiconto_in_lavorazione": _rendiconto(in_lavorazione),
+    }
+
+
+def json_dashboard(dati: Dict) -> str:
+    return json.dumps(dati, default=str, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,298 @@
+"""
+LETTURA ESTRATTI CONTO BANCARI
+==============================
+Parser in streaming per CSV, CAMT.053 (ISO 20022) e OFX.
+Ogni parser restituisce un generatore di righe:
+
+    {"riga": 12, "data": date, "importo": Decimal (positivo = entrata),
+     "descrizione": "...", "riferimento": "..." | None, "errore": None | "..."}
+
+Le righe non interpretabili hanno "errore" valorizzato e non interrompono
+la lettura: la validazione le riporta tutte insieme nell'anteprima.
+"""
+
+import io
+import re
+import csv
+import unicodedata
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Dict, Iterator, Optional
+
+FORMATI = ("csv", "camt053", "ofx")
+
+# Intestazioni CSV riconosciute (normalizzate: minuscolo, senza accenti/punteggiatura)
+_COLONNE_CSV = {
+    "data": ["data contabile", "data operazione", "data registrazione", "data", "booking date", "date"],
+    "descrizione": ["descrizione operazione", "descrizione", "causale", "dettagli", "description", "memo"],
+    "importo": ["importo", "importo eur", "amount"],
+    "entrate": ["entrate", "avere", "accrediti", "accredito", "credit"],
+    "uscite": ["uscite", "dare", "addebiti", "addebito", "debit"],
+    "riferimento": ["riferimento", "id operazione", "codice operazione", "reference"],
+}
+
+_FORMATI_DATA = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y", "%Y%m%d")
+
+
+# ============================================
+# UTILITY
+# ============================================
+
+def _normalizza(testo: str) -> str:
+    testo = unicodedata.normalize("NFKD", testo or "").encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", testo.lower()).strip()
+
+
+def leggi_data(valore: str) -> Optional[date]:
+    valore = (valore or "").strip()
+    for formato in _FORMATI_DATA:
+        try:
+            return datetime.strptime(valore, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def leggi_importo(valore: str) -> Optional[Decimal]:
+    """
+    Interpreta importi in formato italiano o internazionale:
+    "1.234,56", "-1234.56", "1,234.56", "€ 12,00", "12,00-".
+    """
+    testo = re.sub(r"[^\d,.\-+]", "", (valore or "").strip())
+    if not testo:
+        return None
+
+    negativo = testo.startswith("-") or testo.endswith("-")
+    testo = testo.strip("+-")
+
+    if "," in testo and "." in testo:
+        # Il separatore decimale è l'ultimo dei due
+        if testo.rfind(",") > testo.rfind("."):
+            testo = testo.replace(".", "").replace(",", ".")
+        else:
+            testo = testo.replace(",", "")
+    elif "," in testo:
+        testo = testo.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(\.\d{3})+", testo):
+        testo = testo.replace(".", "")
+
+    try:
+        importo = Decimal(testo)
+    except InvalidOperation:
+        return None
+    return -importo if negativo else importo
+
+
+def _riga(numero, data_op, importo, descrizione, riferimento=None, errore=None) -> Dict:
+    if errore is None:
+        if data_op is None:
+            errore = "Data non valida"
+        elif importo is None:
+            errore = "Importo non valido"
+    return {
+        "riga": numero,
+        "data": data_op,
+        "importo": importo,
+        "descrizione": (descrizione or "").strip()[:1000],
+        "riferimento": (riferimento or "").strip()[:255] or None,
+        "errore": errore,
+    }
+
+
+def _testo(flusso: BinaryIO) -> io.TextIOWrapper:
+    """UTF-8 se valido, altrimenti Windows-1252 (export bancari più vecchi)."""
+    campione = flusso.read(65536)
+    flusso.seek(0)
+    try:
+        campione.decode("utf-8")
+        codifica = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Un carattere multibyte può essere tagliato a fine campione
+        codifica = "utf-8-sig" if e.start >= len(campione) - 3 else "cp1252"
+    return io.TextIOWrapper(flusso, encoding=codifica, errors="replace", newline="")
+
+
+def riconosci_formato(nome_file: str, flusso: BinaryIO) -> str:
+    """Formato dall'estensione o, se ambigua, dal contenuto."""
+    estensione = (nome_file or "").lower().rsplit(".", 1)[-1]
+    if estensione == "ofx":
+        return "ofx"
+    inizio = flusso.read(4096)
+    flusso.seek(0)
+    if b"camt.053" in inizio or b"BkToCstmrStmt" in inizio:
+        return "camt053"
+    if b"OFXHEADER" in inizio or b"<OFX>" in inizio:
+        return "ofx"
+    return "csv"
+
+
+# ============================================
+# CSV
+# ============================================
+
+class _DialettoBanca(csv.excel):
+    """Default degli export bancari italiani."""
+    delimiter = ";"
+
+
+def leggi_csv(flusso: BinaryIO) -> Iterator[Dict]:
+    testo = _testo(flusso)
+    campione = testo.read(8192)
+    testo.seek(0)
+    try:
+        dialetto = csv.Sniffer().sniff(campione, delimiters=";,\t|")
+    except csv.Error:
+        dialetto = _DialettoBanca
+
+    lettore = csv.reader(testo, dialetto)
+
+    # Salta eventuali righe di testata della banca fino alle intestazioni
+    colonne = None
+    for intestazione in lettore:
+        normalizzate = [_normalizza(c) for c in intestazione]
+        trovate = {}
+        for campo, alias in _COLONNE_CSV.items():
+            for nome in alias:
+                if nome in normalizzate:
+                    trovate[campo] = normalizzate.index(nome)
+                    break
+        if "data" in trovate and ("importo" in trovate or "entrate" in trovate or "uscite" in trovate):
+            colonne = trovate
+            break
+    if colonne is None:
+        raise ValueError("Intestazioni CSV non riconosciute: servono almeno data e importo (o entrate/uscite)")
+
+    def cella(valori, campo):
+        indice = colonne.get(campo)
+        return valori[indice] if indice is not None and indice < len(valori) else ""
+
+    for valori in lettore:
+        if not any(v.strip() for v in valori):
+            continue
+        numero = lettore.line_num
+        if "importo" in colonne:
+            importo = leggi_importo(cella(valori, "importo"))
+        else:
+            entrata = leggi_importo(cella(valori, "entrate")) or Decimal(0)
+            uscita = leggi_importo(cella(valori, "uscite")) or Decimal(0)
+            importo = abs(entrata) - abs(uscita) if (entrata or uscita) else None
+        yield _riga(
+            numero,
+            leggi_data(cella(valori, "data")),
+            importo,
+            cella(valori, "descrizione"),
+            cella(valori, "riferimento"),
+        )
+
+
+# ============================================
+# CAMT.053 (ISO 20022)
+# ============================================
+
+def _nome(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _figlio(elemento, *percorso):
+    for nome in percorso:
+        if elemento is None:
+            return None
+        elemento = next((f for f in elemento if _nome(f.tag) == nome), None)
+    return elemento
+
+
+def _valore(elemento, *percorso) -> Optional[str]:
+    trovato = _figlio(elemento, *percorso)
+    return trovato.text.strip() if trovato is not None and trovato.text else None
+
+
+def leggi_camt053(flusso: BinaryIO) -> Iterator[Dict]:
+    numero = 0
+    for _, elemento in ET.iterparse(flusso, events=("end",)):
+        if _nome(elemento.tag) != "Ntry":
+            continue
+        numero += 1
+
+        # Solo movimenti contabilizzati (esclusi i "pending")
+        stato = _valore(elemento, "Sts") or _valore(elemento, "Sts", "Cd")
+        if stato and stato not in ("BOOK",):
+            elemento.clear()
+            continue
+
+        importo = leggi_importo(_valore(elemento, "Amt"))
+        if importo is not None and _valore(elemento, "CdtDbtInd") == "DBIT":
+            importo = -importo
+
+        data_op = _valore(elemento, "BookgDt", "Dt") or (_valore(elemento, "BookgDt", "DtTm") or "")[:10]
+
+        descrizioni = []
+        for dettaglio in elemento.iter():
+            if _nome(dettaglio.tag) in ("Ustrd", "AddtlTxInf") and dettaglio.text:
+                descrizioni.append(dettaglio.text.strip())
+        controparte = None
+        for ruolo in ("Dbtr", "Cdtr"):
+            controparte = controparte or _valore(_figlio(elemento, "NtryDtls", "TxDtls", "RltdPties", ruolo), "Nm")
+        if controparte:
+            descrizioni.insert(0, controparte)
+        if not descrizioni and _valore(elemento, "AddtlNtryInf"):
+            descrizioni.append(_valore(elemento, "AddtlNtryInf"))
+
+        yield _riga(
+            numero,
+            leggi_data(data_op),
+            importo,
+            " - ".join(descrizioni),
+            _valore(elemento, "AcctSvcrRef") or _valore(elemento, "NtryRef"),
+        )
+        elemento.clear()
+
+
+# ============================================
+# OFX (SGML 1.x e XML 2.x)
+# ============================================
+
+_TAG_OFX = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+
+
+def leggi_ofx(flusso: BinaryIO) -> Iterator[Dict]:
+    numero = 0
+    corrente = None
+    for linea in _testo(flusso):
+        for chiusura, tag, valore in _TAG_OFX.findall(linea):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if corrente is not None:
+                    yield _riga_ofx(numero, corrente)
+                    corrente = None
+                if not chiusura:
+                    numero += 1
+                    corrente = {}
+            elif corrente is not None and not chiusura and valore.strip():
+                corrente[tag] = valore.strip()
+    if corrente is not None:
+        yield _riga_ofx(numero, corrente)
+
+
+def _riga_ofx(numero: int, campi: Dict) -> Dict:
+    descrizione = " - ".join(v for v in (campi.get("NAME"), campi.get("MEMO")) if v)
+    return _riga(
+        numero,
+        leggi_data(campi.get("DTPOSTED", "")[:8]),
+        leggi_importo(campi.get("TRNAMT")),
+        descrizione,
+        campi.get("FITID"),
+    )
+
+
+_PARSER = {"csv": leggi_csv, "camt053": leggi_camt053, "ofx": leggi_ofx}
+
+
+def leggi_estratto(flusso: BinaryIO, formato: str) -> Iterator[Dict]:
+    """
+    Raises:
+        ValueError: formato sconosciuto o file non interpretabile
+    """
+    if formato not in _PARSER:
+        raise ValueError(f"Formato non supportato: {formato} (ammessi: {', '.join(FORMATI)})")
+    return _PARSER[formato](flusso)
@@ -0,0 +1,166 @@
+"""
+EXPORT MOVIMENTI (CSV / XLSX)
+=============================
+Esportazione dei movimenti con gli stessi filtri di GET /movimenti.
+
+Le righe sono lette con un cursore lato server (named cursor psycopg2)
+a blocchi di EXPORT_BLOCCO e scritte da un generatore:
+
+- CSV: ogni blocco è inviato appena scritto, il download parte subito;
+- XLSX: openpyxl in modalità write_only scrive le righe su file
+  temporaneo; il file compresso è poi inviato a blocchi.
+
+In entrambi i casi la memoria non dipende dal numero di movimenti.
+"""
+
+import os
+import io
+import csv
+import tempfile
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+
+from database import get_db_connection
+
+EXPORT_BLOCCO = int(os.getenv("EXPORT_BLOCCO", 2000))
+
+FORMATI_EXPORT = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def colonne_export(con_saldo: bool) -> List[str]:
+    colonne = ["Data", "Conto", "Categoria", "Descrizione", "Note", "Entrate", "Uscite"]
+    if con_saldo:
+        colonne.append("Saldo progressivo")
+    return colonne
+
+
+def righe_movimenti(
+    ente_id: str,
+    percorsi: Dict[str, str],
+    registro_id: Optional[str] = None,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+    tipo: Optional[str] = None
+) -> Iterator[list]:
+    """
+    Righe dell'export in ordine cronologico. Con un solo conto c'è anche
+    il saldo progressivo (esclusi i bloccati, come nella lista movimenti),
+    calcolato con una window function nello stesso ordine dell'indice.
+    """
+    condizioni = ["m.ente_id = %(ente_id)s"]
+    params = {"ente_id": ente_id}
+    if registro_id:
+        condizioni.append("m.registro_id = %(registro_id)s")
+        params["registro_id"] = registro_id
+    if data_da:
+        condizioni.append("m.data_movimento >= %(data_da)s")
+        params["data_da"] = data_da
+    if data_a:
+        condizioni.append("m.data_movimento <= %(data_a)s")
+        params["data_a"] = data_a
+    if tipo:
+        condizioni.append("m.tipo_movimento = %(tipo)s")
+        params["tipo"] = tipo
+
+    saldo = """,
+        SUM(effetto_saldo_movimento(m.tipo_movimento, m.importo, m.bloccato)) OVER (
+            ORDER BY m.data_movimento, m.created_at, m.id
+        )""" if registro_id else ""
+
+    conn = get_db_connection()
+    # Cursore con nome = cursore lato server: il risultato resta nel database
+    cur = conn.cursor(name="export_movimenti")
+    cur.itersize = EXPORT_BLOCCO
+    try:
+        cur.execute(f"""
+            SELECT m.data_movimento, r.nome, m.categoria_id, c.descrizione,
+                   COALESCE(m.descrizione, m.causale), m.note, m.tipo_movimento, m.importo
+                   {saldo}
+            FROM movimenti_contabili m
+            LEFT JOIN registri_contabili r ON m.registro_id = r.id
+            LEFT JOIN piano_conti c ON m.categoria_id = c.id
+            WHERE {" AND ".join(condizioni)}
+            ORDER BY m.data_movimento, m.created_at, m.id
+        """, params)
+
+        for row in cur:
+            categoria = percorsi.get(str(row[2]), row[3]) if row[2] else None
+            riga = [
+                row[0],
+                row[1] or "",
+                categoria or "",
+                row[4] or "",
+                row[5] or "",
+                row[7] if row[6] == "entrata" else None,
+                row[7] if row[6] == "uscita" else None,
+            ]
+            if registro_id:
+                riga.append(row[8])
+            yield riga
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _importo_italiano(valore) -> str:
+    return f"{valore:.2f}".replace(".", ",") if valore is not None else ""
+
+
+def csv_in_streaming(colonne: List[str], righe: Iterator[list]) -> Iterator[bytes]:
+    """CSV con separatore ';', BOM e decimali con virgola (per Excel in italiano)."""
+    buffer = io.StringIO()
+    scrittore = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    scrittore.writerow(colonne)
+
+    for numero, riga in enumerate(righe, 1):
+        scrittore.writerow([
+            riga[0].strftime("%d/%m/%Y"),
+            *riga[1:5],
+            *(_importo_italiano(v) for v in riga[5:]),
+        ])
+        if numero % EXPORT_BLOCCO == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def xlsx_in_streaming(colonne: List[str], righe: Iterator[list], titolo: str = "Movimenti") -> Iterator[bytes]:
+    """XLSX scritto con openpyxl write_only su file temporaneo, poi inviato a blocchi."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titolo)
+    ws.freeze_panes = "A2"
+
+    intestazione = []
+    for nome in colonne:
+        cella = WriteOnlyCell(ws, value=nome)
+        cella.font = Font(bold=True)
+        intestazione.append(cella)
+    ws.append(intestazione)
+
+    for riga in righe:
+        celle = [WriteOnlyCell(ws, value=riga[0])]
+        celle[0].number_format = "DD/MM/YYYY"
+        celle.extend(riga[1:5])
+        for valore in riga[5:]:
+            cella = WriteOnlyCell(ws, value=valore)
+            cella.number_format = "#,##0.00"
+            celle.append(cella)
+        ws.append(celle)
+
+    with tempfile.TemporaryFile() as file:
+        wb.save(file)
+        file.seek(0)
+        while True:
+            blocco = file.read(64 * 1024)
+            if not blocco:
+                break
+            yield blocco
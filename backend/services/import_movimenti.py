@@ -0,0 +1,370 @@
+"""
+IMPORT MOVIMENTI DA ESTRATTO CONTO
+==================================
+Pipeline set-based per caricare migliaia di righe bancarie in una volta:
+
+1. le righe lette in streaming (services/estratti_conto.py) vengono
+   caricate con COPY in una tabella temporanea di staging;
+2. validazione con poche UPDATE sull'intera tabella: saldo iniziale del
+   conto, periodo chiuso dall'ultimo rendiconto, importi nulli o oltre
+   la precisione di movimenti_contabili.importo, righe già importate
+   (stesso riferimento bancario);
+3. categorie assegnate dalle regole dell'ente (regole_import_categorie);
+4. in anteprima (dry run) si restituisce il riepilogo e si annulla;
+   altrimenti estratto, righe e movimenti sono inseriti con INSERT ...
+   SELECT nella stessa transazione, con una sola riga di audit.
+
+Il chiamante gestisce commit/rollback della connessione.
+"""
+
+import os
+import csv
+import io
+from decimal import Decimal
+from typing import Dict, Iterator, Optional
+
+from services.audit import registra_audit_psycopg2
+
+IMPORT_MAX_RIGHE = int(os.getenv("IMPORT_MAX_RIGHE", 200000))
+IMPORT_ANTEPRIMA_RIGHE = int(os.getenv("IMPORT_ANTEPRIMA_RIGHE", 200))
+
+# movimenti_contabili.importo è NUMERIC(10,2)
+IMPORTO_MASSIMO = Decimal("99999999.99")
+
+_COLONNE_STAGING = ("riga", "data_operazione", "importo", "descrizione", "riferimento", "errore")
+
+
+class _FlussoCopy(io.TextIOBase):
+    """
+    File-like in sola lettura che serializza in CSV le righe del parser
+    man mano che COPY le richiede (nessun buffer dell'intero file).
+    Gli errori del parser sono conservati e rilanciati dopo COPY.
+    """
+
+    def __init__(self, righe: Iterator[Dict]):
+        self._righe = righe
+        self._buffer = ""
+        self._uscita = io.StringIO()
+        self._scrittore = csv.writer(self._uscita)
+        self.numero_righe = 0
+        self.errore: Optional[Exception] = None
+
+    def readable(self):
+        return True
+
+    def _prossimo_blocco(self, righe_per_blocco=1000) -> str:
+        self._uscita.seek(0)
+        self._uscita.truncate()
+        try:
+            for _ in range(righe_per_blocco):
+                riga = next(self._righe)
+                self.numero_righe += 1
+                if self.numero_righe > IMPORT_MAX_RIGHE:
+                    raise ValueError(f"Il file supera il limite di {IMPORT_MAX_RIGHE} righe")
+                self._scrittore.writerow([
+                    riga["riga"],
+                    riga["data"].isoformat() if riga["data"] else "",
+                    riga["importo"] if riga["importo"] is not None else "",
+                    riga["descrizione"],
+                    riga["riferimento"] or "",
+                    riga["errore"] or "",
+                ])
+        except StopIteration:
+            pass
+        except Exception as e:
+            self.errore = e
+        return self._uscita.getvalue()
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self.errore is None:
+            blocco = self._prossimo_blocco()
+            if not blocco:
+                break
+            self._buffer += blocco
+        if size < 0:
+            dati, self._buffer = self._buffer, ""
+        else:
+            dati, self._buffer = self._buffer[:size], self._buffer[size:]
+        return dati
+
+
+def carica_staging(cur, righe: Iterator[Dict]) -> int:
+    """
+    Crea la tabella temporanea import_righe e la popola con COPY.
+
+    Returns:
+        Numero di righe lette
+
+    Raises:
+        ValueError: file non interpretabile o troppo grande
+    """
+    cur.execute("""
+        CREATE TEMP TABLE import_righe (
+            riga INTEGER NOT NULL,
+            data_operazione DATE,
+            importo NUMERIC,
+            descrizione TEXT,
+            riferimento VARCHAR(255),
+            errore TEXT,
+            esito VARCHAR(20),
+            avviso TEXT,
+            categoria_id UUID,
+            movimento_id UUID
+        ) ON COMMIT DROP
+    """)
+
+    flusso = _FlussoCopy(righe)
+    cur.copy_expert(
+        f"COPY import_righe ({', '.join(_COLONNE_STAGING)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        flusso,
+    )
+    if flusso.errore is not None:
+        if isinstance(flusso.errore, ValueError):
+            raise flusso.errore
+        raise ValueError(f"File non interpretabile: {flusso.errore}") from flusso.errore
+
+    # Per i controlli sui duplicati e statistiche aggiornate per il planner
+    cur.execute("CREATE INDEX ON import_righe (riferimento, riga)")
+    cur.execute("ANALYZE import_righe")
+    return flusso.numero_righe
+
+
+def valida_staging(cur, ente_id: str, registro_id: str, crea_movimenti: bool):
+    """Validazione e mappatura categorie sull'intera tabella di staging."""
+    # Importi: staging senza precisione (COPY non va in overflow), arrotondati
+    # ai centesimi e confrontati riga per riga con il limite della colonna
+    # di destinazione
+    cur.execute("""
+        UPDATE import_righe
+        SET importo = ROUND(importo, 2),
+            errore = COALESCE(errore, CASE
+                WHEN ROUND(importo, 2) = 0 THEN 'Importo nullo'
+                WHEN ABS(ROUND(importo, 2)) > %(massimo)s
+                    THEN 'Importo oltre il massimo consentito (99.999.999,99)'
+            END)
+        WHERE importo IS NOT NULL
+    """, {"massimo": IMPORTO_MASSIMO})
+
+    # Date: saldo iniziale del conto e periodo chiuso (come create_movimento).
+    # Conto senza saldo iniziale: nessun limite inferiore, come in
+    # create_movimento; senza rendiconti: nessun periodo chiuso.
+    if crea_movimenti:
+        cur.execute("""
+            WITH limiti AS (
+                SELECT
+                    (SELECT MIN(data_movimento) FROM movimenti_contabili
+                     WHERE registro_id = %(registro_id)s AND tipo_speciale = 'saldo_iniziale') AS inizio,
+                    (SELECT MAX(periodo_fine) FROM rendiconti
+                     WHERE ente_id = %(ente_id)s) AS chiuso_fino_a
+            )
+            UPDATE import_righe s
+            SET errore = CASE
+                WHEN l.inizio IS NOT NULL AND s.data_operazione < l.inizio
+                    THEN 'Data precedente al saldo iniziale del conto (' || to_char(l.inizio, 'DD/MM/YYYY') || ')'
+                WHEN l.chiuso_fino_a IS NOT NULL AND s.data_operazione <= l.chiuso_fino_a
+                    THEN 'Periodo contabile chiuso fino al ' || to_char(l.chiuso_fino_a, 'DD/MM/YYYY')
+            END
+            FROM limiti l
+            WHERE s.errore IS NULL
+        """, {"ente_id": ente_id, "registro_id": registro_id})
+
+    cur.execute("UPDATE import_righe SET esito = CASE WHEN errore IS NULL THEN 'valida' ELSE 'errore' END")
+
+    # Righe già importate in un estratto dello stesso conto, o ripetute nel file
+    cur.execute("""
+        UPDATE import_righe s
+        SET esito = 'duplicato', avviso = 'Riferimento già importato'
+        WHERE s.esito = 'valida'
+          AND s.riferimento IS NOT NULL
+          AND (
+              EXISTS (
+                  SELECT 1
+                  FROM estratti_conto_righe er
+                  JOIN estratti_conto e ON e.id = er.estratto_id
+                  WHERE e.registro_id = %(registro_id)s AND er.riferimento = s.riferimento
+              )
+              OR EXISTS (
+                  SELECT 1 FROM import_righe p
+                  WHERE p.riferimento = s.riferimento AND p.riga < s.riga
+              )
+          )
+    """, {"registro_id": registro_id})
+
+    # Movimenti simili già presenti (inseriti a mano): solo avviso
+    cur.execute("""
+        UPDATE import_righe s
+        SET avviso = 'Possibile duplicato di un movimento esistente'
+        WHERE s.esito = 'valida'
+          AND EXISTS (
+              SELECT 1 FROM movimenti_contabili m
+              WHERE m.registro_id = %(registro_id)s
+                AND m.data_movimento = s.data_operazione
+                AND m.importo = ABS(s.importo)
+                AND m.tipo_movimento = CASE WHEN s.importo > 0 THEN 'entrata' ELSE 'uscita' END
+          )
+    """, {"registro_id": registro_id})
+
+    # Categorie dalle regole: priorità più bassa prima, poi testo più specifico
+    cur.execute("""
+        UPDATE import_righe s
+        SET categoria_id = (
+            SELECT r.categoria_id
+            FROM regole_import_categorie r
+            WHERE r.ente_id = %(ente_id)s
+              AND r.attivo = TRUE
+              AND (r.registro_id IS NULL OR r.registro_id = %(registro_id)s)
+              AND (r.tipo_movimento IS NULL
+                   OR r.tipo_movimento = CASE WHEN s.importo > 0 THEN 'entrata' ELSE 'uscita' END)
+              AND strpos(lower(s.descrizione), lower(r.testo)) > 0
+            ORDER BY r.priorita, length(r.testo) DESC
+            LIMIT 1
+        )
+        WHERE s.esito = 'valida'
+    """, {"ente_id": ente_id, "registro_id": registro_id})
+
+
+def riepilogo_staging(cur) -> Dict:
+    cur.execute("""
+        SELECT
+            COUNT(*),
+            COUNT(*) FILTER (WHERE esito = 'valida'),
+            COUNT(*) FILTER (WHERE esito = 'errore'),
+            COUNT(*) FILTER (WHERE esito = 'duplicato'),
+            COUNT(*) FILTER (WHERE esito = 'valida' AND categoria_id IS NOT NULL),
+            COUNT(*) FILTER (WHERE avviso IS NOT NULL AND esito = 'valida'),
+            COALESCE(SUM(importo) FILTER (WHERE esito = 'valida' AND importo > 0), 0),
+            COALESCE(-SUM(importo) FILTER (WHERE esito = 'valida' AND importo < 0), 0),
+            MIN(data_operazione) FILTER (WHERE esito = 'valida'),
+            MAX(data_operazione) FILTER (WHERE esito = 'valida')
+        FROM import_righe
+    """)
+    r = cur.fetchone()
+
+    # Anteprima: prima errori e avvisi, poi le altre righe
+    cur.execute("""
+        SELECT s.riga, s.data_operazione, s.importo, s.descrizione, s.riferimento,
+               s.esito, s.errore, s.avviso, s.categoria_id, pc.descrizione
+        FROM import_righe s
+        LEFT JOIN piano_conti pc ON pc.id = s.categoria_id
+        ORDER BY (s.esito = 'errore') DESC, (s.avviso IS NOT NULL) DESC, s.riga
+        LIMIT %s
+    """, (IMPORT_ANTEPRIMA_RIGHE,))
+
+    return {
+        "righe_lette": r[0],
+        "righe_valide": r[1],
+        "righe_con_errori": r[2],
+        "righe_duplicate": r[3],
+        "righe_categorizzate": r[4],
+        "righe_con_avvisi": r[5],
+        "totale_entrate": float(r[6]),
+        "totale_uscite": float(r[7]),
+        "data_da": r[8].isoformat() if r[8] else None,
+        "data_a": r[9].isoformat() if r[9] else None,
+        "anteprima": [
+            {
+                "riga": a[0],
+                "data": a[1].isoformat() if a[1] else None,
+                "importo": float(a[2]) if a[2] is not None else None,
+                "descrizione": a[3],
+                "riferimento": a[4],
+                "esito": a[5],
+                "errore": a[6],
+                "avviso": a[7],
+                "categoria_id": str(a[8]) if a[8] else None,
+                "categoria_nome": a[9],
+            }
+            for a in cur.fetchall()
+        ],
+    }
+
+
+def registra_estratto(
+    cur,
+    ente_id: str,
+    registro_id: str,
+    nome_file: str,
+    formato: str,
+    crea_movimenti: bool,
+    current_user: dict
+) -> Dict:
+    """
+    Salva estratto e righe e, se richiesto, crea i movimenti delle righe valide.
+    """
+    cur.execute("""
+        INSERT INTO estratti_conto (ente_id, registro_id, nome_file, formato, created_by)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    """, (ente_id, registro_id, nome_file, formato, current_user.get("user_id")))
+    estratto_id = str(cur.fetchone()[0])
+
+    movimenti_creati = 0
+    if crea_movimenti:
+        cur.execute("UPDATE import_righe SET movimento_id = uuid_generate_v4() WHERE esito = 'valida'")
+
+        # created_at crescente con la riga: a parità di data resta l'ordine dell'estratto
+        cur.execute("""
+            INSERT INTO movimenti_contabili (
+                id, ente_id, registro_id, categoria_id,
+                data_movimento, tipo_movimento, importo, causale,
+                descrizione, note, created_by, created_at
+            )
+            SELECT
+                s.movimento_id, %(ente_id)s, %(registro_id)s, s.categoria_id,
+                s.data_operazione,
+                CASE WHEN s.importo > 0 THEN 'entrata' ELSE 'uscita' END,
+                ABS(s.importo),
+                COALESCE(NULLIF(s.descrizione, ''), 'Movimento da estratto conto'),
+                s.descrizione, '', %(utente_id)s,
+                NOW() + s.riga * INTERVAL '1 microsecond'
+            FROM import_righe s
+            WHERE s.esito = 'valida'
+        """, {"ente_id": ente_id, "registro_id": registro_id, "utente_id": current_user.get("user_id")})
+        movimenti_creati = cur.rowcount
+
+    # Righe con data e importo validi (anche quelle non trasformate in movimenti)
+    cur.execute("""
+        INSERT INTO estratti_conto_righe (
+            estratto_id, riga, data_operazione, importo, descrizione, riferimento, movimento_id
+        )
+        SELECT %s, riga, data_operazione, importo, descrizione, riferimento, movimento_id
+        FROM import_righe
+        WHERE esito IN ('valida', 'errore')
+          AND data_operazione IS NOT NULL AND importo IS NOT NULL
+          AND ABS(importo) <= %s
+        ORDER BY riga
+    """, (estratto_id, IMPORTO_MASSIMO))
+    righe_salvate = cur.rowcount
+
+    # I movimenti creati dall'import sono già riconciliati con la loro riga
+    cur.execute("""
+        INSERT INTO estratti_conto_abbinamenti (riga_id, movimento_id, created_by)
+        SELECT id, movimento_id, %s
+        FROM estratti_conto_righe
+        WHERE estratto_id = %s AND movimento_id IS NOT NULL
+    """, (current_user.get("user_id"), estratto_id))
+
+    cur.execute("""
+        UPDATE estratti_conto SET numero_righe = %s, movimenti_creati = %s WHERE id = %s
+    """, (righe_salvate, movimenti_creati, estratto_id))
+
+    registra_audit_psycopg2(
+        cur,
+        azione="INSERT",
+        tabella="movimenti_contabili",
+        record_id=estratto_id,
+        utente_id=current_user.get("user_id"),
+        utente_email=current_user.get("email"),
+        ente_id=ente_id,
+        dati_nuovi={
+            "estratto_id": estratto_id,
+            "registro_id": str(registro_id),
+            "nome_file": nome_file,
+            "formato": formato,
+            "righe": righe_salvate,
+            "movimenti_creati": movimenti_creati,
+        },
+        descrizione=f"Import estratto conto {nome_file}: {movimenti_creati} movimenti",
+    )
+
+    return {"estratto_id": estratto_id, "righe_salvate": righe_salvate, "movimenti_creati": movimenti_creati}
@@ -0,0 +1,429 @@
+"""
+CODA DEI LAVORI IN BACKGROUND
+=============================
+Operazioni lunghe (PDF dei rendiconti e dell'inventario, import degli
+estratti conto, firma) non vengono più eseguite nella richiesta HTTP: la
+route accoda un lavoro nella tabella jobs (migration 018), risponde con
+il suo id e il client segue l'avanzamento su /api/jobs/{id}.
+
+I lavori sono eseguiti da scripts/worker_jobs.py, in uno o più processi
+separati dall'API:
+
+- prelievo con FOR UPDATE SKIP LOCKED (nessun lavoro preso due volte);
+- risveglio immediato con LISTEN/NOTIFY, polling come riserva;
+- errore → nuovo tentativo con attesa crescente (JOB_RITARDO_SECONDI,
+  raddoppiata a ogni tentativo) fino a max_tentativi;
+  ErroreJobDefinitivo chiude subito il lavoro in errore;
+- il worker tiene un advisory lock di sessione sul lavoro in esecuzione:
+  i lavori in corso senza lock (worker terminato o connessione persa)
+  tornano in coda, quelli ancora in esecuzione non vengono mai ripresi;
+- database non raggiungibile (es. riavvio di Postgres): il worker si
+  riconnette con attesa crescente invece di terminare.
+
+Le funzioni di accodamento non fanno commit: il lavoro diventa visibile
+al worker con il commit del chiamante, insieme ai dati che lo riguardano.
+"""
+
+import os
+import json
+import time
+import select
+import signal
+import socket
+import logging
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from constants import StatoJob
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_TENTATIVI = int(os.getenv("JOB_MAX_TENTATIVI", 3))
+JOB_RITARDO_SECONDI = int(os.getenv("JOB_RITARDO_SECONDI", 30))
+JOB_ATTESA_SECONDI = float(os.getenv("JOB_ATTESA_SECONDI", 5))
+JOB_CONSERVA_GIORNI = int(os.getenv("JOB_CONSERVA_GIORNI", 30))
+
+CANALE = "ecclesia_jobs"
+
+_INTERVALLO_MANUTENZIONE = 60
+_RICONNESSIONE_MAX_SECONDI = 60
+
+_SQL_ACCODA = """
+    INSERT INTO jobs (tipo, ente_id, utente_id, parametri, chiave, max_tentativi)
+    VALUES (%(tipo)s, %(ente_id)s, %(utente_id)s, %(parametri)s::jsonb, %(chiave)s, %(max_tentativi)s)
+    ON CONFLICT (chiave) WHERE chiave IS NOT NULL AND stato IN ('in_coda', 'in_corso')
+    DO NOTHING
+    RETURNING id
+"""
+
+_SQL_ATTIVO = """
+    SELECT id FROM jobs
+    WHERE chiave = %(chiave)s AND stato IN ('in_coda', 'in_corso')
+"""
+
+
+class ErroreJobDefinitivo(Exception):
+    """Errore che un nuovo tentativo non risolve (dati non validi, file mancante)."""
+    pass
+
+
+# ============================================
+# ACCODAMENTO
+# ============================================
+
+def _parametri_accoda(tipo, parametri, ente_id, utente_id, chiave, max_tentativi) -> Dict:
+    return {
+        "tipo": str(tipo.value if hasattr(tipo, "value") else tipo),
+        "ente_id": str(ente_id) if ente_id else None,
+        "utente_id": str(utente_id) if utente_id else None,
+        "parametri": json.dumps(parametri or {}, default=str),
+        "chiave": chiave,
+        "max_tentativi": max_tentativi or JOB_MAX_TENTATIVI,
+    }
+
+
+def accoda_job_psycopg2(
+    cur,
+    tipo: str,
+    parametri: Optional[Dict] = None,
+    ente_id: Optional[str] = None,
+    utente_id: Optional[str] = None,
+    chiave: Optional[str] = None,
+    max_tentativi: Optional[int] = None
+) -> str:
+    """
+    Accoda un lavoro (commit a carico del chiamante).
+
+    Args:
+        chiave: se un lavoro con la stessa chiave è già in coda o in corso
+            non ne viene creato un altro e si restituisce il suo id
+
+    Returns:
+        id del lavoro
+    """
+    valori = _parametri_accoda(tipo, parametri, ente_id, utente_id, chiave, max_tentativi)
+    # Il lavoro esistente può terminare tra INSERT e SELECT: secondo tentativo
+    for _ in range(2):
+        cur.execute(_SQL_ACCODA, valori)
+        riga = cur.fetchone()
+        if riga is None:
+            cur.execute(_SQL_ATTIVO, valori)
+            riga = cur.fetchone()
+        if riga is not None:
+            break
+    else:
+        raise RuntimeError(f"Lavoro {valori['tipo']} non accodato: chiave {chiave} in conflitto, riprovare")
+    cur.execute(f"NOTIFY {CANALE}")
+    return str(riga[0])
+
+
+def accoda_job(
+    db: Session,
+    tipo: str,
+    parametri: Optional[Dict] = None,
+    ente_id: Optional[str] = None,
+    utente_id: Optional[str] = None,
+    chiave: Optional[str] = None,
+    max_tentativi: Optional[int] = None
+) -> str:
+    """Come accoda_job_psycopg2, per le route SQLAlchemy."""
+    cur = db.connection().connection.cursor()
+    try:
+        return accoda_job_psycopg2(cur, tipo, parametri, ente_id, utente_id, chiave, max_tentativi)
+    finally:
+        cur.close()
+
+
+# ============================================
+# LETTURA
+# ============================================
+
+def leggi_job(cur, job_id: str) -> Optional[Dict]:
+    cur.execute("""
+        SELECT id, tipo, ente_id, utente_id, stato, progresso, messaggio,
+               risultato, errore, tentativi, max_tentativi, esegui_dopo,
+               iniziato_at, completato_at, created_at
+        FROM jobs
+        WHERE id = %s
+    """, (str(job_id),))
+    r = cur.fetchone()
+    if not r:
+        return None
+    return {
+        "id": str(r[0]),
+        "tipo": r[1],
+        "ente_id": str(r[2]) if r[2] else None,
+        "utente_id": str(r[3]) if r[3] else None,
+        "stato": r[4],
+        "progresso": r[5],
+        "messaggio": r[6],
+        "risultato": r[7],
+        "errore": r[8],
+        "tentativi": r[9],
+        "max_tentativi": r[10],
+        "prossimo_tentativo": r[11].isoformat() if r[4] == StatoJob.IN_CODA and r[9] else None,
+        "iniziato_at": r[12].isoformat() if r[12] else None,
+        "completato_at": r[13].isoformat() if r[13] else None,
+        "created_at": r[14].isoformat() if r[14] else None,
+    }
+
+
+# ============================================
+# ESECUZIONE (lato worker)
+# ============================================
+
+_GESTORI: Dict[str, Callable] = {}
+
+
+def gestore(tipo: str):
+    """
+    Registra la funzione che esegue un tipo di lavoro:
+    gestore(parametri: dict, job: ContestoJob) -> dict (risultato)
+    """
+    def registra(funzione: Callable) -> Callable:
+        _GESTORI[str(tipo.value if hasattr(tipo, "value") else tipo)] = funzione
+        return funzione
+    return registra
+
+
+class ContestoJob:
+    """Lavoro in esecuzione, passato al gestore per l'avanzamento."""
+
+    def __init__(self, cur, riga: Dict):
+        self._cur = cur
+        self.id = riga["id"]
+        self.tipo = riga["tipo"]
+        self.ente_id = riga["ente_id"]
+        self.utente_id = riga["utente_id"]
+        self.tentativo = riga["tentativi"]
+
+    def avanzamento(self, progresso: int, messaggio: Optional[str] = None):
+        """Percentuale (0-100) e descrizione della fase, visibili su /api/jobs/{id}."""
+        self._cur.execute("""
+            UPDATE jobs SET progresso = %s, messaggio = %s, updated_at = NOW()
+            WHERE id = %s
+        """, (max(0, min(int(progresso), 100)), messaggio, self.id))
+
+
+def preleva(cur, worker: str) -> Optional[Dict]:
+    """
+    Prende il primo lavoro pronto, saltando quelli già presi da altri worker.
+
+    Nello stesso statement la sessione del worker prende l'advisory lock del
+    lavoro: quando lo stato 'in_corso' diventa visibile il lock è già tenuto.
+    Va rilasciato con rilascia() a lavoro concluso.
+    """
+    cur.execute("""
+        UPDATE jobs SET
+            stato = 'in_corso',
+            tentativi = tentativi + 1,
+            worker = %s,
+            iniziato_at = NOW(),
+            updated_at = NOW()
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE stato = 'in_coda' AND esegui_dopo <= NOW()
+            ORDER BY esegui_dopo
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, tipo, ente_id, utente_id, parametri, tentativi,
+                  pg_advisory_lock(hashtext('ecclesia_jobs'), hashtext(jobs.id::text))
+    """, (worker,))
+    r = cur.fetchone()
+    if not r:
+        return None
+    return {
+        "id": str(r[0]),
+        "tipo": r[1],
+        "ente_id": str(r[2]) if r[2] else None,
+        "utente_id": str(r[3]) if r[3] else None,
+        "parametri": r[4] or {},
+        "tentativi": r[5],
+    }
+
+
+def rilascia(cur, job_id: str):
+    """Rilascia l'advisory lock preso da preleva()."""
+    cur.execute(
+        "SELECT pg_advisory_unlock(hashtext('ecclesia_jobs'), hashtext(%s))",
+        (str(job_id),)
+    )
+
+
+def completa(cur, job_id: str, risultato: Optional[Dict]):
+    cur.execute("""
+        UPDATE jobs SET
+            stato = 'completato',
+            progresso = 100,
+            risultato = %s::jsonb,
+            errore = NULL,
+            completato_at = NOW(),
+            updated_at = NOW()
+        WHERE id = %s
+    """, (json.dumps(risultato or {}, default=str), job_id))
+
+
+def fallisci(cur, job_id: str, errore: str, definitivo: bool = False) -> str:
+    """
+    Registra l'errore e rimette il lavoro in coda con attesa crescente,
+    oppure lo chiude in errore se definitivo o a tentativi esauriti.
+
+    Returns:
+        Nuovo stato del lavoro
+    """
+    cur.execute("""
+        UPDATE jobs SET
+            stato = CASE WHEN %(definitivo)s OR tentativi >= max_tentativi
+                         THEN 'errore' ELSE 'in_coda' END,
+            esegui_dopo = NOW() + make_interval(secs => %(ritardo)s * power(2, GREATEST(tentativi - 1, 0))),
+            completato_at = CASE WHEN %(definitivo)s OR tentativi >= max_tentativi
+                                 THEN NOW() END,
+            errore = %(errore)s,
+            worker = NULL,
+            updated_at = NOW()
+        WHERE id = %(id)s
+        RETURNING stato
+    """, {"id": job_id, "errore": errore, "definitivo": definitivo, "ritardo": JOB_RITARDO_SECONDI})
+    riga = cur.fetchone()
+    return riga[0] if riga else StatoJob.ERRORE
+
+
+def recupera_interrotti(cur) -> int:
+    """
+    Lavori in corso il cui advisory lock non è tenuto da nessuna sessione:
+    il worker è terminato o ha perso la connessione. La durata non conta,
+    un lavoro lungo ancora in esecuzione non viene ripreso.
+    """
+    cur.execute("""
+        UPDATE jobs SET
+            stato = CASE WHEN tentativi >= max_tentativi THEN 'errore' ELSE 'in_coda' END,
+            completato_at = CASE WHEN tentativi >= max_tentativi THEN NOW() END,
+            esegui_dopo = NOW(),
+            errore = 'Lavoro interrotto (worker terminato)',
+            worker = NULL,
+            updated_at = NOW()
+        WHERE stato = 'in_corso'
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_locks l
+              WHERE l.locktype = 'advisory'
+                AND l.database = (SELECT oid FROM pg_database WHERE datname = current_database())
+                AND l.classid = hashtext('ecclesia_jobs')::oid
+                AND l.objid = hashtext(jobs.id::text)::oid
+                AND l.objsubid = 2
+          )
+    """)
+    return cur.rowcount
+
+
+def pulisci_conclusi(cur) -> int:
+    cur.execute("""
+        DELETE FROM jobs
+        WHERE stato IN ('completato', 'errore')
+          AND completato_at < NOW() - make_interval(days => %s)
+    """, (JOB_CONSERVA_GIORNI,))
+    return cur.rowcount
+
+
+def esegui_job(cur, riga: Dict):
+    """Esegue un lavoro prelevato e ne registra l'esito."""
+    funzione = _GESTORI.get(riga["tipo"])
+    if funzione is None:
+        fallisci(cur, riga["id"], f"Tipo di lavoro sconosciuto: {riga['tipo']}", definitivo=True)
+        rilascia(cur, riga["id"])
+        return
+
+    inizio = time.perf_counter()
+    try:
+        risultato = funzione(riga["parametri"], ContestoJob(cur, riga))
+    except ErroreJobDefinitivo as e:
+        stato = fallisci(cur, riga["id"], str(e), definitivo=True)
+    except Exception as e:
+        logger.exception("Lavoro %s (%s) fallito", riga["id"], riga["tipo"])
+        stato = fallisci(cur, riga["id"], str(e) or e.__class__.__name__)
+    else:
+        completa(cur, riga["id"], risultato)
+        stato = StatoJob.COMPLETATO
+    finally:
+        rilascia(cur, riga["id"])
+    logger.info(
+        "Lavoro %s (%s) tentativo %d: %s in %.1f s",
+        riga["id"], riga["tipo"], riga["tentativi"], stato, time.perf_counter() - inizio
+    )
+
+
+def _connetti(dsn: str):
+    """Connessione autocommit del worker, in ascolto sul canale dei lavori."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {CANALE}")
+    return conn, cur
+
+
+def esegui_worker(dsn: str, nome: Optional[str] = None, una_volta: bool = False):
+    """
+    Ciclo del worker: preleva ed esegue lavori finché non riceve SIGTERM/SIGINT
+    (il lavoro in corso viene completato). Con una_volta esce a coda vuota.
+    """
+    import psycopg2
+
+    nome = nome or f"{socket.gethostname()}:{os.getpid()}"
+    fermo = []
+
+    def arresta(signum, frame):
+        logger.info("Worker %s: arresto richiesto", nome)
+        fermo.append(signum)
+
+    signal.signal(signal.SIGTERM, arresta)
+    signal.signal(signal.SIGINT, arresta)
+
+    logger.info("Worker %s avviato (tipi: %s)", nome, ", ".join(sorted(_GESTORI)))
+    conn = cur = None
+    ritardo = 1
+    ultima_manutenzione = 0.0
+    try:
+        while not fermo:
+            try:
+                if conn is None:
+                    conn, cur = _connetti(dsn)
+                    ritardo = 1
+
+                if time.monotonic() - ultima_manutenzione > _INTERVALLO_MANUTENZIONE:
+                    recuperati = recupera_interrotti(cur)
+                    if recuperati:
+                        logger.warning("Worker %s: %d lavori interrotti rimessi in coda", nome, recuperati)
+                    pulisci_conclusi(cur)
+                    ultima_manutenzione = time.monotonic()
+
+                riga = preleva(cur, nome)
+                if riga is not None:
+                    esegui_job(cur, riga)
+                    continue
+                if una_volta:
+                    break
+
+                # Coda vuota: attesa di un NOTIFY (o dei lavori da ritentare)
+                try:
+                    if select.select([conn], [], [], JOB_ATTESA_SECONDI) != ([], [], []):
+                        conn.poll()
+                        conn.notifies.clear()
+                except InterruptedError:
+                    pass
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Il lavoro eventualmente in corso resta senza lock: recupera_interrotti lo rimette in coda
+                logger.error("Worker %s: database non raggiungibile (%s), nuovo tentativo tra %d s", nome, e, ritardo)
+                if conn is not None:
+                    conn.close()
+                conn = cur = None
+                for _ in range(ritardo):
+                    if fermo:
+                        break
+                    time.sleep(1)
+                ritardo = min(ritardo * 2, _RICONNESSIONE_MAX_SECONDI)
+    finally:
+        if conn is not None:
+            conn.close()
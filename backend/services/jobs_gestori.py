@@ -0,0 +1,195 @@
+"""
+GESTORI DEI LAVORI IN BACKGROUND
+================================
+Funzioni eseguite dal worker (scripts/worker_jobs.py) per ogni tipo di
+lavoro della coda (services/jobs.py). Ogni gestore apre le proprie
+connessioni, riceve i parametri salvati all'accodamento e restituisce
+il risultato mostrato su /api/jobs/{id}; "file" (percorso relativo alla
+cartella backend) è scaricabile da /api/jobs/{id}/file.
+
+Le route sono importate dentro le funzioni: il worker non carica
+l'applicazione FastAPI.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict
+
+from fastapi import HTTPException
+
+from database import get_db_connection
+from constants import TipoJob
+from services.jobs import gestore, ContestoJob, ErroreJobDefinitivo
+from services.render_pdf import renderizza_pdf
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+IMPORT_DIR = BASE_DIR / "uploads" / "import"
+INVENTARIO_PDF_DIR = BASE_DIR / "uploads" / "inventario" / "registri"
+
+
+def _relativo(percorso: Path) -> str:
+    return str(Path(percorso).resolve().relative_to(BASE_DIR))
+
+
+def _richiedi_weasyprint(disponibile: bool):
+    """Senza WeasyPrint un nuovo tentativo non cambia l'esito."""
+    if not disponibile:
+        raise ErroreJobDefinitivo("Generazione PDF non disponibile in questo ambiente (WeasyPrint non installato)")
+
+
+# ============================================
+# PDF RENDICONTO
+# ============================================
+
+@gestore(TipoJob.PDF_RENDICONTO)
+def pdf_rendiconto(parametri: Dict, job: ContestoJob) -> Dict:
+    """Genera il PDF del rendiconto e ne salva il percorso (rendiconti.pdf_path)."""
+    from routes.rendiconti_documenti import genera_pdf_rendiconto, WEASYPRINT_AVAILABLE
+
+    _richiedi_weasyprint(WEASYPRINT_AVAILABLE)
+    job.avanzamento(10, "Generazione PDF del rendiconto")
+    pdf_path = genera_pdf_rendiconto(parametri["rendiconto_id"], parametri["ente_id"])
+    return {
+        "rendiconto_id": parametri["rendiconto_id"],
+        "pdf_path": pdf_path,
+        "file": f"rendiconti/{pdf_path}",
+        "nome_file": f"rendiconto_{parametri['rendiconto_id']}.pdf",
+    }
+
+
+# ============================================
+# PDF REGISTRO INVENTARIO
+# ============================================
+
+@gestore(TipoJob.PDF_REGISTRO_INVENTARIO)
+def pdf_registro_inventario(parametri: Dict, job: ContestoJob) -> Dict:
+    from routes.inventario_pdf import html_registro, WEASYPRINT_AVAILABLE
+
+    _richiedi_weasyprint(WEASYPRINT_AVAILABLE)
+    job.avanzamento(10, "Lettura del registro")
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        html_content, filename = html_registro(cur, parametri["registro_id"], parametri["ente_id"])
+    except HTTPException as e:
+        raise ErroreJobDefinitivo(e.detail)
+    finally:
+        cur.close()
+        conn.close()
+
+    job.avanzamento(30, "Generazione PDF")
+    percorso = INVENTARIO_PDF_DIR / parametri["ente_id"] / filename
+    renderizza_pdf(html_content, percorso=str(percorso), base_url=str(BASE_DIR))
+    return {"file": _relativo(percorso), "nome_file": filename}
+
+
+# ============================================
+# IMPORT ESTRATTO CONTO
+# ============================================
+
+def salva_file_import(flusso, nome: str) -> str:
+    """Copia il file caricato in uploads/import (letto poi dal worker)."""
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    percorso = IMPORT_DIR / nome
+    with open(percorso, "wb") as f:
+        while True:
+            blocco = flusso.read(1024 * 1024)
+            if not blocco:
+                break
+            f.write(blocco)
+    return str(percorso)
+
+
+@gestore(TipoJob.IMPORT_ESTRATTO)
+def import_estratto(parametri: Dict, job: ContestoJob) -> Dict:
+    """
+    Import di un estratto conto caricato con asincrono=true
+    (stessi passi di POST /registri/{id}/import, senza anteprima).
+    """
+    from services.estratti_conto import leggi_estratto
+    from services.import_movimenti import carica_staging, valida_staging, riepilogo_staging, registra_estratto
+
+    percorso = parametri["percorso"]
+    if not os.path.exists(percorso):
+        raise ErroreJobDefinitivo("File dell'estratto conto non più disponibile")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        job.avanzamento(10, "Lettura del file")
+        with open(percorso, "rb") as f:
+            try:
+                carica_staging(cur, leggi_estratto(f, parametri["formato"]))
+            except ValueError as e:
+                raise ErroreJobDefinitivo(str(e))
+
+        job.avanzamento(50, "Validazione delle righe")
+        valida_staging(cur, parametri["ente_id"], parametri["registro_id"], parametri["crea_movimenti"])
+        riepilogo = riepilogo_staging(cur)
+        if riepilogo["righe_con_errori"] and not parametri["ignora_errori"]:
+            raise ErroreJobDefinitivo(
+                f"{riepilogo['righe_con_errori']} righe con errori: correggi il file o importa ignorando gli errori"
+            )
+
+        job.avanzamento(75, "Registrazione dei movimenti")
+        risultato = registra_estratto(
+            cur, parametri["ente_id"], parametri["registro_id"], parametri["nome_file"],
+            parametri["formato"], parametri["crea_movimenti"], parametri["utente"]
+        )
+        conn.commit()
+    except ErroreJobDefinitivo:
+        conn.rollback()
+        os.remove(percorso)
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    os.remove(percorso)
+    riepilogo.pop("anteprima", None)
+    return {**riepilogo, **risultato, "importato": True}
+
+
+# ============================================
+# FIRMA RENDICONTO
+# ============================================
+
+@gestore(TipoJob.FIRMA_RENDICONTO)
+def firma_rendiconto(parametri: Dict, job: ContestoJob) -> Dict:
+    """Applica timbro e firma del Vescovo al PDF di un rendiconto approvato."""
+    from routes.contabilita import applica_firma_vescovo
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pdf_path FROM rendiconti WHERE id = %s", (parametri["rendiconto_id"],))
+        riga = cur.fetchone()
+        if not riga or not riga[0]:
+            raise ErroreJobDefinitivo("PDF del rendiconto non trovato")
+
+        job.avanzamento(20, "Applicazione di timbro e firma")
+        try:
+            pdf_firmato = applica_firma_vescovo(riga[0])
+        except FileNotFoundError as e:
+            raise ErroreJobDefinitivo(str(e))
+
+        cur.execute("""
+            UPDATE rendiconti SET pdf_firmato_path = %s WHERE id = %s
+        """, (pdf_firmato, parametri["rendiconto_id"]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        "rendiconto_id": parametri["rendiconto_id"],
+        "pdf_firmato": pdf_firmato,
+        "file": f"rendiconti/{pdf_firmato}",
+        "nome_file": f"rendiconto_{parametri['rendiconto_id']}_firmato.pdf",
+    }
@@ -0,0 +1,387 @@
+"""
+SERVIZIO METRICHE
+=================
+Strumentazione delle richieste HTTP: istogrammi di latenza per route
+(path template, es. /api/contabilita/movimenti/{movimento_id}),
+conteggio richieste, richieste in corso, dimensione risposte e tempo
+speso nel database rispetto al tempo applicativo.
+
+Esposizione in formato testo Prometheus (/api/metrics) e come header
+Server-Timing su ogni risposta.
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+from contextvars import ContextVar
+from typing import Optional, Dict, Tuple
+
+logger = logging.getLogger("ecclesia.sql")
+
+# Profilazione SQL per richiesta (conteggio per statement + punto di chiamata).
+# Attiva di default in sviluppo; in produzione si abilita con SQL_PROFILING=true
+SQL_PROFILING = os.getenv(
+    "SQL_PROFILING",
+    "true" if os.getenv("ENVIRONMENT", "production") == "development" else "false"
+).lower() in ("1", "true", "on")
+SQL_SOGLIA_LENTA_MS = float(os.getenv("SQL_SOGLIA_LENTA_MS", 500))
+SQL_SOGLIA_QUERY = int(os.getenv("SQL_SOGLIA_QUERY", 50))
+SQL_SOGLIA_RIPETIZIONI = int(os.getenv("SQL_SOGLIA_RIPETIZIONI", 5))
+
+# Directory backend: i punti di chiamata sono riportati relativi a questa
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bucket istogrammi (secondi / byte)
+BUCKET_DURATA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_DIMENSIONE = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Bucket render PDF (secondi): documenti da frazioni di secondo a minuti
+BUCKET_DURATA_PDF = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Etichetta per le richieste che non corrispondono a nessuna route
+# (evita di creare una serie per ogni URL sconosciuto)
+ROUTE_NON_TROVATA = "<non_trovata>"
+
+
+# ============================================
+# STATO DELLA RICHIESTA CORRENTE
+# ============================================
+
+class StatoRichiesta:
+    """
+    Accumulatore per la richiesta in corso. È un oggetto mutabile:
+    il ContextVar viene copiato nei task e nel threadpool, ma tutti
+    vedono la stessa istanza e le query eseguite nelle route def
+    finiscono comunque nella richiesta giusta.
+    """
+
+    __slots__ = ("db_secondi", "query", "statement")
+
+    def __init__(self):
+        self.db_secondi = 0.0
+        self.query = 0
+        # statement normalizzato -> [ripetizioni, secondi, punto di chiamata]
+        self.statement = {} if SQL_PROFILING else None
+
+
+_richiesta_corrente: ContextVar[Optional[StatoRichiesta]] = ContextVar(
+    "richiesta_corrente", default=None
+)
+
+
+def inizia_richiesta() -> StatoRichiesta:
+    """Crea l'accumulatore per la richiesta corrente (chiamato dal middleware)"""
+    stato = StatoRichiesta()
+    _richiesta_corrente.set(stato)
+    return stato
+
+
+def richiesta_corrente() -> Optional[StatoRichiesta]:
+    return _richiesta_corrente.get()
+
+
+def registra_query(durata: float, statement=None):
+    """
+    Registra il tempo di una query sulla richiesta corrente.
+    Chiamata dagli hook di database.py (SQLAlchemy e psycopg2).
+    Fuori da una richiesta HTTP (script, worker) non fa nulla.
+    """
+    stato = _richiesta_corrente.get()
+    if stato is None:
+        return
+    stato.db_secondi += durata
+    stato.query += 1
+
+    if stato.statement is not None and statement is not None:
+        chiave = _normalizza_statement(statement)
+        voce = stato.statement.get(chiave)
+        if voce is None:
+            stato.statement[chiave] = [1, durata, _punto_di_chiamata()]
+        else:
+            voce[0] += 1
+            voce[1] += durata
+
+
+_SPAZI = re.compile(r"\s+")
+
+
+def _normalizza_statement(statement) -> str:
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    return _SPAZI.sub(" ", str(statement)).strip()
+
+
+def _punto_di_chiamata() -> str:
+    """
+    Primo frame dello stack che appartiene al codice dell'applicazione
+    (esclusi database.py, questo modulo e le librerie installate).
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(_BACKEND_DIR)
+            and "site-packages" not in filename
+            and not filename.endswith(("database.py", "metriche.py"))
+        ):
+            relativo = os.path.relpath(filename, _BACKEND_DIR)
+            return f"{relativo}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "sconosciuto"
+
+
+def analizza_richiesta(metodo: str, route: str, durata: float, stato: StatoRichiesta):
+    """
+    Al termine della richiesta: segnala pattern N+1 (stesso statement
+    ripetuto oltre SQL_SOGLIA_RIPETIZIONI volte) con il punto di chiamata,
+    e le richieste lente o con troppe query.
+    """
+    if stato.statement is None:
+        return
+
+    sospetti = [
+        (ripetizioni, secondi, punto, sql)
+        for sql, (ripetizioni, secondi, punto) in stato.statement.items()
+        if ripetizioni >= SQL_SOGLIA_RIPETIZIONI
+    ]
+    if sospetti:
+        with _lock:
+            chiave = (metodo, route)
+            _nplus1_totali[chiave] = _nplus1_totali.get(chiave, 0) + 1
+        for ripetizioni, secondi, punto, sql in sorted(sospetti, reverse=True):
+            logger.warning(
+                "Possibile N+1 in %s %s: %d esecuzioni (%.1f ms) da %s: %s",
+                metodo, route, ripetizioni, secondi * 1000, punto, sql[:200]
+            )
+
+    if durata * 1000 > SQL_SOGLIA_LENTA_MS or stato.query > SQL_SOGLIA_QUERY:
+        logger.warning(
+            "Richiesta lenta %s %s: %.1f ms totali, %.1f ms DB, %d query (%d distinte)",
+            metodo, route, durata * 1000, stato.db_secondi * 1000,
+            stato.query, len(stato.statement)
+        )
+
+
+# ============================================
+# REGISTRO METRICHE
+# ============================================
+
+class _Istogramma:
+    """Istogramma cumulativo in stile Prometheus"""
+
+    __slots__ = ("bucket", "conteggi", "somma", "totale")
+
+    def __init__(self, bucket: Tuple[float, ...]):
+        self.bucket = bucket
+        self.conteggi = [0] * len(bucket)
+        self.somma = 0.0
+        self.totale = 0
+
+    def osserva(self, valore: float):
+        self.somma += valore
+        self.totale += 1
+        for i, limite in enumerate(self.bucket):
+            if valore <= limite:
+                self.conteggi[i] += 1
+
+
+_lock = threading.Lock()
+_richieste_totali: Dict[Tuple[str, str, str], int] = {}
+_durate: Dict[Tuple[str, str], _Istogramma] = {}
+_durate_db: Dict[Tuple[str, str], _Istogramma] = {}
+_dimensioni: Dict[Tuple[str, str], _Istogramma] = {}
+_query_totali: Dict[Tuple[str, str], int] = {}
+_nplus1_totali: Dict[Tuple[str, str], int] = {}
+_in_corso = 0
+_pdf_esiti: Dict[str, int] = {}
+_pdf_attesa = _Istogramma(BUCKET_DURATA_PDF)
+_pdf_durata = _Istogramma(BUCKET_DURATA_PDF)
+
+
+def richiesta_iniziata():
+    global _in_corso
+    with _lock:
+        _in_corso += 1
+
+
+def richiesta_terminata():
+    global _in_corso
+    with _lock:
+        _in_corso -= 1
+
+
+def registra_richiesta(
+    metodo: str,
+    route: str,
+    status_code: int,
+    durata: float,
+    stato: StatoRichiesta,
+    dimensione: Optional[int] = None
+):
+    """Aggiorna i contatori al termine di una richiesta"""
+    chiave = (metodo, route)
+    with _lock:
+        chiave_status = (metodo, route, str(status_code))
+        _richieste_totali[chiave_status] = _richieste_totali.get(chiave_status, 0) + 1
+
+        if chiave not in _durate:
+            _durate[chiave] = _Istogramma(BUCKET_DURATA)
+            _durate_db[chiave] = _Istogramma(BUCKET_DURATA)
+        _durate[chiave].osserva(durata)
+        _durate_db[chiave].osserva(stato.db_secondi)
+        _query_totali[chiave] = _query_totali.get(chiave, 0) + stato.query
+
+        if dimensione is not None:
+            if chiave not in _dimensioni:
+                _dimensioni[chiave] = _Istogramma(BUCKET_DIMENSIONE)
+            _dimensioni[chiave].osserva(dimensione)
+
+
+def registra_render_pdf(esito: str, attesa: Optional[float] = None, durata: Optional[float] = None):
+    """Esito di un render PDF (services/render_pdf.py), con attesa in coda e durata se riuscito"""
+    with _lock:
+        _pdf_esiti[esito] = _pdf_esiti.get(esito, 0) + 1
+        if attesa is not None:
+            _pdf_attesa.osserva(attesa)
+        if durata is not None:
+            _pdf_durata.osserva(durata)
+
+
+def server_timing(durata: float, stato: StatoRichiesta) -> str:
+    """Valore dell'header Server-Timing (millisecondi)"""
+    db_ms = stato.db_secondi * 1000
+    totale_ms = durata * 1000
+    app_ms = max(totale_ms - db_ms, 0.0)
+    return (
+        f'db;dur={db_ms:.1f};desc="{stato.query} query", '
+        f"app;dur={app_ms:.1f}, "
+        f"total;dur={totale_ms:.1f}"
+    )
+
+
+# ============================================
+# ESPORTAZIONE PROMETHEUS
+# ============================================
+
+def _etichette(**valori) -> str:
+    parti = []
+    for nome, valore in valori.items():
+        valore = str(valore).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parti.append(f'{nome}="{valore}"')
+    return "{" + ",".join(parti) + "}"
+
+
+def _formatta_numero(valore: float) -> str:
+    if valore == int(valore):
+        return str(int(valore))
+    return repr(valore)
+
+
+def _esporta_istogramma(righe: list, nome: str, aiuto: str, serie: dict):
+    righe.append(f"# HELP {nome} {aiuto}")
+    righe.append(f"# TYPE {nome} histogram")
+    for (metodo, route), isto in sorted(serie.items()):
+        for limite, conteggio in zip(isto.bucket, isto.conteggi):
+            etichette = _etichette(method=metodo, route=route, le=_formatta_numero(limite))
+            righe.append(f"{nome}_bucket{etichette} {conteggio}")
+        etichette = _etichette(method=metodo, route=route, le="+Inf")
+        righe.append(f"{nome}_bucket{etichette} {isto.totale}")
+        etichette = _etichette(method=metodo, route=route)
+        righe.append(f"{nome}_sum{etichette} {isto.somma:.6f}")
+        righe.append(f"{nome}_count{etichette} {isto.totale}")
+
+
+def _esporta_istogramma_semplice(righe: list, nome: str, aiuto: str, isto: _Istogramma):
+    righe.append(f"# HELP {nome} {aiuto}")
+    righe.append(f"# TYPE {nome} histogram")
+    for limite, conteggio in zip(isto.bucket, isto.conteggi):
+        righe.append(f"{nome}_bucket{_etichette(le=_formatta_numero(limite))} {conteggio}")
+    righe.append(f'{nome}_bucket{{le="+Inf"}} {isto.totale}')
+    righe.append(f"{nome}_sum {isto.somma:.6f}")
+    righe.append(f"{nome}_count {isto.totale}")
+
+
+def esporta_prometheus() -> str:
+    """Tutte le metriche in formato testo Prometheus 0.0.4"""
+    # Import locali: database e render_pdf importano questo modulo
+    import database
+    from services import render_pdf
+
+    righe = []
+    with _lock:
+        righe.append("# HELP ecclesia_http_requests_total Richieste HTTP completate")
+        righe.append("# TYPE ecclesia_http_requests_total counter")
+        for (metodo, route, status_code), valore in sorted(_richieste_totali.items()):
+            etichette = _etichette(method=metodo, route=route, status=status_code)
+            righe.append(f"ecclesia_http_requests_total{etichette} {valore}")
+
+        righe.append("# HELP ecclesia_http_requests_in_flight Richieste HTTP in corso")
+        righe.append("# TYPE ecclesia_http_requests_in_flight gauge")
+        righe.append(f"ecclesia_http_requests_in_flight {_in_corso}")
+
+        _esporta_istogramma(
+            righe, "ecclesia_http_request_duration_seconds",
+            "Durata totale delle richieste HTTP", _durate
+        )
+        _esporta_istogramma(
+            righe, "ecclesia_http_request_db_seconds",
+            "Tempo speso in query al database per richiesta", _durate_db
+        )
+        _esporta_istogramma(
+            righe, "ecclesia_http_response_size_bytes",
+            "Dimensione delle risposte HTTP (Content-Length)", _dimensioni
+        )
+
+        righe.append("# HELP ecclesia_db_queries_total Query SQL eseguite dalle richieste HTTP")
+        righe.append("# TYPE ecclesia_db_queries_total counter")
+        for (metodo, route), valore in sorted(_query_totali.items()):
+            righe.append(f"ecclesia_db_queries_total{_etichette(method=metodo, route=route)} {valore}")
+
+        righe.append("# HELP ecclesia_db_nplus1_total Richieste con statement ripetuti (possibile N+1)")
+        righe.append("# TYPE ecclesia_db_nplus1_total counter")
+        for (metodo, route), valore in sorted(_nplus1_totali.items()):
+            righe.append(f"ecclesia_db_nplus1_total{_etichette(method=metodo, route=route)} {valore}")
+
+        righe.append("# HELP ecclesia_pdf_render_total Render PDF per esito")
+        righe.append("# TYPE ecclesia_pdf_render_total counter")
+        for esito, valore in sorted(_pdf_esiti.items()):
+            righe.append(f"ecclesia_pdf_render_total{_etichette(esito=esito)} {valore}")
+        _esporta_istogramma_semplice(
+            righe, "ecclesia_pdf_queue_wait_seconds", "Attesa in coda dei render PDF", _pdf_attesa
+        )
+        _esporta_istogramma_semplice(
+            righe, "ecclesia_pdf_render_seconds", "Durata dei render PDF nel worker", _pdf_durata
+        )
+
+    righe.append("# HELP ecclesia_pdf_queue_depth Render PDF in coda o in lavorazione")
+    righe.append("# TYPE ecclesia_pdf_queue_depth gauge")
+    righe.append(f"ecclesia_pdf_queue_depth {render_pdf.stato_coda()}")
+
+    # Stato dei pool di connessione
+    pool_stats = database.pool.stats()
+    righe.append("# HELP ecclesia_db_pool_connections Connessioni del pool psycopg2")
+    righe.append("# TYPE ecclesia_db_pool_connections gauge")
+    righe.append(f'ecclesia_db_pool_connections{{stato="in_uso"}} {pool_stats["in_uso"]}')
+    righe.append(f'ecclesia_db_pool_connections{{stato="inattive"}} {pool_stats["inattive"]}')
+    righe.append("# HELP ecclesia_db_pool_timeouts_total Checkout del pool scaduti")
+    righe.append("# TYPE ecclesia_db_pool_timeouts_total counter")
+    righe.append(f"ecclesia_db_pool_timeouts_total {pool_stats['timeouts']}")
+
+    return "\n".join(righe) + "\n"
+
+
+def azzera():
+    """Azzera contatori e istogrammi (usato dagli script di benchmark)"""
+    global _pdf_attesa, _pdf_durata
+    with _lock:
+        _richieste_totali.clear()
+        _durate.clear()
+        _durate_db.clear()
+        _dimensioni.clear()
+        _query_totali.clear()
+        _nplus1_totali.clear()
+        _pdf_esiti.clear()
+        _pdf_attesa = _Istogramma(BUCKET_DURATA_PDF)
+        _pdf_durata = _Istogramma(BUCKET_DURATA_PDF)
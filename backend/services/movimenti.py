@@ -0,0 +1,199 @@
+"""
+SERVIZIO LISTE MOVIMENTI
+========================
+Pagine di movimenti con saldo progressivo per registro calcolato in SQL.
+
+- Ordinamento e paginazione keyset su (data_movimento, created_at, id),
+  dal più recente (indici della migration 011_movimenti_keyset.sql).
+- Totali e saldo finale per registro da una query aggregata separata,
+  eseguita solo per la prima pagina (senza cursore).
+- Saldo progressivo di una riga = saldo del registro all'inizio della
+  pagina - movimenti più recenti nella pagina (window function). Il saldo
+  all'inizio delle pagine successive viaggia nel cursore: le pagine
+  seguenti leggono solo le proprie righe.
+
+Come il calcolo precedente in Python, il saldo considera solo i
+movimenti che rispettano i filtri ed esclude i bloccati.
+"""
+
+import os
+import json
+import base64
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+# Dimensione pagina quando si usa il cursore senza limite esplicito
+MOVIMENTI_PAGINA = int(os.getenv("MOVIMENTI_PAGINA", 100))
+MOVIMENTI_PAGINA_MAX = int(os.getenv("MOVIMENTI_PAGINA_MAX", 1000))
+
+_CHIAVE_MINORE = "(m.data_movimento, m.created_at, m.id) < (:c_data, :c_creato, CAST(:c_id AS uuid))"
+
+
+def codifica_cursore(data_movimento: date, created_at: datetime, movimento_id, saldi: Dict[str, Decimal]) -> str:
+    """Cursore opaco per la pagina successiva, con il saldo di ogni registro a quel punto."""
+    saldi = {reg_id: str(saldo) for reg_id, saldo in saldi.items() if saldo}
+    grezzo = f"{data_movimento.isoformat()}|{created_at.isoformat()}|{movimento_id}|{json.dumps(saldi)}"
+    return base64.urlsafe_b64encode(grezzo.encode()).decode().rstrip("=")
+
+
+def decodifica_cursore(cursore: str) -> Tuple[date, datetime, str, Dict[str, Decimal]]:
+    """
+    Raises:
+        ValueError: se il cursore non è valido
+    """
+    try:
+        grezzo = base64.urlsafe_b64decode(cursore + "=" * (-len(cursore) % 4)).decode()
+        data_mov, creato, movimento_id, saldi = grezzo.split("|", 3)
+        return (
+            date.fromisoformat(data_mov),
+            datetime.fromisoformat(creato),
+            str(uuid.UUID(movimento_id)),
+            {str(uuid.UUID(reg_id)): Decimal(saldo) for reg_id, saldo in json.loads(saldi).items()},
+        )
+    except (ValueError, ArithmeticError, AttributeError, UnicodeDecodeError) as e:
+        raise ValueError("Cursore non valido") from e
+
+
+def _filtri(ente_id, registro_id, data_da, data_a, tipo) -> Tuple[str, Dict]:
+    condizioni = ["m.ente_id = :ente_id"]
+    params = {"ente_id": ente_id}
+    if registro_id:
+        condizioni.append("m.registro_id = :registro_id")
+        params["registro_id"] = registro_id
+    if data_da:
+        condizioni.append("m.data_movimento >= :data_da")
+        params["data_da"] = data_da
+    if data_a:
+        condizioni.append("m.data_movimento <= :data_a")
+        params["data_a"] = data_a
+    if tipo:
+        condizioni.append("m.tipo_movimento = :tipo")
+        params["tipo"] = tipo
+    return " AND ".join(condizioni), params
+
+
+def pagina_movimenti(
+    db: Session,
+    ente_id: str,
+    registro_id: Optional[str] = None,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+    tipo: Optional[str] = None,
+    cursore: Optional[str] = None,
+    limite: Optional[int] = None,
+    crescente: bool = False
+) -> Dict:
+    """
+    Una pagina di movimenti (tutti se limite è None) con saldo progressivo.
+
+    Args:
+        crescente: senza limite né cursore, righe dal meno recente
+
+    Returns:
+        {
+            "righe": [(riga, saldo_progressivo), ...],
+            "totali": {registro_id: {"entrate", "uscite", "saldo"}},
+                (None con il cursore: restano quelli della prima pagina)
+            "cursore_successivo": str | None
+        }
+
+    Raises:
+        ValueError: se il cursore non è valido
+    """
+    where, params = _filtri(ente_id, registro_id, data_da, data_a, tipo)
+
+    totali = None
+    if cursore:
+        c_data, c_creato, c_id, saldi = decodifica_cursore(cursore)
+        params.update({"c_data": c_data, "c_creato": c_creato, "c_id": c_id})
+    else:
+        # Totali e saldo finale per registro: una sola volta, alla prima pagina
+        righe_totali = db.execute(text(f"""
+            SELECT
+                m.registro_id,
+                COALESCE(SUM(m.importo) FILTER (
+                    WHERE m.tipo_movimento = 'entrata' AND NOT COALESCE(m.bloccato, FALSE)), 0),
+                COALESCE(SUM(m.importo) FILTER (
+                    WHERE m.tipo_movimento = 'uscita' AND NOT COALESCE(m.bloccato, FALSE)), 0),
+                COALESCE(SUM(effetto_saldo_movimento(m.tipo_movimento, m.importo, m.bloccato)), 0)
+            FROM movimenti_contabili m
+            WHERE {where}
+            GROUP BY m.registro_id
+        """), params).fetchall()
+
+        totali = {}
+        for reg_id, entrate, uscite, saldo in righe_totali:
+            totali[str(reg_id)] = {"entrate": entrate, "uscite": uscite, "saldo": saldo}
+        saldi = {reg_id: t["saldo"] for reg_id, t in totali.items()}
+
+    # Pagina: la window function lavora solo sulle righe della pagina
+    pagina_where = where + (f" AND {_CHIAVE_MINORE}" if cursore else "")
+    pagina_limite = ""
+    if limite:
+        pagina_limite = "LIMIT :limite"
+        params["limite"] = limite + 1
+
+    righe = db.execute(text(f"""
+        SELECT p.*,
+               COALESCE(SUM(p.effetto) OVER (
+                   PARTITION BY p.registro_id
+                   ORDER BY p.data_movimento DESC, p.created_at DESC, p.id DESC
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS successivi_in_pagina
+        FROM (
+            SELECT
+                m.id,
+                m.data_movimento,
+                m.tipo_movimento,
+                m.importo,
+                m.descrizione,
+                m.note,
+                m.allegati,
+                m.bloccato,
+                m.tipo_speciale,
+                r.nome AS conto_nome,
+                m.registro_id,
+                m.categoria_id,
+                c.descrizione AS categoria_nome,
+                m.created_at,
+                m.riporto_saldo,
+                effetto_saldo_movimento(m.tipo_movimento, m.importo, m.bloccato) AS effetto
+            FROM movimenti_contabili m
+            LEFT JOIN registri_contabili r ON m.registro_id = r.id
+            LEFT JOIN piano_conti c ON m.categoria_id = c.id
+            WHERE {pagina_where}
+            ORDER BY m.data_movimento DESC, m.created_at DESC, m.id DESC
+            {pagina_limite}
+        ) p
+        ORDER BY p.data_movimento DESC, p.created_at DESC, p.id DESC
+    """), params).fetchall()
+
+    altre_pagine = limite and len(righe) > limite
+    if altre_pagine:
+        righe = righe[:limite]
+
+    risultato = []
+    saldi_successivi = dict(saldi)
+    for riga in righe:
+        reg_id = str(riga.registro_id)
+        saldo = saldi.get(reg_id, Decimal(0)) - riga.successivi_in_pagina
+        risultato.append((riga, saldo))
+        # Saldo del registro prima di questa riga, per la pagina seguente
+        saldi_successivi[reg_id] = saldo - riga.effetto
+
+    cursore_successivo = None
+    if altre_pagine:
+        ultima = righe[-1]
+        cursore_successivo = codifica_cursore(
+            ultima.data_movimento, ultima.created_at, ultima.id, saldi_successivi
+        )
+
+    if crescente and not limite and not cursore:
+        risultato.reverse()
+
+    return {"righe": risultato, "totali": totali, "cursore_successivo": cursore_successivo}
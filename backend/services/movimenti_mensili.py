@@ -0,0 +1,88 @@
+"""
+SERVIZIO RIEPILOGHI MENSILI
+===========================
+movimenti_mensili è mantenuta dai trigger della migration
+014_movimenti_mensili.sql (somma e numero dei movimenti per ente,
+registro, categoria, mese e tipo). I totali di periodo si leggono con
+la funzione SQL totali_movimenti_periodo(ente_id, data_da, data_a).
+
+Qui le funzioni per verificarla e ricostruirla dai movimenti.
+"""
+
+from typing import Optional, List, Dict
+
+_CHIAVE = "ente_id, registro_id, categoria_id, mese, tipo_movimento, tipo_speciale, riporto_saldo"
+
+# Riepiloghi ricalcolati da zero dai movimenti
+_QUERY_RIEPILOGHI_CALCOLATI = """
+    SELECT ente_id, registro_id, categoria_id,
+           date_trunc('month', data_movimento)::date AS mese,
+           tipo_movimento, tipo_speciale, COALESCE(riporto_saldo, FALSE) AS riporto_saldo,
+           SUM(importo) AS totale, COUNT(*) AS numero
+    FROM movimenti_contabili
+    WHERE (%(ente_id)s::uuid IS NULL OR ente_id = %(ente_id)s::uuid)
+    GROUP BY 1, 2, 3, 4, 5, 6, 7
+"""
+
+
+def verifica_riepiloghi(cur, ente_id: Optional[str] = None) -> List[Dict]:
+    """
+    Confronta i riepiloghi memorizzati con quelli ricalcolati.
+
+    Returns:
+        Lista delle chiavi (ente, registro, mese, ...) con differenze
+    """
+    cur.execute(f"""
+        SELECT
+            COALESCE(c.ente_id, m.ente_id),
+            COALESCE(c.registro_id, m.registro_id),
+            COALESCE(c.mese, m.mese),
+            COALESCE(c.tipo_movimento, m.tipo_movimento),
+            COALESCE(m.totale, 0), COALESCE(m.numero, 0),
+            COALESCE(c.totale, 0), COALESCE(c.numero, 0)
+        FROM ({_QUERY_RIEPILOGHI_CALCOLATI}) c
+        FULL JOIN (
+            SELECT * FROM movimenti_mensili
+            WHERE (%(ente_id)s::uuid IS NULL OR ente_id = %(ente_id)s::uuid)
+        ) m USING ({_CHIAVE})
+        WHERE COALESCE(m.totale, 0) <> COALESCE(c.totale, 0)
+           OR COALESCE(m.numero, 0) <> COALESCE(c.numero, 0)
+        ORDER BY 1, 2, 3
+    """, {"ente_id": ente_id})
+
+    return [
+        {
+            "ente_id": str(row[0]),
+            "registro_id": str(row[1]),
+            "mese": row[2].isoformat(),
+            "tipo_movimento": row[3],
+            "totale_memorizzato": float(row[4]),
+            "numero_memorizzato": row[5],
+            "totale_calcolato": float(row[6]),
+            "numero_calcolato": row[7],
+        }
+        for row in cur.fetchall()
+    ]
+
+
+def ricostruisci_riepiloghi(cur, ente_id: Optional[str] = None) -> int:
+    """
+    Ricostruisce i riepiloghi dai movimenti (ed elimina le righe azzerate).
+
+    La tabella viene bloccata in SHARE ROW EXCLUSIVE: i trigger dei
+    movimenti concorrenti attendono il commit e applicano la loro
+    variazione ai riepiloghi ricostruiti.
+
+    Returns:
+        Numero di righe di riepilogo ricostruite
+    """
+    cur.execute("LOCK TABLE movimenti_mensili IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        DELETE FROM movimenti_mensili
+        WHERE (%(ente_id)s::uuid IS NULL OR ente_id = %(ente_id)s::uuid)
+    """, {"ente_id": ente_id})
+    cur.execute(f"""
+        INSERT INTO movimenti_mensili ({_CHIAVE}, totale, numero)
+        {_QUERY_RIEPILOGHI_CALCOLATI}
+    """, {"ente_id": ente_id})
+    return cur.rowcount
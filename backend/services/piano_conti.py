@@ -0,0 +1,108 @@
+"""
+SERVIZIO GERARCHIA PIANO DEI CONTI
+==================================
+Percorsi e discendenti delle categorie letti dalla closure table
+piano_conti_gerarchia (migration 010_piano_conti_gerarchia.sql),
+mantenuta dai trigger su piano_conti.
+
+Ogni funzione esegue una sola query, a qualsiasi profondità.
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Dict, Iterable, List, Tuple
+
+# Sottoquery riutilizzabile nei filtri: categoria_id IN (...discendenti...)
+SQL_DISCENDENTI = """
+    SELECT discendente_id FROM piano_conti_gerarchia
+    WHERE antenato_id = ANY(CAST(:antenati AS uuid[]))
+"""
+
+
+def _ids_validi(categoria_ids: Iterable) -> List[str]:
+    return sorted({str(i) for i in categoria_ids if i})
+
+
+def gerarchie_categorie(db: Session, categoria_ids: Iterable) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Catena degli antenati per ogni categoria, dalla radice alla categoria.
+
+    Returns:
+        {categoria_id: [(id, descrizione), ...]} ordinato dalla radice
+    """
+    ids = _ids_validi(categoria_ids)
+    if not ids:
+        return {}
+
+    rows = db.execute(text("""
+        SELECT g.discendente_id, a.id, a.descrizione
+        FROM piano_conti_gerarchia g
+        JOIN piano_conti a ON a.id = g.antenato_id
+        WHERE g.discendente_id = ANY(CAST(:ids AS uuid[]))
+        ORDER BY g.discendente_id, g.profondita DESC
+    """), {"ids": ids}).fetchall()
+
+    gerarchie = {}
+    for discendente_id, antenato_id, descrizione in rows:
+        gerarchie.setdefault(str(discendente_id), []).append((str(antenato_id), descrizione))
+    return gerarchie
+
+
+def percorsi_categorie(db: Session, categoria_ids: Iterable, separatore: str = ": ") -> Dict[str, str]:
+    """
+    Percorso completo di ogni categoria.
+
+    Esempio: {"<id>": "Entrate: Offerte: Matrimoni"}
+    """
+    ids = _ids_validi(categoria_ids)
+    if not ids:
+        return {}
+
+    rows = db.execute(text("""
+        SELECT g.discendente_id,
+               string_agg(a.descrizione, :separatore ORDER BY g.profondita DESC)
+        FROM piano_conti_gerarchia g
+        JOIN piano_conti a ON a.id = g.antenato_id
+        WHERE g.discendente_id = ANY(CAST(:ids AS uuid[]))
+        GROUP BY g.discendente_id
+    """), {"ids": ids, "separatore": separatore}).fetchall()
+
+    return {str(r[0]): r[1] for r in rows}
+
+
+def discendenti_categorie(db: Session, categoria_ids: Iterable) -> List[str]:
+    """
+    Categorie indicate più tutte le sottocategorie, a qualsiasi livello.
+
+    Returns:
+        Lista di id (le categorie indicate sono incluse)
+    """
+    ids = _ids_validi(categoria_ids)
+    if not ids:
+        return []
+
+    rows = db.execute(text(f"""
+        {SQL_DISCENDENTI}
+        GROUP BY discendente_id
+        ORDER BY MIN(profondita), discendente_id
+    """), {"antenati": ids}).fetchall()
+
+    return [str(r[0]) for r in rows]
+
+
+def elimina_categorie(db: Session, categoria_ids: List[str], ente_id: str):
+    """
+    Elimina in blocco categorie e associazioni ai registri.
+    Le righe della gerarchia sono rimosse dalle FK ON DELETE CASCADE.
+    """
+    ids = _ids_validi(categoria_ids)
+    if not ids:
+        return
+
+    db.execute(text("""
+        DELETE FROM categorie_registri WHERE categoria_id = ANY(CAST(:ids AS uuid[]))
+    """), {"ids": ids})
+    db.execute(text("""
+        DELETE FROM piano_conti
+        WHERE id = ANY(CAST(:ids AS uuid[])) AND ente_id = :ente_id
+    """), {"ids": ids, "ente_id": ente_id})
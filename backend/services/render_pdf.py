@@ -0,0 +1,239 @@
+"""
+SERVIZIO RENDER PDF
+===================
+WeasyPrint impiega secondi di CPU per un documento: eseguito nella
+richiesta blocca il worker (o l'event loop, nelle route async). Qui il
+render avviene in un pool di processi dedicato:
+
+- PDF_WORKERS processi avviati con "spawn" e preparati all'avvio
+  (WeasyPrint importato, FontConfiguration creata, fontconfig/Pango
+  inizializzati con un documento di prova);
+- al massimo PDF_CODA_MAX documenti in coda o in lavorazione: oltre,
+  CodaPdfPiena (da restituire come 503);
+- limite di tempo per documento (PDF_TIMEOUT_SECONDI, SIGALRM nel worker)
+  e di memoria per processo (PDF_MEMORIA_MB, RLIMIT_AS); ogni processo
+  viene sostituito dopo PDF_TASK_PER_WORKER documenti;
+- metriche (coda, attesa, durata, esiti) in /api/metrics.
+
+API: renderizza_pdf() per le route def e i worker dei lavori. Se percorso
+è indicato il PDF è scritto dal worker sul file, altrimenti sono
+restituiti i byte.
+"""
+
+import os
+import time
+import signal
+import logging
+import importlib.util
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Tuple
+
+from services import metriche
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURAZIONE
+# ============================================
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", 2))
+PDF_CODA_MAX = int(os.getenv("PDF_CODA_MAX", 20))
+PDF_TIMEOUT_SECONDI = float(os.getenv("PDF_TIMEOUT_SECONDI", 60))
+PDF_MEMORIA_MB = int(os.getenv("PDF_MEMORIA_MB", 1024))  # 0 = nessun limite
+PDF_TASK_PER_WORKER = int(os.getenv("PDF_TASK_PER_WORKER", 50))
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Attesa lato applicazione: timeout del worker più il tempo in coda
+_ATTESA_MASSIMA = PDF_TIMEOUT_SECONDI * (PDF_CODA_MAX / max(PDF_WORKERS, 1) + 1)
+
+
+class ErroreRenderPdf(Exception):
+    """Render non riuscito (il messaggio è mostrabile all'utente)."""
+
+
+class CodaPdfPiena(ErroreRenderPdf):
+    pass
+
+
+class TimeoutRenderPdf(ErroreRenderPdf):
+    pass
+
+
+# ============================================
+# LATO WORKER
+# ============================================
+
+_font_config = None
+
+
+def _scaduto(signum, frame):
+    raise TimeoutRenderPdf(f"Generazione PDF oltre {PDF_TIMEOUT_SECONDI:.0f} secondi")
+
+
+def _inizializza_worker(memoria_mb: int):
+    global _font_config
+    if memoria_mb:
+        import resource
+        limite = memoria_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+    signal.signal(signal.SIGALRM, _scaduto)
+
+    from weasyprint import HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    HTML(string="<p>Ecclesia</p>").write_pdf(font_config=_font_config)
+
+
+def _pronto() -> int:
+    return os.getpid()
+
+
+def _render(html: str, base_url: str, percorso: Optional[str], timeout: float) -> Tuple[Optional[bytes], float, float]:
+    """Eseguito nel worker. Returns: (byte o None, inizio, durata)"""
+    from weasyprint import HTML
+
+    inizio = time.time()
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if percorso:
+            Path(percorso).parent.mkdir(parents=True, exist_ok=True)
+        risultato = HTML(string=html, base_url=base_url).write_pdf(
+            target=percorso, font_config=_font_config
+        )
+    except MemoryError:
+        raise ErroreRenderPdf(f"Generazione PDF oltre il limite di memoria ({PDF_MEMORIA_MB} MB)")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return risultato, inizio, time.time() - inizio
+
+
+# ============================================
+# LATO APPLICAZIONE
+# ============================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_in_corso = 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inizializza_worker,
+                initargs=(PDF_MEMORIA_MB,),
+                max_tasks_per_child=PDF_TASK_PER_WORKER or None,
+            )
+        return _pool
+
+
+def _ricrea_pool(pool: ProcessPoolExecutor):
+    """Dopo la morte di un worker (es. memoria esaurita) il pool non è più utilizzabile."""
+    global _pool
+    logger.warning("Render PDF: worker terminato, pool ricreato")
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def avvia_pool():
+    """Avvia e prepara i worker (chiamata all'avvio dell'applicazione)."""
+    if importlib.util.find_spec("weasyprint") is None:
+        return  # Ambiente senza WeasyPrint: le route PDF rispondono 501
+    pool = _get_pool()
+    for _ in range(PDF_WORKERS):
+        pool.submit(_pronto)
+
+
+def chiudi_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stato_coda() -> int:
+    """Documenti in coda o in lavorazione."""
+    return _in_corso
+
+
+def _invia(html: str, base_url: Optional[str], percorso: Optional[str]) -> Tuple[Future, float, ProcessPoolExecutor]:
+    global _in_corso
+    with _lock:
+        if _in_corso >= PDF_CODA_MAX:
+            metriche.registra_render_pdf("coda_piena")
+            raise CodaPdfPiena("Troppi documenti in generazione, riprovare tra poco")
+        _in_corso += 1
+
+    inviato = time.time()
+    argomenti = (_render, html, base_url or str(BASE_DIR), str(percorso) if percorso else None, PDF_TIMEOUT_SECONDI)
+    pool = _get_pool()
+    try:
+        try:
+            future = pool.submit(*argomenti)
+        except BrokenProcessPool:
+            # Pool rotto da un render precedente: un nuovo tentativo
+            _ricrea_pool(pool)
+            pool = _get_pool()
+            future = pool.submit(*argomenti)
+    except BaseException:
+        _termina()
+        raise
+    return future, inviato, pool
+
+
+def _termina():
+    global _in_corso
+    with _lock:
+        _in_corso -= 1
+
+
+def _risultato(future: Future, inviato: float, pool: ProcessPoolExecutor) -> Optional[bytes]:
+    """Esito di un render completato, con metriche."""
+    try:
+        pdf, inizio, durata = future.result(timeout=0)
+    except TimeoutRenderPdf:
+        metriche.registra_render_pdf("timeout")
+        raise
+    except BrokenProcessPool:
+        metriche.registra_render_pdf("errore")
+        _ricrea_pool(pool)
+        raise ErroreRenderPdf("Il processo di generazione PDF è terminato in modo anomalo")
+    except Exception:
+        metriche.registra_render_pdf("errore")
+        raise
+    metriche.registra_render_pdf("ok", attesa=max(inizio - inviato, 0.0), durata=durata)
+    return pdf
+
+
+def renderizza_pdf(html: str, percorso: Optional[str] = None, base_url: Optional[str] = None) -> Optional[bytes]:
+    """
+    Genera il PDF nel pool e attende il risultato.
+
+    Returns:
+        Byte del PDF, None se scritto su percorso
+
+    Raises:
+        CodaPdfPiena, TimeoutRenderPdf, ErroreRenderPdf
+    """
+    future, inviato, pool = _invia(html, base_url, percorso)
+    try:
+        wait([future], timeout=_ATTESA_MASSIMA)
+    finally:
+        _termina()
+    if not future.done():
+        future.cancel()
+        metriche.registra_render_pdf("timeout")
+        raise TimeoutRenderPdf("Generazione PDF non completata in tempo")
+    return _risultato(future, inviato, pool)
@@ -0,0 +1,273 @@
+"""
+MOTORE REPORT CONTABILE
+=======================
+Report di POST /api/contabilita/report in due parti:
+
+- riepilogo: totali per categoria ai tre livelli della gerarchia, per
+  registro e complessivi, per entrate e uscite, calcolati con una sola
+  query (GROUP BY tipo, GROUPING SETS (ROLLUP(livello1, livello2,
+  livello3), (registro))) sui riepiloghi mensili della migration 014;
+- dettaglio (facoltativo): i movimenti letti con un cursore lato server
+  a blocchi e serializzati in streaming, senza tenere in memoria né
+  l'elenco né il JSON completo.
+"""
+
+import os
+import json
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from database import engine
+from services.piano_conti import SQL_DISCENDENTI
+from services.cache_categorie import AlberoCategorie, chiave_ordinamento
+from constants import TipoMovimento
+
+# Movimenti letti dal cursore (e serializzati) per blocco
+REPORT_BLOCCO = int(os.getenv("REPORT_BLOCCO", 2000))
+
+_TIPI = (TipoMovimento.ENTRATA, TipoMovimento.USCITA)
+
+
+def filtri_report(data: dict) -> Dict:
+    """Filtri dal body della richiesta (stessi nomi usati dal frontend)."""
+    tipi_mov = data.get('tipiMovimento', {'entrate': True, 'uscite': True})
+    tipi = []
+    if tipi_mov.get('entrate'):
+        tipi.append(TipoMovimento.ENTRATA)
+    if tipi_mov.get('uscite'):
+        tipi.append(TipoMovimento.USCITA)
+    return {
+        "data_inizio": data.get('dataInizio') or None,
+        "data_fine": data.get('dataFine') or None,
+        "conti": [str(c) for c in data.get('contiSelezionati') or []],
+        "categorie": [str(c) for c in data.get('categorieSelezionate') or []],
+        "tipi": tipi,
+    }
+
+
+def _condizioni(filtri: Dict, alias: str) -> Tuple[str, Dict]:
+    condizioni = []
+    params = {}
+    if filtri["conti"]:
+        condizioni.append(f"{alias}.registro_id = ANY(CAST(:conti AS uuid[]))")
+        params["conti"] = filtri["conti"]
+    if filtri["categorie"]:
+        # Categorie selezionate + tutte le sottocategorie (qualsiasi livello)
+        condizioni.append(f"{alias}.categoria_id IN ({SQL_DISCENDENTI})")
+        params["antenati"] = filtri["categorie"]
+    if filtri["tipi"]:
+        condizioni.append(f"{alias}.tipo_movimento = ANY(CAST(:tipi AS varchar[]))")
+        params["tipi"] = filtri["tipi"]
+    return "".join(f" AND {c}" for c in condizioni), params
+
+
+# ============================================
+# RIEPILOGO (GROUPING SETS)
+# ============================================
+
+def _nodo(albero: AlberoCategorie, categoria_id, totale, numero) -> Dict:
+    cat = albero.get(categoria_id)
+    return {
+        "id": str(categoria_id) if categoria_id else None,
+        "codice": cat["codice"] if cat else "",
+        "descrizione": cat["descrizione"] if cat else "Non categorizzato",
+        "totale": float(totale),
+        "numero": int(numero),
+        "sottocategorie": [],
+    }
+
+
+def _ordina(nodi: List[Dict]) -> List[Dict]:
+    # Non categorizzato in fondo
+    nodi.sort(key=lambda n: (n["id"] is None, chiave_ordinamento(n["codice"]), n["descrizione"]))
+    for nodo in nodi:
+        _ordina(nodo["sottocategorie"])
+    return nodi
+
+
+def riepilogo_report(db: Session, ente_id: str, filtri: Dict, albero: AlberoCategorie) -> Dict:
+    """
+    Returns:
+        {
+            "entrata": {"totale", "numero", "categorie": [albero a 3 livelli], "registri": [...]},
+            "uscita": {...}
+        }
+    """
+    where, params = _condizioni(filtri, "t")
+    params.update({
+        "ente_id": ente_id,
+        "data_inizio": filtri["data_inizio"],
+        "data_fine": filtri["data_fine"],
+    })
+
+    righe = db.execute(text(f"""
+        WITH catene AS (
+            SELECT g.discendente_id AS categoria_id,
+                   (array_agg(g.antenato_id ORDER BY g.profondita DESC))[1:3] AS livelli
+            FROM piano_conti_gerarchia g
+            JOIN piano_conti pc ON pc.id = g.discendente_id
+            WHERE pc.ente_id = :ente_id
+            GROUP BY g.discendente_id
+        ),
+        totali AS (
+            SELECT t.tipo_movimento, t.registro_id,
+                   c.livelli[1] AS livello1, c.livelli[2] AS livello2, c.livelli[3] AS livello3,
+                   t.totale, t.numero
+            FROM totali_movimenti_periodo(
+                CAST(:ente_id AS uuid), CAST(:data_inizio AS date), CAST(:data_fine AS date)
+            ) t
+            LEFT JOIN catene c ON c.categoria_id = t.categoria_id
+            WHERE NOT t.riporto_saldo
+              AND t.tipo_movimento IN ('entrata', 'uscita')
+              {where}
+        )
+        SELECT
+            tipo_movimento, registro_id, livello1, livello2, livello3,
+            GROUPING(registro_id) AS senza_registro,
+            GROUPING(livello1, livello2, livello3) AS livelli_raggruppati,
+            SUM(totale), SUM(numero)
+        FROM totali
+        GROUP BY tipo_movimento, GROUPING SETS (ROLLUP(livello1, livello2, livello3), (registro_id))
+    """), params).fetchall()
+
+    registri = {
+        str(r[0]): r[1] for r in db.execute(text("""
+            SELECT id, nome FROM registri_contabili WHERE ente_id = :ente_id
+        """), {"ente_id": ente_id}).fetchall()
+    }
+
+    riepilogo = {
+        tipo: {"totale": 0.0, "numero": 0, "categorie": [], "registri": []}
+        for tipo in _TIPI
+    }
+    livello1, livello2 = {}, {}
+
+    # Prima i livelli superiori (bitmask GROUPING: 7 = totale, 3 = livello 1, ...)
+    for riga in sorted(righe, key=lambda r: -r.livelli_raggruppati):
+        sezione = riepilogo[riga.tipo_movimento]
+        totale, numero = riga[7], riga[8]
+
+        if riga.senza_registro == 0:
+            sezione["registri"].append({
+                "id": str(riga.registro_id),
+                "nome": registri.get(str(riga.registro_id), ""),
+                "totale": float(totale),
+                "numero": int(numero),
+            })
+        elif riga.livelli_raggruppati == 7:
+            sezione["totale"] = float(totale)
+            sezione["numero"] = int(numero)
+        elif riga.livelli_raggruppati == 3:
+            nodo = _nodo(albero, riga.livello1, totale, numero)
+            livello1[(riga.tipo_movimento, riga.livello1)] = nodo
+            sezione["categorie"].append(nodo)
+        elif riga.livelli_raggruppati == 1 and riga.livello2:
+            # Categorie radice senza figli: livello2 NULL, nessun nodo figlio
+            nodo = _nodo(albero, riga.livello2, totale, numero)
+            livello2[(riga.tipo_movimento, riga.livello2)] = nodo
+            livello1[(riga.tipo_movimento, riga.livello1)]["sottocategorie"].append(nodo)
+        elif riga.livelli_raggruppati == 0 and riga.livello3:
+            nodo = _nodo(albero, riga.livello3, totale, numero)
+            livello2[(riga.tipo_movimento, riga.livello2)]["sottocategorie"].append(nodo)
+
+    for sezione in riepilogo.values():
+        _ordina(sezione["categorie"])
+        sezione["registri"].sort(key=lambda r: r["nome"])
+    return riepilogo
+
+
+# ============================================
+# DETTAGLIO (STREAMING)
+# ============================================
+
+def _movimento(riga, albero: AlberoCategorie, cat_sel: set) -> Dict:
+    categoria_id = str(riga.categoria_id) if riga.categoria_id else None
+    categoria_nome = riga.categoria_nome
+    catena = albero.catena(categoria_id) or ([(categoria_id, categoria_nome)] if categoria_id else [])
+    nomi = [nome for _, nome in catena]
+
+    # Padre e nonno della categoria del movimento
+    categoria_padre_id, categoria_padre_nome = catena[-2] if len(catena) >= 2 else (None, None)
+    categoria_nonno_id, categoria_nonno_nome = catena[-3] if len(catena) >= 3 else (None, None)
+
+    if not catena:
+        gerarchia = "Non categorizzato"
+    elif cat_sel:
+        # Percorso fino alla categoria selezionata più vicina alla radice
+        livello_sel = next((i for i, (cat_id, _) in enumerate(catena) if cat_id in cat_sel), 0)
+        gerarchia = " > ".join(nomi[:livello_sel + 1])
+    else:
+        gerarchia = " > ".join(nomi)
+
+    return {
+        "id": str(riga.id),
+        "data_movimento": riga.data_movimento.isoformat() if riga.data_movimento else None,
+        "causale": riga.causale,
+        "importo": float(riga.importo),
+        "tipo_movimento": riga.tipo_movimento,
+        "conto": riga.conto_nome,
+        "categoria": categoria_nome or "Non categorizzato",
+        "categoria_id": categoria_id,
+        "categoria_padre": categoria_padre_nome,
+        "categoria_padre_id": categoria_padre_id,
+        "categoria_nonno": categoria_nonno_nome,
+        "categoria_nonno_id": categoria_nonno_id,
+        "gerarchia": gerarchia,
+    }
+
+
+def movimenti_report(ente_id: str, filtri: Dict, albero: AlberoCategorie) -> Iterator[Dict]:
+    """
+    Movimenti del report dal più recente, con cursore lato server su una
+    connessione dedicata (chiusa a fine iterazione, anche se interrotta).
+    """
+    where, params = _condizioni(filtri, "m")
+    params["ente_id"] = ente_id
+    if filtri["data_inizio"]:
+        where += " AND m.data_movimento >= :data_inizio"
+        params["data_inizio"] = filtri["data_inizio"]
+    if filtri["data_fine"]:
+        where += " AND m.data_movimento <= :data_fine"
+        params["data_fine"] = filtri["data_fine"]
+
+    cat_sel = set(filtri["categorie"])
+    with engine.connect() as conn:
+        risultato = conn.execution_options(stream_results=True, yield_per=REPORT_BLOCCO).execute(text(f"""
+            SELECT
+                m.id, m.data_movimento, m.causale, m.importo, m.tipo_movimento,
+                r.nome as conto_nome,
+                c.descrizione as categoria_nome,
+                m.categoria_id
+            FROM movimenti_contabili m
+            LEFT JOIN registri_contabili r ON m.registro_id = r.id
+            LEFT JOIN piano_conti c ON m.categoria_id = c.id
+            WHERE m.ente_id = :ente_id
+              AND (m.riporto_saldo IS NULL OR m.riporto_saldo = FALSE)
+              {where}
+            ORDER BY m.data_movimento DESC, m.created_at DESC
+        """), params)
+        for riga in risultato:
+            yield _movimento(riga, albero, cat_sel)
+
+
+def json_in_streaming(intestazione: Dict, chiave: str, elementi: Iterator[Dict]) -> Iterator[str]:
+    """
+    Un oggetto JSON con i campi di 'intestazione' e, per ultimo, la lista
+    'chiave' prodotta man mano (un blocco di REPORT_BLOCCO elementi per chunk).
+    """
+    testa = json.dumps(intestazione, default=str)
+    yield testa[:-1] + (", " if intestazione else "") + json.dumps(chiave) + ": ["
+
+    blocco = []
+    primo = True
+    for elemento in elementi:
+        blocco.append(json.dumps(elemento, default=str))
+        if len(blocco) >= REPORT_BLOCCO:
+            yield ("" if primo else ",") + ",".join(blocco)
+            primo = False
+            blocco = []
+    if blocco:
+        yield ("" if primo else ",") + ",".join(blocco)
+    yield "]}"
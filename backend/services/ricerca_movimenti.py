@@ -0,0 +1,122 @@
+"""
+RICERCA MOVIMENTI
+=================
+Ricerca testuale in descrizione, causale e note dei movimenti
+(indici della migration 017_ricerca_movimenti.sql):
+
+- full-text italiano (websearch_to_tsquery): parole intere, con radici
+  ("offerta" trova "offerte"), frasi tra virgolette ed esclusioni (-parola);
+- trigrammi (pg_trgm): parti di parola e importi ("150,5" trova 150.50).
+
+Una riga corrisponde se soddisfa almeno uno dei due criteri. L'ordine è
+per rilevanza (rango full-text + somiglianza delle parole), poi dal
+movimento più recente; la paginazione è per numero di pagina.
+"""
+
+import os
+import re
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from services.piano_conti import SQL_DISCENDENTI
+
+RICERCA_PAGINA = int(os.getenv("RICERCA_PAGINA", 50))
+RICERCA_PAGINA_MAX = int(os.getenv("RICERCA_PAGINA_MAX", 200))
+RICERCA_MIN_CARATTERI = 3
+
+_TESTO = "testo_ricerca_movimento(m.descrizione, m.causale, m.note, m.importo)"
+
+
+def _testo_trigrammi(testo: str) -> str:
+    """Testo per il confronto a trigrammi: minuscolo, virgola decimale come punto."""
+    return re.sub(r"(\d),(\d)", r"\1.\2", testo.strip().lower())
+
+
+def _like(testo: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", testo) + "%"
+
+
+def cerca_movimenti(
+    db: Session,
+    ente_id: str,
+    testo: str,
+    registro_id: Optional[str] = None,
+    categoria_id: Optional[str] = None,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+    tipo: Optional[str] = None,
+    pagina: int = 1,
+    per_pagina: int = RICERCA_PAGINA
+) -> Dict:
+    """
+    Movimenti dell'ente che corrispondono al testo, ordinati per rilevanza.
+
+    Args:
+        categoria_id: la categoria e tutte le sue sottocategorie
+
+    Returns:
+        {"risultati": [righe], "pagina", "per_pagina", "ha_successivi"}
+
+    Raises:
+        ValueError: se il testo è troppo corto
+    """
+    testo = (testo or "").strip()
+    if len(testo) < RICERCA_MIN_CARATTERI:
+        raise ValueError(f"Inserire almeno {RICERCA_MIN_CARATTERI} caratteri")
+
+    trigrammi = _testo_trigrammi(testo)
+    condizioni = ["m.ente_id = :ente_id"]
+    params = {
+        "ente_id": ente_id,
+        "testo": testo,
+        "trigrammi": trigrammi,
+        "like": _like(trigrammi),
+        "limite": per_pagina + 1,
+        "offset": (pagina - 1) * per_pagina,
+    }
+    if registro_id:
+        condizioni.append("m.registro_id = :registro_id")
+        params["registro_id"] = registro_id
+    if categoria_id:
+        condizioni.append(f"m.categoria_id IN ({SQL_DISCENDENTI})")
+        params["antenati"] = [str(categoria_id)]
+    if data_da:
+        condizioni.append("m.data_movimento >= :data_da")
+        params["data_da"] = data_da
+    if data_a:
+        condizioni.append("m.data_movimento <= :data_a")
+        params["data_a"] = data_a
+    if tipo:
+        condizioni.append("m.tipo_movimento = :tipo")
+        params["tipo"] = tipo
+
+    righe = db.execute(text(f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('italian', :testo) AS tsq
+        )
+        SELECT
+            m.id, m.data_movimento, m.tipo_movimento, m.importo,
+            m.descrizione, m.causale, m.note,
+            m.registro_id, r.nome AS conto_nome,
+            m.categoria_id, c.descrizione AS categoria_nome,
+            m.bloccato, m.tipo_speciale,
+            ts_rank_cd(m.ricerca, q.tsq) + word_similarity(:trigrammi, {_TESTO}) AS rilevanza
+        FROM movimenti_contabili m
+        CROSS JOIN q
+        LEFT JOIN registri_contabili r ON m.registro_id = r.id
+        LEFT JOIN piano_conti c ON m.categoria_id = c.id
+        WHERE {" AND ".join(condizioni)}
+          AND (m.ricerca @@ q.tsq OR {_TESTO} LIKE :like)
+        ORDER BY rilevanza DESC, m.data_movimento DESC, m.id
+        LIMIT :limite OFFSET :offset
+    """), params).fetchall()
+
+    return {
+        "risultati": righe[:per_pagina],
+        "pagina": pagina,
+        "per_pagina": per_pagina,
+        "ha_successivi": len(righe) > per_pagina,
+    }
@@ -0,0 +1,296 @@
+"""
+RICONCILIAZIONE ESTRATTI CONTO
+==============================
+Abbina le righe di un estratto importato ai movimenti del conto.
+
+Nessun confronto a coppie righe × movimenti: i movimenti ancora da
+riconciliare sono indicizzati in memoria per (tipo, importo in centesimi),
+con le date ordinate per la ricerca binaria della finestra temporale.
+
+1. Abbinamenti 1:1 — stesso tipo e importo, data entro la finestra.
+   Punteggio da vicinanza della data e somiglianza della descrizione;
+   assegnazione greedy dal punteggio più alto.
+2. Abbinamenti 1:n — per le righe rimaste, combinazioni di 2..N movimenti
+   dello stesso tipo nella finestra la cui somma è l'importo della riga
+   (es. un versamento che raccoglie più offerte). Si valutano solo i
+   movimenti più vicini per data, con ricerca per somma complementare.
+3. Righe e movimenti del periodo rimasti senza abbinamento.
+
+Le proposte vanno confermate dall'utente (estratti_conto_abbinamenti).
+"""
+
+import os
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+# Giorni di tolleranza tra data contabile della banca e data del movimento
+RICONCILIAZIONE_GIORNI = int(os.getenv("RICONCILIAZIONE_GIORNI", 5))
+# Massimo numero di movimenti abbinabili a una sola riga
+RICONCILIAZIONE_MAX_PARTI = int(os.getenv("RICONCILIAZIONE_MAX_PARTI", 3))
+# Movimenti candidati (i più vicini per data) valutati per gli abbinamenti 1:n
+RICONCILIAZIONE_CANDIDATI = int(os.getenv("RICONCILIAZIONE_CANDIDATI", 40))
+
+# Parole ricorrenti negli estratti che non aiutano a distinguere i movimenti
+_PAROLE_VUOTE = {
+    "di", "da", "del", "della", "per", "a", "il", "la", "e", "in",
+    "bonifico", "pagamento", "versamento", "sepa", "sdd", "sct", "disposizione",
+    "favore", "ord", "ordinante", "beneficiario", "rif", "causale",
+}
+
+
+# ============================================
+# UTILITY
+# ============================================
+
+def _parole(testo: str) -> frozenset:
+    testo = unicodedata.normalize("NFKD", testo or "").encode("ascii", "ignore").decode().lower()
+    return frozenset(p for p in re.findall(r"[a-z0-9]+", testo) if len(p) > 1 and p not in _PAROLE_VUOTE)
+
+
+def somiglianza(a: str, b: str, parole_a: Optional[frozenset] = None, parole_b: Optional[frozenset] = None) -> float:
+    """
+    Somiglianza 0..1 tra due descrizioni: parole in comune (Jaccard),
+    con SequenceMatcher come ripiego per descrizioni abbreviate diversamente.
+    """
+    parole_a = _parole(a) if parole_a is None else parole_a
+    parole_b = _parole(b) if parole_b is None else parole_b
+    if not parole_a or not parole_b:
+        return 0.0
+    jaccard = len(parole_a & parole_b) / len(parole_a | parole_b)
+    if jaccard >= 0.5:
+        return jaccard
+    testo_a = " ".join(sorted(parole_a))
+    testo_b = " ".join(sorted(parole_b))
+    return max(jaccard, SequenceMatcher(None, testo_a, testo_b).ratio() * 0.8)
+
+
+def _centesimi(importo) -> int:
+    return int(round(abs(importo) * 100))
+
+
+def _tipo(importo) -> str:
+    return "entrata" if importo > 0 else "uscita"
+
+
+def _punteggio(riga: Dict, movimenti: List[Dict], giorni: int) -> float:
+    """Vicinanza media delle date (60%) e somiglianza delle descrizioni (40%)."""
+    vicinanza = sum(
+        1 - abs((m["data"] - riga["data"]).days) / (giorni + 1) for m in movimenti
+    ) / len(movimenti)
+    simile = max(
+        somiglianza(riga["descrizione"], m["descrizione"], riga["parole"], m["parole"]) for m in movimenti
+    )
+    return round(0.6 * vicinanza + 0.4 * simile, 3)
+
+
+class _IndiceMovimenti:
+    """Movimenti non abbinati per (tipo, centesimi) e per tipo, ordinati per data."""
+
+    def __init__(self, movimenti: List[Dict]):
+        self.per_importo = defaultdict(list)
+        self.per_tipo = defaultdict(list)
+        for mov in sorted(movimenti, key=lambda m: (m["data"], m["id"])):
+            self.per_importo[(mov["tipo"], mov["centesimi"])].append(mov)
+            self.per_tipo[mov["tipo"]].append(mov)
+        self._date = {
+            chiave: [m["data"] for m in lista]
+            for chiave, lista in list(self.per_importo.items()) + list(self.per_tipo.items())
+        }
+
+    def finestra(self, chiave, data_riga, giorni) -> List[Dict]:
+        lista = self.per_importo.get(chiave) if isinstance(chiave, tuple) else self.per_tipo.get(chiave)
+        if not lista:
+            return []
+        date = self._date[chiave]
+        inizio = bisect_left(date, data_riga - timedelta(days=giorni))
+        fine = bisect_right(date, data_riga + timedelta(days=giorni))
+        return lista[inizio:fine]
+
+
+# ============================================
+# PROPOSTE
+# ============================================
+
+def _abbinamenti_1_1(righe, indice, giorni, usati) -> List[Dict]:
+    coppie = []
+    for riga in righe:
+        for mov in indice.finestra((riga["tipo"], riga["centesimi"]), riga["data"], giorni):
+            coppie.append((_punteggio(riga, [mov], giorni), riga, mov))
+
+    # Greedy dal punteggio più alto; a parità, ordine di riga e data
+    coppie.sort(key=lambda c: (-c[0], c[1]["riga"], c[2]["data"]))
+    proposte = []
+    righe_abbinate = set()
+    for punteggio, riga, mov in coppie:
+        if riga["id"] in righe_abbinate or mov["id"] in usati:
+            continue
+        righe_abbinate.add(riga["id"])
+        usati.add(mov["id"])
+        proposte.append({"tipo": "1:1", "riga": riga, "movimenti": [mov], "punteggio": punteggio})
+    return proposte
+
+
+def _combinazione(obiettivo: int, candidati: List[Dict], parti: int) -> Optional[List[Dict]]:
+    """
+    Combinazione di 'parti' candidati con somma 'obiettivo' (centesimi).
+    I candidati sono ordinati per distanza dalla data della riga: la prima
+    combinazione trovata privilegia i movimenti più vicini.
+    """
+    if parti == 2:
+        # Somma complementare con dizionario: O(k) invece di O(k²)
+        posizioni = defaultdict(list)
+        for j, candidato in enumerate(candidati):
+            posizioni[candidato["centesimi"]].append(j)
+        for i, primo in enumerate(candidati):
+            for j in posizioni.get(obiettivo - primo["centesimi"], ()):
+                if j > i:
+                    return [primo, candidati[j]]
+        return None
+
+    for i, primo in enumerate(candidati):
+        resto = obiettivo - primo["centesimi"]
+        if resto > 0:
+            coda = _combinazione(resto, candidati[i + 1:], parti - 1)
+            if coda:
+                return [primo] + coda
+    return None
+
+
+def _abbinamenti_1_n(righe, indice, giorni, usati, max_parti) -> List[Dict]:
+    proposte = []
+    for riga in sorted(righe, key=lambda r: (r["data"], r["riga"])):
+        candidati = [
+            m for m in indice.finestra(riga["tipo"], riga["data"], giorni)
+            if m["id"] not in usati and m["centesimi"] < riga["centesimi"]
+        ]
+        if len(candidati) < 2:
+            continue
+        candidati.sort(key=lambda m: (abs((m["data"] - riga["data"]).days), m["data"], m["id"]))
+        candidati = candidati[:RICONCILIAZIONE_CANDIDATI]
+
+        for parti in range(2, max_parti + 1):
+            trovata = _combinazione(riga["centesimi"], candidati, parti)
+            if trovata:
+                usati.update(m["id"] for m in trovata)
+                proposte.append({
+                    "tipo": "1:n",
+                    "riga": riga,
+                    "movimenti": sorted(trovata, key=lambda m: (m["data"], m["id"])),
+                    "punteggio": _punteggio(riga, trovata, giorni),
+                })
+                break
+    return proposte
+
+
+def proponi_abbinamenti(
+    righe: List[Dict],
+    movimenti: List[Dict],
+    giorni: int = RICONCILIAZIONE_GIORNI,
+    max_parti: int = RICONCILIAZIONE_MAX_PARTI
+) -> Dict:
+    """
+    Args:
+        righe: righe dell'estratto da abbinare
+            {"id", "riga", "data", "importo" (con segno), "descrizione"}
+        movimenti: movimenti del conto non ancora abbinati
+            {"id", "data", "tipo", "importo", "descrizione"}
+
+    Returns:
+        {"proposte": [...], "righe_non_abbinate": [...], "movimenti_non_abbinati": [...]}
+        I movimenti non abbinati sono limitati al periodo dell'estratto.
+    """
+    for riga in righe:
+        riga.update(tipo=_tipo(riga["importo"]), centesimi=_centesimi(riga["importo"]),
+                    parole=_parole(riga["descrizione"]))
+    for mov in movimenti:
+        mov.update(centesimi=_centesimi(mov["importo"]), parole=_parole(mov["descrizione"]))
+
+    indice = _IndiceMovimenti(movimenti)
+    usati = set()
+
+    proposte = _abbinamenti_1_1(righe, indice, giorni, usati)
+    abbinate = {p["riga"]["id"] for p in proposte}
+    restanti = [r for r in righe if r["id"] not in abbinate]
+    if max_parti > 1:
+        proposte += _abbinamenti_1_n(restanti, indice, giorni, usati, max_parti)
+        abbinate = {p["riga"]["id"] for p in proposte}
+
+    data_da = min((r["data"] for r in righe), default=None)
+    data_a = max((r["data"] for r in righe), default=None)
+
+    proposte.sort(key=lambda p: p["riga"]["riga"])
+    return {
+        "proposte": proposte,
+        "righe_non_abbinate": sorted((r for r in righe if r["id"] not in abbinate), key=lambda r: r["riga"]),
+        "movimenti_non_abbinati": [
+            m for m in sorted(movimenti, key=lambda m: (m["data"], m["id"]))
+            if m["id"] not in usati and righe and data_da <= m["data"] <= data_a
+        ],
+    }
+
+
+# ============================================
+# ACCESSO AI DATI (psycopg2)
+# ============================================
+
+def carica_riconciliazione(cur, estratto_id: str, registro_id: str, giorni: int = RICONCILIAZIONE_GIORNI):
+    """Righe dell'estratto non ancora abbinate e movimenti candidati del conto."""
+    cur.execute("""
+        SELECT r.id, r.riga, r.data_operazione, r.importo, COALESCE(r.descrizione, '')
+        FROM estratti_conto_righe r
+        WHERE r.estratto_id = %s
+          AND r.importo <> 0
+          AND NOT EXISTS (SELECT 1 FROM estratti_conto_abbinamenti a WHERE a.riga_id = r.id)
+        ORDER BY r.riga
+    """, (estratto_id,))
+    righe = [
+        {"id": str(r[0]), "riga": r[1], "data": r[2], "importo": r[3], "descrizione": r[4]}
+        for r in cur.fetchall()
+    ]
+    if not righe:
+        return righe, []
+
+    data_da = min(r["data"] for r in righe) - timedelta(days=giorni)
+    data_a = max(r["data"] for r in righe) + timedelta(days=giorni)
+
+    # Solo il periodo dell'estratto: gli anni precedenti del conto non vengono letti
+    cur.execute("""
+        SELECT m.id, m.data_movimento, m.tipo_movimento, m.importo,
+               COALESCE(m.descrizione, '') || ' ' || COALESCE(m.causale, '')
+        FROM movimenti_contabili m
+        WHERE m.registro_id = %s
+          AND m.data_movimento BETWEEN %s AND %s
+          AND m.tipo_speciale IS DISTINCT FROM 'saldo_iniziale'
+          AND NOT COALESCE(m.bloccato, FALSE)
+          AND NOT EXISTS (SELECT 1 FROM estratti_conto_abbinamenti a WHERE a.movimento_id = m.id)
+    """, (registro_id, data_da, data_a))
+    movimenti = [
+        {"id": str(m[0]), "data": m[1], "tipo": m[2], "importo": m[3], "descrizione": m[4].strip()}
+        for m in cur.fetchall()
+    ]
+    return righe, movimenti
+
+
+def serializza_riga(riga: Dict) -> Dict:
+    return {
+        "id": riga["id"],
+        "riga": riga["riga"],
+        "data": riga["data"].isoformat(),
+        "importo": float(riga["importo"]),
+        "descrizione": riga["descrizione"],
+    }
+
+
+def serializza_movimento(mov: Dict) -> Dict:
+    return {
+        "id": mov["id"],
+        "data": mov["data"].isoformat(),
+        "tipo": mov["tipo"],
+        "importo": float(mov["importo"]),
+        "descrizione": mov["descrizione"],
+    }
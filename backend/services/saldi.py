@@ -0,0 +1,77 @@
+"""
+SERVIZIO SALDI REGISTRI
+=======================
+registri_contabili.saldo_attuale è mantenuto dai trigger della migration
+009_saldi_registri.sql (somma dei movimenti non bloccati).
+Qui le funzioni per verificarlo e ricostruirlo dai movimenti.
+"""
+
+from typing import Optional, List, Dict
+
+# Saldo ricalcolato da zero, come faceva get_registri prima dei trigger
+_QUERY_SALDI_CALCOLATI = """
+    SELECT
+        r.id,
+        r.ente_id,
+        r.nome,
+        r.saldo_attuale AS saldo_memorizzato,
+        COALESCE(SUM(effetto_saldo_movimento(m.tipo_movimento, m.importo, m.bloccato)), 0)
+            AS saldo_calcolato
+    FROM registri_contabili r
+    LEFT JOIN movimenti_contabili m ON m.registro_id = r.id
+    WHERE (%(ente_id)s::uuid IS NULL OR r.ente_id = %(ente_id)s::uuid)
+    GROUP BY r.id, r.ente_id, r.nome, r.saldo_attuale
+"""
+
+
+def verifica_saldi(cur, ente_id: Optional[str] = None) -> List[Dict]:
+    """
+    Confronta il saldo memorizzato con quello ricalcolato dai movimenti.
+
+    Returns:
+        Lista dei registri con differenze (vuota se tutto allineato)
+    """
+    cur.execute(f"""
+        SELECT * FROM ({_QUERY_SALDI_CALCOLATI}) s
+        WHERE s.saldo_memorizzato IS DISTINCT FROM s.saldo_calcolato
+        ORDER BY s.ente_id, s.nome
+    """, {"ente_id": ente_id})
+
+    return [
+        {
+            "registro_id": str(row[0]),
+            "ente_id": str(row[1]),
+            "nome": row[2],
+            "saldo_memorizzato": float(row[3]) if row[3] is not None else None,
+            "saldo_calcolato": float(row[4]),
+        }
+        for row in cur.fetchall()
+    ]
+
+
+def ricostruisci_saldi(cur, ente_id: Optional[str] = None) -> int:
+    """
+    Riallinea saldo_attuale ai movimenti.
+
+    Le righe dei registri vengono bloccate PRIMA del ricalcolo: i trigger
+    dei movimenti concorrenti attendono il commit e applicano il loro
+    delta sul saldo ricostruito, quindi nessun movimento va perso.
+
+    Returns:
+        Numero di registri corretti
+    """
+    cur.execute("""
+        SELECT id FROM registri_contabili
+        WHERE (%(ente_id)s::uuid IS NULL OR ente_id = %(ente_id)s::uuid)
+        ORDER BY id
+        FOR UPDATE
+    """, {"ente_id": ente_id})
+
+    cur.execute(f"""
+        UPDATE registri_contabili r
+        SET saldo_attuale = s.saldo_calcolato
+        FROM ({_QUERY_SALDI_CALCOLATI}) s
+        WHERE r.id = s.id
+          AND r.saldo_attuale IS DISTINCT FROM s.saldo_calcolato
+    """, {"ente_id": ente_id})
+    return cur.rowcount
@@ -0,0 +1,100 @@
+"""
+Cache dell'albero delle categorie (services/cache_categorie.py) con
+fakeredis: lettura dalla cache, invalidazione per versione tra processi
+e ripiego sul database se Redis non risponde.
+"""
+import fakeredis
+import pytest
+import redis
+
+from services import cache_categorie
+
+RIGHE = [
+    ("c1", "1", "Entrate", 1, None, None, "entrata", False, True, 0, []),
+    ("c11", "1.1", "Offerte", 2, "c1", "c1", "entrata", False, True, 0, ["reg1"]),
+]
+
+
+@pytest.fixture
+def server():
+    server = fakeredis.FakeServer()
+    cache_categorie.imposta_client(fakeredis.FakeRedis(server=server))
+    yield server
+    cache_categorie.imposta_client(None)
+
+
+def nuovo_processo(server):
+    """Altro worker: stessa istanza Redis, cache locale vuota."""
+    cache_categorie.imposta_client(fakeredis.FakeRedis(server=server))
+
+
+def test_seconda_lettura_dalla_cache(server, sessione_prova):
+    db = sessione_prova(predefinita=list(RIGHE))
+    albero = cache_categorie.albero_categorie(db, "e1")
+    assert albero.get("c11")["percorso"] == "Entrate: Offerte"
+
+    assert cache_categorie.albero_categorie(db, "e1") is albero
+    nuovo_processo(server)
+    assert cache_categorie.albero_categorie(db, "e1").get("c11")["percorso"] == "Entrate: Offerte"
+    assert len(db.query) == 1
+
+
+def test_invalidazione_vista_dagli_altri_processi(server, sessione_prova):
+    db = sessione_prova(predefinita=list(RIGHE))
+    cache_categorie.albero_categorie(db, "e1")
+    cache_categorie.albero_categorie(db, "e2")
+
+    db.predefinita[1] = ("c11", "1.1", "Offerte domenicali", 2, "c1", "c1", "entrata", False, True, 0, [])
+    nuovo_processo(server)
+    cache_categorie.invalida_categorie("e1")
+    assert len(db.query) == 2
+
+    assert cache_categorie.albero_categorie(db, "e1").get("c11")["descrizione"] == "Offerte domenicali"
+    assert len(db.query) == 3
+    # Gli altri enti restano in cache
+    assert cache_categorie.albero_categorie(db, "e2").get("c11")["descrizione"] == "Offerte"
+    assert len(db.query) == 3
+
+
+def test_redis_non_raggiungibile(sessione_prova):
+    class RedisGuasto:
+        chiamate = 0
+
+        def __getattr__(self, nome):
+            def errore(*args, **kwargs):
+                RedisGuasto.chiamate += 1
+                raise redis.ConnectionError("connessione rifiutata")
+            return errore
+
+    cache_categorie.imposta_client(RedisGuasto())
+    try:
+        db = sessione_prova(predefinita=RIGHE)
+        assert cache_categorie.albero_categorie(db, "e1").get("c11") is not None
+        assert cache_categorie.albero_categorie(db, "e1").get("c11") is not None
+        cache_categorie.invalida_categorie("e1")
+
+        # Ogni richiesta legge dal database; Redis sospeso dopo il primo errore
+        assert len(db.query) == 2
+        assert RedisGuasto.chiamate == 1
+        assert cache_categorie.client_redis() is None
+    finally:
+        cache_categorie.imposta_client(None)
+
+
+def test_eliminazione_registro_invalida_le_categorie(server, sessione_prova, monkeypatch):
+    from routes import contabilita
+
+    letture = sessione_prova(predefinita=list(RIGHE))
+    assert cache_categorie.albero_categorie(letture, "e1").get("c11")["registri_abilitati"] == ["reg1"]
+
+    monkeypatch.setattr(contabilita, "get_record_data", lambda db, tabella, record_id: None)
+    monkeypatch.setattr(contabilita, "registra_audit", lambda **kwargs: None)
+    # Movimenti del conto, saldo iniziale, associazioni, registro eliminato
+    db = sessione_prova([(0,)], [], [], [("reg1", "Cassa")])
+    contabilita.delete_registro("reg1", db=db, current_user={"ente_id": "e1"}, x_ente_id=None)
+    assert db.commit_eseguiti == 1
+
+    letture.predefinita[1] = RIGHE[1][:10] + ([],)
+    nuovo_processo(server)
+    assert cache_categorie.albero_categorie(letture, "e1").get("c11")["registri_abilitati"] == []
+    assert len(letture.query) == 2
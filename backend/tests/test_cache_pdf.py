@@ -0,0 +1,62 @@
+"""Cache dei PDF (services/cache_pdf.py): riduzione LRU e margine di sicurezza."""
+import os
+import time
+
+import pytest
+
+from services import cache_pdf
+
+
+@pytest.fixture(autouse=True)
+def cartella(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_pdf, "PDF_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(cache_pdf, "PDF_CACHE_MAX_MB", 1)
+    monkeypatch.setattr(cache_pdf, "_totale_stimato", None)
+    monkeypatch.setattr(cache_pdf, "_prossima_scansione", 0.0)
+    return tmp_path
+
+
+MEZZO_MB = b"x" * (512 * 1024)
+
+
+def invecchia(chiave, secondi):
+    percorso = cache_pdf._percorso(chiave)
+    passato = time.time() - secondi
+    os.utime(percorso, (passato, passato))
+
+
+def test_elimina_le_voci_meno_usate(monkeypatch):
+    monkeypatch.setattr(cache_pdf, "PDF_CACHE_MAX_MB", 10)
+    for i, chiave in enumerate(["aa1", "bb2", "cc3"]):
+        cache_pdf.salva(chiave, MEZZO_MB)
+        invecchia(chiave, 3600 - i)
+    monkeypatch.setattr(cache_pdf, "PDF_CACHE_MAX_MB", 1)
+    cache_pdf.leggi("aa1")  # usata ora: resta
+    invecchia("aa1", 1000)
+
+    cache_pdf.salva("dd4", MEZZO_MB)
+
+    assert cache_pdf.leggi("bb2") is None
+    assert cache_pdf.leggi("cc3") is None
+    assert cache_pdf.leggi("aa1") is not None
+    assert cache_pdf.leggi("dd4") is not None
+
+
+def test_non_elimina_le_voci_usate_di_recente():
+    for chiave in ["aa1", "bb2", "cc3"]:
+        cache_pdf.salva(chiave, MEZZO_MB)
+
+    for chiave in ["aa1", "bb2", "cc3"]:
+        assert cache_pdf.leggi(chiave) is not None
+
+
+def test_scansione_solo_oltre_il_limite(monkeypatch):
+    cache_pdf.salva("aa1", b"x" * 1024)
+    scansioni = []
+    riduci = cache_pdf._riduci
+    monkeypatch.setattr(cache_pdf, "_riduci", lambda: (scansioni.append(1), riduci()))
+
+    cache_pdf.salva("bb2", b"x" * 1024)
+    assert scansioni == []
+    cache_pdf.salva("cc3", b"x" * (1024 * 1024))
+    assert scansioni == [1]
@@ -0,0 +1,173 @@
+"""
+Aggregati dei periodi chiusi (services/cache_periodi_chiusi.py):
+intervalli aperti tra i rendiconti e unione degli aggregati in cache con
+i movimenti aperti letti dal database.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from services import cache_categorie, cache_periodi_chiusi
+from services.cache_periodi_chiusi import _intervalli_aperti, aggregati_periodo
+
+ANNO = (date(2025, 1, 1), date(2025, 12, 31))
+
+
+# ============================================
+# INTERVALLI APERTI
+# ============================================
+
+@pytest.mark.parametrize("chiusi, attesi", [
+    ([], [ANNO]),
+    # Periodo chiuso interno
+    ([(date(2025, 3, 1), date(2025, 6, 30))],
+     [(date(2025, 1, 1), date(2025, 2, 28)), (date(2025, 7, 1), date(2025, 12, 31))]),
+    # Estremi coincidenti con il periodo richiesto
+    ([(date(2025, 1, 1), date(2025, 6, 30))], [(date(2025, 7, 1), date(2025, 12, 31))]),
+    ([(date(2025, 7, 1), date(2025, 12, 31))], [(date(2025, 1, 1), date(2025, 6, 30))]),
+    ([ANNO], []),
+    # Periodi adiacenti: nessun buco tra i due
+    ([(date(2025, 1, 1), date(2025, 6, 30)), (date(2025, 7, 1), date(2025, 9, 30))],
+     [(date(2025, 10, 1), date(2025, 12, 31))]),
+    # Periodi sovrapposti
+    ([(date(2025, 1, 1), date(2025, 6, 30)), (date(2025, 3, 1), date(2025, 9, 30))],
+     [(date(2025, 10, 1), date(2025, 12, 31))]),
+    # Periodo contenuto in uno precedente
+    ([(date(2025, 2, 1), date(2025, 10, 31)), (date(2025, 3, 1), date(2025, 4, 30))],
+     [(date(2025, 1, 1), date(2025, 1, 31)), (date(2025, 11, 1), date(2025, 12, 31))]),
+    # Periodi di un giorno
+    ([(date(2025, 1, 1), date(2025, 1, 1)), (date(2025, 12, 31), date(2025, 12, 31))],
+     [(date(2025, 1, 2), date(2025, 12, 30))]),
+])
+def test_intervalli_aperti(chiusi, attesi):
+    assert _intervalli_aperti(*ANNO, chiusi) == attesi
+
+
+def test_intervalli_aperti_illimitati():
+    chiusi = [(date(2024, 1, 1), date(2024, 12, 31))]
+    assert _intervalli_aperti(date.min, date.max, chiusi) == [
+        (date.min, date(2023, 12, 31)),
+        (date(2025, 1, 1), date.max),
+    ]
+
+
+# ============================================
+# UNIONE CACHE + MOVIMENTI APERTI
+# ============================================
+
+def aggregato(registro, categoria, mese, tipo, totale, numero, tipo_speciale=None):
+    return (registro, categoria, mese, tipo, tipo_speciale, False, Decimal(totale), numero)
+
+
+@pytest.fixture(autouse=True)
+def redis_prova():
+    cache_categorie.imposta_client(fakeredis.FakeRedis())
+    cache_periodi_chiusi._locale.clear()
+    yield
+    cache_categorie.imposta_client(None)
+    cache_periodi_chiusi._locale.clear()
+
+
+def rendiconto(id, inizio, fine, versione=datetime(2026, 1, 10, 9, 0)):
+    return SimpleNamespace(id=id, periodo_inizio=inizio, periodo_fine=fine, updated_at=versione)
+
+
+class DatiProva:
+    """Righe del database di prova, scelte in base ai parametri di ogni query."""
+
+    def __init__(self, rendiconti, bloccati, aperti):
+        self.rendiconti = rendiconti
+        self.bloccati = bloccati
+        self.aperti = aperti
+
+    def __call__(self, parametri):
+        if "rendiconto_id" in parametri:
+            return self.bloccati[parametri["rendiconto_id"]]
+        if "data_da" in parametri:
+            return self.rendiconti
+        return self.aperti
+
+
+@pytest.fixture
+def dati():
+    return DatiProva(
+        rendiconti=[rendiconto("r1", date(2025, 1, 1), date(2025, 6, 30))],
+        bloccati={"r1": [
+            aggregato("reg1", "cat1", date(2025, 6, 1), "entrata", "100.00", 2),
+            aggregato("reg1", "cat2", date(2025, 3, 1), "uscita", "40.00", 1),
+        ]},
+        aperti=[
+            # Giroconto non bloccato nel periodo chiuso: stessa chiave dei bloccati
+            aggregato("reg1", "cat1", date(2025, 6, 1), "entrata", "15.50", 1),
+            aggregato("reg2", "cat1", date(2025, 9, 1), "entrata", "30.00", 3),
+            # Movimenti che si annullano (inserito e poi stornato): riga esclusa
+            aggregato("reg2", "cat3", date(2025, 10, 1), "uscita", "0.00", 0),
+        ],
+    )
+
+
+@pytest.fixture
+def db(sessione_prova, dati):
+    return sessione_prova(predefinita=dati)
+
+
+def letture_bloccati(db):
+    return sum("rendiconto_id" in parametri for _, parametri in db.query)
+
+
+def query_aperti(db):
+    [parametri] = [p for _, p in db.query if "aperto_da_0" in p]
+    return parametri
+
+
+def test_unione_aggregati_chiusi_e_aperti(db):
+    righe = aggregati_periodo(db, "e1", *ANNO)
+
+    assert [(r["registro_id"], r["categoria_id"], r["mese"], r["totale"], r["numero"]) for r in righe] == [
+        ("reg1", "cat2", date(2025, 3, 1), Decimal("40.00"), 1),
+        ("reg1", "cat1", date(2025, 6, 1), Decimal("115.50"), 3),
+        ("reg2", "cat1", date(2025, 9, 1), Decimal("30.00"), 3),
+    ]
+    parametri = query_aperti(db)
+    assert (parametri["aperto_da_0"], parametri["aperto_a_0"]) == (date(2025, 7, 1), date(2025, 12, 31))
+    assert "aperto_da_1" not in parametri
+    # Movimenti non bloccati del periodo chiuso
+    assert (parametri["chiuso_da_0"], parametri["chiuso_a_0"]) == (date(2025, 1, 1), date(2025, 6, 30))
+
+
+def test_aggregati_chiusi_dalla_cache_finche_la_versione_non_cambia(db, dati):
+    aggregati_periodo(db, "e1", *ANNO)
+    # Altro worker: solo Redis
+    cache_periodi_chiusi._locale.clear()
+    aggregati_periodo(db, "e1", *ANNO)
+    assert letture_bloccati(db) == 1
+
+    # Rendiconto corretto: nuovo updated_at anche senza invalidazione
+    dati.rendiconti = [rendiconto("r1", date(2025, 1, 1), date(2025, 6, 30), datetime(2026, 2, 1, 8, 30))]
+    dati.bloccati["r1"] = dati.bloccati["r1"][:1]
+    righe = aggregati_periodo(db, "e1", *ANNO)
+    assert letture_bloccati(db) == 2
+    assert [r["categoria_id"] for r in righe] == ["cat1", "cat1"]
+
+
+def test_invalidazione(db):
+    aggregati_periodo(db, "e1", *ANNO)
+    cache_periodi_chiusi.invalida_aggregati_rendiconto("r1")
+    aggregati_periodo(db, "e1", *ANNO)
+    assert letture_bloccati(db) == 2
+
+
+def test_rendiconto_esteso_oltre_il_periodo_richiesto_non_e_in_cache(db, dati):
+    # La query dei rendiconti seleziona solo quelli interni al periodo:
+    # senza rendiconti tutto il periodo è letto come aperto
+    dati.rendiconti = []
+
+    aggregati_periodo(db, "e1", date(2025, 3, 1), date(2025, 8, 31))
+
+    assert letture_bloccati(db) == 0
+    parametri = query_aperti(db)
+    assert (parametri["aperto_da_0"], parametri["aperto_a_0"]) == (date(2025, 3, 1), date(2025, 8, 31))
+    assert "chiuso_da_0" not in parametri
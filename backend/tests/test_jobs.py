@@ -0,0 +1,79 @@
+"""
+Coda dei lavori (services/jobs.py): accodamento con chiave in conflitto e
+rilascio dell'advisory lock del lavoro a esecuzione conclusa.
+"""
+import pytest
+
+from services import jobs
+
+
+def test_accoda_restituisce_il_lavoro_attivo_con_la_stessa_chiave(sessione_prova):
+    # INSERT senza riga (chiave già attiva), poi ricerca del lavoro attivo
+    db = sessione_prova([], [("id-attivo",)])
+    assert jobs.accoda_job_psycopg2(db.cursore(), "pdf", chiave="k") == "id-attivo"
+    assert db.query[-1][0] == f"NOTIFY {jobs.CANALE}"
+
+
+def test_accoda_senza_riga_solleva_errore_chiaro(sessione_prova):
+    db = sessione_prova()
+    with pytest.raises(RuntimeError, match="non accodato"):
+        jobs.accoda_job_psycopg2(db.cursore(), "pdf", chiave="k")
+    assert not any(sql.startswith("NOTIFY") for sql, _ in db.query)
+
+
+@pytest.mark.parametrize("esito", ["completato", "errore", "sconosciuto"])
+def test_esegui_job_rilascia_il_lock(monkeypatch, sessione_prova, esito):
+    def gestore(parametri, job):
+        if esito == "errore":
+            raise jobs.ErroreJobDefinitivo("dati non validi")
+        return {}
+
+    monkeypatch.setitem(jobs._GESTORI, "prova", gestore)
+    # Risposta di fallisci() (nuovo stato del lavoro)
+    db = sessione_prova([("errore",)])
+    riga = {"id": "id-1", "tipo": "prova" if esito != "sconosciuto" else "altro",
+            "ente_id": None, "utente_id": None, "parametri": {}, "tentativi": 1}
+
+    jobs.esegui_job(db.cursore(), riga)
+
+    sql, parametri = db.query[-1]
+    assert "pg_advisory_unlock" in sql
+    assert parametri == ("id-1",)
+
+
+def test_worker_si_riconnette_se_il_database_non_risponde(monkeypatch, sessione_prova):
+    import psycopg2
+
+    class ConnessioneProva:
+        chiusa = False
+
+        def close(self):
+            self.chiusa = True
+
+    # Manutenzione (recupero, pulizia) e prelievo a coda vuota
+    db = sessione_prova()
+    tentativi = []
+
+    def connetti(dsn):
+        tentativi.append(dsn)
+        if len(tentativi) == 1:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return ConnessioneProva(), db.cursore()
+
+    monkeypatch.setattr(jobs, "_connetti", connetti)
+    monkeypatch.setattr(jobs.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(jobs.time, "sleep", lambda secondi: None)
+
+    jobs.esegui_worker("dsn", nome="prova", una_volta=True)
+
+    assert len(tentativi) == 2
+    assert len(db.query) == 3
+
+
+def test_pdf_senza_weasyprint_errore_definitivo(monkeypatch):
+    from routes import rendiconti_documenti
+    from services import jobs_gestori
+
+    monkeypatch.setattr(rendiconti_documenti, "WEASYPRINT_AVAILABLE", False)
+    with pytest.raises(jobs.ErroreJobDefinitivo):
+        jobs_gestori.pdf_rendiconto({"rendiconto_id": "r1", "ente_id": "e1"}, None)
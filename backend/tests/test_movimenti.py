@@ -0,0 +1,59 @@
+"""
+Liste movimenti (services/movimenti.py): totali solo nella prima pagina,
+saldo progressivo delle pagine successive ripreso dal cursore, ordine
+cronologico senza paginazione.
+"""
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from services.movimenti import decodifica_cursore, pagina_movimenti
+
+REGISTRO = str(uuid.uuid4())
+
+
+def movimento(giorno, effetto, successivi_in_pagina):
+    return SimpleNamespace(
+        id=uuid.uuid4(), data_movimento=date(2025, 1, giorno),
+        created_at=datetime(2025, 1, giorno, 12), registro_id=REGISTRO,
+        effetto=Decimal(effetto), successivi_in_pagina=Decimal(successivi_in_pagina),
+    )
+
+
+def test_pagine_successive_senza_totali_e_con_saldo_dal_cursore(sessione_prova):
+    # Dal più recente: uscita 30, entrata 60, entrata 40 (saldo finale 70)
+    recente, medio, vecchio = movimento(3, -30, 0), movimento(2, 60, -30), movimento(1, 40, 30)
+    db = sessione_prova(
+        [(REGISTRO, Decimal(100), Decimal(30), Decimal(70))],
+        [recente, medio, vecchio],
+    )
+    prima = pagina_movimenti(db, "ente", limite=2)
+
+    assert [saldo for _, saldo in prima["righe"]] == [Decimal(70), Decimal(100)]
+    assert prima["totali"][REGISTRO]["saldo"] == Decimal(70)
+    assert decodifica_cursore(prima["cursore_successivo"])[3] == {REGISTRO: Decimal(40)}
+
+    db = sessione_prova([movimento(1, 40, 0)])
+    seconda = pagina_movimenti(db, "ente", cursore=prima["cursore_successivo"], limite=2)
+
+    assert len(db.query) == 1
+    assert seconda["totali"] is None
+    assert [saldo for _, saldo in seconda["righe"]] == [Decimal(40)]
+    assert seconda["cursore_successivo"] is None
+
+
+def test_senza_paginazione_ordine_crescente_a_richiesta(sessione_prova):
+    recente, vecchio = movimento(2, 60, 0), movimento(1, 40, 60)
+    db = sessione_prova([(REGISTRO, Decimal(100), Decimal(0), Decimal(100))], [recente, vecchio])
+
+    righe = pagina_movimenti(db, "ente", crescente=True)["righe"]
+
+    assert [(r.data_movimento.day, saldo) for r, saldo in righe] == [(1, Decimal(40)), (2, Decimal(100))]
+
+
+def test_cursore_non_valido(sessione_prova):
+    with pytest.raises(ValueError):
+        pagina_movimenti(sessione_prova(), "ente", cursore="non-valido", limite=10)
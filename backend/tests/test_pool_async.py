@@ -0,0 +1,24 @@
+"""Pool asyncpg creato una sola volta anche da richieste concorrenti."""
+import asyncio
+
+import database
+
+
+def test_prime_richieste_concorrenti_creano_un_solo_pool(monkeypatch):
+    creati = []
+
+    async def create_pool(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        creati.append(object())
+        return creati[-1]
+
+    monkeypatch.setattr(database.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(database, "async_pool", None)
+
+    async def richieste():
+        return await asyncio.gather(*(database.get_async_db() for _ in range(5)))
+
+    pool = asyncio.run(richieste())
+
+    assert len(creati) == 1
+    assert all(p is creati[0] for p in pool)
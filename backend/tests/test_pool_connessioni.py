@@ -0,0 +1,94 @@
+"""
+Pool psycopg2 (database.ConnectionPool): il limite massimo vale anche
+durante l'health check e l'apertura delle connessioni, fuori dal lock.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import psycopg2.extensions
+
+from database import ConnectionPool, PoolTimeoutError
+
+
+class ConnessioneProva:
+    closed = False
+    autocommit = False
+    info = SimpleNamespace(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+    _pool = None
+    _last_used = 0.0
+
+    def _close_socket(self):
+        self.closed = True
+
+
+def crea_pool(maxconn=1, ritardo=0.0):
+    pool = ConnectionPool("", minconn=0, maxconn=maxconn, timeout=0.2, healthcheck_seconds=0)
+    pool.aperte = []
+
+    def connetti():
+        time.sleep(ritardo)
+        conn = ConnessioneProva()
+        pool.aperte.append(conn)
+        with pool._lock:
+            pool._stats["connessioni_create"] += 1
+        return conn
+
+    pool._connect = connetti
+    return pool
+
+
+def preleva_in_parallelo(pool, quante):
+    risultati = []
+
+    def preleva():
+        try:
+            risultati.append(pool.getconn())
+        except PoolTimeoutError as e:
+            risultati.append(e)
+
+    thread = [threading.Thread(target=preleva) for _ in range(quante)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    return risultati
+
+
+def test_limite_durante_apertura():
+    pool = crea_pool(maxconn=1, ritardo=0.1)
+    risultati = preleva_in_parallelo(pool, 2)
+
+    assert sum(isinstance(r, ConnessioneProva) for r in risultati) == 1
+    assert sum(isinstance(r, PoolTimeoutError) for r in risultati) == 1
+    assert len(pool.aperte) == 1
+
+
+def test_limite_durante_health_check():
+    pool = crea_pool(maxconn=1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    def health_check_lento(c):
+        time.sleep(0.1)
+        return True
+
+    pool._is_healthy = health_check_lento
+    risultati = preleva_in_parallelo(pool, 2)
+
+    assert risultati.count(conn) == 1
+    assert sum(isinstance(r, PoolTimeoutError) for r in risultati) == 1
+    assert len(pool.aperte) == 1
+
+
+def test_connessione_non_valida_libera_il_posto():
+    pool = crea_pool(maxconn=1)
+    vecchia = pool.getconn()
+    pool.putconn(vecchia)
+    pool._is_healthy = lambda c: c is not vecchia
+
+    nuova = pool.getconn()
+
+    assert nuova is not vecchia and vecchia.closed
+    assert pool.stats()["in_uso"] == 1
+    assert pool.stats()["connessioni_scartate"] == 1
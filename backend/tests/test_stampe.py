@@ -0,0 +1,110 @@
+"""
+Dati della stampa del rendiconto (routes/stampe.py): saldi di apertura
+dalla fotografia del rendiconto precedente (stessa regola del documento
+del rendiconto, services.chiusura_rendiconto.saldi_apertura), altrimenti
+dai riepiloghi mensili (totali_movimenti_periodo).
+"""
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from routes import stampe
+
+
+def riga(**campi):
+    return SimpleNamespace(**campi)
+
+
+RENDICONTO = riga(
+    id="r2", ente_id="e1",
+    periodo_inizio=date(2025, 1, 1), periodo_fine=date(2025, 12, 31),
+    totale_entrate=Decimal("500"), totale_uscite=Decimal("200"),
+    denominazione="Parrocchia", indirizzo="", cap="", comune="", provincia="",
+    codice_fiscale="", telefono="", email="", diocesi="", parroco="Don A", vescovo="",
+    parroco_nome=None, vescovo_nome=None, data_invio=None, data_revisione=None,
+    stato="bozza", osservazioni_economo=None, luogo_firma=None,
+    firma_vescovo_path=None, timbro_diocesi_path=None,
+)
+
+REGISTRI = [
+    riga(id="reg1", nome="Cassa", tipo="cassa", saldo_attuale=Decimal("150")),
+    riga(id="reg2", nome="Banca", tipo="banca", saldo_attuale=Decimal("1000")),
+]
+
+PIANO_CONTI = [
+    riga(id="c1", codice="1", descrizione="Offerte", livello=1, categoria="entrata",
+         is_sistema=False, conto_padre_id=None, totale=Decimal("0")),
+    riga(id="c11", codice="1.1", descrizione="Messe", livello=2, categoria="entrata",
+         is_sistema=False, conto_padre_id="c1", totale=Decimal("300")),
+    riga(id="c12", codice="1.2", descrizione="Matrimoni", livello=2, categoria="entrata",
+         is_sistema=False, conto_padre_id="c1", totale=Decimal("200")),
+    riga(id="c0", codice="000", descrizione="Riporto", livello=1, categoria="entrata",
+         is_sistema=True, conto_padre_id=None, totale=Decimal("0")),
+]
+
+
+def test_saldi_apertura_dalla_fotografia(sessione_prova):
+    db = sessione_prova(
+        [RENDICONTO],
+        [("reg1", Decimal("100")), ("reg2", Decimal("900"))],
+        PIANO_CONTI,
+        PIANO_CONTI,
+        REGISTRI,
+    )
+
+    dati = stampe.calcola_dati_rendiconto("r2", db)
+
+    assert dati["saldo_iniziale_entrate"] == 1000
+    assert [c["saldo"] for c in dati["conti_iniziali"]] == [100, 900]
+    assert dati["variazione_periodo"] == 150
+    # Ultimo rendiconto chiuso prima dell'inizio del periodo, anche con un intervallo scoperto
+    assert db.query[1][1] == ("e1", date(2025, 1, 1))
+    # Nessuna risomma dello storico: rendiconto, fotografia, due categorie, registri
+    assert len(db.query) == 5
+
+
+def test_senza_rendiconto_precedente_usa_i_riepiloghi(sessione_prova):
+    db = sessione_prova(
+        [RENDICONTO],
+        [],
+        [Decimal("-50")],
+        PIANO_CONTI,
+        PIANO_CONTI,
+        REGISTRI,
+        [riga(registro_id="reg1", variazione=Decimal("70"))],
+    )
+
+    dati = stampe.calcola_dati_rendiconto("r2", db)
+
+    assert dati["saldo_iniziale_entrate"] == 0
+    assert dati["saldo_iniziale_uscite"] == 50
+    assert db.query[2][1]["data_fine"] == date(2024, 12, 31)
+    # Variazione del periodo per registro, 0 per i registri senza movimenti
+    assert [c["saldo"] for c in dati["conti_iniziali"]] == [80, 1000]
+    parametri = db.query[6][1]
+    assert (parametri["data_inizio"], parametri["data_fine"]) == (date(2025, 1, 1), date(2025, 12, 31))
+
+
+def test_categorie_gerarchiche(sessione_prova):
+    db = sessione_prova(PIANO_CONTI)
+
+    categorie = stampe.calcola_categorie_gerarchiche("r2", "e1", "entrata", db)
+
+    assert categorie == [{
+        "descrizione": "Offerte",
+        "sottocategorie": [
+            {"descrizione": "Messe", "totale": 300.0},
+            {"descrizione": "Matrimoni", "totale": 200.0},
+        ],
+        "subtotale": 500.0,
+    }]
+    assert len(db.query) == 1
+
+
+def test_rendiconto_inesistente(sessione_prova):
+    with pytest.raises(HTTPException) as errore:
+        stampe.calcola_dati_rendiconto("x", sessione_prova())
+    assert errore.value.status_code == 404
@@ -0,0 +1,70 @@
+"""
+GET /api/rendiconti/{id}/pdf: render nel pool di processi
+(services/render_pdf.py) e PDF dalla cache con ETag.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth import get_current_user
+from database import get_db
+from routes import stampe
+from services import cache_pdf
+from utils import pdf_generator
+
+DATI = {"rendiconto_id": "r1", "anno": 2025, "ente": {"denominazione": "Parrocchia"}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, sessione_prova):
+    render = []
+
+    def renderizza_pdf(html, percorso=None, base_url=None):
+        render.append(percorso)
+        with open(percorso, "wb") as f:
+            f.write(b"%PDF-1.7 prova")
+
+    monkeypatch.setattr(cache_pdf, "PDF_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(pdf_generator, "RENDICONTI_DIR", tmp_path)
+    monkeypatch.setattr(pdf_generator, "renderizza_pdf", renderizza_pdf)
+    monkeypatch.setattr(pdf_generator, "prepara_rendiconto",
+                        lambda dati, output_path=None: ("<html>rendiconto</html>", tmp_path / "r1.pdf"))
+    monkeypatch.setattr(stampe, "calcola_dati_rendiconto", lambda rendiconto_id, db: dict(DATI))
+
+    db = sessione_prova()
+
+    app = FastAPI()
+    app.include_router(stampe.router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: {"user_id": "u1"}
+    client = TestClient(app)
+    client.render = render
+    client.db = db
+    return client
+
+
+def test_pdf_generato_nel_pool_e_poi_dalla_cache(client):
+    prima = client.get("/api/rendiconti/r1/pdf")
+    assert prima.status_code == 200
+    assert prima.content == b"%PDF-1.7 prova"
+    assert len(client.render) == 1
+    assert len(client.db.query) == 1  # pdf_path salvato
+
+    seconda = client.get("/api/rendiconti/r1/pdf")
+    assert seconda.status_code == 200
+    assert seconda.headers["ETag"] == prima.headers["ETag"]
+    assert len(client.render) == 1
+    assert len(client.db.query) == 1
+
+    non_modificato = client.get("/api/rendiconti/r1/pdf", headers={"If-None-Match": prima.headers["ETag"]})
+    assert non_modificato.status_code == 304
+
+
+def test_coda_piena(client, monkeypatch):
+    def coda_piena(*args, **kwargs):
+        raise stampe.CodaPdfPiena("Troppe stampe in corso")
+
+    monkeypatch.setattr(pdf_generator, "renderizza_pdf", coda_piena)
+    risposta = client.get("/api/rendiconti/r1/pdf")
+    assert risposta.status_code == 503
+    assert risposta.headers["Retry-After"] == "10"
@@ -0,0 +1,21 @@
+"""
+ETag e richieste condizionali (If-None-Match)
+=============================================
+Usati dalle risposte in cache: dashboard della contabilità (ETag del
+corpo JSON) e PDF generati (ETag dall'impronta del documento).
+"""
+import hashlib
+from typing import Optional
+
+
+def etag_contenuto(corpo: str) -> str:
+    """ETag forte del corpo della risposta."""
+    return '"' + hashlib.sha256(corpo.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_corrisponde(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto debole di If-None-Match (elenco di ETag o *)."""
+    if not if_none_match:
+        return False
+    valori = [v.strip() for v in if_none_match.split(",")]
+    return "*" in valori or any(v.removeprefix("W/") == etag for v in valori)
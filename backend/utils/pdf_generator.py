@@ -2,7 +2,6 @@
 Utility per generazione PDF rendiconti con WeasyPrint
 """
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
 # WeasyPrint opzionale (richiede GTK su Windows)
 try:
     from weasyprint import HTML
@@ -10,7 +9,10 @@ try:
 except (ImportError, OSError):
     WEASYPRINT_AVAILABLE = False
 from datetime import datetime
-from decimal import Decimal
+
+from services.render_pdf import renderizza_pdf
+from services import cache_pdf
+from utils.template_pdf import get_template
 
 # Directory base
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,42 +24,24 @@ RENDICONTI_DIR = UPLOADS_DIR / "rendiconti"
 RENDICONTI_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def formatta_euro(valore):
-    """
-    Formatta un numero come valuta europea
-    Es: 1234.56 → "1.234,56"
-    """
-    if valore is None:
-        return "0,00"
-    
-    # Converti in Decimal se necessario
-    if not isinstance(valore, Decimal):
-        valore = Decimal(str(valore))
-    
-    # Formatta con separatori
-    valore_str = f"{valore:,.2f}"
+def prepara_rendiconto(dati: dict, output_path: str = None):
+    """HTML del rendiconto da template Jinja2 e percorso del PDF"""
+    # Template compilato una volta (ambiente condiviso)
+    template = get_template('rendiconto.html')
     
-    # Sostituisci , con . per migliaia e . con , per decimali (stile italiano)
-    valore_str = valore_str.replace(",", "X").replace(".", ",").replace("X", ".")
-    
-    return valore_str
-
-
-def formatta_data(data):
-    """
-    Formatta una data in formato italiano
-    Es: 2024-01-15 → "15/01/2024"
-    """
-    if isinstance(data, str):
-        try:
-            data = datetime.fromisoformat(data.replace('Z', '+00:00'))
-        except:
-            return data
+    # Renderizza HTML
+    html_content = template.render(**dati)
     
-    if isinstance(data, datetime):
-        return data.strftime("%d/%m/%Y")
+    # Genera nome file se non specificato
+    if not output_path:
+        anno = dati.get('anno', datetime.now().year)
+        rendiconto_id = dati.get('rendiconto_id', 'temp')
+        filename = f"rendiconto_{anno}_{rendiconto_id}.pdf"
+        output_path = RENDICONTI_DIR / filename
+    else:
+        output_path = Path(output_path)
     
-    return str(data)
+    return html_content, output_path
 
 
 def genera_pdf_rendiconto(dati: dict, output_path: str = None) -> str:
@@ -71,35 +55,36 @@ def genera_pdf_rendiconto(dati: dict, output_path: str = None) -> str:
     Returns:
         Path del PDF generato
     """
-    # Setup Jinja2
-    env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)))
-    env.filters['formatta_euro'] = formatta_euro
-    env.filters['formatta_data'] = formatta_data
+    html_content, output_path = prepara_rendiconto(dati, output_path)
     
-    # Carica template
-    template = env.get_template('rendiconto.html')
-    
-    # Renderizza HTML
-    html_content = template.render(**dati)
-    
-    # Genera nome file se non specificato
-    if not output_path:
-        anno = dati.get('anno', datetime.now().year)
-        rendiconto_id = dati.get('rendiconto_id', 'temp')
-        filename = f"rendiconto_{anno}_{rendiconto_id}.pdf"
-        output_path = RENDICONTI_DIR / filename
-    else:
-        output_path = Path(output_path)
-    
-    # Crea directory se non esiste
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Genera PDF con WeasyPrint
-    HTML(string=html_content, base_url=str(BASE_DIR)).write_pdf(str(output_path))
+    # Genera PDF con WeasyPrint (pool di processi, services/render_pdf.py)
+    renderizza_pdf(html_content, percorso=str(output_path), base_url=str(BASE_DIR))
     
     return str(output_path)
 
 
+def pdf_rendiconto_in_cache(dati: dict):
+    """
+    PDF del rendiconto dalla cache (services/cache_pdf.py): generato solo
+    se l'HTML o le immagini di firma e timbro sono cambiati.
+    
+    Returns:
+        (percorso in cache, chiave, path del PDF generato o None se dalla cache)
+    """
+    html_content, output_path = prepara_rendiconto(dati)
+    chiave = cache_pdf.impronta(
+        "rendiconto",
+        html_content,
+        file=[dati.get('firma_vescovo_path'), dati.get('timbro_diocesi_path')]
+    )
+    percorso = cache_pdf.leggi(chiave)
+    if percorso is not None:
+        return percorso, chiave, None
+    
+    renderizza_pdf(html_content, percorso=str(output_path), base_url=str(BASE_DIR))
+    return cache_pdf.salva(chiave, da_file=str(output_path)), chiave, str(output_path)
+
+
 def salva_firma_vescovo(file, rendiconto_id: str) -> str:
     """
     Salva immagine firma vescovo
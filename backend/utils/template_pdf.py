@@ -0,0 +1,148 @@
+"""
+Ambiente Jinja2 condiviso per i template dei PDF
+================================================
+Un solo Environment per processo al posto di uno nuovo per ogni stampa:
+
+- i template sono compilati una volta e restano in memoria
+  (precompila_template() all'avvio dell'app e del worker);
+- bytecode cache su disco (JINJA_CACHE_DIR): i nuovi processi non
+  ripetono il parsing dei template;
+- filtri italiani (ita, ita_int, data, formatta_euro, formatta_data)
+  registrati una sola volta;
+- controllo delle modifiche ai file solo in sviluppo
+  (ENVIRONMENT=development o JINJA_AUTO_RELOAD=true).
+"""
+import os
+import logging
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATES_DIR = BASE_DIR / "templates"
+
+JINJA_AUTO_RELOAD = os.getenv(
+    "JINJA_AUTO_RELOAD",
+    "true" if os.getenv("ENVIRONMENT", "production") == "development" else "false"
+).lower() in ("1", "true", "on")
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ecclesia_jinja"))
+
+
+# ============================================
+# FILTRI
+# ============================================
+
+def formato_italiano(valore):
+    """1234.56 → "1.234,56" (valori non numerici restituiti invariati)"""
+    try:
+        numero = float(valore)
+        formatted = "{:,.2f}".format(numero)
+        return formatted.replace(",", "X").replace(".", ",").replace("X", ".")
+    except:
+        return valore
+
+
+def formato_italiano_intero(valore):
+    """1234 → "1.234" """
+    try:
+        numero = int(float(valore))
+        return f"{numero:,}".replace(",", ".")
+    except:
+        return valore
+
+
+def formato_data(valore):
+    """date o "2024-01-15" → "15/01/2024" """
+    if not valore:
+        return ""
+    try:
+        if isinstance(valore, str):
+            valore = date.fromisoformat(valore)
+        return valore.strftime('%d/%m/%Y')
+    except:
+        return str(valore)
+
+
+def formatta_euro(valore):
+    """
+    Formatta un numero come valuta europea
+    Es: 1234.56 → "1.234,56"
+    """
+    if valore is None:
+        return "0,00"
+
+    # Converti in Decimal se necessario
+    if not isinstance(valore, Decimal):
+        valore = Decimal(str(valore))
+
+    # Formatta con separatori
+    valore_str = f"{valore:,.2f}"
+
+    # Sostituisci , con . per migliaia e . con , per decimali (stile italiano)
+    valore_str = valore_str.replace(",", "X").replace(".", ",").replace("X", ".")
+
+    return valore_str
+
+
+def formatta_data(data):
+    """
+    Formatta una data in formato italiano
+    Es: 2024-01-15 → "15/01/2024"
+    """
+    if isinstance(data, str):
+        try:
+            data = datetime.fromisoformat(data.replace('Z', '+00:00'))
+        except:
+            return data
+
+    if isinstance(data, datetime):
+        return data.strftime("%d/%m/%Y")
+
+    return str(data)
+
+
+# ============================================
+# AMBIENTE
+# ============================================
+
+def crea_ambiente(bytecode_cache: bool = True) -> Environment:
+    """Environment con loader e filtri del progetto (usato anche dal benchmark)."""
+    cache = None
+    if bytecode_cache:
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    env = Environment(
+        loader=FileSystemLoader(str(TEMPLATES_DIR)),
+        auto_reload=JINJA_AUTO_RELOAD,
+        bytecode_cache=cache,
+        cache_size=-1,
+    )
+    env.filters.update({
+        'ita': formato_italiano,
+        'ita_int': formato_italiano_intero,
+        'data': formato_data,
+        'formatta_euro': formatta_euro,
+        'formatta_data': formatta_data,
+    })
+    return env
+
+
+env = crea_ambiente()
+
+
+def get_template(nome: str):
+    return env.get_template(nome)
+
+
+def precompila_template():
+    """Compila tutti i template (chiamata all'avvio: la prima stampa non paga il parsing)."""
+    for nome in env.list_templates(extensions=["html"]):
+        try:
+            env.get_template(nome)
+        except Exception:
+            logger.exception("Template %s non compilabile", nome)